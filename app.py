@@ -1,14 +1,30 @@
-from flask import Flask, request, jsonify, send_file, send_from_directory
+from flask import Flask, Request, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import os
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
-import io
-from PIL import Image
 import base64
+import itertools
 from decimal import Decimal
 import json
-import requests
+
+from supabase_client import get_client
+import billing
+import bulk
+from bulk import DEFAULT_TARIFFA, calcola_rimborso
+from assets import assets_from_env
+from cache import cache_from_env
+from conditional import conditional_json, is_fresh, json_with_etag, list_etag, list_etag_with, not_modified
+import exports
+import importazione
+from image_pipeline import PipelineSatura, controlla_formato, pipeline_from_env
+from jobs import CodaPiena, jobs_from_env
+from metrics import metrics_from_env
+from pagination import fetch_page, parse_limit
+import reports
+import search
+import snapshot
+import sync
 
 # Carica variabili ambiente
 load_dotenv()
@@ -16,22 +32,71 @@ load_dotenv()
 app = Flask(__name__, static_folder='static')
 app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY', 'dev-secret-key')
 app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_UPLOAD_SIZE', 10485760))
-CORS(app)
+
+# I CSV di /api/import sono letti in streaming: limite proprio (IMPORT_MAX_SIZE)
+IMPORT_MAX_SIZE = importazione.max_size_from_env()
+
+class Richiesta(Request):
+    @property
+    def max_content_length(self):
+        if self.path.startswith('/api/import/'):
+            return IMPORT_MAX_SIZE
+        return super().max_content_length
+
+app.request_class = Richiesta
+# ETag esposto per le chiamate cross-origin (sviluppo su localhost:5000)
+CORS(app, expose_headers=['ETag'])
+
+# File statici con nome hashato e precompressi (assets.py)
+assets = assets_from_env(app.static_folder)
+
+# Istogrammi di latenza per route e per chiamata a Supabase su /api/metrics
+metrics = metrics_from_env()
+metrics.init_app(app)
 
 # Configurazione Supabase
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_KEY')
 SUPABASE_SERVICE_KEY = os.getenv('SUPABASE_SERVICE_KEY')
 
-# Headers per API Supabase
-def get_supabase_headers(use_service_key=False):
-    key = SUPABASE_SERVICE_KEY if use_service_key else SUPABASE_KEY
-    return {
-        'apikey': key,
-        'Authorization': f'Bearer {key}',
-        'Content-Type': 'application/json',
-        'Prefer': 'return=representation'
-    }
+# Client Supabase con pool di connessioni keep-alive (uno per worker)
+# Header anon/service e timeout sono configurati in supabase_client.py
+
+# Cache dei dati di riferimento (categorie, clienti, veicoli, progetti)
+# Invalidata dalle route di scrittura corrispondenti
+reference_cache = cache_from_env()
+
+# Dimensione dei blocchi e massimo di record per gli endpoint /bulk
+BULK_CHUNK_SIZE, BULK_MAX_RECORDS = bulk.limiti_from_env()
+
+# Righe per upsert e upsert in parallelo per /api/import
+IMPORT_CHUNK_SIZE, IMPORT_PARALLELI = importazione.limiti_from_env()
+
+# Sovrapposizione tra letture e finestra dei tombstone per /api/sync
+SYNC_OVERLAP_SECONDS, SYNC_RETENTION_DAYS = sync.parametri_from_env()
+
+def lista_riferimento(table, params, key=''):
+    def carica():
+        response = get_client().get(table, params=params)
+        response.raise_for_status()
+        return response.json()
+    return reference_cache.get_or_load(table, key, carica)
+
+# Pipeline immagini: decodifica/resize in processi separati, upload in background
+image_pipeline = pipeline_from_env(
+    get_client, on_finish=lambda stato, secondi: metrics.osserva_sezione(f'upload_immagine_{stato}', secondi))
+
+# Export e report in background: pool limitato, file riusati finché i dati non cambiano
+job_queue = jobs_from_env(
+    get_client, on_finish=lambda tipo, stato, secondi: metrics.osserva_sezione(f'job_{tipo}_{stato}', secondi))
+
+# Snapshot colonnare di spese e chilometriche per filtri, cursori e totali
+# delle liste paginate (snapshot.py), None se SNAPSHOT_ENABLED non è attivo
+snapshot_liste = snapshot.snapshot_from_env(get_client)
+
+def invalida_snapshot(table):
+    if snapshot_liste is not None:
+        snapshot_liste.invalida(table)
 
 # OCR disabilitato (Google Vision non incluso)
 vision_client = None
@@ -49,22 +114,19 @@ app.json_encoder = DecimalEncoder
 
 @app.route('/')
 def index():
-    return send_from_directory('static', 'index.html')
+    return assets.risposta('index.html')
 
 @app.route('/<path:filename>')
 def serve_static(filename):
-    return send_from_directory('static', filename)
+    return assets.risposta(filename)
 
 # ============= API CATEGORIE =============
 
 @app.route('/api/categorie', methods=['GET'])
 def get_categorie():
     try:
-        url = f"{SUPABASE_URL}/rest/v1/categorie"
         params = {'attiva': 'eq.true'}
-        response = requests.get(url, headers=get_supabase_headers(), params=params)
-        response.raise_for_status()
-        return jsonify(response.json()), 200
+        return conditional_json(lista_riferimento('categorie', params))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -72,9 +134,9 @@ def get_categorie():
 def create_categoria():
     try:
         data = request.get_json()
-        url = f"{SUPABASE_URL}/rest/v1/categorie"
-        response = requests.post(url, headers=get_supabase_headers(True), json=data)
+        response = get_client().post('categorie', json=data)
         response.raise_for_status()
+        reference_cache.invalidate('categorie')
         return jsonify(response.json()[0]), 201
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -84,11 +146,8 @@ def create_categoria():
 @app.route('/api/clienti', methods=['GET'])
 def get_clienti():
     try:
-        url = f"{SUPABASE_URL}/rest/v1/clienti"
         params = {'attivo': 'eq.true', 'order': 'nome.asc'}
-        response = requests.get(url, headers=get_supabase_headers(), params=params)
-        response.raise_for_status()
-        return jsonify(response.json()), 200
+        return conditional_json(lista_riferimento('clienti', params))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -96,9 +155,9 @@ def get_clienti():
 def create_cliente():
     try:
         data = request.get_json()
-        url = f"{SUPABASE_URL}/rest/v1/clienti"
-        response = requests.post(url, headers=get_supabase_headers(True), json=data)
+        response = get_client().post('clienti', json=data)
         response.raise_for_status()
+        reference_cache.invalidate('clienti', 'progetti')
         return jsonify(response.json()[0]), 201
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -107,10 +166,10 @@ def create_cliente():
 def update_cliente(id):
     try:
         data = request.get_json()
-        url = f"{SUPABASE_URL}/rest/v1/clienti"
         params = {'id': f'eq.{id}'}
-        response = requests.patch(url, headers=get_supabase_headers(True), params=params, json=data)
+        response = get_client().patch('clienti', params=params, json=data)
         response.raise_for_status()
+        reference_cache.invalidate('clienti', 'progetti')
         return jsonify(response.json()[0]), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -118,11 +177,11 @@ def update_cliente(id):
 @app.route('/api/clienti/<int:id>', methods=['DELETE'])
 def delete_cliente(id):
     try:
-        url = f"{SUPABASE_URL}/rest/v1/clienti"
         params = {'id': f'eq.{id}'}
         data = {'attivo': False}
-        response = requests.patch(url, headers=get_supabase_headers(True), params=params, json=data)
+        response = get_client().patch('clienti', params=params, json=data)
         response.raise_for_status()
+        reference_cache.invalidate('clienti', 'progetti')
         return jsonify({'message': 'Cliente disattivato'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -132,14 +191,11 @@ def delete_cliente(id):
 @app.route('/api/progetti', methods=['GET'])
 def get_progetti():
     try:
-        url = f"{SUPABASE_URL}/rest/v1/progetti"
         params = {'select': '*,clienti(nome)', 'order': 'data_inizio.desc'}
         cliente_id = request.args.get('cliente_id')
         if cliente_id:
             params['cliente_id'] = f'eq.{cliente_id}'
-        response = requests.get(url, headers=get_supabase_headers(), params=params)
-        response.raise_for_status()
-        return jsonify(response.json()), 200
+        return conditional_json(lista_riferimento('progetti', params, key=cliente_id or ''))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -147,9 +203,9 @@ def get_progetti():
 def create_progetto():
     try:
         data = request.get_json()
-        url = f"{SUPABASE_URL}/rest/v1/progetti"
-        response = requests.post(url, headers=get_supabase_headers(True), json=data)
+        response = get_client().post('progetti', json=data)
         response.raise_for_status()
+        reference_cache.invalidate('progetti')
         return jsonify(response.json()[0]), 201
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -158,10 +214,10 @@ def create_progetto():
 def update_progetto(id):
     try:
         data = request.get_json()
-        url = f"{SUPABASE_URL}/rest/v1/progetti"
         params = {'id': f'eq.{id}'}
-        response = requests.patch(url, headers=get_supabase_headers(True), params=params, json=data)
+        response = get_client().patch('progetti', params=params, json=data)
         response.raise_for_status()
+        reference_cache.invalidate('progetti')
         return jsonify(response.json()[0]), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -171,11 +227,8 @@ def update_progetto(id):
 @app.route('/api/veicoli', methods=['GET'])
 def get_veicoli():
     try:
-        url = f"{SUPABASE_URL}/rest/v1/veicoli"
         params = {'attivo': 'eq.true', 'order': 'targa.asc'}
-        response = requests.get(url, headers=get_supabase_headers(), params=params)
-        response.raise_for_status()
-        return jsonify(response.json()), 200
+        return conditional_json(lista_riferimento('veicoli', params))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -183,13 +236,13 @@ def get_veicoli():
 def create_veicolo():
     try:
         data = request.get_json()
-        url = f"{SUPABASE_URL}/rest/v1/veicoli"
-        response = requests.post(url, headers=get_supabase_headers(True), json=data)
+        response = get_client().post('veicoli', json=data)
         
         # Debug: mostra errore dettagliato
         if not response.ok:
             return jsonify({'error': f'{response.status_code} Client Error: {response.text}'}), 500
             
+        reference_cache.invalidate('veicoli')
         return jsonify(response.json()[0]), 201
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -198,10 +251,10 @@ def create_veicolo():
 def update_veicolo(id):
     try:
         data = request.get_json()
-        url = f"{SUPABASE_URL}/rest/v1/veicoli"
         params = {'id': f'eq.{id}'}
-        response = requests.patch(url, headers=get_supabase_headers(True), params=params, json=data)
+        response = get_client().patch('veicoli', params=params, json=data)
         response.raise_for_status()
+        reference_cache.invalidate('veicoli')
         return jsonify(response.json()[0]), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -209,41 +262,165 @@ def update_veicolo(id):
 @app.route('/api/veicoli/<int:id>', methods=['DELETE'])
 def delete_veicolo(id):
     try:
-        url = f"{SUPABASE_URL}/rest/v1/veicoli"
         params = {'id': f'eq.{id}'}
         data = {'attivo': False}
-        response = requests.patch(url, headers=get_supabase_headers(True), params=params, json=data)
+        response = get_client().patch('veicoli', params=params, json=data)
         response.raise_for_status()
+        reference_cache.invalidate('veicoli')
         return jsonify({'message': 'Veicolo disattivato'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# ============= FILTRI E PAGINAZIONE =============
+
+def filtro_date(params, colonna, data_inizio, data_fine):
+    # Entrambi i limiti sulla stessa colonna: PostgREST li combina in AND
+    condizioni = []
+    if data_inizio:
+        condizioni.append(f'gte.{data_inizio}')
+    if data_fine:
+        condizioni.append(f'lte.{data_fine}')
+    if condizioni:
+        params[colonna] = condizioni
+
+def filtri_spese(args):
+    params = {}
+    filtro_date(params, 'data_spesa', args.get('data_inizio'), args.get('data_fine'))
+    if args.get('categoria_id'):
+        params['categoria_id'] = f'eq.{args.get("categoria_id")}'
+    if args.get('cliente_id'):
+        params['cliente_id'] = f'eq.{args.get("cliente_id")}'
+    if args.get('addebitabile'):
+        params['addebitabile'] = f'eq.{args.get("addebitabile")}'
+    return params
+
+def filtri_chilometriche(args):
+    params = {}
+    filtro_date(params, 'data_viaggio', args.get('data_inizio'), args.get('data_fine'))
+    if args.get('veicolo_id'):
+        params['veicolo_id'] = f'eq.{args.get("veicolo_id")}'
+    if args.get('cliente_id'):
+        params['cliente_id'] = f'eq.{args.get("cliente_id")}'
+    return params
+
+def richiesta_paginata():
+    return 'limit' in request.args or 'cursor' in request.args
+
+# Le letture sono closure senza accesso a request: possono girare nel pool
+# di fan-out del client (client.gather) insieme alle impronte dell'ETag
+
+def lettore_pagina(table, params, order_column):
+    # Paginazione keyset su (data, id): vedi pagination.py
+    limit = parse_limit(request.args.get('limit'))
+    cursor = request.args.get('cursor')
+    
+    def leggi():
+        rows, next_cursor = fetch_page(get_client(), table, params, order_column, limit, cursor)
+        return {'data': rows, 'next_cursor': next_cursor, 'has_more': next_cursor is not None}
+    return leggi
+
+def lettore_lista(table, params, order):
+    def leggi():
+        response = get_client().get(table, params=dict(params, order=order))
+        response.raise_for_status()
+        return response.json()
+    return leggi
+
+def vista_snapshot(table):
+    # None senza snapshot, per le liste non paginate o finché il primo caricamento non è completo
+    if snapshot_liste is None or not richiesta_paginata():
+        return None
+    return snapshot_liste.vista(table)
+
+def lettore_snapshot(vista, posizioni, table, params):
+    # Filtro e cursore già risolti sullo snapshot: dal database solo le righe della pagina
+    limit = parse_limit(request.args.get('limit'))
+    ids, next_cursor = vista.pagina(posizioni, limit, request.args.get('cursor'))
+    
+    def leggi():
+        rows = snapshot.leggi_per_id(get_client(), table, ids, params['select'])
+        return {'data': rows, 'next_cursor': next_cursor, 'has_more': next_cursor is not None}
+    return leggi
+
+def lettore_rpc(funzione, argomenti):
+    def leggi():
+        response = get_client().rpc(funzione, argomenti)
+        response.raise_for_status()
+        return response.json()
+    return leggi
+
+def lista_condizionale(table, params, *letture, impronta=None):
+    """
+    ETag e letture di una lista: (etag, risultati), risultati None per il 304.
+    Con If-None-Match le letture partono solo se l'ETag è cambiato; senza,
+    un 304 è impossibile e impronte e letture partono tutte insieme.
+    impronta() sostituisce la lettura di max(updated_at)/count (snapshot).
+    """
+    client = get_client()
+    if request.if_none_match:
+        etag = list_etag(client, table, params, fingerprint=impronta)
+        if is_fresh(etag):
+            return etag, None
+        return etag, client.gather(*letture)
+    return list_etag_with(client, table, params, *letture, fingerprint=impronta)
+
 # ============= API SPESE =============
 
+def inserimento_bulk(table):
+    """Inserisce un array di record: 201 se tutti inseriti, 207 con gli errori per riga altrimenti"""
+    try:
+        records = request.get_json(silent=True)
+        if not isinstance(records, list):
+            return jsonify({'error': 'Il corpo deve essere un array di record'}), 400
+        if len(records) > BULK_MAX_RECORDS:
+            return jsonify({'error': f'Massimo {BULK_MAX_RECORDS} record per richiesta'}), 413
+
+        risultato = bulk.inserisci(get_client(), table, records, chunk_size=BULK_CHUNK_SIZE)
+        invalida_snapshot(table)
+        return jsonify(risultato), 207 if risultato['errori'] else 201
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/spese', methods=['GET'])
 def get_spese():
     try:
-        url = f"{SUPABASE_URL}/rest/v1/spese"
-        params = {
-            'select': '*,categorie(nome,colore),clienti(nome),progetti(nome)',
-            'order': 'data_spesa.desc'
-        }
-        
-        # Filtri opzionali
-        if request.args.get('data_inizio'):
-            params['data_spesa'] = f'gte.{request.args.get("data_inizio")}'
-        if request.args.get('data_fine'):
-            params['data_spesa'] = f'lte.{request.args.get("data_fine")}'
-        if request.args.get('categoria_id'):
-            params['categoria_id'] = f'eq.{request.args.get("categoria_id")}'
-        if request.args.get('cliente_id'):
-            params['cliente_id'] = f'eq.{request.args.get("cliente_id")}'
-        if request.args.get('addebitabile'):
-            params['addebitabile'] = f'eq.{request.args.get("addebitabile")}'
-            
-        response = requests.get(url, headers=get_supabase_headers(), params=params)
-        response.raise_for_status()
-        return jsonify(response.json()), 200
+        params = filtri_spese(request.args)
+        params['select'] = '*,categorie(nome,colore),clienti(nome),progetti(nome)'
+        impronta = None
+        vista = vista_snapshot('spese')
+        
+        # Con limit/cursor restituisce una pagina con i metadati del cursore
+        if not richiesta_paginata():
+            letture = [lettore_lista('spese', params, 'data_spesa.desc,id.desc')]
+        elif vista is not None:
+            # Filtri, cursore, totali e impronta dell'ETag calcolati in memoria
+            posizioni = vista.filtra(request.args)
+            letture = [lettore_snapshot(vista, posizioni, 'spese', params)]
+            impronta = lambda: vista.impronta(posizioni)
+            if not request.args.get('cursor'):
+                letture.append(lambda: snapshot.totali_spese(vista, posizioni))
+        else:
+            letture = [lettore_pagina('spese', params, 'data_spesa')]
+            # Totali dell'intero filtro, non solo della pagina caricata
+            if not request.args.get('cursor'):
+                letture.append(lettore_rpc('totali_spese', {
+                    'p_da': request.args.get('data_inizio') or None,
+                    'p_a': request.args.get('data_fine') or None,
+                    'p_categoria_id': request.args.get('categoria_id') or None,
+                    'p_cliente_id': request.args.get('cliente_id') or None,
+                    'p_addebitabile': request.args.get('addebitabile') or None
+                }))
+        
+        # 304 se nulla è cambiato: la lista non viene nemmeno letta
+        etag, risultati = lista_condizionale('spese', params, *letture, impronta=impronta)
+        if risultati is None:
+            return not_modified(etag)
+        result = risultati[0]
+        if len(risultati) > 1:
+            result['totali'] = risultati[1]
+        return json_with_etag(result, etag)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -251,21 +428,25 @@ def get_spese():
 def create_spesa():
     try:
         data = request.get_json()
-        url = f"{SUPABASE_URL}/rest/v1/spese"
-        response = requests.post(url, headers=get_supabase_headers(True), json=data)
+        response = get_client().post('spese', json=data)
         response.raise_for_status()
+        invalida_snapshot('spese')
         return jsonify(response.json()[0]), 201
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/spese/bulk', methods=['POST'])
+def create_spese_bulk():
+    return inserimento_bulk('spese')
+
 @app.route('/api/spese/<int:id>', methods=['PUT'])
 def update_spesa(id):
     try:
         data = request.get_json()
-        url = f"{SUPABASE_URL}/rest/v1/spese"
         params = {'id': f'eq.{id}'}
-        response = requests.patch(url, headers=get_supabase_headers(True), params=params, json=data)
+        response = get_client().patch('spese', params=params, json=data)
         response.raise_for_status()
+        invalida_snapshot('spese')
         return jsonify(response.json()[0]), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -273,10 +454,10 @@ def update_spesa(id):
 @app.route('/api/spese/<int:id>', methods=['DELETE'])
 def delete_spesa(id):
     try:
-        url = f"{SUPABASE_URL}/rest/v1/spese"
         params = {'id': f'eq.{id}'}
-        response = requests.delete(url, headers=get_supabase_headers(True), params=params)
+        response = get_client().delete('spese', params=params)
         response.raise_for_status()
+        invalida_snapshot('spese')
         return jsonify({'message': 'Spesa eliminata'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -286,25 +467,39 @@ def delete_spesa(id):
 @app.route('/api/chilometriche', methods=['GET'])
 def get_chilometriche():
     try:
-        url = f"{SUPABASE_URL}/rest/v1/chilometriche"
-        params = {
-            'select': '*,veicoli(targa,modello),clienti(nome),progetti(nome)',
-            'order': 'data_viaggio.desc'
-        }
-        
-        # Filtri opzionali
-        if request.args.get('data_inizio'):
-            params['data_viaggio'] = f'gte.{request.args.get("data_inizio")}'
-        if request.args.get('data_fine'):
-            params['data_viaggio'] = f'lte.{request.args.get("data_fine")}'
-        if request.args.get('veicolo_id'):
-            params['veicolo_id'] = f'eq.{request.args.get("veicolo_id")}'
-        if request.args.get('cliente_id'):
-            params['cliente_id'] = f'eq.{request.args.get("cliente_id")}'
-            
-        response = requests.get(url, headers=get_supabase_headers(), params=params)
-        response.raise_for_status()
-        return jsonify(response.json()), 200
+        params = filtri_chilometriche(request.args)
+        params['select'] = '*,veicoli(targa,modello),clienti(nome),progetti(nome)'
+        impronta = None
+        vista = vista_snapshot('chilometriche')
+        
+        if not richiesta_paginata():
+            letture = [lettore_lista('chilometriche', params, 'data_viaggio.desc,id.desc')]
+        elif vista is not None:
+            posizioni = vista.filtra(request.args)
+            letture = [lettore_snapshot(vista, posizioni, 'chilometriche', params)]
+            impronta = lambda: vista.impronta(posizioni)
+            if not request.args.get('cursor'):
+                letture.append(lambda: snapshot.totali_chilometriche(vista, posizioni))
+        else:
+            letture = [lettore_pagina('chilometriche', params, 'data_viaggio')]
+            # Totali dell'intero filtro, non solo della pagina caricata
+            if not request.args.get('cursor'):
+                letture.append(lettore_rpc('totali_chilometriche', {
+                    'p_da': request.args.get('data_inizio') or None,
+                    'p_a': request.args.get('data_fine') or None,
+                    'p_veicolo_id': request.args.get('veicolo_id') or None,
+                    'p_cliente_id': request.args.get('cliente_id') or None
+                }))
+        
+        etag, risultati = lista_condizionale('chilometriche', params, *letture, impronta=impronta)
+        if risultati is None:
+            return not_modified(etag)
+        result = risultati[0]
+        if len(risultati) > 1:
+            result['totali'] = risultati[1]
+        return json_with_etag(result, etag)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -314,17 +509,20 @@ def create_chilometrica():
         data = request.get_json()
         
         # Calcola rimborso automaticamente
-        km = float(data.get('km_percorsi', 0))
-        tariffa = float(data.get('tariffa_applicata', 0.19))
-        data['rimborso_calcolato'] = round(km * tariffa, 2)
+        data['rimborso_calcolato'] = calcola_rimborso(data.get('km_percorsi', 0),
+                                                      data.get('tariffa_applicata', DEFAULT_TARIFFA))
         
-        url = f"{SUPABASE_URL}/rest/v1/chilometriche"
-        response = requests.post(url, headers=get_supabase_headers(True), json=data)
+        response = get_client().post('chilometriche', json=data)
         response.raise_for_status()
+        invalida_snapshot('chilometriche')
         return jsonify(response.json()[0]), 201
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/chilometriche/bulk', methods=['POST'])
+def create_chilometriche_bulk():
+    return inserimento_bulk('chilometriche')
+
 @app.route('/api/chilometriche/<int:id>', methods=['PUT'])
 def update_chilometrica(id):
     try:
@@ -332,14 +530,13 @@ def update_chilometrica(id):
         
         # Ricalcola rimborso se necessario
         if 'km_percorsi' in data or 'tariffa_applicata' in data:
-            km = float(data.get('km_percorsi', 0))
-            tariffa = float(data.get('tariffa_applicata', 0.19))
-            data['rimborso_calcolato'] = round(km * tariffa, 2)
+            data['rimborso_calcolato'] = calcola_rimborso(data.get('km_percorsi', 0),
+                                                          data.get('tariffa_applicata', DEFAULT_TARIFFA))
         
-        url = f"{SUPABASE_URL}/rest/v1/chilometriche"
         params = {'id': f'eq.{id}'}
-        response = requests.patch(url, headers=get_supabase_headers(True), params=params, json=data)
+        response = get_client().patch('chilometriche', params=params, json=data)
         response.raise_for_status()
+        invalida_snapshot('chilometriche')
         return jsonify(response.json()[0]), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -347,10 +544,10 @@ def update_chilometrica(id):
 @app.route('/api/chilometriche/<int:id>', methods=['DELETE'])
 def delete_chilometrica(id):
     try:
-        url = f"{SUPABASE_URL}/rest/v1/chilometriche"
         params = {'id': f'eq.{id}'}
-        response = requests.delete(url, headers=get_supabase_headers(True), params=params)
+        response = get_client().delete('chilometriche', params=params)
         response.raise_for_status()
+        invalida_snapshot('chilometriche')
         return jsonify({'message': 'Chilometrica eliminata'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -367,34 +564,19 @@ def upload_image():
         if file.filename == '':
             return jsonify({'error': 'Nome file vuoto'}), 400
         
-        # Comprimi immagine
-        img = Image.open(file)
-        img.thumbnail((1200, 1200))
-        
-        # Converti in JPEG
-        buffer = io.BytesIO()
-        if img.mode in ('RGBA', 'P'):
-            img = img.convert('RGB')
-        img.save(buffer, format='JPEG', quality=85)
-        buffer.seek(0)
-        
-        # Upload a Supabase Storage
-        filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{file.filename}"
-        filename = filename.replace(' ', '_')
-        
-        storage_url = f"{SUPABASE_URL}/storage/v1/object/expenses/{filename}"
-        headers = {
-            'Authorization': f'Bearer {SUPABASE_SERVICE_KEY}',
-            'Content-Type': 'image/jpeg'
-        }
-        
-        response = requests.post(storage_url, headers=headers, data=buffer.getvalue())
+        data = file.read()
+        try:
+            controlla_formato(data)
+        except Exception:
+            return jsonify({'error': 'File non riconosciuto come immagine'}), 400
         
-        if response.status_code not in [200, 201]:
-            return jsonify({'error': 'Errore upload immagine'}), 500
-        
-        # URL pubblico dell'immagine
-        image_url = f"{SUPABASE_URL}/storage/v1/object/public/expenses/{filename}"
+        # Compressione e upload su Storage avvengono in background (image_pipeline.py):
+        # la risposta contiene già l'URL definitivo e l'handle per lo stato.
+        # L'id è lo sha256 del file: una foto già caricata non viene rielaborata
+        try:
+            job = image_pipeline.submit(data)
+        except PipelineSatura as e:
+            return jsonify({'error': str(e)}), 503, {'Retry-After': '2'}
         
         # OCR disabilitato
         ocr_data = {
@@ -402,13 +584,103 @@ def upload_image():
         }
         
         return jsonify({
-            'image_url': image_url,
+            'upload_id': job['id'],
+            'stato': job['stato'],
+            'status_url': f"/api/upload/{job['id']}",
+            'image_url': job['image_url'],
+            'riusata': job['riusata'],
             'ocr_data': ocr_data
-        }), 200
+        }), 200 if job['stato'] == 'completato' else 202
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/upload/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    try:
+        job = image_pipeline.status(upload_id)
+        if job is None:
+            return jsonify({'error': 'Upload non trovato'}), 404
+        return jsonify({
+            'upload_id': job['id'],
+            'stato': job['stato'],
+            'image_url': job['image_url'],
+            'errore': job['errore'],
+            'riusata': job['riusata'],
+            # Spese con una ricevuta uguale o simile (dHash): possibile nota spese duplicata
+            'duplicati': job['duplicati']
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ============= IMPORT CSV =============
+
+@app.route('/api/import/spese', methods=['POST'])
+def import_spese():
+    """
+    Importa un CSV (campo file multipart oppure corpo text/csv) letto in
+    streaming: 200 se tutte le righe sono valide, 207 con gli errori per riga
+    """
+    try:
+        if request.files:
+            if 'file' not in request.files:
+                return jsonify({'error': 'Nessun file caricato'}), 400
+            stream = request.files['file'].stream
+        else:
+            stream = request.stream
+
+        # Colonne del file con nomi diversi da quelli riconosciuti: ?col_importo=Importo EUR
+        mappa = {chiave[4:]: valore for chiave, valore in request.args.items() if chiave.startswith('col_')}
+        file = importazione.testo(stream, request.args.get('encoding') or 'utf-8-sig')
+        risultato = importazione.importa(
+            get_client(), file, mappa=mappa,
+            delimitatore=request.args.get('delimitatore') or None,
+            categoria=request.args.get('categoria') or None,
+            inverti_segno=request.args.get('inverti_segno', 'false').lower() == 'true',
+            chunk_size=IMPORT_CHUNK_SIZE, paralleli=IMPORT_PARALLELI)
+        invalida_snapshot('spese')
+        return jsonify(risultato), 207 if risultato['num_errori'] else 200
+    except UnicodeDecodeError as e:
+        # Le righe già importate restano: ripetere con l'encoding giusto non le duplica
+        return jsonify({'error': f'File non leggibile come {e.encoding}: riprovare con encoding=latin-1'}), 400
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ============= SINCRONIZZAZIONE =============
+
+@app.route('/api/sync', methods=['GET'])
+def get_sync():
+    try:
+        # Solo le righe cambiate dopo il watermark: vedi sync.py
+        since = request.args.get('since')
+        since = sync.istante(since) if since else None
+        return jsonify(sync.delta(get_client(), since, SYNC_OVERLAP_SECONDS, SYNC_RETENTION_DAYS)), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ============= RICERCA =============
+
+@app.route('/api/search', methods=['GET'])
+def get_search():
+    try:
+        # Full-text + trigrammi su spese e chilometriche: vedi search.py
+        try:
+            offset = int(request.args.get('offset', 0))
+        except ValueError:
+            raise ValueError('Parametro offset non valido')
+        limit = parse_limit(request.args.get('limit'), default=20)
+        risultati = search.cerca(get_client(), request.args.get('q'), request.args.get('tipo') or None,
+                                 limit, offset)
+        return jsonify(risultati), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # ============= STATISTICHE =============
 
 @app.route('/api/stats/dashboard', methods=['GET'])
@@ -417,177 +689,240 @@ def get_dashboard_stats():
         oggi = datetime.now()
         primo_giorno_mese = oggi.replace(day=1).strftime('%Y-%m-%d')
         
-        stats = {}
-        
-        # Spese mese corrente
-        url = f"{SUPABASE_URL}/rest/v1/spese"
-        params = {'data_spesa': f'gte.{primo_giorno_mese}', 'select': 'importo'}
-        response = requests.get(url, headers=get_supabase_headers(), params=params)
-        spese = response.json()
-        stats['spese_mese'] = sum(float(s['importo']) for s in spese)
-        
-        # Spese addebitabili
-        params = {'data_spesa': f'gte.{primo_giorno_mese}', 'addebitabile': 'eq.true', 'select': 'importo'}
-        response = requests.get(url, headers=get_supabase_headers(), params=params)
-        spese_add = response.json()
-        stats['spese_addebitabili'] = sum(float(s['importo']) for s in spese_add)
-        
-        # Km mese corrente
-        url = f"{SUPABASE_URL}/rest/v1/chilometriche"
-        params = {'data_viaggio': f'gte.{primo_giorno_mese}', 'select': 'km_percorsi,rimborso_calcolato'}
-        response = requests.get(url, headers=get_supabase_headers(), params=params)
-        km = response.json()
-        stats['km_mese'] = sum(float(k['km_percorsi']) for k in km)
-        stats['rimborsi_km'] = sum(float(k['rimborso_calcolato']) for k in km)
-        
-        # Ultime spese
-        url = f"{SUPABASE_URL}/rest/v1/spese"
-        params = {
-            'select': '*,categorie(nome,colore),clienti(nome)',
-            'order': 'data_spesa.desc',
-            'limit': '10'
-        }
-        response = requests.get(url, headers=get_supabase_headers(), params=params)
-        stats['ultime_spese'] = response.json()
-        
-        # Spese per categoria (mese corrente)
-        url = f"{SUPABASE_URL}/rest/v1/spese"
-        params = {
-            'data_spesa': f'gte.{primo_giorno_mese}',
-            'select': 'importo,categorie(nome,colore)'
-        }
-        response = requests.get(url, headers=get_supabase_headers(), params=params)
-        spese_cat = response.json()
-        
-        categorie_totali = {}
-        for spesa in spese_cat:
-            if spesa.get('categorie'):
-                cat_nome = spesa['categorie']['nome']
-                if cat_nome not in categorie_totali:
-                    categorie_totali[cat_nome] = {
-                        'nome': cat_nome,
-                        'colore': spesa['categorie']['colore'],
-                        'totale': 0
-                    }
-                categorie_totali[cat_nome]['totale'] += float(spesa['importo'])
-        
-        stats['spese_per_categoria'] = list(categorie_totali.values())
+        # Totali, km, rimborsi, ripartizione per categoria e ultime spese
+        # calcolati da Postgres in un'unica chiamata (vedi dashboard_stats in schema.sql)
+        response = get_client().rpc('dashboard_stats', {'p_da': primo_giorno_mese})
+        response.raise_for_status()
+        stats = response.json()
         
         return jsonify(stats), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# ============= REPORT =============
+
+def riferimenti_per_id():
+    # Anche categorie e veicoli disattivati: compaiono nei mesi passati
+    categorie = lista_riferimento('categorie', {'select': 'id,nome,colore'}, key='tutte')
+    veicoli = lista_riferimento('veicoli', {'select': 'id,targa,modello'}, key='tutti')
+    return {c['id']: c for c in categorie}, {v['id']: v for v in veicoli}
+
+@app.route('/api/report/mensile', methods=['GET'])
+def get_report_mensile():
+    try:
+        oggi = datetime.now()
+        anno = request.args.get('anno', oggi.year, type=int)
+        mese = request.args.get('mese', oggi.month, type=int)
+        categorie, veicoli = riferimenti_per_id()
+        return conditional_json(reports.report_mensile(get_client(), anno, mese, categorie, veicoli))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/report/annuale', methods=['GET'])
+def get_report_annuale():
+    try:
+        anno = request.args.get('anno', datetime.now().year, type=int)
+        categorie, veicoli = riferimenti_per_id()
+        return conditional_json(reports.report_annuale(get_client(), anno, categorie, veicoli))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/report/addebiti', methods=['GET'])
+def get_report_addebiti():
+    try:
+        cliente_id = request.args.get('cliente_id', type=int)
+        progetto_id = request.args.get('progetto_id', type=int)
+        da = request.args.get('da') or None
+        a = request.args.get('a') or None
+
+        # Riepilogo aggregato dal database e dettaglio letto a pagine,
+        # disegnato una pagina PDF alla volta (vedi billing.py)
+        with metrics.sezione('report_addebiti'):
+            path = billing.genera_pdf(get_client(), cliente_id, progetto_id, da, a)
+        filename = f"addebiti_{cliente_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+
+        return Response(
+            stream_with_context(exports.leggi_a_blocchi(path)),
+            mimetype=billing.PDF_MIMETYPE,
+            headers={
+                'Content-Disposition': f'attachment; filename={filename}',
+                'Content-Length': str(os.path.getsize(path))
+            }
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # ============= EXPORT EXCEL =============
 
 @app.route('/api/export/excel', methods=['POST'])
 def export_excel():
     try:
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, PatternFill, Alignment
-        
         data = request.get_json()
         tipo = data.get('tipo', 'spese')
         filtri = data.get('filtri', {})
         
-        wb = Workbook()
-        ws = wb.active
-        
         if tipo == 'spese':
-            ws.title = "Spese"
-            headers = ['Data', 'Categoria', 'Cliente', 'Progetto', 'Descrizione', 'Importo', 'Fornitore', 'Addebitabile']
-            ws.append(headers)
-            
-            # Formattazione header
-            for cell in ws[1]:
-                cell.font = Font(bold=True, color="FFFFFF")
-                cell.fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-                cell.alignment = Alignment(horizontal="center")
-            
-            # Recupera spese
-            url = f"{SUPABASE_URL}/rest/v1/spese"
-            params = {
-                'select': '*,categorie(nome),clienti(nome),progetti(nome)',
-                'order': 'data_spesa.desc'
-            }
-            if filtri.get('data_inizio'):
-                params['data_spesa'] = f'gte.{filtri["data_inizio"]}'
-            if filtri.get('data_fine'):
-                params['data_spesa'] = f'lte.{filtri["data_fine"]}'
-            if filtri.get('cliente_id'):
-                params['cliente_id'] = f'eq.{filtri["cliente_id"]}'
-                
-            response = requests.get(url, headers=get_supabase_headers(), params=params)
-            spese = response.json()
-            
-            for spesa in spese:
-                ws.append([
-                    spesa['data_spesa'],
-                    spesa['categorie']['nome'] if spesa.get('categorie') else '',
-                    spesa['clienti']['nome'] if spesa.get('clienti') else '',
-                    spesa['progetti']['nome'] if spesa.get('progetti') else '',
-                    spesa['descrizione'],
-                    float(spesa['importo']),
-                    spesa.get('fornitore', ''),
-                    'Sì' if spesa['addebitabile'] else 'No'
-                ])
-        
+            params = filtri_spese(filtri)
         elif tipo == 'chilometriche':
-            ws.title = "Chilometriche"
-            headers = ['Data', 'Veicolo', 'Partenza', 'Arrivo', 'Km', 'Tariffa', 'Rimborso', 'Cliente', 'Addebitabile']
-            ws.append(headers)
-            
-            # Formattazione header
-            for cell in ws[1]:
-                cell.font = Font(bold=True, color="FFFFFF")
-                cell.fill = PatternFill(start_color="10B981", end_color="10B981", fill_type="solid")
-                cell.alignment = Alignment(horizontal="center")
-            
-            # Recupera chilometriche
-            url = f"{SUPABASE_URL}/rest/v1/chilometriche"
-            params = {
-                'select': '*,veicoli(targa),clienti(nome)',
-                'order': 'data_viaggio.desc'
-            }
-            if filtri.get('data_inizio'):
-                params['data_viaggio'] = f'gte.{filtri["data_inizio"]}'
-            if filtri.get('data_fine'):
-                params['data_viaggio'] = f'lte.{filtri["data_fine"]}'
-            if filtri.get('veicolo_id'):
-                params['veicolo_id'] = f'eq.{filtri["veicolo_id"]}'
-                
-            response = requests.get(url, headers=get_supabase_headers(), params=params)
-            chilometriche = response.json()
-            
-            for km in chilometriche:
-                ws.append([
-                    km['data_viaggio'],
-                    km['veicoli']['targa'] if km.get('veicoli') else '',
-                    km['partenza'],
-                    km['arrivo'],
-                    float(km['km_percorsi']),
-                    float(km['tariffa_applicata']),
-                    float(km['rimborso_calcolato']),
-                    km['clienti']['nome'] if km.get('clienti') else '',
-                    'Sì' if km['addebitabile'] else 'No'
-                ])
-        
-        # Salva file
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
-        
+            params = filtri_chilometriche(filtri)
+        else:
+            return jsonify({'error': f'Tipo export non valido: {tipo}'}), 400
+        
+        # Letture a pagine + openpyxl write-only: memoria costante
+        # indipendentemente dal numero di righe (vedi exports.py)
+        with metrics.sezione(f'export_excel_{tipo}'):
+            path = exports.genera_excel(get_client(), tipo, params)
         filename = f"{tipo}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
         
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
+        return Response(
+            stream_with_context(exports.leggi_a_blocchi(path)),
+            mimetype=exports.XLSX_MIMETYPE,
+            headers={
+                'Content-Disposition': f'attachment; filename={filename}',
+                'Content-Length': str(os.path.getsize(path))
+            }
         )
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/export/<tipo>.<formato>', methods=['GET'])
+def export_testo(tipo, formato):
+    try:
+        if formato not in exports.FORMATI_TESTO:
+            return jsonify({'error': f'Formato export non valido: {formato}'}), 400
+        if tipo == 'spese':
+            params = filtri_spese(request.args)
+        elif tipo == 'chilometriche':
+            params = filtri_chilometriche(request.args)
+        else:
+            return jsonify({'error': f'Tipo export non valido: {tipo}'}), 400
+
+        # La prima pagina (piccola) si legge qui, così un errore di Supabase
+        # diventa ancora un 500; le altre mentre la risposta viene inviata
+        pagine = exports.pagine_testo(get_client(), tipo, params)
+        prima = next(pagine, [])
+        filename = f"{tipo}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{formato}"
+
+        return Response(
+            stream_with_context(exports.stream_testo(itertools.chain([prima], pagine), tipo, formato)),
+            mimetype=exports.FORMATI_TESTO[formato],
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ============= JOB IN BACKGROUND =============
+
+def job_json(job):
+    totale = job.get('totale')
+    return {
+        'job_id': job['id'],
+        'tipo': job['tipo'],
+        'stato': job['stato'],
+        'righe': job['righe'],
+        'totale': totale,
+        'progresso': round(min(job['righe'] / totale, 1), 3) if totale else None,
+        'cache': job['cache'],
+        'errore': job['errore'],
+        'status_url': f"/api/jobs/{job['id']}",
+        'download_url': f"/api/jobs/{job['id']}/download"
+    }
+
+def intero(valore, nome):
+    if valore in (None, ''):
+        return None
+    try:
+        return int(valore)
+    except (TypeError, ValueError):
+        raise ValueError(f'Parametro {nome} non valido')
+
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    try:
+        data = request.get_json() or {}
+        tipo = data.get('tipo')
+        filtri = data.get('filtri') or {}
+
+        argomenti = {}
+        if tipo == 'excel_spese':
+            params = filtri_spese(filtri)
+        elif tipo == 'excel_chilometriche':
+            params = filtri_chilometriche(filtri)
+        elif tipo == 'addebiti':
+            argomenti = {
+                'cliente_id': intero(filtri.get('cliente_id'), 'cliente_id'),
+                'progetto_id': intero(filtri.get('progetto_id'), 'progetto_id'),
+                'da': filtri.get('da') or None,
+                'a': filtri.get('a') or None
+            }
+            params = billing.parametri(**argomenti)
+        else:
+            return jsonify({'error': f'Tipo job non valido: {tipo}'}), 400
+
+        # Risposta immediata: l'export gira nel pool di jobs.py, oppure il
+        # file è già pronto per gli stessi filtri su dati invariati
+        try:
+            job = job_queue.submit(tipo, params, **argomenti)
+        except CodaPiena as e:
+            return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
+        return jsonify(job_json(job)), 200 if job['stato'] == 'completato' else 202
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    try:
+        job = job_queue.status(job_id)
+        if job is None:
+            return jsonify({'error': 'Job non trovato'}), 404
+        return jsonify(job_json(job)), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs/<job_id>/download', methods=['GET'])
+def job_download(job_id):
+    try:
+        job = job_queue.status(job_id)
+        if job is None:
+            return jsonify({'error': 'Job non trovato'}), 404
+        if job['stato'] != 'completato':
+            return jsonify({'error': f"Job non completato ({job['stato']})"}), 409
+        artifact = job_queue.artifact(job)
+        if artifact is None:
+            return jsonify({'error': 'File scaduto, ripetere l\'export'}), 410
+        path, mimetype = artifact
+        estensione = os.path.splitext(path)[1]
+        filename = f"{job['tipo']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}{estensione}"
+
+        # Il file resta su disco: serve anche alle richieste identiche successive
+        return Response(
+            stream_with_context(exports.leggi_a_blocchi(path, elimina=False)),
+            mimetype=mimetype,
+            headers={
+                'Content-Disposition': f'attachment; filename={filename}',
+                'Content-Length': str(os.path.getsize(path))
+            }
+        )
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ============= CACHE =============
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(reference_cache.stats()), 200
+
 # ============= HEALTH CHECK =============
 
 @app.route('/api/health', methods=['GET'])
@@ -596,6 +931,7 @@ def health_check():
         'status': 'ok',
         'timestamp': datetime.now().isoformat(),
         'supabase_configured': bool(SUPABASE_URL and SUPABASE_KEY),
+        'data_backend': os.getenv('DATA_BACKEND', 'postgrest'),
         'vision_configured': vision_client is not None
     }), 200
 
@@ -0,0 +1,207 @@
+"""
+File statici con nome hashato, precompressi e cache a lungo termine.
+
+All'avvio ogni file di static/ riceve un nome con l'impronta del
+contenuto (app.js -> app.3f2a9c1b.js) e viene compresso una volta sola
+in gzip e, se è installato il pacchetto brotli, in br. I riferimenti in
+index.html, manifest.json e service-worker.js vengono riscritti con i
+nomi hashati; il service worker riceve anche un CACHE_NAME che cambia
+con il contenuto, così il browser installa la nuova versione e scarta la
+cache precedente.
+
+Risposte:
+    nomi hashati       Cache-Control: public, max-age=31536000, immutable
+    index.html, manifest.json, service-worker.js e nomi originali
+                       Cache-Control: no-cache + ETag (304 se invariati)
+La codifica è scelta da Accept-Encoding (br, gzip, nessuna) con
+Vary: Accept-Encoding.
+
+Con ASSETS_ENABLED=0 i file vengono serviti così come sono (sviluppo).
+
+Uso da riga di comando (manifest e dimensioni, oppure file per un CDN):
+    python assets.py
+    python assets.py --out build/static
+"""
+import argparse
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+from flask import Response, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # compressione br opzionale
+    brotli = None
+
+# Riferiti da URL fissi: non si hashano ma vengono riscritti
+RISCRITTI = ('index.html', 'manifest.json', 'service-worker.js')
+
+IMMUTABILE = 'public, max-age=31536000, immutable'
+RIVALIDA = 'no-cache'
+
+# Sotto questa dimensione la compressione non ripaga
+MIN_COMPRESSIONE = 512
+
+CACHE_NAME = re.compile(r"(const CACHE_NAME = ')[^']*(')")
+
+
+class Asset:
+    def __init__(self, nome, corpo, cache_control):
+        self.nome = nome
+        self.content_type = mimetypes.guess_type(nome)[0] or 'application/octet-stream'
+        if self.content_type.startswith('text/') or self.content_type in ('application/javascript', 'application/json'):
+            self.content_type += '; charset=utf-8'
+        self.cache_control = cache_control
+        self.impronta = hashlib.sha256(corpo).hexdigest()
+        # codifica -> corpo; solo le compressioni che riducono davvero
+        self.corpi = {'identity': corpo}
+        if len(corpo) >= MIN_COMPRESSIONE:
+            compressi = {'gzip': gzip.compress(corpo, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                compressi['br'] = brotli.compress(corpo, quality=11)
+            for codifica, dati in compressi.items():
+                if len(dati) < len(corpo) * 0.9:
+                    self.corpi[codifica] = dati
+
+    def etag(self, codifica):
+        return f'{self.impronta[:16]}-{codifica}'
+
+    def codifica_per(self, accept_encoding):
+        for codifica in ('br', 'gzip'):
+            if codifica in self.corpi and accept_encoding[codifica]:
+                return codifica
+        return 'identity'
+
+
+class AssetPipeline:
+    """Indice dei file statici pronto in memoria: nessun accesso al disco per richiesta"""
+
+    def __init__(self, static_dir):
+        self.static_dir = static_dir
+        self.nomi = {}      # nome originale -> nome hashato
+        self.assets = {}    # percorso servito -> Asset
+        self.versione = ''
+        self.carica()
+
+    def carica(self):
+        originali = {}
+        for radice, _, files in os.walk(self.static_dir):
+            for file in files:
+                percorso = os.path.join(radice, file)
+                nome = os.path.relpath(percorso, self.static_dir).replace(os.sep, '/')
+                with open(percorso, 'rb') as f:
+                    originali[nome] = f.read()
+
+        nomi, assets = {}, {}
+        for nome, corpo in originali.items():
+            if nome in RISCRITTI:
+                continue
+            base, estensione = os.path.splitext(nome)
+            hashato = f'{base}.{hashlib.sha256(corpo).hexdigest()[:10]}{estensione}'
+            nomi[nome] = hashato
+            assets[hashato] = Asset(hashato, corpo, IMMUTABILE)
+            # Il nome originale resta valido per le pagine già in cache
+            assets[nome] = Asset(nome, corpo, RIVALIDA)
+        self.nomi = nomi
+
+        impronta = hashlib.sha256()
+        for nome in sorted(nomi.values()):
+            impronta.update(nome.encode())
+        riscritti = {nome: self.riscrivi(originali[nome].decode()) for nome in RISCRITTI if nome in originali}
+        for testo in riscritti.values():
+            impronta.update(testo.encode())
+        self.versione = impronta.hexdigest()[:10]
+
+        for nome, testo in riscritti.items():
+            if nome == 'service-worker.js':
+                testo = CACHE_NAME.sub(rf'\g<1>expense-tracker-{self.versione}\g<2>', testo)
+            assets[nome] = Asset(nome, testo.encode(), RIVALIDA)
+        self.assets = assets
+
+    def riscrivi(self, testo):
+        """Sostituisce i riferimenti ai file ("app.js", '/app.js') con i nomi hashati"""
+        for nome in sorted(self.nomi, key=len, reverse=True):
+            testo = re.sub(rf'(?<=["\'/]){re.escape(nome)}(?=["\'?#)])', self.nomi[nome], testo)
+        return testo
+
+    def url(self, nome):
+        return '/' + self.nomi.get(nome, nome)
+
+    def risposta(self, nome):
+        asset = self.assets.get(nome)
+        if asset is None:
+            # File aggiunti dopo l'avvio
+            return send_from_directory(self.static_dir, nome)
+
+        codifica = asset.codifica_per(request.accept_encodings)
+        etag = asset.etag(codifica)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(asset.corpi[codifica], content_type=asset.content_type)
+            if codifica != 'identity':
+                response.headers['Content-Encoding'] = codifica
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = asset.cache_control
+        if len(asset.corpi) > 1:
+            response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+    def scrivi(self, destinazione):
+        """File hashati e precompressi (.gz, .br) per un server statico o un CDN"""
+        estensioni = {'identity': '', 'gzip': '.gz', 'br': '.br'}
+        for nome, asset in self.assets.items():
+            for codifica, corpo in asset.corpi.items():
+                percorso = os.path.join(destinazione, nome + estensioni[codifica])
+                os.makedirs(os.path.dirname(percorso), exist_ok=True)
+                with open(percorso, 'wb') as f:
+                    f.write(corpo)
+
+
+class StaticDiretti:
+    """ASSETS_ENABLED=0: file serviti dal disco senza riscritture"""
+
+    def __init__(self, static_dir):
+        self.static_dir = static_dir
+
+    def url(self, nome):
+        return '/' + nome
+
+    def risposta(self, nome):
+        return send_from_directory(self.static_dir, nome)
+
+
+def assets_from_env(static_dir):
+    if os.getenv('ASSETS_ENABLED', '1') == '0':
+        return StaticDiretti(static_dir)
+    return AssetPipeline(static_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--static', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static'))
+    parser.add_argument('--out', help='Scrive i file hashati e precompressi in questa cartella')
+    args = parser.parse_args()
+
+    pipeline = AssetPipeline(args.static)
+    print(f'Versione cache service worker: expense-tracker-{pipeline.versione}')
+    if brotli is None:
+        print('brotli non installato: solo gzip')
+    print(f'{"file":<44} {"originale":>10} {"gzip":>8} {"br":>8}')
+    for nome in sorted(pipeline.assets):
+        asset = pipeline.assets[nome]
+        if asset.cache_control != IMMUTABILE and nome not in RISCRITTI:
+            continue
+        corpi = asset.corpi
+        print(f'{nome:<44} {len(corpi["identity"]):>10,} {len(corpi.get("gzip", b"")) or "-":>8} '
+              f'{len(corpi.get("br", b"")) or "-":>8}')
+    if args.out:
+        pipeline.scrivi(args.out)
+        print(f'File scritti in {args.out}')
+
+
+if __name__ == '__main__':
+    main()
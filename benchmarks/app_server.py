@@ -0,0 +1,32 @@
+"""
+Avvia app.py da una directory qualsiasi (es. un worktree git di un altro
+commit) su un server WSGI locale, per bench_endpoints.py.
+
+Il processo importa solo l'app della directory indicata: i moduli del
+working tree corrente non vengono mescolati con quelli del commit
+misurato. Stampa la porta su stdout e resta in ascolto.
+
+Uso (di solito lanciato da bench_endpoints.py):
+    SUPABASE_URL=http://127.0.0.1:54321 python benchmarks/app_server.py /percorso/app
+"""
+import logging
+import os
+import sys
+
+
+def main():
+    app_dir = os.path.abspath(sys.argv[1])
+    sys.path.insert(0, app_dir)
+    os.chdir(app_dir)
+
+    from werkzeug.serving import make_server
+    import app as app_module
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+    print(server.server_port, flush=True)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
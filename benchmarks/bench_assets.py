@@ -0,0 +1,81 @@
+"""
+Benchmark dei file statici: byte e richieste per prima visita e visita
+successiva, con e senza la pipeline di assets.py.
+
+Simula un browser con la cache HTTP: alla prima visita scarica la pagina
+e i file che richiama, alla successiva salta le risposte immutable e
+rivalida le altre con If-None-Match: ogni richiesta rimasta è un giro
+di rete in più su mobile.
+
+Uso:
+    python benchmarks/bench_assets.py
+"""
+import argparse
+import gzip
+import os
+import re
+import sys
+
+from flask import Flask
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from assets import AssetPipeline, StaticDiretti  # noqa: E402
+
+STATIC_DIR = os.path.join(REPO_ROOT, 'static')
+RIFERIMENTI = re.compile(r'(?:href|src)="([^"#:]+)"')
+
+
+def app_per(assets):
+    app = Flask(__name__, static_folder=None)
+    app.add_url_rule('/', 'index', lambda: assets.risposta('index.html'))
+    app.add_url_rule('/<path:filename>', 'file', lambda filename: assets.risposta(filename))
+    return app
+
+
+def visita(client, cache):
+    """Una visita: restituisce (richieste, byte trasferiti)"""
+    richieste, byte = 0, 0
+    pagina = None
+    percorsi = ['/']
+    while percorsi:
+        percorso = percorsi.pop(0)
+        in_cache = cache.get(percorso)
+        if in_cache and 'immutable' in in_cache['cache_control']:
+            corpo = in_cache['corpo']
+        else:
+            headers = {'Accept-Encoding': 'br, gzip'}
+            if in_cache and in_cache['etag']:
+                headers['If-None-Match'] = in_cache['etag']
+            response = client.get(percorso, headers=headers)
+            richieste += 1
+            byte += len(response.data) + sum(len(k) + len(v) + 4 for k, v in response.headers.items())
+            if response.status_code == 304:
+                corpo = in_cache['corpo']
+            else:
+                corpo = response.get_data()
+                if response.headers.get('Content-Encoding') == 'gzip':
+                    corpo = gzip.decompress(corpo)
+                cache[percorso] = {'corpo': corpo, 'etag': response.headers.get('ETag'),
+                                   'cache_control': response.headers.get('Cache-Control') or ''}
+        if pagina is None:
+            pagina = corpo.decode()
+            percorsi.extend(dict.fromkeys('/' + r.lstrip('/') for r in RIFERIMENTI.findall(pagina)))
+    return richieste, byte
+
+
+def main():
+    argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter).parse_args()
+
+    print(f'{"modalità":<22} {"visita":<11} {"richieste":>9} {"byte":>9}')
+    for etichetta, assets in (('file diretti', StaticDiretti(STATIC_DIR)), ('assets.py', AssetPipeline(STATIC_DIR))):
+        client = app_per(assets).test_client()
+        cache = {}
+        for visita_nome in ('prima', 'successiva'):
+            richieste, byte = visita(client, cache)
+            print(f'{etichetta:<22} {visita_nome:<11} {richieste:>9} {byte:>9,}')
+
+
+if __name__ == '__main__':
+    main()
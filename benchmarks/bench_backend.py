@@ -0,0 +1,101 @@
+"""
+Confronto dei backend dati: PostgREST (HTTP) vs PostgreSQL diretto.
+
+Esegue le stesse letture dell'app con SupabaseClient e PostgresClient
+sullo stesso database, verifica che le risposte JSON coincidano e riporta
+la latenza p50/p95 per query. Infine misura la lettura completa per
+l'export: paginazione keyset su PostgREST vs cursore lato server.
+
+Serve un database con lo schema di database/schema.sql e dei dati (es.
+populate_demo_data.py --scale 1), raggiungibile sia via PostgREST sia
+direttamente:
+    SUPABASE_URL, SUPABASE_KEY   API PostgREST (Supabase o PostgREST locale)
+    DATABASE_URL                 connessione diretta allo stesso database
+
+Uso:
+    python benchmarks/bench_backend.py --repeat 50
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pagination import fetch_page, iter_pages  # noqa: E402
+from postgres_client import postgres_client_from_env  # noqa: E402
+from supabase_client import client_from_env  # noqa: E402
+
+SPESE_SELECT = '*,categorie(nome,colore),clienti(nome),progetti(nome)'
+FILTRI = {'data_spesa': ['gte.2025-01-01', 'lte.2025-12-31']}
+
+# nome, funzione(client) -> dati confrontabili
+QUERY = [
+    ('categorie', lambda c: c.get('categorie', params={'attiva': 'eq.true'}).json()),
+    ('clienti', lambda c: c.get('clienti', params={'attivo': 'eq.true', 'order': 'nome.asc'}).json()),
+    ('spese pagina', lambda c: fetch_page(c, 'spese', {'select': SPESE_SELECT}, 'data_spesa', 50)[0]),
+    ('spese filtrate', lambda c: fetch_page(c, 'spese', dict(FILTRI, select=SPESE_SELECT), 'data_spesa', 50)[0]),
+    ('impronta', lambda c: c.get('spese', params=dict(FILTRI, select='updated_at', limit='1',
+                                                          order='updated_at.desc.nullslast'),
+                                 headers={'Prefer': 'count=exact'}).headers.get('Content-Range')),
+    ('dashboard', lambda c: c.rpc('dashboard_stats', {'p_da': '2025-01-01'}).json()),
+    ('totali km', lambda c: c.rpc('totali_chilometriche', {'p_da': None, 'p_a': None,
+                                                            'p_veicolo_id': None, 'p_cliente_id': None}).json()),
+]
+
+
+def normalizza(dati):
+    # PostgREST e Postgres possono differire solo nell'ordine delle chiavi
+    return json.dumps(dati, sort_keys=True)
+
+
+def misura(funzione, client, ripetizioni):
+    tempi = []
+    for _ in range(ripetizioni):
+        inizio = time.perf_counter()
+        funzione(client)
+        tempi.append(time.perf_counter() - inizio)
+    tempi.sort()
+    return statistics.median(tempi) * 1000, tempi[int(0.95 * (len(tempi) - 1))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=30, help='Ripetizioni per query')
+    parser.add_argument('--page-size', type=int, default=1000, help='Blocco per la lettura completa')
+    args = parser.parse_args()
+
+    if not os.getenv('DATABASE_URL') or not os.getenv('SUPABASE_URL'):
+        sys.exit('Servono DATABASE_URL e SUPABASE_URL/SUPABASE_KEY sullo stesso database')
+
+    rest = client_from_env()
+    pg = postgres_client_from_env()
+    diverse = []
+
+    print(f'{"query":<16} {"rest p50":>9} {"rest p95":>9} {"pg p50":>8} {"pg p95":>8} {"uguali":>7}')
+    for nome, funzione in QUERY:
+        uguali = normalizza(funzione(rest)) == normalizza(funzione(pg))
+        if not uguali:
+            diverse.append(nome)
+        r50, r95 = misura(funzione, rest, args.repeat)
+        p50, p95 = misura(funzione, pg, args.repeat)
+        print(f'{nome:<16} {r50:>9.1f} {r95:>9.1f} {p50:>8.1f} {p95:>8.1f} {"sì" if uguali else "NO":>7}')
+
+    print(f'\nLettura completa spese (blocchi da {args.page_size})')
+    for etichetta, client in (('PostgREST keyset', rest), ('cursore lato server', pg)):
+        inizio = time.perf_counter()
+        righe = sum(len(p) for p in iter_pages(client, 'spese', {'select': SPESE_SELECT}, 'data_spesa',
+                                               args.page_size))
+        durata = time.perf_counter() - inizio
+        print(f'  {etichetta:<20} {righe:>9,} righe  {durata:>7.2f} s  {righe / durata:>10,.0f} righe/s')
+
+    rest.close()
+    pg.close()
+    if diverse:
+        sys.exit(f"Risposte diverse tra i backend: {', '.join(diverse)}")
+
+
+if __name__ == '__main__':
+    main()
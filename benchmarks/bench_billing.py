@@ -0,0 +1,121 @@
+"""
+Benchmark report addebiti PDF: platypus in memoria vs canvas a pagine.
+
+Per ogni dimensione esegue le due modalità in un sottoprocesso separato e
+riporta tempo, picco di memoria residente (ru_maxrss), pagine e
+dimensione del file. Le spese sono sintetiche e arrivano a pagine da
+1000, come dalla paginazione keyset:
+    platypus   tutte le righe in una Table di SimpleDocTemplate, il modo
+               abituale di fare tabelle con reportlab
+    canvas     billing.scrivi_pdf: una pagina PDF alla volta, ogni
+               colonna in un oggetto testo (quello usato dall'app)
+
+Uso:
+    python benchmarks/bench_billing.py --rows 1000 10000 100000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PAGE_SIZE = 1000
+PROGETTI = ['Cantiere Brescia', 'Manutenzione linea 5', 'Collaudo impianto', None]
+CATEGORIE = ['Carburante', 'Pedaggi', 'Ristoranti', 'Alberghi', 'Materiali']
+
+
+def pagine_sintetiche(n):
+    for start in range(0, n, PAGE_SIZE):
+        yield [{
+            'id': n - i,
+            'data_spesa': f'2025-{12 - i % 12:02d}-{28 - i % 28:02d}',
+            'descrizione': f'Spesa di prova numero {i} per il cantiere, descrizione lunga',
+            'fornitore': f'Fornitore {i % 30}',
+            'numero_documento': f'FT-{i}',
+            'importo': f'{(i % 500) + 0.5:.2f}',
+            'categorie': {'nome': CATEGORIE[i % len(CATEGORIE)]},
+            'progetti': {'nome': PROGETTI[i % len(PROGETTI)]} if PROGETTI[i % len(PROGETTI)] else None,
+        } for i in range(start, min(start + PAGE_SIZE, n))]
+
+
+def riepilogo(n):
+    return {
+        'cliente': 'Cliente di prova',
+        'progetto': None,
+        'num_voci': n,
+        'totale': sum((i % 500) + 0.5 for i in range(n)),
+        'righe': [{'progetto': p, 'categoria': c, 'num_voci': n // 20, 'totale': 1000.0}
+                  for p in PROGETTI for c in CATEGORIE],
+    }
+
+
+def esegui_platypus(path, n):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
+    from billing import COLONNE, voce
+
+    righe = [[nome for nome, _, _ in COLONNE]]
+    righe += [voce(r) for pagina in pagine_sintetiche(n) for r in pagina]
+    tabella = Table(righe, colWidths=[larghezza for _, larghezza, _ in COLONNE], repeatRows=1)
+    tabella.setStyle(TableStyle([('FONT', (0, 0), (-1, -1), 'Helvetica', 8),
+                                 ('FONT', (0, 0), (-1, 0), 'Helvetica-Bold', 8),
+                                 ('ALIGN', (-1, 0), (-1, -1), 'RIGHT')]))
+    pagine = []
+    doc = SimpleDocTemplate(path, pagesize=A4, leftMargin=36, rightMargin=36, topMargin=36, bottomMargin=36)
+    doc.build([tabella], onLaterPages=lambda c, d: pagine.append(1), onFirstPage=lambda c, d: pagine.append(1))
+    return len(pagine)
+
+
+def esegui_canvas(path, n):
+    from billing import scrivi_pdf
+
+    return scrivi_pdf(path, riepilogo(n), pagine_sintetiche(n))
+
+
+def figlio(modalita, n):
+    fd, path = tempfile.mkstemp(suffix='.pdf')
+    os.close(fd)
+    try:
+        start = time.perf_counter()
+        pagine = (esegui_platypus if modalita == 'platypus' else esegui_canvas)(path, n)
+        elapsed = time.perf_counter() - start
+        size = os.path.getsize(path)
+    finally:
+        os.remove(path)
+    # ru_maxrss è in KiB su Linux
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({'secondi': elapsed, 'rss_mb': rss, 'pagine': pagine, 'byte': size}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--max-platypus', type=int, default=10000,
+                        help='Salta la modalità platypus oltre questo numero di righe')
+    parser.add_argument('--figlio', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.figlio:
+        figlio(args.figlio[0], int(args.figlio[1]))
+        return
+
+    print(f'{"righe":>9} {"modalità":<10} {"tempo (s)":>10} {"picco RSS (MB)":>15} {"pagine":>8} {"file (MB)":>10}')
+    for n in args.rows:
+        for modalita in ('platypus', 'canvas'):
+            if modalita == 'platypus' and n > args.max_platypus:
+                print(f'{n:>9} {modalita:<10} {"saltato":>10}')
+                continue
+            out = subprocess.run([sys.executable, __file__, '--figlio', modalita, str(n)],
+                                 capture_output=True, text=True, check=True).stdout
+            r = json.loads(out)
+            print(f'{n:>9} {modalita:<10} {r["secondi"]:>10.2f} {r["rss_mb"]:>15.1f} {r["pagine"]:>8,} '
+                  f'{r["byte"] / 1e6:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
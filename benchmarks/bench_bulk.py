@@ -0,0 +1,98 @@
+"""
+Benchmark inserimento: un POST per riga vs endpoint /bulk.
+
+Avvia l'app su un server WSGI locale collegato al PostgREST finto e
+inserisce N chilometriche, prima con POST /api/chilometriche (una
+richiesta HTTP e un insert PostgREST per riga, come fa oggi il client)
+e poi con POST /api/chilometriche/bulk. Riporta righe/s e numero di
+chiamate a PostgREST.
+
+Con --latency-ms si simula la latenza di rete verso Supabase.
+
+Uso:
+    python benchmarks/bench_bulk.py --rows 200 2000 --latency-ms 20
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_postgrest import FakeSupabase, FakeSupabaseServer  # noqa: E402
+
+
+def viaggi(n, seed=42):
+    rnd = random.Random(seed)
+    return [{
+        'data_viaggio': f'2026-01-{rnd.randint(1, 28):02d}',
+        'partenza': 'Milano',
+        'arrivo': rnd.choice(['Torino', 'Bergamo', 'Brescia', 'Como']),
+        'km_percorsi': rnd.randint(10, 300),
+        'tariffa_applicata': 0.4523,
+        'veicolo_id': 1,
+    } for _ in range(n)]
+
+
+def singoli(base_url, records):
+    sessione = requests.Session()
+    for record in records:
+        sessione.post(f'{base_url}/api/chilometriche', json=record).raise_for_status()
+
+
+def bulk(base_url, records, batch):
+    sessione = requests.Session()
+    for start in range(0, len(records), batch):
+        r = sessione.post(f'{base_url}/api/chilometriche/bulk', json=records[start:start + batch])
+        r.raise_for_status()
+        assert not r.json()['errori'], r.json()['errori'][:3]
+
+
+def misura(label, fake, n, call):
+    fake.requests = 0
+    inizio = time.perf_counter()
+    call()
+    durata = time.perf_counter() - inizio
+    print(f'{label:<10} {n:>7} {durata:>9.2f} s {n / durata:>10.0f} righe/s {fake.requests:>10}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[200, 2000])
+    parser.add_argument('--batch', type=int, default=5000, help='Record per richiesta /bulk')
+    parser.add_argument('--latency-ms', type=float, default=20.0)
+    args = parser.parse_args()
+
+    fake = FakeSupabase(latency=args.latency_ms / 1000)
+    fake_server = FakeSupabaseServer(fake).start()
+    os.environ['SUPABASE_URL'] = fake_server.url
+    os.environ['SUPABASE_KEY'] = 'bench'
+    os.environ['SUPABASE_SERVICE_KEY'] = 'bench'
+
+    from werkzeug.serving import make_server
+    import app as app_module
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+
+    print(f'Latenza PostgREST simulata: {args.latency_ms:.0f} ms, blocchi da {app_module.BULK_CHUNK_SIZE} righe\n')
+    print(f'{"modalità":<10} {"righe":>7} {"tempo":>11} {"throughput":>17} {"PostgREST":>10}')
+    for n in args.rows:
+        records = viaggi(n)
+        misura('singoli', fake, n, lambda: singoli(base_url, records))
+        misura('bulk', fake, n, lambda: bulk(base_url, records, args.batch))
+
+    server.shutdown()
+    fake_server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""
+Benchmark del modello di concorrenza: gunicorn sync vs gthread.
+
+Avvia l'app con gunicorn contro il PostgREST finto (latenza --latency-ms
+per chiamata) con lo stesso numero di processi nei due modi:
+    sync     una richiesta alla volta per processo (il vecchio Procfile)
+    gthread  --threads richieste per processo (gunicorn.conf.py)
+e per ogni livello di --concurrency riporta req/s, p50/p95 e la memoria
+residente (RSS) complessiva dei worker a fine misura.
+
+Le richieste alternano lista paginata di spese, prima pagina delle
+chilometriche (pagina + totali), report mensile e categorie: le prime tre
+fanno più chiamate indipendenti a Supabase, che partono in parallelo.
+
+Uso:
+    python benchmarks/bench_concurrency.py --workers 2 --threads 16 --concurrency 1 16 64
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.fake_postgrest import FakeSupabase, FakeSupabaseServer  # noqa: E402
+from demo_data import carica_fake  # noqa: E402
+
+PERCORSI = [
+    '/api/spese?limit=50',
+    '/api/chilometriche?limit=50',
+    '/api/report/mensile?anno=2026&mese=3',
+    '/api/categorie',
+]
+
+
+def porta_libera():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def avvia_gunicorn(modo, workers, threads, supabase_url):
+    porta = porta_libera()
+    env = dict(os.environ, SUPABASE_URL=supabase_url, SUPABASE_KEY='bench', SUPABASE_SERVICE_KEY='bench',
+               WEB_CONCURRENCY=str(workers), GUNICORN_THREADS=str(threads))
+    comando = [sys.executable, '-m', 'gunicorn', 'app:app', '-c', 'gunicorn.conf.py',
+               '--bind', f'127.0.0.1:{porta}', '--log-level', 'warning']
+    if modo == 'sync':
+        # Con threads > 1 gunicorn passerebbe da solo a gthread
+        comando += ['--worker-class', 'sync', '--threads', '1']
+    processo = subprocess.Popen(comando, cwd=REPO_ROOT, env=env)
+    base_url = f'http://127.0.0.1:{porta}'
+    for _ in range(100):
+        try:
+            requests.get(f'{base_url}/api/health', timeout=1)
+            return processo, base_url
+        except requests.RequestException:
+            time.sleep(0.1)
+    processo.terminate()
+    raise RuntimeError(f'gunicorn ({modo}) non si è avviato')
+
+
+def rss_worker(pid_master):
+    """RSS totale (MB) dei processi figli del master gunicorn, da /proc"""
+    totale = 0
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f'/proc/{pid}/status') as f:
+                status = dict(riga.split(':', 1) for riga in f if ':' in riga)
+        except OSError:
+            continue
+        if int(status['PPid']) == pid_master and 'VmRSS' in status:
+            totale += int(status['VmRSS'].split()[0])
+    return totale / 1024
+
+
+def misura(base_url, richieste, concurrency):
+    latenze, errori = [], [0]
+    lock = threading.Lock()
+    contatore = iter(range(richieste))
+
+    def worker():
+        sessione = requests.Session()
+        while True:
+            with lock:
+                n = next(contatore, None)
+            if n is None:
+                return
+            inizio = time.perf_counter()
+            try:
+                ok = sessione.get(base_url + PERCORSI[n % len(PERCORSI)], timeout=60).status_code < 400
+            except requests.RequestException:
+                ok = False
+            durata = time.perf_counter() - inizio
+            with lock:
+                latenze.append(durata)
+                errori[0] += not ok
+
+    inizio = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    totale = time.perf_counter() - inizio
+    latenze.sort()
+    return {
+        'rps': len(latenze) / totale,
+        'p50': statistics.median(latenze) * 1000,
+        'p95': latenze[int(0.95 * (len(latenze) - 1))] * 1000,
+        'errori': errori[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=float, default=0.02, help='Scala del dataset (1 = 100.000 spese)')
+    parser.add_argument('--latency-ms', type=float, default=50.0, help='Latenza simulata verso Supabase')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=200, help='Richieste per livello')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 16, 64])
+    args = parser.parse_args()
+
+    fake = FakeSupabase(latency=args.latency_ms / 1000)
+    carica_fake(fake, args.scale, 42)
+    fake.ricalcola_rollup()
+    fake_server = FakeSupabaseServer(fake).start()
+
+    print(f'Latenza PostgREST {args.latency_ms:.0f} ms, {args.workers} worker, {args.threads} thread (gthread)')
+    print(f'{"modo":<8} {"conc.":>5} {"req/s":>8} {"p50 ms":>9} {"p95 ms":>9} {"err":>4} {"RSS MB":>8}')
+    try:
+        for modo in ('sync', 'gthread'):
+            processo, base_url = avvia_gunicorn(modo, args.workers, args.threads, fake_server.url)
+            try:
+                misura(base_url, 2 * len(PERCORSI) * args.workers, args.workers)  # riscaldamento
+                for concurrency in args.concurrency:
+                    r = misura(base_url, max(args.requests, concurrency), concurrency)
+                    print(f'{modo:<8} {concurrency:>5} {r["rps"]:>8.1f} {r["p50"]:>9.1f} {r["p95"]:>9.1f} '
+                          f'{r["errori"]:>4} {rss_worker(processo.pid):>8.1f}')
+            finally:
+                processo.terminate()
+                processo.wait()
+    finally:
+        fake_server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
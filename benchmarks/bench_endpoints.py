@@ -0,0 +1,256 @@
+"""
+Benchmark delle route di app.py contro il PostgREST finto.
+
+Per ogni target (il working tree, oppure due commit con --compare):
+    1. avvia fake_postgrest con il dataset di demo_data.py (--scale, --seed)
+       e la latenza verso Supabase indicata da --latency-ms
+    2. avvia l'app del target in un processo separato (app_server.py)
+    3. esegue ogni route con i livelli di --concurrency e riporta
+       p50/p95/p99 e richieste al secondo
+
+Con --compare i due commit vengono estratti in worktree temporanei e
+misurati con lo stesso dataset. Le route il cui p95 peggiora più di
+--threshold sono segnalate e lo script termina con codice 1, così può
+girare in CI.
+
+Uso:
+    python benchmarks/bench_endpoints.py --concurrency 1 8 --requests 200
+    python benchmarks/bench_endpoints.py --routes spese dashboard --latency-ms 20
+    python benchmarks/bench_endpoints.py --compare HEAD~1 HEAD --json risultati.json
+"""
+import argparse
+import io
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.fake_postgrest import FakeSupabase, FakeSupabaseServer  # noqa: E402
+from demo_data import carica_fake  # noqa: E402
+
+SPESA = {'data_spesa': '2026-03-02', 'categoria_id': 1, 'importo': 12.5, 'descrizione': 'Pedaggio benchmark'}
+
+
+def immagine_jpeg():
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new('RGB', (1600, 1200), (200, 180, 150)).save(buffer, format='JPEG', quality=85)
+    return buffer.getvalue()
+
+
+# nome, metodo, percorso, opzioni: json, files, condizionale (If-None-Match), peso (frazione di --requests)
+ROUTE = [
+    ('health', 'GET', '/api/health', {}),
+    ('categorie', 'GET', '/api/categorie', {}),
+    ('clienti', 'GET', '/api/clienti', {}),
+    ('veicoli', 'GET', '/api/veicoli', {}),
+    ('progetti', 'GET', '/api/progetti?cliente_id=1', {}),
+    ('spese pagina', 'GET', '/api/spese?limit=50', {}),
+    ('spese filtrate', 'GET', '/api/spese?limit=50&data_inizio=2026-01-01&data_fine=2026-03-31&cliente_id=1', {}),
+    ('spese 304', 'GET', '/api/spese?limit=50', {'condizionale': True}),
+    ('spese tutte', 'GET', '/api/spese', {'peso': 0.1}),
+    ('km pagina', 'GET', '/api/chilometriche?limit=50', {}),
+    ('dashboard', 'GET', '/api/stats/dashboard', {}),
+    ('report mensile', 'GET', '/api/report/mensile?anno=2026&mese=3', {}),
+    ('report annuale', 'GET', '/api/report/annuale?anno=2026', {}),
+    ('nuova spesa', 'POST', '/api/spese', {'json': SPESA}),
+    ('modifica spesa', 'PUT', '/api/spese/1', {'json': {'note': 'benchmark'}}),
+    ('bulk spese', 'POST', '/api/spese/bulk', {'json': [SPESA] * 100, 'peso': 0.2}),
+    ('upload', 'POST', '/api/upload', {'immagine': True, 'peso': 0.2}),
+    ('export excel', 'POST', '/api/export/excel', {'json': {'tipo': 'spese'}, 'peso': 0.05}),
+    ('export csv', 'GET', '/api/export/spese.csv', {'peso': 0.05}),
+    ('export ndjson', 'GET', '/api/export/spese.ndjson', {'peso': 0.05}),
+]
+
+
+def percentile(valori, p):
+    valori = sorted(valori)
+    return valori[min(len(valori) - 1, int(round(p / 100 * (len(valori) - 1))))]
+
+
+def misura_route(base_url, route, richieste, concurrency, immagine):
+    nome, metodo, percorso, opzioni = route
+    url = base_url + percorso
+    headers = {}
+    if opzioni.get('condizionale'):
+        etag = requests.get(url).headers.get('ETag')
+        if etag:
+            headers['If-None-Match'] = etag
+
+    latenze, errori = [], [0]
+    lock = threading.Lock()
+    contatore = iter(range(richieste))
+
+    def worker():
+        sessione = requests.Session()
+        while True:
+            with lock:
+                if next(contatore, None) is None:
+                    return
+            kwargs = {'headers': headers}
+            if 'json' in opzioni:
+                kwargs['json'] = opzioni['json']
+            if opzioni.get('immagine'):
+                kwargs['files'] = {'file': ('ricevuta.jpg', immagine, 'image/jpeg')}
+            inizio = time.perf_counter()
+            try:
+                response = sessione.request(metodo, url, **kwargs)
+                response.content
+                ok = response.status_code < 400
+            except requests.RequestException:
+                ok = False
+            durata = time.perf_counter() - inizio
+            with lock:
+                latenze.append(durata)
+                if not ok:
+                    errori[0] += 1
+
+    inizio = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    totale = time.perf_counter() - inizio
+
+    return {
+        'route': nome,
+        'concurrency': concurrency,
+        'richieste': len(latenze),
+        'errori': errori[0],
+        'p50': statistics.median(latenze) * 1000,
+        'p95': percentile(latenze, 95) * 1000,
+        'p99': percentile(latenze, 99) * 1000,
+        'rps': len(latenze) / totale,
+    }
+
+
+def avvia_app(app_dir, supabase_url):
+    env = dict(os.environ, SUPABASE_URL=supabase_url, SUPABASE_KEY='bench', SUPABASE_SERVICE_KEY='bench',
+               IMAGE_MAX_PENDING='10000')
+    processo = subprocess.Popen([sys.executable, os.path.join(REPO_ROOT, 'benchmarks', 'app_server.py'), app_dir],
+                                env=env, stdout=subprocess.PIPE, text=True)
+    porta = processo.stdout.readline().strip()
+    if not porta:
+        processo.wait()
+        raise RuntimeError(f"L'app in {app_dir} non si è avviata")
+    base_url = f'http://127.0.0.1:{porta}'
+    for _ in range(50):
+        try:
+            requests.get(f'{base_url}/api/health', timeout=1)
+            break
+        except requests.RequestException:
+            time.sleep(0.1)
+    return processo, base_url
+
+
+def esegui_target(etichetta, app_dir, args, routes, immagine):
+    fake = FakeSupabase(latency=args.latency_ms / 1000)
+    dataset = carica_fake(fake, args.scale, args.seed)
+    fake.ricalcola_rollup()
+    fake_server = FakeSupabaseServer(fake).start()
+    processo, base_url = avvia_app(app_dir, fake_server.url)
+
+    print(f'\n== {etichetta}: {dataset.num_spese:,} spese, {dataset.num_viaggi:,} viaggi, '
+          f'latenza PostgREST {args.latency_ms:.0f} ms ==')
+    print(f'{"route":<16} {"conc.":>5} {"req":>5} {"err":>4} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"req/s":>8}')
+    risultati = []
+    try:
+        for route in routes:
+            richieste = max(2, int(args.requests * route[3].get('peso', 1)))
+            # Riscaldamento: cache, pool di connessioni, pool di processi
+            misura_route(base_url, route, min(3, richieste), 1, immagine)
+            for concurrency in args.concurrency:
+                r = misura_route(base_url, route, richieste, concurrency, immagine)
+                risultati.append(r)
+                print(f'{r["route"]:<16} {concurrency:>5} {r["richieste"]:>5} {r["errori"]:>4} {r["p50"]:>9.1f} '
+                      f'{r["p95"]:>9.1f} {r["p99"]:>9.1f} {r["rps"]:>8.1f}')
+    finally:
+        processo.terminate()
+        processo.wait()
+        fake_server.shutdown()
+    return risultati
+
+
+def confronta(base, nuovo, etichette, threshold):
+    print(f'\n== Confronto p95: {etichette[0]} -> {etichette[1]} (soglia +{threshold:.0%}) ==')
+    print(f'{"route":<16} {"conc.":>5} {"p95 prima":>10} {"p95 dopo":>10} {"delta":>8} {"req/s prima":>12} {"req/s dopo":>11}')
+    indice = {(r['route'], r['concurrency']): r for r in base}
+    regressioni = []
+    for r in nuovo:
+        prima = indice.get((r['route'], r['concurrency']))
+        if not prima:
+            continue
+        if prima['errori'] or r['errori']:
+            # Route assente o in errore in uno dei due commit: non confrontabile
+            print(f'{r["route"]:<16} {r["concurrency"]:>5} {"n/d":>10} {"n/d":>10}')
+            continue
+        delta = r['p95'] / prima['p95'] - 1 if prima['p95'] else 0.0
+        segnale = '  <-- regressione' if delta > threshold else ''
+        if segnale:
+            regressioni.append(r['route'])
+        print(f'{r["route"]:<16} {r["concurrency"]:>5} {prima["p95"]:>10.1f} {r["p95"]:>10.1f} {delta:>+8.0%} '
+              f'{prima["rps"]:>12.1f} {r["rps"]:>11.1f}{segnale}')
+    return regressioni
+
+
+def worktree(rev, destinazione):
+    subprocess.run(['git', '-C', REPO_ROOT, 'worktree', 'add', '--detach', destinazione, rev],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=float, default=0.1, help='Scala del dataset (1 = 100.000 spese)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--latency-ms', type=float, default=5.0, help='Latenza simulata verso Supabase')
+    parser.add_argument('--requests', type=int, default=100, help='Richieste per route e livello')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--routes', nargs='+', help='Solo le route il cui nome contiene uno di questi testi')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NUOVO'), help='Confronta due commit')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Peggioramento p95 tollerato')
+    parser.add_argument('--json', help='Salva i risultati in un file JSON')
+    args = parser.parse_args()
+
+    routes = [r for r in ROUTE if not args.routes or any(f in r[0] for f in args.routes)]
+    immagine = immagine_jpeg()
+
+    if not args.compare:
+        risultati = {'working tree': esegui_target('working tree', REPO_ROOT, args, routes, immagine)}
+        regressioni = []
+    else:
+        tmp = tempfile.mkdtemp(prefix='bench-endpoints-')
+        risultati = {}
+        try:
+            for rev in args.compare:
+                destinazione = os.path.join(tmp, rev.replace('/', '_').replace('~', '_').replace('^', '_'))
+                worktree(rev, destinazione)
+                risultati[rev] = esegui_target(rev, destinazione, args, routes, immagine)
+        finally:
+            for rev in os.listdir(tmp):
+                subprocess.run(['git', '-C', REPO_ROOT, 'worktree', 'remove', '--force', os.path.join(tmp, rev)],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            shutil.rmtree(tmp, ignore_errors=True)
+        regressioni = confronta(risultati[args.compare[0]], risultati[args.compare[1]], args.compare,
+                                args.threshold)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'parametri': vars(args), 'risultati': risultati}, f, indent=2)
+    if regressioni:
+        print(f"\nRegressioni: {', '.join(sorted(set(regressioni)))}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
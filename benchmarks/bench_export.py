@@ -0,0 +1,122 @@
+"""
+Benchmark export: Excel in memoria, Excel write-only a pagine, CSV e NDJSON.
+
+Per ogni dimensione esegue ogni modalità in un sottoprocesso separato e
+riporta tempo, picco di memoria residente (ru_maxrss) e, per CSV e NDJSON,
+il tempo fino al primo blocco della risposta. Le righe sono sintetiche e
+vengono prodotte a pagine da 1000, come dalla paginazione keyset; la
+modalità "memoria" le accumula tutte prima di scrivere, come faceva
+export_excel con response.json().
+
+Uso:
+    python benchmarks/bench_export.py --rows 10000 100000 1000000
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PAGE_SIZE = 1000
+
+
+def pagine_sintetiche(n):
+    for start in range(0, n, PAGE_SIZE):
+        yield [{
+            'id': i,
+            'data_spesa': f'2024-{(i % 12) + 1:02d}-{(i % 28) + 1:02d}',
+            'categorie': {'nome': 'Carburante'},
+            'clienti': {'nome': f'Cliente {i % 50}'},
+            'progetti': None,
+            'descrizione': f'Spesa di prova numero {i}',
+            'importo': f'{(i % 500) + 0.5:.2f}',
+            'fornitore': f'Fornitore {i % 30}',
+            'addebitabile': i % 3 == 0,
+        } for i in range(start, min(start + PAGE_SIZE, n))]
+
+
+def esegui_memoria(n):
+    from openpyxl import Workbook
+    from exports import SPESE_HEADERS, riga_spesa
+
+    spese = [r for pagina in pagine_sintetiche(n) for r in pagina]
+    wb = Workbook()
+    ws = wb.active
+    ws.append(SPESE_HEADERS)
+    for spesa in spese:
+        ws.append(riga_spesa(spesa))
+    output = io.BytesIO()
+    wb.save(output)
+    return len(output.getvalue())
+
+
+def esegui_streaming(n):
+    from exports import SPESE_HEADERS, leggi_a_blocchi, riga_spesa, scrivi_foglio
+
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    righe = (riga_spesa(r) for pagina in pagine_sintetiche(n) for r in pagina)
+    scrivi_foglio(path, 'Spese', SPESE_HEADERS, '4472C4', righe)
+    return sum(len(chunk) for chunk in leggi_a_blocchi(path))
+
+
+def esegui_testo(formato, n):
+    from exports import stream_testo
+
+    start = time.perf_counter()
+    primo = None
+    size = 0
+    for blocco in stream_testo(pagine_sintetiche(n), 'spese', formato):
+        if primo is None:
+            primo = time.perf_counter() - start
+        size += len(blocco)
+    return size, primo
+
+
+def figlio(modalita, n):
+    start = time.perf_counter()
+    primo = None
+    if modalita in ('csv', 'ndjson'):
+        size, primo = esegui_testo(modalita, n)
+    else:
+        size = (esegui_memoria if modalita == 'memoria' else esegui_streaming)(n)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss è in KiB su Linux
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({'secondi': elapsed, 'rss_mb': rss, 'byte': size, 'primo_ms': primo and primo * 1000}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--max-memoria', type=int, default=1000000,
+                        help='Salta la modalità in memoria oltre questo numero di righe')
+    parser.add_argument('--figlio', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.figlio:
+        figlio(args.figlio[0], int(args.figlio[1]))
+        return
+
+    print(f'{"righe":>9} {"modalità":<10} {"tempo (s)":>10} {"picco RSS (MB)":>15} {"file (MB)":>10} '
+          f'{"primo blocco (ms)":>18}')
+    for n in args.rows:
+        for modalita in ('memoria', 'streaming', 'csv', 'ndjson'):
+            if modalita == 'memoria' and n > args.max_memoria:
+                print(f'{n:>9} {modalita:<10} {"saltato":>10}')
+                continue
+            out = subprocess.run([sys.executable, __file__, '--figlio', modalita, str(n)],
+                                 capture_output=True, text=True, check=True).stdout
+            r = json.loads(out)
+            primo = f'{r["primo_ms"]:>18.1f}' if r['primo_ms'] is not None else ''
+            print(f'{n:>9} {modalita:<10} {r["secondi"]:>10.2f} {r["rss_mb"]:>15.1f} {r["byte"] / 1e6:>10.1f} {primo}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark dell'import CSV (importazione.py).
+
+Genera un estratto conto sintetico di N righe nel formato delle banche
+italiane (separatore ;, date gg/mm/aaaa, importi negativi con la virgola,
+categoria per nome e cliente per codice) e misura:
+    analisi      lettura CSV e normalizzazione, senza database: righe/s
+                 confrontate con --target (esce con codice 1 se sotto)
+    import       importa() completo sul PostgREST finto, con upsert a
+                 blocchi in parallelo
+    ripetizione  lo stesso file una seconda volta: nessuna riga inserita,
+                 tutte già presenti
+
+Con --latency-ms si simula la latenza di rete verso Supabase.
+
+Uso:
+    python benchmarks/bench_import.py --rows 200000 --latency-ms 20
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import importazione  # noqa: E402
+from benchmarks.fake_postgrest import FakeSupabase, FakeSupabaseServer  # noqa: E402
+from demo_data import CATEGORIE, carica_fake  # noqa: E402
+
+ESERCENTI = ('Autogrill Villoresi', 'Autostrade per l\'Italia', 'Hotel Centrale', 'Trattoria da Mario',
+             'Eni Station', 'Q8 Easy', 'Ferramenta Rossi', 'Taxi Milano')
+
+
+def estratto(n, codici, seed=42):
+    """CSV sintetico in memoria, dal movimento più recente"""
+    rnd = random.Random(seed)
+    oggi = date(2026, 1, 1)
+    righe = ['Data operazione;Descrizione;Esercente;Importo;Categoria;Codice cliente;Riferimento']
+    for i in range(n):
+        giorno = (oggi - timedelta(days=i // 50)).strftime('%d/%m/%Y')
+        esercente = rnd.choice(ESERCENTI)
+        importo = f'-{rnd.randint(100, 250000) / 100:,.2f}'.replace(',', 'X').replace('.', ',').replace('X', '.')
+        categoria = rnd.choice(CATEGORIE)[0] if rnd.random() < 0.8 else ''
+        cliente = rnd.choice(codici) if rnd.random() < 0.3 else ''
+        righe.append(f'{giorno};Pagamento carta {esercente};{esercente};{importo};{categoria};{cliente};TX{i:08d}')
+    return ('\n'.join(righe) + '\n').encode()
+
+
+def analisi(dati, categorie, clienti):
+    intestazione, righe = importazione.leggi_righe(importazione.testo(io.BytesIO(dati)))
+    posizioni = importazione.associa_colonne(intestazione)
+    normalizza = importazione.Normalizzatore(posizioni, categorie, clienti, inverti_segno=True)
+    valide = errori = 0
+    for blocco, errori_blocco in importazione.analizza(righe, normalizza, 1000):
+        valide += len(blocco)
+        errori += len(errori_blocco)
+    return valide, errori
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--target', type=float, default=50000, help='Righe/s minime dell\'analisi')
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--paralleli', type=int, default=4)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    args = parser.parse_args()
+
+    fake = FakeSupabase()
+    carica_fake(fake, scale=0.01)
+    fake_server = FakeSupabaseServer(fake).start()
+    os.environ['SUPABASE_URL'] = fake_server.url
+    os.environ['SUPABASE_KEY'] = 'bench'
+    os.environ['SUPABASE_SERVICE_KEY'] = 'bench'
+    from supabase_client import get_client
+    client = get_client()
+
+    codici = [r['codice'] for r in fake.tables['clienti'] if r.get('codice')]
+    dati = estratto(args.rows, codici)
+    categorie, clienti = importazione.carica_riferimenti(client)
+    print(f'{args.rows:,} righe, {len(dati) / 1e6:.1f} MB')
+
+    inizio = time.perf_counter()
+    valide, errori = analisi(dati, categorie, clienti)
+    durata = time.perf_counter() - inizio
+    velocita = args.rows / durata
+    print(f'{"analisi":<12} {durata:>8.2f} s {velocita:>10,.0f} righe/s  ({valide:,} valide, {errori:,} errori)')
+
+    fake.latency = args.latency_ms / 1000
+    for etichetta in ('import', 'ripetizione'):
+        fake.requests = 0
+        inizio = time.perf_counter()
+        esito = importazione.importa(client, importazione.testo(io.BytesIO(dati)), inverti_segno=True,
+                                     chunk_size=args.chunk_size, paralleli=args.paralleli)
+        durata = time.perf_counter() - inizio
+        print(f'{etichetta:<12} {durata:>8.2f} s {args.rows / durata:>10,.0f} righe/s  '
+              f"({esito['inserite']:,} inserite, {esito['gia_presenti']:,} già presenti, "
+              f"{esito['num_errori']:,} errori, {fake.requests} richieste)")
+
+    client.close()
+    if velocita < args.target:
+        sys.exit(f'Analisi sotto il target: {velocita:,.0f} < {args.target:,.0f} righe/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Benchmark: connessioni nuove per richiesta vs pool keep-alive.
+
+Esegue lo stesso numero di GET contro il PostgREST finto, prima con
+requests.get (una connessione per chiamata, come faceva app.py) e poi con
+SupabaseClient, e riporta tempo totale e connessioni aperte.
+
+Con --handshake-ms si simula il costo di TCP+TLS verso Supabase, che in
+locale sarebbe altrimenti trascurabile.
+
+Uso:
+    python benchmarks/bench_pool.py --requests 500 --handshake-ms 40
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_postgrest import FakeSupabase, FakeSupabaseServer  # noqa: E402
+from supabase_client import SupabaseClient  # noqa: E402
+
+
+def run(label, call, fake, n, concurrency):
+    fake.connections = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for response in pool.map(lambda _: call(), range(n)):
+            response.raise_for_status()
+    elapsed = time.perf_counter() - start
+    print(f'{label:<22} {elapsed:8.3f} s  {n / elapsed:9.1f} req/s  connessioni aperte: {fake.connections}')
+    return elapsed, fake.connections
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--handshake-ms', type=float, default=20.0)
+    args = parser.parse_args()
+
+    fake = FakeSupabase(handshake_latency=args.handshake_ms / 1000)
+    fake.load('categorie', [{'id': i, 'nome': f'Categoria {i}', 'attiva': True} for i in range(1, 9)])
+    server = FakeSupabaseServer(fake).start()
+
+    url = f'{server.url}/rest/v1/categorie'
+    headers = {'apikey': 'bench', 'Authorization': 'Bearer bench'}
+    params = {'attiva': 'eq.true'}
+
+    client = SupabaseClient(server.url, 'bench', pool_maxsize=args.concurrency)
+
+    print(f'{args.requests} GET, concorrenza {args.concurrency}, handshake simulato {args.handshake_ms} ms\n')
+    t_plain, c_plain = run('requests.get', lambda: requests.get(url, headers=headers, params=params),
+                           fake, args.requests, args.concurrency)
+    t_pool, c_pool = run('SupabaseClient (pool)', lambda: client.get('categorie', params=params),
+                         fake, args.requests, args.concurrency)
+
+    print(f'\nHandshake risparmiati: {c_plain - c_pool}  speedup: {t_plain / t_pool:.1f}x')
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark della ricerca (RPC cerca) su un database reale.
+
+Esegue ricerche tipiche (fornitore, errore di battitura, categoria, città,
+più parole, termine molto comune) e riporta risultati e
+latenza p50/p95 per query. Esce con codice 1 se un p95 supera --budget-ms.
+La latenza è misurata dal client: include la rete verso il database, per
+valutare solo la query usare DATA_BACKEND=postgres sulla stessa macchina.
+
+Serve un database con lo schema di database/schema.sql (estensione pg_trgm,
+indici di ricerca e funzione cerca) e molti dati, ad esempio un milione di
+spese con:
+    DATABASE_URL=postgresql://... python populate_demo_data.py --scale 10 --copy
+
+Uso:
+    DATA_BACKEND=postgres DATABASE_URL=postgresql://... python benchmarks/bench_search.py --repeat 50
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import search  # noqa: E402
+from supabase_client import data_client_from_env  # noqa: E402
+
+QUERY = [
+    'Autogrill',
+    'autogril',
+    'carburante',
+    'Brescia',
+    'hotel centrale',
+    'trattoria mario',
+    'ritorno',
+]
+
+
+def misura(client, testo, tipo, limit, ripetizioni):
+    tempi = []
+    for _ in range(ripetizioni):
+        inizio = time.perf_counter()
+        esito = search.cerca(client, testo, tipo, limit)
+        tempi.append(time.perf_counter() - inizio)
+    tempi.sort()
+    return esito, statistics.median(tempi) * 1000, tempi[int(0.95 * (len(tempi) - 1))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=30, help='Ripetizioni per query')
+    parser.add_argument('--limit', type=int, default=20, help='Risultati per pagina')
+    parser.add_argument('--budget-ms', type=float, default=50.0, help='p95 massimo accettato')
+    parser.add_argument('--query', nargs='+', default=QUERY, help='Testi da cercare')
+    args = parser.parse_args()
+
+    client = data_client_from_env()
+    oltre = []
+
+    print(f'{"query":<20} {"tipo":<14} {"risultati":>9} {"p50 ms":>8} {"p95 ms":>8}')
+    for testo in args.query:
+        for tipo in (None, 'spese', 'chilometriche'):
+            esito, p50, p95 = misura(client, testo, tipo, args.limit, args.repeat)
+            risultati = f"{len(esito['risultati'])}{'+' if esito['has_more'] else ''}"
+            print(f'{testo:<20} {tipo or "tutti":<14} {risultati:>9} {p50:>8.1f} {p95:>8.1f}')
+            if p95 > args.budget_ms:
+                oltre.append(f'{testo} ({tipo or "tutti"})')
+
+    client.close()
+    if oltre:
+        sys.exit(f"p95 oltre {args.budget_ms:.0f} ms: {', '.join(oltre)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark dello snapshot colonnare (snapshot.py).
+
+Carica N spese sul PostgREST finto e misura:
+    caricamento   lettura iniziale delle colonne a pagine
+    filtri        filtro + prima pagina + totali per categoria in memoria,
+                  per una serie di combinazioni di filtri: righe
+                  esaminate per millisecondo, confrontate con --target
+                  (esce con codice 1 se sotto)
+    incrementale  aggiornamento dopo --modifiche righe cambiate da un
+                  altro processo (e altrettante eliminate)
+
+Uso:
+    python benchmarks/bench_snapshot.py --scale 0.3
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import snapshot  # noqa: E402
+from benchmarks.fake_postgrest import FakeSupabase, FakeSupabaseServer  # noqa: E402
+from demo_data import carica_fake  # noqa: E402
+
+FILTRI = (
+    {},
+    {'data_inizio': '2025-01-01', 'data_fine': '2025-06-30'},
+    {'categoria_id': '1'},
+    {'cliente_id': '2', 'addebitabile': 'true'},
+    {'data_inizio': '2025-03-01', 'categoria_id': '3', 'addebitabile': 'false'},
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=float, default=0.3, help='Moltiplicatore dei dati demo (1 = 100.000 spese)')
+    parser.add_argument('--ripetizioni', type=int, default=200)
+    parser.add_argument('--modifiche', type=int, default=500)
+    parser.add_argument('--target', type=float, default=20000, help='Righe/ms minime dei filtri')
+    args = parser.parse_args()
+
+    if snapshot.np is None:
+        sys.exit('numpy non installato: pip install numpy')
+
+    fake = FakeSupabase()
+    carica_fake(fake, scale=args.scale)
+    # Dati demo scritti "adesso": invecchiati, altrimenti la sovrapposizione
+    # dell'aggiornamento incrementale li rileggerebbe tutti
+    for riga in fake.tables['spese']:
+        riga['updated_at'] = '2025-01-01T00:00:00'
+    fake_server = FakeSupabaseServer(fake).start()
+    os.environ['SUPABASE_URL'] = fake_server.url
+    os.environ['SUPABASE_KEY'] = 'bench'
+    os.environ['SUPABASE_SERVICE_KEY'] = 'bench'
+    from supabase_client import get_client
+
+    # Intervallo lungo: gli aggiornamenti partono solo da invalida()
+    cache = snapshot.Snapshot(get_client, intervallo=3600)
+    inizio = time.perf_counter()
+    # Il caricamento iniziale gira in background: intanto vista() restituisce None
+    while (vista := cache.vista('spese')) is None:
+        time.sleep(0.01)
+    durata = time.perf_counter() - inizio
+    print(f'{"caricamento":<13} {durata * 1000:>9.0f} ms  ({len(vista):,} spese)')
+
+    inizio = time.perf_counter()
+    for _ in range(args.ripetizioni):
+        for filtri in FILTRI:
+            posizioni = vista.filtra(filtri)
+            vista.pagina(posizioni, 50)
+            snapshot.totali_spese(vista, posizioni)
+            vista.impronta(posizioni)
+    durata = (time.perf_counter() - inizio) * 1000
+    richieste = args.ripetizioni * len(FILTRI)
+    velocita = len(vista) * richieste / durata
+    print(f'{"filtri":<13} {durata / richieste:>9.3f} ms  {velocita:>10,.0f} righe/ms')
+
+    # Modifiche di un altro worker: updated_at nuovo e tombstone delle eliminate
+    adesso = time.strftime('%Y-%m-%dT%H:%M:%S')
+    spese = fake.tables['spese']
+    for riga in spese[:args.modifiche]:
+        riga['importo'] = round(float(riga['importo']) + 1, 2)
+        riga['updated_at'] = adesso
+    eliminate = spese[-args.modifiche:]
+    del spese[-args.modifiche:]
+    fake.insert('eliminazioni', [{'tabella': 'spese', 'riga_id': r['id'], 'eliminata_il': adesso}
+                                 for r in eliminate])
+    fake.requests = 0
+    cache.invalida('spese')
+    inizio = time.perf_counter()
+    vista = cache.vista('spese')
+    durata = time.perf_counter() - inizio
+    print(f'{"incrementale":<13} {durata * 1000:>9.0f} ms  ({len(vista):,} spese, {fake.requests} richieste)')
+
+    get_client().close()
+    if velocita < args.target:
+        sys.exit(f'Filtri sotto il target: {velocita:,.0f} < {args.target:,.0f} righe/ms')
+
+
+if __name__ == '__main__':
+    main()
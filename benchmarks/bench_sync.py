@@ -0,0 +1,129 @@
+"""
+Benchmark aggiornamento dati: liste complete vs /api/sync incrementale.
+
+Avvia l'app su un server WSGI locale collegato al PostgREST finto con il
+dataset sintetico, poi confronta:
+    liste complete   GET di spese, chilometriche e dati di riferimento,
+                     come fa oggi il client a ogni aggiornamento
+    sync completa    GET /api/sync senza since (primo avvio)
+    sync delta       GET /api/sync?since=<watermark> dopo N modifiche
+                     fatte tramite l'API (90% PUT, 10% DELETE)
+Riporta righe, byte e tempo di ogni aggiornamento e verifica che il delta
+contenga tutte le modifiche e i tombstone delle eliminazioni.
+
+Il PostgREST finto filtra scorrendo le righe in memoria: i byte trasferiti
+sono quelli reali, il tempo lato database no (su Postgres le letture
+usano gli indici su updated_at ed eliminata_il).
+
+Uso:
+    python benchmarks/bench_sync.py --scale 0.2 --changes 0 10 100 1000
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_postgrest import FakeSupabase, FakeSupabaseServer  # noqa: E402
+from demo_data import carica_fake  # noqa: E402
+
+LISTE = ['/api/spese', '/api/chilometriche', '/api/categorie', '/api/clienti', '/api/veicoli', '/api/progetti']
+
+
+def scarica(sessione, base_url, percorsi):
+    righe, byte = 0, 0
+    inizio = time.perf_counter()
+    risposte = []
+    for percorso in percorsi:
+        r = sessione.get(base_url + percorso)
+        r.raise_for_status()
+        byte += len(r.content)
+        risposte.append(r.json())
+    durata = time.perf_counter() - inizio
+    for dati in risposte:
+        if isinstance(dati, list):
+            righe += len(dati)
+        elif 'modificate' in dati:
+            righe += sum(len(v) for v in dati['modificate'].values())
+            righe += sum(len(v) for v in dati['eliminate'].values())
+    return righe, byte, durata, risposte
+
+
+def riga(etichetta, righe, byte, durata):
+    print(f'{etichetta:<28} {righe:>9,} {byte / 1024:>11,.0f} {durata * 1000:>10,.0f}')
+
+
+def modifica(sessione, base_url, fake, n, rnd):
+    ids = rnd.sample([r['id'] for r in fake.tables['spese']], n)
+    eliminate = set(ids[:n // 10])
+    for id in ids:
+        if id in eliminate:
+            sessione.delete(f'{base_url}/api/spese/{id}').raise_for_status()
+        else:
+            sessione.put(f'{base_url}/api/spese/{id}', json={'note': 'modificata'}).raise_for_status()
+    return set(ids) - eliminate, eliminate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=float, default=0.2, help='Scala del dataset (1 = 100.000 spese)')
+    parser.add_argument('--changes', type=int, nargs='+', default=[0, 10, 100, 1000])
+    parser.add_argument('--latency-ms', type=float, default=5.0)
+    args = parser.parse_args()
+
+    fake = FakeSupabase(latency=args.latency_ms / 1000)
+    carica_fake(fake, args.scale, 42)
+    # Dataset caricato un'ora fa: fuori dalla sovrapposizione tra letture
+    un_ora_fa = time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(time.time() - 3600))
+    for righe in fake.tables.values():
+        for r in righe:
+            r['updated_at'] = un_ora_fa
+    fake_server = FakeSupabaseServer(fake).start()
+    os.environ['SUPABASE_URL'] = fake_server.url
+    os.environ['SUPABASE_KEY'] = 'bench'
+    os.environ['SUPABASE_SERVICE_KEY'] = 'bench'
+    # Senza sovrapposizione ogni delta contiene solo le modifiche del proprio giro
+    os.environ['SYNC_OVERLAP_SECONDS'] = '0'
+
+    from werkzeug.serving import make_server
+    import app as app_module
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    sessione = requests.Session()
+    rnd = random.Random(42)
+
+    print(f"{len(fake.tables['spese']):,} spese, {len(fake.tables['chilometriche']):,} chilometriche, "
+          f'latenza PostgREST {args.latency_ms:.0f} ms\n')
+    print(f'{"aggiornamento":<28} {"righe":>9} {"KB":>11} {"ms":>10}')
+    riga('liste complete', *scarica(sessione, base_url, LISTE)[:3])
+    righe, byte, durata, (sync,) = scarica(sessione, base_url, ['/api/sync'])
+    riga('sync completa', righe, byte, durata)
+
+    errori = []
+    for n in args.changes:
+        watermark = sync['watermark']
+        time.sleep(1.1)  # il finto ha timestamp al secondo
+        modificate, eliminate = modifica(sessione, base_url, fake, n, rnd)
+        righe, byte, durata, (sync,) = scarica(sessione, base_url, [f'/api/sync?since={watermark}'])
+        riga(f'sync delta ({n} modifiche)', righe, byte, durata)
+        ricevute = {r['id'] for r in sync['modificate']['spese']}
+        if not modificate <= ricevute or not eliminate <= set(sync['eliminate']['spese']):
+            errori.append(n)
+
+    server.shutdown()
+    fake_server.shutdown()
+    if errori:
+        sys.exit(f'Modifiche mancanti nel delta per: {errori}')
+
+
+if __name__ == '__main__':
+    main()
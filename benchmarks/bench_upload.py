@@ -0,0 +1,158 @@
+"""
+Benchmark upload ricevute: elaborazione inline vs pipeline in background.
+
+Avvia l'app su un server WSGI locale (threaded) collegato al PostgREST
+finto e invia foto JPEG da 12 MP con concorrenza 1, 4 e 16. Per ogni
+livello misura:
+    - latenza della risposta di /api/upload
+    - throughput di upload completati (fino a stato "completato" su Storage)
+    - latenza di /api/health durante gli upload (blocco degli altri endpoint)
+
+La modalità "inline" riproduce la vecchia route: decodifica completa,
+thumbnail, ricodifica e POST a Storage nel thread della richiesta.
+Ogni upload di "inline" e "pipeline" è una foto diversa (byte in coda al
+JPEG, quindi sha256 diverso); "ripetuta" invia di nuovo foto già caricate,
+che la pipeline riconosce dall'hash senza decodificarle né ricaricarle.
+
+Uso:
+    python benchmarks/bench_upload.py --uploads 32 --concurrency 1 4 16
+"""
+import argparse
+import io
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_postgrest import FakeSupabase, FakeSupabaseServer  # noqa: E402
+
+
+def foto_12mp():
+    from PIL import Image
+    rumore = Image.effect_noise((4000, 3000), 40)
+    img = Image.merge('RGB', (rumore, rumore.rotate(180), rumore.transpose(Image.FLIP_LEFT_RIGHT)))
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def varianti(foto, serie):
+    """Stessa immagine con byte diversi in coda (quindi sha256 diverso) per ogni upload"""
+    return lambda i: foto + f'{serie}-{i}'.encode()
+
+
+def registra_route_inline(flask_app, client_factory):
+    from flask import jsonify, request
+    from PIL import Image
+
+    @flask_app.route('/bench/upload-inline', methods=['POST'])
+    def upload_inline():
+        file = request.files['file']
+        img = Image.open(file)
+        img.thumbnail((1200, 1200))
+        buffer = io.BytesIO()
+        if img.mode in ('RGBA', 'P'):
+            img = img.convert('RGB')
+        img.save(buffer, format='JPEG', quality=85)
+        nome = f'inline_{time.time_ns()}.jpg'
+        client_factory().upload('expenses', nome, buffer.getvalue(), content_type='image/jpeg')
+        return jsonify({'stato': 'completato'}), 200
+
+
+def percentile(valori, p):
+    valori = sorted(valori)
+    return valori[min(len(valori) - 1, int(round(p / 100 * (len(valori) - 1))))]
+
+
+def esegui(base_url, endpoint, foto, uploads, concurrency):
+    """foto(i): byte dell'i-esimo upload"""
+    sessione = requests.Session()
+    latenze, sonde = [], []
+    fine = threading.Event()
+
+    def sonda():
+        s = requests.Session()
+        while not fine.is_set():
+            t = time.perf_counter()
+            s.get(f'{base_url}/api/health')
+            sonde.append(time.perf_counter() - t)
+            time.sleep(0.05)
+
+    def un_upload(i):
+        dati = foto(i)
+        t = time.perf_counter()
+        r = sessione.post(f'{base_url}{endpoint}', files={'file': ('ricevuta.jpg', dati, 'image/jpeg')})
+        while r.status_code == 503:
+            time.sleep(float(r.headers.get('Retry-After', 1)) / 10)
+            r = sessione.post(f'{base_url}{endpoint}', files={'file': ('ricevuta.jpg', dati, 'image/jpeg')})
+        latenze.append(time.perf_counter() - t)
+        body = r.json()
+        # Attende il completamento in background
+        while body.get('stato') not in ('completato', 'errore'):
+            time.sleep(0.02)
+            body = sessione.get(f"{base_url}/api/upload/{body['upload_id']}").json()
+
+    thread_sonda = threading.Thread(target=sonda, daemon=True)
+    thread_sonda.start()
+    inizio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(un_upload, range(uploads)))
+    durata = time.perf_counter() - inizio
+    fine.set()
+    thread_sonda.join()
+
+    return {
+        'throughput': uploads / durata,
+        'risposta_p50': statistics.median(latenze) * 1000,
+        'risposta_p95': percentile(latenze, 95) * 1000,
+        'health_p95': percentile(sonde, 95) * 1000 if sonde else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uploads', type=int, default=32)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    args = parser.parse_args()
+
+    fake_server = FakeSupabaseServer(FakeSupabase()).start()
+    os.environ['SUPABASE_URL'] = fake_server.url
+    os.environ['SUPABASE_KEY'] = 'bench'
+    os.environ['SUPABASE_SERVICE_KEY'] = 'bench'
+    os.environ.setdefault('IMAGE_MAX_PENDING', '16')
+
+    from werkzeug.serving import make_server
+    import app as app_module
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    registra_route_inline(app_module.app, app_module.get_client)
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+
+    foto = foto_12mp()
+    print(f'Foto di prova: 4000x3000, {len(foto) / 1e6:.1f} MB, {args.uploads} upload per livello\n')
+    print(f'{"modalità":<10} {"conc.":>5} {"upload/s":>9} {"risposta p50":>13} {"risposta p95":>13} {"health p95":>11}')
+    for concurrency in args.concurrency:
+        # "ripetuta" invia le stesse foto appena caricate da "pipeline"
+        for modalita, endpoint, serie in (('inline', '/bench/upload-inline', 'inline'),
+                                          ('pipeline', '/api/upload', 'pipeline'),
+                                          ('ripetuta', '/api/upload', 'pipeline')):
+            r = esegui(base_url, endpoint, varianti(foto, f'{serie}{concurrency}'), args.uploads, concurrency)
+            print(f'{modalita:<10} {concurrency:>5} {r["throughput"]:>9.1f} {r["risposta_p50"]:>10.0f} ms'
+                  f' {r["risposta_p95"]:>10.0f} ms {r["health_p95"]:>8.0f} ms')
+
+    server.shutdown()
+    fake_server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
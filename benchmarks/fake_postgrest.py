@@ -0,0 +1,579 @@
+"""
+Server locale che imita le API PostgREST e Storage di Supabase.
+
+Usato dai benchmark per misurare l'app senza un progetto Supabase reale.
+Supporta il sottoinsieme di sintassi usato da app.py:
+    filtri   colonna=eq.|neq.|gt.|gte.|lt.|lte.|is.|in.(...), or=(...), and=(...)
+    select   colonne e relazioni incorporate, es. *,categorie(nome,colore)
+    order    colonna.asc|desc, anche multiple separate da virgola
+    limit / offset, header Prefer: count=exact
+    rpc      /rest/v1/rpc/<nome> via GET o POST, implementate in FakeSupabase.rpc
+             (predefinite: le funzioni di database/schema.sql usate da app.py)
+
+Conta le connessioni TCP aperte dai client, così i benchmark possono
+mostrare quanti handshake vengono risparmiati dal pool keep-alive.
+
+Uso standalone:
+    python benchmarks/fake_postgrest.py --port 54321
+"""
+import argparse
+import json
+import re
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# Relazione incorporata -> colonna foreign key nella tabella principale
+FOREIGN_KEYS = {
+    'categorie': 'categoria_id',
+    'clienti': 'cliente_id',
+    'progetti': 'progetto_id',
+    'veicoli': 'veicolo_id',
+}
+
+# Colonne NOT NULL senza default: un insert che le omette fallisce per intero come in Postgres
+NOT_NULL = {
+    'spese': ('data_spesa', 'importo', 'descrizione'),
+    'chilometriche': ('data_viaggio', 'partenza', 'arrivo', 'km_percorsi', 'tariffa_applicata',
+                      'rimborso_calcolato'),
+}
+
+# Tabelle con il trigger registra_eliminazioni: i DELETE scrivono un tombstone in eliminazioni
+CON_ELIMINAZIONI = ('categorie', 'clienti', 'progetti', 'veicoli', 'spese', 'chilometriche')
+
+# Default SQL delle colonne (le righe restituite da PostgREST li contengono sempre)
+DEFAULTS = {
+    'spese': {'addebitabile': False, 'addebitata': False},
+    'chilometriche': {'addebitabile': False, 'addebitata': False},
+}
+
+
+def split_top_level(text, sep=','):
+    """Divide una stringa sul separatore ignorando quelli tra parentesi"""
+    parts, depth, current = [], 0, ''
+    for ch in text:
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        if ch == sep and depth == 0:
+            parts.append(current)
+            current = ''
+        else:
+            current += ch
+    if current:
+        parts.append(current)
+    return parts
+
+
+def coerce(value, reference):
+    if value == 'null':
+        return None
+    if isinstance(reference, bool):
+        return value == 'true'
+    if isinstance(reference, (int, float)):
+        try:
+            return float(value)
+        except ValueError:
+            return value
+    return value
+
+
+def match(row, column, expr):
+    op, _, value = expr.partition('.')
+    current = row.get(column)
+    if op == 'is':
+        return current is None if value == 'null' else current == (value == 'true')
+    if op == 'in':
+        values = [v.strip('"') for v in value.strip('()').split(',')]
+        return str(current) in values
+    target = coerce(value, current)
+    if current is None or target is None:
+        return op == 'neq' and current != target
+    if isinstance(current, (int, float)) and not isinstance(current, bool):
+        current = float(current)
+    if op == 'eq':
+        return current == target
+    if op == 'neq':
+        return current != target
+    if op == 'gt':
+        return current > target
+    if op == 'gte':
+        return current >= target
+    if op == 'lt':
+        return current < target
+    if op == 'lte':
+        return current <= target
+    raise ValueError(f'Operatore non supportato: {op}')
+
+
+def match_logic(row, operator, expr):
+    """Valuta or=(...) / and=(...) con condizioni annidate, es. (a.lt.1,and(a.eq.1,id.lt.5))"""
+    results = []
+    for item in split_top_level(expr[1:-1]):
+        if item.startswith(('and(', 'or(')):
+            name, _, inner = item.partition('(')
+            results.append(match_logic(row, name, '(' + inner))
+        else:
+            column, _, condition = item.partition('.')
+            results.append(match(row, column, condition))
+    return any(results) if operator == 'or' else all(results)
+
+
+class FakeSupabase:
+    """Stato in memoria: tabelle, oggetti di storage, funzioni RPC"""
+
+    def __init__(self, latency=0.0, handshake_latency=0.0):
+        self.tables = {}
+        self.storage = {}
+        self.rpc = dict(RPC_PREDEFINITE)
+        self.latency = latency
+        self.handshake_latency = handshake_latency
+        # Come db-max-rows di PostgREST (1000 su Supabase): None = nessun limite
+        self.max_rows = None
+        self.connections = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._next_id = {}
+        self._indexes = {}
+
+    def load(self, table, rows):
+        adesso = time.strftime('%Y-%m-%dT%H:%M:%S')
+        for row in rows:
+            row.setdefault('updated_at', adesso)
+        with self._lock:
+            self.tables.setdefault(table, []).extend(rows)
+            max_id = max((r.get('id', 0) for r in self.tables[table]), default=0)
+            self._next_id[table] = max_id + 1
+
+    def insert(self, table, rows, on_conflict=None, resolution=None):
+        """
+        Inserisce le righe; con on_conflict (colonne separate da virgola) e
+        resolution ignore-duplicates/merge-duplicates si comporta come
+        INSERT ... ON CONFLICT DO NOTHING/DO UPDATE: restituisce solo le
+        righe inserite o aggiornate.
+        """
+        for row in rows:
+            missing = [c for c in NOT_NULL.get(table, ()) if row.get(c) is None]
+            if missing:
+                raise ValueError(f'null value in column "{missing[0]}" violates not-null constraint')
+        chiavi = on_conflict.split(',') if on_conflict and resolution else None
+        with self._lock:
+            rows_table = self.tables.setdefault(table, [])
+            inserted = []
+            adesso = time.strftime('%Y-%m-%dT%H:%M:%S')
+            esistenti = {}
+            if chiavi:
+                # Come un indice UNIQUE: le chiavi con un NULL non sono mai in conflitto
+                esistenti = {tuple(r.get(c) for c in chiavi): r for r in rows_table}
+            for row in rows:
+                if chiavi:
+                    chiave = tuple(row.get(c) for c in chiavi)
+                    esistente = esistenti.get(chiave) if None not in chiave else None
+                    if esistente is not None:
+                        if resolution == 'merge-duplicates':
+                            esistente.update(row)
+                            esistente['updated_at'] = adesso
+                            inserted.append(esistente)
+                        continue
+                row = dict(DEFAULTS.get(table, {}), **row)
+                row.setdefault('updated_at', adesso)
+                if 'id' not in row:
+                    row['id'] = self._next_id.get(table, 1)
+                    self._next_id[table] = row['id'] + 1
+                rows_table.append(row)
+                inserted.append(row)
+                if chiavi:
+                    esistenti[tuple(row.get(c) for c in chiavi)] = row
+            return inserted
+
+    def query(self, table, params):
+        rows = self.tables.get(table, [])
+        for column, exprs in params.items():
+            if column in ('select', 'order', 'limit', 'offset', 'on_conflict'):
+                continue
+            for expr in exprs:
+                if column in ('or', 'and'):
+                    rows = [r for r in rows if match_logic(r, column, expr)]
+                else:
+                    rows = [r for r in rows if match(r, column, expr)]
+        if 'order' in params:
+            for part in reversed(params['order'][0].split(',')):
+                column, _, direction = part.partition('.')
+                desc = direction.startswith('desc')
+                rows = sorted(rows, key=lambda r: (r.get(column) is None,
+                                                   r.get(column) if r.get(column) is not None else ''),
+                              reverse=desc)
+        total = len(rows)
+        offset = int(params.get('offset', ['0'])[0])
+        if 'limit' in params:
+            rows = rows[offset:offset + int(params['limit'][0])]
+        elif offset:
+            rows = rows[offset:]
+        if self.max_rows is not None:
+            rows = rows[:self.max_rows]
+        select = params.get('select', ['*'])[0]
+        return [self.project(r, select) for r in rows], total
+
+    def project(self, row, select):
+        result = {}
+        for field in split_top_level(select):
+            if '(' in field:
+                name, _, columns = field.partition('(')
+                related = self.lookup(name, row.get(FOREIGN_KEYS.get(name)))
+                result[name] = self.project(related, columns[:-1]) if related else None
+            elif field == '*':
+                result.update(row)
+            else:
+                result[field] = row.get(field)
+        return result
+
+    def lookup(self, table, id):
+        if id is None:
+            return None
+        rows = self.tables.get(table, [])
+        index = self._indexes.get(table)
+        if index is None or index[0] != len(rows):
+            index = (len(rows), {r.get('id'): r for r in rows})
+            self._indexes[table] = index
+        return index[1].get(id)
+
+    def ricalcola_rollup(self):
+        """Come database/backfill_rollup.sql: i trigger non esistono nel finto"""
+        spese, km = {}, {}
+        for r in self.tables.get('spese', []):
+            chiave = (r['data_spesa'][:8] + '01', r.get('categoria_id') or 0)
+            tot = spese.setdefault(chiave, [0, 0.0, 0.0])
+            tot[0] += 1
+            tot[1] += float(r['importo'])
+            tot[2] += float(r['importo']) if r.get('addebitabile') else 0.0
+        for r in self.tables.get('chilometriche', []):
+            chiave = (r['data_viaggio'][:8] + '01', r.get('veicolo_id') or 0)
+            tot = km.setdefault(chiave, [0, 0.0, 0.0])
+            tot[0] += 1
+            tot[1] += float(r['km_percorsi'])
+            tot[2] += float(r['rimborso_calcolato'])
+        with self._lock:
+            self.tables['rollup_spese_mensili'] = [
+                {'mese': m, 'categoria_id': c, 'num_spese': n, 'totale': round(t, 2),
+                 'totale_addebitabile': round(a, 2)} for (m, c), (n, t, a) in sorted(spese.items())]
+            self.tables['rollup_km_mensili'] = [
+                {'mese': m, 'veicolo_id': v, 'num_viaggi': n, 'km_totali': round(k, 2),
+                 'rimborso_totale': round(r, 2)} for (m, v), (n, k, r) in sorted(km.items())]
+
+
+def rpc_dashboard_stats(fake, args):
+    da = args.get('p_da') or ''
+    ultime = int(args.get('p_ultime') or 10)
+    spese = [r for r in fake.tables.get('spese', []) if r['data_spesa'] >= da]
+    viaggi = [r for r in fake.tables.get('chilometriche', []) if r['data_viaggio'] >= da]
+    per_categoria = {}
+    for r in spese:
+        categoria = fake.lookup('categorie', r.get('categoria_id'))
+        if categoria:
+            chiave = (categoria['nome'], categoria.get('colore'))
+            per_categoria[chiave] = per_categoria.get(chiave, 0.0) + float(r['importo'])
+    recenti = sorted(fake.tables.get('spese', []), key=lambda r: (r['data_spesa'], r['id']), reverse=True)
+    return {
+        'spese_mese': round(sum(float(r['importo']) for r in spese), 2),
+        'spese_addebitabili': round(sum(float(r['importo']) for r in spese if r.get('addebitabile')), 2),
+        'km_mese': round(sum(float(r['km_percorsi']) for r in viaggi), 2),
+        'rimborsi_km': round(sum(float(r['rimborso_calcolato']) for r in viaggi), 2),
+        'spese_per_categoria': [{'nome': n, 'colore': c, 'totale': round(t, 2)} for (n, c), t in
+                                sorted(per_categoria.items(), key=lambda x: -x[1])],
+        'ultime_spese': [fake.project(r, '*,categorie(nome,colore),clienti(nome)') for r in recenti[:ultime]],
+    }
+
+
+def rpc_totali_chilometriche(fake, args):
+    viaggi = [r for r in fake.tables.get('chilometriche', [])
+              if (not args.get('p_da') or r['data_viaggio'] >= args['p_da'])
+              and (not args.get('p_a') or r['data_viaggio'] <= args['p_a'])
+              and (not args.get('p_veicolo_id') or r.get('veicolo_id') == int(args['p_veicolo_id']))
+              and (not args.get('p_cliente_id') or r.get('cliente_id') == int(args['p_cliente_id']))]
+    return {
+        'num_viaggi': len(viaggi),
+        'km_totali': round(sum(float(r['km_percorsi']) for r in viaggi), 2),
+        'rimborso_totale': round(sum(float(r['rimborso_calcolato']) for r in viaggi), 2),
+    }
+
+
+def rpc_totali_spese(fake, args):
+    spese = [r for r in fake.tables.get('spese', [])
+             if (not args.get('p_da') or r['data_spesa'] >= args['p_da'])
+             and (not args.get('p_a') or r['data_spesa'] <= args['p_a'])
+             and (not args.get('p_categoria_id') or r.get('categoria_id') == int(args['p_categoria_id']))
+             and (not args.get('p_cliente_id') or r.get('cliente_id') == int(args['p_cliente_id']))
+             and (not args.get('p_addebitabile') or bool(r.get('addebitabile')) == (args['p_addebitabile'] == 'true'))]
+    per_categoria = {}
+    for r in spese:
+        num, totale = per_categoria.get(r.get('categoria_id'), (0, 0.0))
+        per_categoria[r.get('categoria_id')] = (num + 1, totale + float(r['importo']))
+    return {
+        'num_spese': len(spese),
+        'importo_totale': round(sum(float(r['importo']) for r in spese), 2),
+        'per_categoria': [{'categoria_id': c, 'num_spese': n, 'totale': round(t, 2)} for c, (n, t) in
+                          sorted(per_categoria.items(), key=lambda x: (-x[1][1], x[0] is None, x[0] or 0))],
+    }
+
+
+def rpc_fingerprint_riferimenti(fake, args):
+    return {t: f"{max((r.get('updated_at') or '' for r in fake.tables.get(t, [])), default='')}"
+               f"/{len(fake.tables.get(t, []))}" for t in ('categorie', 'clienti', 'progetti', 'veicoli')}
+
+
+def rpc_istante_sync(fake, args):
+    return time.strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def rpc_cerca(fake, args):
+    # Approssimazione della funzione SQL: sottostringa o tutte le parole,
+    # punteggio = parole trovate, marcatori \x02/\x03 come ts_headline
+    testo = (args.get('p_testo') or '').strip().lower()
+    parole = testo.split()
+    sorgenti = {
+        'spese': lambda r: ('data_spesa', r.get('descrizione'), r.get('fornitore'), r.get('importo'),
+                            [r.get('descrizione'), r.get('fornitore'), r.get('numero_documento'), r.get('note')]),
+        'chilometriche': lambda r: ('data_viaggio', f"{r.get('partenza')} → {r.get('arrivo')}", r.get('descrizione'),
+                                    r.get('rimborso_calcolato'),
+                                    [r.get('partenza'), r.get('arrivo'), r.get('descrizione'), r.get('note')]),
+    }
+    risultati = []
+    for tipo, campi in sorgenti.items():
+        if args.get('p_tipo') and args['p_tipo'] != tipo:
+            continue
+        for r in fake.tables.get(tipo, []):
+            colonna_data, titolo, dettaglio, importo, testi = campi(r)
+            documento = ' · '.join(t for t in testi if t)
+            minuscolo = documento.lower()
+            trovate = sum(1 for p in parole if p in minuscolo)
+            if not parole or (testo not in minuscolo and trovate < len(parole)):
+                continue
+            evidenziato = documento
+            for p in sorted(set(parole), key=len, reverse=True):
+                evidenziato = re.sub(re.escape(p), lambda m: f'\x02{m.group(0)}\x03', evidenziato, flags=re.I)
+            risultati.append({'tipo': tipo, 'id': r['id'], 'data': r[colonna_data], 'titolo': titolo,
+                              'dettaglio': dettaglio, 'importo': importo, 'punteggio': float(trovate),
+                              'evidenziato': evidenziato})
+    risultati.sort(key=lambda r: (r['punteggio'], r['data'], r['id']), reverse=True)
+    offset = int(args.get('p_offset') or 0)
+    return risultati[offset:offset + int(args.get('p_limite') or 20)]
+
+
+def rpc_riepilogo_addebiti(fake, args):
+    cliente_id = int(args['p_cliente_id'])
+    progetto_id = int(args['p_progetto_id']) if args.get('p_progetto_id') else None
+    gruppi = {}
+    for r in fake.tables.get('spese', []):
+        if (r.get('cliente_id') != cliente_id or not r.get('addebitabile') or r.get('addebitata')
+                or (progetto_id and r.get('progetto_id') != progetto_id)
+                or (args.get('p_da') and r['data_spesa'] < args['p_da'])
+                or (args.get('p_a') and r['data_spesa'] > args['p_a'])):
+            continue
+        progetto = fake.lookup('progetti', r.get('progetto_id'))
+        categoria = fake.lookup('categorie', r.get('categoria_id'))
+        chiave = (progetto['nome'] if progetto else None, categoria['nome'] if categoria else None)
+        tot = gruppi.setdefault(chiave, [0, 0.0])
+        tot[0] += 1
+        tot[1] += float(r['importo'])
+    cliente = fake.lookup('clienti', cliente_id)
+    progetto = fake.lookup('progetti', progetto_id)
+    righe = [{'progetto': p, 'categoria': c, 'num_voci': n, 'totale': round(t, 2)}
+             for (p, c), (n, t) in sorted(gruppi.items(), key=lambda g: (g[0][0] is None, g[0][0] or '', -g[1][1]))]
+    return {
+        'cliente': cliente['nome'] if cliente else None,
+        'progetto': progetto['nome'] if progetto else None,
+        'num_voci': sum(r['num_voci'] for r in righe),
+        'totale': round(sum(r['totale'] for r in righe), 2),
+        'righe': righe,
+    }
+
+
+def rpc_ricevute_simili(fake, args):
+    dhash = int(args['p_dhash'])
+    distanza = int(args.get('p_distanza', 6))
+    vicine = {}
+    for r in fake.tables.get('ricevute', []):
+        bit = bin((r['dhash'] ^ dhash) & (2 ** 64 - 1)).count('1')
+        if bit <= distanza:
+            vicine[r['sha256']] = bit
+    risultati = []
+    for s in fake.tables.get('spese', []):
+        trovato = re.search(r'([0-9a-f]{64})\.jpg$', s.get('immagine_url') or '')
+        if trovato and trovato.group(1) in vicine:
+            risultati.append({'spesa_id': s['id'], 'data_spesa': s['data_spesa'], 'importo': s['importo'],
+                              'descrizione': s['descrizione'], 'immagine_url': s['immagine_url'],
+                              'distanza': vicine[trovato.group(1)]})
+    risultati.sort(key=lambda r: (r['data_spesa'], r['spesa_id']), reverse=True)
+    risultati.sort(key=lambda r: r['distanza'])
+    return risultati[:int(args.get('p_limite', 10))]
+
+
+RPC_PREDEFINITE = {
+    'dashboard_stats': rpc_dashboard_stats,
+    'totali_chilometriche': rpc_totali_chilometriche,
+    'totali_spese': rpc_totali_spese,
+    'fingerprint_riferimenti': rpc_fingerprint_riferimenti,
+    'istante_sync': rpc_istante_sync,
+    'cerca': rpc_cerca,
+    'riepilogo_addebiti': rpc_riepilogo_addebiti,
+    'ricevute_simili': rpc_ricevute_simili,
+}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        # Header e body vengono scritti separatamente: senza TCP_NODELAY
+        # Nagle + delayed ACK aggiungono ~40 ms alle connessioni keep-alive
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        fake = self.server.fake
+        with fake._lock:
+            fake.connections += 1
+        if fake.handshake_latency:
+            time.sleep(fake.handshake_latency)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=None, headers=None):
+        payload = b'' if body is None else (body if isinstance(body, bytes) else json.dumps(body).encode())
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(payload)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _route(self):
+        fake = self.server.fake
+        with fake._lock:
+            fake.requests += 1
+        if fake.latency:
+            time.sleep(fake.latency)
+        parts = urlsplit(self.path)
+        return fake, parts.path, parse_qs(parts.query, keep_blank_values=True)
+
+    def do_GET(self):
+        fake, path, params = self._route()
+        if path.startswith('/storage/v1/object/public/'):
+            key = path[len('/storage/v1/object/public/'):]
+            if key not in fake.storage:
+                return self._send(404, {'message': 'Object not found'})
+            return self._send(200, fake.storage[key])
+        if path.startswith('/rest/v1/rpc/'):
+            args = {k: v[0] for k, v in params.items()}
+            return self._call_rpc(fake, path[len('/rest/v1/rpc/'):], args)
+        if not path.startswith('/rest/v1/'):
+            return self._send(404, {'message': 'not found'})
+        table = path[len('/rest/v1/'):]
+        try:
+            rows, total = fake.query(table, params)
+        except ValueError as e:
+            return self._send(400, {'message': str(e)})
+        headers = {}
+        if 'count=exact' in (self.headers.get('Prefer') or ''):
+            end = max(len(rows) - 1, 0)
+            headers['Content-Range'] = f'0-{end}/{total}' if rows else f'*/{total}'
+        self._send(200, rows, headers)
+
+    do_HEAD = do_GET
+
+    def do_POST(self):
+        fake, path, params = self._route()
+        body = self._body()
+        if path.startswith('/storage/v1/object/'):
+            key = path[len('/storage/v1/object/'):]
+            fake.storage[key] = body
+            return self._send(200, {'Key': key})
+        if path.startswith('/rest/v1/rpc/'):
+            return self._call_rpc(fake, path[len('/rest/v1/rpc/'):], json.loads(body or b'{}'))
+        table = path[len('/rest/v1/'):]
+        data = json.loads(body or b'[]')
+        prefer = self.headers.get('Prefer') or ''
+        resolution = next((r for r in ('ignore-duplicates', 'merge-duplicates') if f'resolution={r}' in prefer), None)
+        try:
+            rows = fake.insert(table, data if isinstance(data, list) else [data],
+                               on_conflict=params.get('on_conflict', [None])[0], resolution=resolution)
+        except ValueError as e:
+            return self._send(400, {'code': '23502', 'message': str(e)})
+        if 'select' in params:
+            rows = [fake.project(r, params['select'][0]) for r in rows]
+        self._send(201, rows)
+
+    def _call_rpc(self, fake, name, args):
+        if name not in fake.rpc:
+            return self._send(404, {'message': f'funzione {name} non trovata'})
+        return self._send(200, fake.rpc[name](fake, args))
+
+    def do_PATCH(self):
+        fake, path, params = self._route()
+        table = path[len('/rest/v1/'):]
+        changes = json.loads(self._body() or b'{}')
+        rows, _ = fake.query(table, {k: v for k, v in params.items() if k != 'select'})
+        updated = []
+        with fake._lock:
+            for row in fake.tables.get(table, []):
+                if any(row.get('id') == r.get('id') for r in rows):
+                    row.update(changes)
+                    row['updated_at'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+                    updated.append(dict(row))
+        self._send(200, updated)
+
+    def do_DELETE(self):
+        fake, path, params = self._route()
+        table = path[len('/rest/v1/'):]
+        rows, _ = fake.query(table, params)
+        ids = {r.get('id') for r in rows}
+        with fake._lock:
+            fake.tables[table] = [r for r in fake.tables.get(table, []) if r.get('id') not in ids]
+        if table in CON_ELIMINAZIONI and ids:
+            fake.insert('eliminazioni', [{'tabella': table, 'riga_id': id,
+                                          'eliminata_il': time.strftime('%Y-%m-%dT%H:%M:%S')} for id in ids])
+        self._send(200, rows)
+
+
+class FakeSupabaseServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, fake=None, host='127.0.0.1', port=0):
+        self.fake = fake or FakeSupabase()
+        super().__init__((host, port), Handler)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PostgREST/Storage finto per benchmark locali')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=54321)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Latenza aggiunta ad ogni richiesta')
+    parser.add_argument('--handshake-ms', type=float, default=0.0, help='Latenza aggiunta ad ogni nuova connessione')
+    args = parser.parse_args()
+
+    fake = FakeSupabase(latency=args.latency_ms / 1000, handshake_latency=args.handshake_ms / 1000)
+    server = FakeSupabaseServer(fake, args.host, args.port)
+    print(f'PostgREST finto in ascolto su {server.url}')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
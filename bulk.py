@@ -0,0 +1,187 @@
+"""
+Inserimento in blocco di spese e chilometriche.
+
+Un array di record (es. una settimana di spese sincronizzata dal
+telefono) viene validato in un solo passaggio, che calcola anche
+rimborso_calcolato per le chilometriche, e inserito con un POST
+PostgREST per ogni blocco di BULK_CHUNK_SIZE righe invece di un POST per
+riga.
+
+Un insert PostgREST è una singola transazione: se un blocco viene
+rifiutato (es. foreign key inesistente) le sue righe vengono ritentate
+una alla volta, così solo quelle davvero invalide finiscono negli errori.
+
+I record con chiave_client (generata dall'app per la coda offline) sono
+inseriti con ON CONFLICT (chiave_client) DO NOTHING: se la risposta a un
+invio va persa e l'app lo ripete, le righe già salvate non vengono
+duplicate e la risposta riporta comunque il loro id.
+
+Configurazione (variabili ambiente):
+    BULK_CHUNK_SIZE   righe per insert (default 500)
+    BULK_MAX_RECORDS  record accettati per richiesta (default 5000)
+"""
+import os
+import re
+
+DEFAULT_TARIFFA = 0.19
+
+# Colonne scrivibili e obbligatorie per tabella (vedi database/schema.sql)
+COLONNE = {
+    'spese': ('data_spesa', 'categoria_id', 'cliente_id', 'progetto_id', 'importo', 'descrizione',
+              'fornitore', 'numero_documento', 'addebitabile', 'addebitata', 'note', 'immagine_url',
+              'ocr_data', 'chiave_client'),
+    'chilometriche': ('data_viaggio', 'veicolo_id', 'cliente_id', 'progetto_id', 'partenza', 'arrivo',
+                      'km_percorsi', 'tariffa_applicata', 'rimborso_calcolato', 'addebitabile',
+                      'addebitata', 'descrizione', 'note', 'chiave_client'),
+}
+OBBLIGATORIE = {
+    'spese': ('data_spesa', 'importo', 'descrizione'),
+    'chilometriche': ('data_viaggio', 'partenza', 'arrivo', 'km_percorsi'),
+}
+# UUID (con o senza trattini): finisce in un filtro in.(...) di PostgREST
+CHIAVE_CLIENT_RE = re.compile(r'[0-9a-fA-F-]{32,36}')
+
+
+def calcola_rimborso(km, tariffa):
+    return round(float(km) * float(tariffa), 2)
+
+
+def valida(table, records):
+    """
+    Controlla i record e restituisce (righe valide, errori).
+    Le righe valide sono coppie (indice originale, record normalizzato).
+    """
+    colonne = set(COLONNE[table])
+    obbligatorie = OBBLIGATORIE[table]
+    chilometriche = table == 'chilometriche'
+    righe, errori = [], []
+
+    for indice, record in enumerate(records):
+        if not isinstance(record, dict):
+            errori.append({'indice': indice, 'error': 'Il record deve essere un oggetto'})
+            continue
+        sconosciute = [c for c in record if c not in colonne]
+        if sconosciute:
+            errori.append({'indice': indice, 'error': f"Colonne sconosciute: {', '.join(sconosciute)}"})
+            continue
+        mancanti = [c for c in obbligatorie if record.get(c) in (None, '')]
+        if mancanti:
+            errori.append({'indice': indice, 'error': f"Campi obbligatori mancanti: {', '.join(mancanti)}"})
+            continue
+
+        riga = dict(record)
+        if not riga.get('chiave_client'):
+            riga.pop('chiave_client', None)
+        elif not isinstance(riga['chiave_client'], str) or not CHIAVE_CLIENT_RE.fullmatch(riga['chiave_client']):
+            errori.append({'indice': indice, 'error': 'chiave_client non valida'})
+            continue
+        try:
+            if chilometriche:
+                # Tariffa 0 esplicita = nessun rimborso, come nelle route a riga singola
+                tariffa = riga.get('tariffa_applicata')
+                riga['tariffa_applicata'] = float(DEFAULT_TARIFFA if tariffa in (None, '') else tariffa)
+                riga['rimborso_calcolato'] = calcola_rimborso(riga['km_percorsi'], riga['tariffa_applicata'])
+            else:
+                float(riga['importo'])
+        except (TypeError, ValueError):
+            campo = 'km_percorsi' if chilometriche else 'importo'
+            errori.append({'indice': indice, 'error': f'Valore numerico non valido in {campo}'})
+            continue
+        righe.append((indice, riga))
+
+    return righe, errori
+
+
+def messaggio_errore(response):
+    try:
+        return response.json().get('message') or response.text
+    except ValueError:
+        return response.text
+
+
+def _abbina(client, table, blocco, inserite, con_chiave):
+    """[(indice, id)] delle righe del blocco dalla risposta dell'insert"""
+    if not con_chiave:
+        return [(indice, inserita['id']) for (indice, _), inserita in zip(blocco, inserite)]
+    # DO NOTHING restituisce solo le righe nuove: le altre erano già state
+    # salvate da un invio precedente e si cercano per chiave
+    per_chiave = {r['chiave_client']: r['id'] for r in inserite}
+    mancanti = sorted({riga['chiave_client'] for _, riga in blocco} - per_chiave.keys())
+    if mancanti:
+        response = client.get(table, params={'select': 'id,chiave_client',
+                                             'chiave_client': f"in.({','.join(mancanti)})"})
+        response.raise_for_status()
+        per_chiave.update((r['chiave_client'], r['id']) for r in response.json())
+    return [(indice, per_chiave[riga['chiave_client']]) for indice, riga in blocco
+            if riga['chiave_client'] in per_chiave]
+
+
+def _inserisci_blocco(client, table, blocco, headers):
+    """Inserisce un blocco; restituisce ([(indice, id)], errori)"""
+    colonne = sorted({c for _, riga in blocco for c in riga})
+    params = {'columns': ','.join(colonne), 'select': 'id'}
+    # I blocchi contengono solo righe con chiave_client oppure solo righe senza
+    con_chiave = 'chiave_client' in colonne
+    if con_chiave:
+        params.update(select='id,chiave_client', on_conflict='chiave_client')
+        headers = dict(headers, Prefer=headers['Prefer'] + ',resolution=ignore-duplicates')
+    try:
+        response = client.post(table, json=[riga for _, riga in blocco], params=params, headers=headers)
+        if response.ok:
+            return _abbina(client, table, blocco, response.json(), con_chiave), []
+    except Exception as e:
+        # Con chiave_client l'app può ripetere l'invio senza duplicare le righe già salvate
+        return [], [{'indice': i, 'error': str(e)} for i, _ in blocco]
+
+    if 400 <= response.status_code < 500 and len(blocco) > 1:
+        # Il blocco è stato annullato per intero: si isolano le righe invalide
+        params.pop('columns')
+        inserite, errori = [], []
+        for indice, riga in blocco:
+            try:
+                singola = client.post(table, json=riga, params=params, headers=headers)
+                if singola.ok:
+                    inserite.extend(_abbina(client, table, [(indice, riga)], singola.json(), con_chiave))
+                    continue
+            except Exception as e:
+                errori.append({'indice': indice, 'error': str(e)})
+                continue
+            errori.append({'indice': indice, 'error': messaggio_errore(singola)})
+        return inserite, errori
+    messaggio = messaggio_errore(response)
+    return [], [{'indice': i, 'error': messaggio} for i, _ in blocco]
+
+
+def inserisci(client, table, records, chunk_size=500):
+    """
+    Valida e inserisce i record a blocchi, inviati in parallelo.
+    Restituisce {'inseriti', 'ids', 'errori'}: ids è allineato ai record in
+    ingresso (None per quelli non inseriti).
+    """
+    righe, errori = valida(table, records)
+    ids = [None] * len(records)
+    # missing=default: le colonne assenti in un record prendono il default SQL, non NULL
+    headers = {'Prefer': 'return=representation,missing=default'}
+
+    con_chiave = [r for r in righe if 'chiave_client' in r[1]]
+    senza_chiave = [r for r in righe if 'chiave_client' not in r[1]]
+    blocchi = [gruppo[start:start + chunk_size] for gruppo in (con_chiave, senza_chiave)
+               for start in range(0, len(gruppo), chunk_size)]
+    # Ogni blocco è una transazione a sé: l'ordine di inserimento non conta
+    risultati = client.gather(*(lambda blocco=blocco: _inserisci_blocco(client, table, blocco, headers)
+                                for blocco in blocchi))
+    for inserite, errori_blocco in risultati:
+        for indice, id_ in inserite:
+            ids[indice] = id_
+        errori.extend(errori_blocco)
+
+    errori.sort(key=lambda e: e['indice'])
+    return {
+        'inseriti': sum(1 for i in ids if i is not None),
+        'ids': ids,
+        'errori': errori,
+    }
+
+
+def limiti_from_env():
+    return int(os.getenv('BULK_CHUNK_SIZE', 500)), int(os.getenv('BULK_MAX_RECORDS', 5000))
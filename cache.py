@@ -0,0 +1,149 @@
+"""
+Cache in-process (TTL + LRU) per i dati di riferimento: categorie,
+clienti, veicoli, progetti.
+
+Ogni voce è associata alla "versione" del suo namespace. Le route di
+scrittura invalidano il namespace incrementandone la versione, così le
+voci vecchie diventano subito dei miss.
+
+Con più worker gunicorn ogni processo ha la sua cache: impostando
+CACHE_REDIS_URL le versioni vengono lette da Redis (una GET per lettura)
+e un'invalidazione in un worker vale per tutti. Senza Redis le versioni
+restano locali e gli altri worker si riallineano entro CACHE_TTL secondi.
+
+Configurazione (variabili ambiente):
+    CACHE_TTL        secondi di validità delle voci (default 300)
+    CACHE_MAXSIZE    numero massimo di voci (default 256)
+    CACHE_REDIS_URL  backend condiviso opzionale, es. redis://localhost:6379/0
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+class LocalVersions:
+    """Versioni dei namespace nel solo processo corrente"""
+
+    def __init__(self):
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace):
+        return self._versions.get(namespace, 0)
+
+    def bump(self, namespace):
+        with self._lock:
+            self._versions[namespace] = self._versions.get(namespace, 0) + 1
+
+
+class RedisVersions:
+    """Versioni condivise tra worker tramite contatori Redis"""
+
+    def __init__(self, url, prefix='expense-tracker:cache:'):
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self.prefix = prefix
+
+    def get(self, namespace):
+        # Se Redis non risponde restituisce None: la cache viene bypassata
+        try:
+            value = self.client.get(self.prefix + namespace)
+            return int(value) if value else 0
+        except redis.RedisError as e:
+            logger.warning('Redis non disponibile, cache bypassata: %s', e)
+            return None
+
+    def bump(self, namespace):
+        try:
+            self.client.incr(self.prefix + namespace)
+        except redis.RedisError as e:
+            logger.warning('Invalidazione su Redis fallita: %s', e)
+
+
+class TTLCache:
+    def __init__(self, maxsize=256, ttl=300, versions=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.versions = versions or LocalVersions()
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get_or_load(self, namespace, key, loader):
+        """Restituisce il valore in cache o lo carica con loader() (le eccezioni non vengono salvate)"""
+        version = self.versions.get(namespace)
+        full_key = (namespace, key)
+        now = time.monotonic()
+
+        if version is not None:
+            with self._lock:
+                entry = self._data.get(full_key)
+                if entry and entry[0] > now and entry[1] == version:
+                    self._data.move_to_end(full_key)
+                    self.hits += 1
+                    return entry[2]
+                self.misses += 1
+
+        value = loader()
+
+        if version is not None:
+            with self._lock:
+                self._data[full_key] = (now + self.ttl, version, value)
+                self._data.move_to_end(full_key)
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+                    self.evictions += 1
+        return value
+
+    def invalidate(self, *namespaces):
+        for namespace in namespaces:
+            self.versions.bump(namespace)
+            self.invalidations += 1
+        with self._lock:
+            for full_key in [k for k in self._data if k[0] in namespaces]:
+                del self._data[full_key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            richieste = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / richieste, 4) if richieste else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'backend': 'redis' if isinstance(self.versions, RedisVersions) else 'local'
+            }
+
+
+def cache_from_env():
+    versions = None
+    redis_url = os.getenv('CACHE_REDIS_URL')
+    if redis_url:
+        if redis is None:
+            logger.warning('CACHE_REDIS_URL impostato ma il pacchetto redis non è installato')
+        else:
+            versions = RedisVersions(redis_url)
+    return TTLCache(
+        maxsize=int(os.getenv('CACHE_MAXSIZE', 256)),
+        ttl=float(os.getenv('CACHE_TTL', 300)),
+        versions=versions
+    )
@@ -0,0 +1,100 @@
+"""
+ETag forti e GET condizionali (If-None-Match -> 304) per le liste.
+
+Per spese e chilometriche l'ETag non viene calcolato sul corpo della
+risposta, che andrebbe comunque scaricato da Supabase, ma su
+un'impronta economica: max(updated_at) e numero di righe che
+soddisfano gli stessi filtri, più l'impronta delle tabelle di
+riferimento incorporate (categorie, clienti, ...). Se l'impronta non
+cambia il client riceve 304 senza che la lista venga letta.
+
+Per le liste di riferimento, servite dalla cache, l'ETag è l'hash del
+corpo stesso.
+"""
+import hashlib
+import json
+
+from flask import Response, jsonify, request
+
+# Da incrementare se cambia il formato delle risposte, per invalidare gli ETag esistenti
+ETAG_VERSION = '1'
+
+# Parametri che non cambiano l'insieme di righe selezionato
+NON_FILTRI = ('select', 'order', 'limit', 'offset', 'or')
+
+
+def make_etag(*parts):
+    digest = hashlib.sha1(ETAG_VERSION.encode())
+    for part in parts:
+        digest.update(b'\0')
+        digest.update(str(part).encode())
+    return digest.hexdigest()
+
+
+def body_etag(payload):
+    return make_etag(json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str))
+
+
+def table_fingerprint(client, table, params):
+    """max(updated_at) e count delle righe filtrate, in una sola chiamata PostgREST"""
+    fp_params = {k: v for k, v in params.items() if k not in NON_FILTRI}
+    fp_params['select'] = 'updated_at'
+    fp_params['order'] = 'updated_at.desc.nullslast'
+    fp_params['limit'] = '1'
+    response = client.get(table, params=fp_params, headers={'Prefer': 'count=exact'})
+    response.raise_for_status()
+    rows = response.json()
+    total = response.headers.get('Content-Range', '').rpartition('/')[2]
+    return f"{rows[0]['updated_at'] if rows else ''}/{total}"
+
+
+def references_fingerprint(client):
+    response = client.rpc('fingerprint_riferimenti')
+    response.raise_for_status()
+    return json.dumps(response.json(), sort_keys=True)
+
+
+def list_etag(client, table, params, fingerprint=None):
+    etag, _ = list_etag_with(client, table, params, fingerprint=fingerprint)
+    return etag
+
+
+def list_etag_with(client, table, params, *calls, fingerprint=None):
+    """
+    ETag della lista più altre letture indipendenti (calls), tutte in
+    parallelo: restituisce (etag, risultati di calls). fingerprint()
+    sostituisce table_fingerprint (es. impronta calcolata dallo snapshot).
+    """
+    # Il percorso completo distingue filtri e cursori diversi
+    path = request.full_path
+    fingerprint = fingerprint or (lambda: table_fingerprint(client, table, params))
+    results = client.gather(fingerprint, lambda: references_fingerprint(client), *calls)
+    return make_etag(path, results[0], results[1]), results[2:]
+
+
+def is_fresh(etag):
+    return etag in request.if_none_match
+
+
+def not_modified(etag):
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def json_with_etag(payload, etag, status=200):
+    response = jsonify(payload)
+    response.status_code = status
+    response.set_etag(etag)
+    # Il browser può conservare la risposta ma deve sempre rivalidarla
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def conditional_json(payload):
+    """Risposta per un corpo già disponibile (es. dalla cache): 304 se l'ETag coincide"""
+    etag = body_etag(payload)
+    if is_fresh(etag):
+        return not_modified(etag)
+    return json_with_etag(payload, etag)
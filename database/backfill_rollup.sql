@@ -0,0 +1,50 @@
+-- Ricostruzione dei rollup mensili da spese e chilometriche
+-- Da eseguire nel SQL Editor dopo aver creato tabelle e trigger di
+-- rollup (sezione "Rollup mensili" di schema.sql) su un database che
+-- contiene già dati, oppure per riallineare i rollup in caso di dubbi.
+-- Su un database esistente le vecchie view vanno prima eliminate
+-- (DROP VIEW v_totali_mensili, v_km_veicolo) perché cambiano i tipi
+-- delle colonne.
+
+BEGIN;
+
+-- Blocca le scritture durante la ricostruzione: un insert concorrente
+-- verrebbe contato due volte (dal trigger e dalla SELECT sottostante)
+LOCK TABLE spese, chilometriche IN SHARE MODE;
+
+TRUNCATE rollup_spese_mensili, rollup_km_mensili;
+
+INSERT INTO rollup_spese_mensili (mese, categoria_id, num_spese, totale, totale_addebitabile)
+SELECT
+    date_trunc('month', data_spesa)::DATE,
+    COALESCE(categoria_id, 0),
+    COUNT(*),
+    SUM(importo),
+    COALESCE(SUM(importo) FILTER (WHERE addebitabile), 0)
+FROM spese
+GROUP BY 1, 2;
+
+INSERT INTO rollup_km_mensili (mese, veicolo_id, num_viaggi, km_totali, rimborso_totale)
+SELECT
+    date_trunc('month', data_viaggio)::DATE,
+    COALESCE(veicolo_id, 0),
+    COUNT(*),
+    SUM(km_percorsi),
+    SUM(rimborso_calcolato)
+FROM chilometriche
+GROUP BY 1, 2;
+
+COMMIT;
+
+-- Verifica: entrambe le query devono restituire zero righe
+-- SELECT date_trunc('month', data_spesa)::DATE AS mese, COALESCE(categoria_id, 0) AS categoria_id,
+--        COUNT(*) AS num_spese, SUM(importo) AS totale
+-- FROM spese GROUP BY 1, 2
+-- EXCEPT
+-- SELECT mese, categoria_id, num_spese, totale FROM rollup_spese_mensili;
+--
+-- SELECT date_trunc('month', data_viaggio)::DATE AS mese, COALESCE(veicolo_id, 0) AS veicolo_id,
+--        COUNT(*) AS num_viaggi, SUM(km_percorsi) AS km_totali
+-- FROM chilometriche GROUP BY 1, 2
+-- EXCEPT
+-- SELECT mese, veicolo_id, num_viaggi, km_totali FROM rollup_km_mensili;
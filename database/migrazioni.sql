@@ -0,0 +1,32 @@
+-- Colonne aggiunte a tabelle esistenti dopo la prima versione di schema.sql
+-- Da eseguire nel SQL Editor su un database creato con una versione
+-- precedente dello schema: ogni istruzione è idempotente, si può
+-- rieseguire senza errori (CREATE OR REPLACE TRIGGER richiede
+-- PostgreSQL 14, come su Supabase). Un database nuovo creato con
+-- schema.sql ha già tutte queste colonne.
+
+-- ETag delle liste (conditional.py) e /api/sync: categorie e veicoli non
+-- avevano updated_at. Senza queste colonne fingerprint_riferimenti() non si
+-- può creare e le letture con updated_at falliscono. Usa la funzione
+-- update_updated_at_column() già definita in schema.sql. Esegui questa parte
+-- prima di creare fingerprint_riferimenti() da schema.sql.
+ALTER TABLE categorie ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE veicoli ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+
+CREATE OR REPLACE TRIGGER update_categorie_updated_at BEFORE UPDATE ON categorie
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+CREATE OR REPLACE TRIGGER update_veicoli_updated_at BEFORE UPDATE ON veicoli
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+-- Import CSV (/api/import/spese, importazione.py): chiave di idempotenza
+-- calcolata dal contenuto della riga importata. L'upsert a blocchi usa
+-- ON CONFLICT (chiave_importazione) DO NOTHING, quindi ripetere l'import
+-- dello stesso estratto conto non inserisce nulla. Le spese inserite a mano
+-- hanno NULL, che non è mai in conflitto con il vincolo UNIQUE.
+ALTER TABLE spese ADD COLUMN IF NOT EXISTS chiave_importazione TEXT UNIQUE;
+
+-- Chiave generata dall'app per gli inserimenti in coda offline
+-- (/api/*/bulk, static/idb-store.js): reinviare un blocco la cui risposta
+-- è andata persa non duplica le righe
+ALTER TABLE spese ADD COLUMN IF NOT EXISTS chiave_client TEXT UNIQUE;
+ALTER TABLE chilometriche ADD COLUMN IF NOT EXISTS chiave_client TEXT UNIQUE;
@@ -8,7 +8,8 @@ CREATE TABLE categorie (
     descrizione TEXT,
     colore VARCHAR(7) DEFAULT '#6B7280',
     attiva BOOLEAN DEFAULT true,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
 -- Inserimento categorie predefinite
@@ -65,12 +66,13 @@ CREATE TABLE veicoli (
     marca VARCHAR(50),
     modello VARCHAR(50),
     anno INTEGER,
-    tariff_km_aci DECIMAL(5,3) DEFAULT 0.680, -- Tariffa ACI standard
+    tariffa_km_aci DECIMAL(5,3) DEFAULT 0.680, -- Tariffa ACI standard
     tariffa_km_custom DECIMAL(5,3), -- Tariffa personalizzata
     usa_tariffa_custom BOOLEAN DEFAULT false,
     note TEXT,
     attivo BOOLEAN DEFAULT true,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
 -- Tabella Spese
@@ -89,6 +91,8 @@ CREATE TABLE spese (
     note TEXT,
     immagine_url TEXT, -- URL immagine ricevuta su Supabase Storage
     ocr_data JSONB, -- Dati estratti dall'OCR
+    chiave_importazione TEXT UNIQUE, -- Import CSV: chiave dal contenuto della riga, un reimport non duplica
+    chiave_client TEXT UNIQUE, -- Chiave generata dall'app offline: un reinvio non duplica la riga
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
@@ -109,20 +113,29 @@ CREATE TABLE chilometriche (
     addebitata BOOLEAN DEFAULT false,
     descrizione TEXT,
     note TEXT,
+    chiave_client TEXT UNIQUE, -- Come per spese
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
 -- Indici per performance
-CREATE INDEX idx_spese_data ON spese(data_spesa);
+-- (data, id) copre sia i filtri per data sia la paginazione keyset ordinata per data DESC, id DESC
+CREATE INDEX idx_spese_data_id ON spese(data_spesa DESC, id DESC);
 CREATE INDEX idx_spese_cliente ON spese(cliente_id);
 CREATE INDEX idx_spese_progetto ON spese(progetto_id);
 CREATE INDEX idx_spese_categoria ON spese(categoria_id);
 CREATE INDEX idx_spese_addebitabile ON spese(addebitabile);
-CREATE INDEX idx_chilometriche_data ON chilometriche(data_viaggio);
+CREATE INDEX idx_chilometriche_data_id ON chilometriche(data_viaggio DESC, id DESC);
 CREATE INDEX idx_chilometriche_veicolo ON chilometriche(veicolo_id);
 CREATE INDEX idx_chilometriche_cliente ON chilometriche(cliente_id);
 CREATE INDEX idx_progetti_cliente ON progetti(cliente_id);
+-- updated_at: letture incrementali di /api/sync e impronte degli ETag
+CREATE INDEX idx_categorie_updated_at ON categorie(updated_at);
+CREATE INDEX idx_clienti_updated_at ON clienti(updated_at);
+CREATE INDEX idx_progetti_updated_at ON progetti(updated_at);
+CREATE INDEX idx_veicoli_updated_at ON veicoli(updated_at);
+CREATE INDEX idx_spese_updated_at ON spese(updated_at);
+CREATE INDEX idx_chilometriche_updated_at ON chilometriche(updated_at);
 
 -- Funzione per aggiornare updated_at
 CREATE OR REPLACE FUNCTION update_updated_at_column()
@@ -134,19 +147,26 @@ END;
 $$ LANGUAGE plpgsql;
 
 -- Trigger per aggiornare automaticamente updated_at
+CREATE TRIGGER update_categorie_updated_at BEFORE UPDATE ON categorie
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
 CREATE TRIGGER update_clienti_updated_at BEFORE UPDATE ON clienti
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 
 CREATE TRIGGER update_progetti_updated_at BEFORE UPDATE ON progetti
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 
+CREATE TRIGGER update_veicoli_updated_at BEFORE UPDATE ON veicoli
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
 CREATE TRIGGER update_spese_updated_at BEFORE UPDATE ON spese
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 
 CREATE TRIGGER update_chilometriche_updated_at BEFORE UPDATE ON chilometriche
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 
--- View per report spese per cliente
+-- View per report spese per cliente (spesa_id e progetto_id in coda:
+-- su un database esistente basta CREATE OR REPLACE VIEW)
 CREATE VIEW v_spese_cliente AS
 SELECT 
     c.id as cliente_id,
@@ -158,36 +178,570 @@ SELECT
     s.descrizione,
     s.addebitabile,
     s.addebitata,
-    s.fornitore
+    s.fornitore,
+    s.id as spesa_id,
+    s.progetto_id
 FROM spese s
 LEFT JOIN clienti c ON s.cliente_id = c.id
 LEFT JOIN categorie cat ON s.categoria_id = cat.id
 LEFT JOIN progetti p ON s.progetto_id = p.id;
 
--- View per totali mensili
+-- Rollup mensili mantenuti dai trigger: i report leggono poche righe per
+-- mese invece di riaggregare tutto lo storico di spese e chilometriche.
+-- La chiave 0 raccoglie le righe senza categoria/veicolo.
+CREATE TABLE rollup_spese_mensili (
+    mese DATE NOT NULL, -- primo giorno del mese
+    categoria_id INTEGER NOT NULL DEFAULT 0,
+    num_spese INTEGER NOT NULL DEFAULT 0,
+    totale DECIMAL(14,2) NOT NULL DEFAULT 0,
+    totale_addebitabile DECIMAL(14,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (mese, categoria_id)
+);
+
+CREATE TABLE rollup_km_mensili (
+    mese DATE NOT NULL,
+    veicolo_id INTEGER NOT NULL DEFAULT 0,
+    num_viaggi INTEGER NOT NULL DEFAULT 0,
+    km_totali DECIMAL(12,2) NOT NULL DEFAULT 0,
+    rimborso_totale DECIMAL(14,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (mese, veicolo_id)
+);
+
+-- Trigger a livello di statement con tabelle di transizione: un insert
+-- in blocco da 500 righe produce un upsert per (mese, categoria), non 500
+CREATE OR REPLACE FUNCTION aggiorna_rollup_spese()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO rollup_spese_mensili AS r (mese, categoria_id, num_spese, totale, totale_addebitabile)
+        SELECT date_trunc('month', data_spesa)::DATE, COALESCE(categoria_id, 0),
+               -COUNT(*), -SUM(importo), -COALESCE(SUM(importo) FILTER (WHERE addebitabile), 0)
+        FROM vecchie
+        GROUP BY 1, 2
+        ON CONFLICT (mese, categoria_id) DO UPDATE SET
+            num_spese = r.num_spese + EXCLUDED.num_spese,
+            totale = r.totale + EXCLUDED.totale,
+            totale_addebitabile = r.totale_addebitabile + EXCLUDED.totale_addebitabile;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO rollup_spese_mensili AS r (mese, categoria_id, num_spese, totale, totale_addebitabile)
+        SELECT date_trunc('month', data_spesa)::DATE, COALESCE(categoria_id, 0),
+               COUNT(*), SUM(importo), COALESCE(SUM(importo) FILTER (WHERE addebitabile), 0)
+        FROM nuove
+        GROUP BY 1, 2
+        ON CONFLICT (mese, categoria_id) DO UPDATE SET
+            num_spese = r.num_spese + EXCLUDED.num_spese,
+            totale = r.totale + EXCLUDED.totale,
+            totale_addebitabile = r.totale_addebitabile + EXCLUDED.totale_addebitabile;
+    END IF;
+    DELETE FROM rollup_spese_mensili WHERE num_spese = 0;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION aggiorna_rollup_km()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO rollup_km_mensili AS r (mese, veicolo_id, num_viaggi, km_totali, rimborso_totale)
+        SELECT date_trunc('month', data_viaggio)::DATE, COALESCE(veicolo_id, 0),
+               -COUNT(*), -SUM(km_percorsi), -SUM(rimborso_calcolato)
+        FROM vecchie
+        GROUP BY 1, 2
+        ON CONFLICT (mese, veicolo_id) DO UPDATE SET
+            num_viaggi = r.num_viaggi + EXCLUDED.num_viaggi,
+            km_totali = r.km_totali + EXCLUDED.km_totali,
+            rimborso_totale = r.rimborso_totale + EXCLUDED.rimborso_totale;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO rollup_km_mensili AS r (mese, veicolo_id, num_viaggi, km_totali, rimborso_totale)
+        SELECT date_trunc('month', data_viaggio)::DATE, COALESCE(veicolo_id, 0),
+               COUNT(*), SUM(km_percorsi), SUM(rimborso_calcolato)
+        FROM nuove
+        GROUP BY 1, 2
+        ON CONFLICT (mese, veicolo_id) DO UPDATE SET
+            num_viaggi = r.num_viaggi + EXCLUDED.num_viaggi,
+            km_totali = r.km_totali + EXCLUDED.km_totali,
+            rimborso_totale = r.rimborso_totale + EXCLUDED.rimborso_totale;
+    END IF;
+    DELETE FROM rollup_km_mensili WHERE num_viaggi = 0;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Postgres non ammette tabelle di transizione su trigger con più eventi:
+-- un trigger per evento, stessa funzione
+CREATE TRIGGER rollup_spese_insert AFTER INSERT ON spese
+    REFERENCING NEW TABLE AS nuove
+    FOR EACH STATEMENT EXECUTE FUNCTION aggiorna_rollup_spese();
+
+CREATE TRIGGER rollup_spese_update AFTER UPDATE ON spese
+    REFERENCING OLD TABLE AS vecchie NEW TABLE AS nuove
+    FOR EACH STATEMENT EXECUTE FUNCTION aggiorna_rollup_spese();
+
+CREATE TRIGGER rollup_spese_delete AFTER DELETE ON spese
+    REFERENCING OLD TABLE AS vecchie
+    FOR EACH STATEMENT EXECUTE FUNCTION aggiorna_rollup_spese();
+
+CREATE TRIGGER rollup_km_insert AFTER INSERT ON chilometriche
+    REFERENCING NEW TABLE AS nuove
+    FOR EACH STATEMENT EXECUTE FUNCTION aggiorna_rollup_km();
+
+CREATE TRIGGER rollup_km_update AFTER UPDATE ON chilometriche
+    REFERENCING OLD TABLE AS vecchie NEW TABLE AS nuove
+    FOR EACH STATEMENT EXECUTE FUNCTION aggiorna_rollup_km();
+
+CREATE TRIGGER rollup_km_delete AFTER DELETE ON chilometriche
+    REFERENCING OLD TABLE AS vecchie
+    FOR EACH STATEMENT EXECUTE FUNCTION aggiorna_rollup_km();
+
+-- Eliminazioni (tombstone) per la sincronizzazione incrementale (/api/sync):
+-- le righe cancellate non hanno più un updated_at da confrontare
+CREATE TABLE eliminazioni (
+    id BIGSERIAL PRIMARY KEY,
+    tabella TEXT NOT NULL,
+    riga_id INTEGER NOT NULL,
+    eliminata_il TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX idx_eliminazioni_eliminata_il ON eliminazioni(eliminata_il);
+
+CREATE OR REPLACE FUNCTION registra_eliminazioni()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO eliminazioni (tabella, riga_id)
+    SELECT TG_TABLE_NAME, id FROM vecchie;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER eliminazioni_categorie AFTER DELETE ON categorie
+    REFERENCING OLD TABLE AS vecchie
+    FOR EACH STATEMENT EXECUTE FUNCTION registra_eliminazioni();
+
+CREATE TRIGGER eliminazioni_clienti AFTER DELETE ON clienti
+    REFERENCING OLD TABLE AS vecchie
+    FOR EACH STATEMENT EXECUTE FUNCTION registra_eliminazioni();
+
+CREATE TRIGGER eliminazioni_progetti AFTER DELETE ON progetti
+    REFERENCING OLD TABLE AS vecchie
+    FOR EACH STATEMENT EXECUTE FUNCTION registra_eliminazioni();
+
+CREATE TRIGGER eliminazioni_veicoli AFTER DELETE ON veicoli
+    REFERENCING OLD TABLE AS vecchie
+    FOR EACH STATEMENT EXECUTE FUNCTION registra_eliminazioni();
+
+CREATE TRIGGER eliminazioni_spese AFTER DELETE ON spese
+    REFERENCING OLD TABLE AS vecchie
+    FOR EACH STATEMENT EXECUTE FUNCTION registra_eliminazioni();
+
+CREATE TRIGGER eliminazioni_chilometriche AFTER DELETE ON chilometriche
+    REFERENCING OLD TABLE AS vecchie
+    FOR EACH STATEMENT EXECUTE FUNCTION registra_eliminazioni();
+
+-- Watermark di /api/sync: stesso orologio (e fuso) di updated_at
+CREATE OR REPLACE FUNCTION istante_sync()
+RETURNS TIMESTAMP AS $$
+    SELECT LOCALTIMESTAMP;
+$$ LANGUAGE sql STABLE;
+
+-- Tombstone più vecchi della finestra di SYNC_RETENTION_DAYS: i client
+-- fermi da più tempo ricevono comunque una sincronizzazione completa.
+-- Da pianificare, es. con pg_cron: SELECT pulisci_eliminazioni(30);
+CREATE OR REPLACE FUNCTION pulisci_eliminazioni(p_giorni INTEGER DEFAULT 30)
+RETURNS INTEGER AS $$
+DECLARE
+    eliminate INTEGER;
+BEGIN
+    DELETE FROM eliminazioni WHERE eliminata_il < CURRENT_TIMESTAMP - make_interval(days => p_giorni);
+    GET DIAGNOSTICS eliminate = ROW_COUNT;
+    RETURN eliminate;
+END;
+$$ LANGUAGE plpgsql;
+
+-- View per totali mensili (letta dai rollup, stesse colonne di prima)
 CREATE VIEW v_totali_mensili AS
 SELECT 
-    EXTRACT(YEAR FROM data_spesa) as anno,
-    EXTRACT(MONTH FROM data_spesa) as mese,
+    EXTRACT(YEAR FROM r.mese) as anno,
+    EXTRACT(MONTH FROM r.mese) as mese,
     cat.nome as categoria,
-    COUNT(*) as num_spese,
-    SUM(importo) as totale,
-    SUM(CASE WHEN addebitabile THEN importo ELSE 0 END) as totale_addebitabile
-FROM spese s
-LEFT JOIN categorie cat ON s.categoria_id = cat.id
-GROUP BY anno, mese, cat.nome;
+    r.num_spese,
+    r.totale,
+    r.totale_addebitabile
+FROM rollup_spese_mensili r
+LEFT JOIN categorie cat ON r.categoria_id = cat.id;
 
--- View per km totali per veicolo
+-- View per km totali per veicolo (letta dai rollup)
 CREATE VIEW v_km_veicolo AS
 SELECT 
     v.targa,
     v.marca,
     v.modello,
-    EXTRACT(YEAR FROM ch.data_viaggio) as anno,
-    EXTRACT(MONTH FROM ch.data_viaggio) as mese,
-    COUNT(*) as num_viaggi,
-    SUM(ch.km_percorsi) as km_totali,
-    SUM(ch.rimborso_calcolato) as rimborso_totale
-FROM chilometriche ch
-JOIN veicoli v ON ch.veicolo_id = v.id
-GROUP BY v.targa, v.marca, v.modello, anno, mese;
+    EXTRACT(YEAR FROM r.mese) as anno,
+    EXTRACT(MONTH FROM r.mese) as mese,
+    r.num_viaggi,
+    r.km_totali,
+    r.rimborso_totale
+FROM rollup_km_mensili r
+JOIN veicoli v ON r.veicolo_id = v.id;
+
+-- Statistiche dashboard in un solo round-trip (RPC /rest/v1/rpc/dashboard_stats)
+-- Aggrega nel database invece di scaricare tutte le righe del mese
+CREATE OR REPLACE FUNCTION dashboard_stats(p_da DATE, p_ultime INTEGER DEFAULT 10)
+RETURNS JSON AS $$
+    WITH totali_spese AS (
+        SELECT
+            COALESCE(SUM(importo), 0) AS spese_mese,
+            COALESCE(SUM(importo) FILTER (WHERE addebitabile), 0) AS spese_addebitabili
+        FROM spese
+        WHERE data_spesa >= p_da
+    ),
+    totali_km AS (
+        SELECT
+            COALESCE(SUM(km_percorsi), 0) AS km_mese,
+            COALESCE(SUM(rimborso_calcolato), 0) AS rimborsi_km
+        FROM chilometriche
+        WHERE data_viaggio >= p_da
+    ),
+    per_categoria AS (
+        SELECT cat.nome, cat.colore, SUM(s.importo) AS totale
+        FROM spese s
+        JOIN categorie cat ON s.categoria_id = cat.id
+        WHERE s.data_spesa >= p_da
+        GROUP BY cat.nome, cat.colore
+    ),
+    ultime AS (
+        SELECT
+            s.*,
+            CASE WHEN cat.id IS NULL THEN NULL
+                 ELSE json_build_object('nome', cat.nome, 'colore', cat.colore) END AS categorie,
+            CASE WHEN c.id IS NULL THEN NULL
+                 ELSE json_build_object('nome', c.nome) END AS clienti
+        FROM spese s
+        LEFT JOIN categorie cat ON s.categoria_id = cat.id
+        LEFT JOIN clienti c ON s.cliente_id = c.id
+        ORDER BY s.data_spesa DESC, s.id DESC
+        LIMIT p_ultime
+    )
+    SELECT json_build_object(
+        'spese_mese', ts.spese_mese,
+        'spese_addebitabili', ts.spese_addebitabili,
+        'km_mese', tk.km_mese,
+        'rimborsi_km', tk.rimborsi_km,
+        'spese_per_categoria', COALESCE(
+            (SELECT json_agg(pc ORDER BY pc.totale DESC) FROM per_categoria pc), '[]'::json),
+        'ultime_spese', COALESCE(
+            (SELECT json_agg(u ORDER BY u.data_spesa DESC, u.id DESC) FROM ultime u), '[]'::json)
+    )
+    FROM totali_spese ts, totali_km tk;
+$$ LANGUAGE sql STABLE;
+
+-- Totali km/rimborsi per i filtri della pagina chilometriche
+-- (la lista è paginata, quindi i totali non si possono sommare lato client)
+CREATE OR REPLACE FUNCTION totali_chilometriche(
+    p_da DATE DEFAULT NULL,
+    p_a DATE DEFAULT NULL,
+    p_veicolo_id INTEGER DEFAULT NULL,
+    p_cliente_id INTEGER DEFAULT NULL
+)
+RETURNS JSON AS $$
+    SELECT json_build_object(
+        'num_viaggi', COUNT(*),
+        'km_totali', COALESCE(SUM(km_percorsi), 0),
+        'rimborso_totale', COALESCE(SUM(rimborso_calcolato), 0)
+    )
+    FROM chilometriche
+    WHERE (p_da IS NULL OR data_viaggio >= p_da)
+      AND (p_a IS NULL OR data_viaggio <= p_a)
+      AND (p_veicolo_id IS NULL OR veicolo_id = p_veicolo_id)
+      AND (p_cliente_id IS NULL OR cliente_id = p_cliente_id);
+$$ LANGUAGE sql STABLE;
+
+-- Totali della lista spese filtrata (prima pagina di /api/spese), con il
+-- dettaglio per categoria
+CREATE OR REPLACE FUNCTION totali_spese(
+    p_da DATE DEFAULT NULL,
+    p_a DATE DEFAULT NULL,
+    p_categoria_id INTEGER DEFAULT NULL,
+    p_cliente_id INTEGER DEFAULT NULL,
+    p_addebitabile BOOLEAN DEFAULT NULL
+)
+RETURNS JSON AS $$
+    WITH filtrate AS (
+        SELECT categoria_id, importo
+        FROM spese
+        WHERE (p_da IS NULL OR data_spesa >= p_da)
+          AND (p_a IS NULL OR data_spesa <= p_a)
+          AND (p_categoria_id IS NULL OR categoria_id = p_categoria_id)
+          AND (p_cliente_id IS NULL OR cliente_id = p_cliente_id)
+          AND (p_addebitabile IS NULL OR addebitabile = p_addebitabile)
+    )
+    SELECT json_build_object(
+        'num_spese', (SELECT COUNT(*) FROM filtrate),
+        'importo_totale', (SELECT COALESCE(SUM(importo), 0) FROM filtrate),
+        'per_categoria', COALESCE((
+            SELECT json_agg(json_build_object('categoria_id', categoria_id, 'num_spese', num, 'totale', totale)
+                            ORDER BY totale DESC, categoria_id NULLS LAST)
+            FROM (
+                SELECT categoria_id, COUNT(*) AS num, SUM(importo) AS totale
+                FROM filtrate
+                GROUP BY categoria_id
+            ) gruppi
+        ), '[]'::json)
+    );
+$$ LANGUAGE sql STABLE;
+
+-- Impronta delle tabelle di riferimento per gli ETag delle liste:
+-- una modifica a categorie/clienti/progetti/veicoli cambia anche le
+-- liste di spese e chilometriche che le incorporano
+CREATE OR REPLACE FUNCTION fingerprint_riferimenti()
+RETURNS JSON AS $$
+    SELECT json_build_object(
+        'categorie', (SELECT COALESCE(MAX(updated_at)::TEXT, '') || '/' || COUNT(*) FROM categorie),
+        'clienti', (SELECT COALESCE(MAX(updated_at)::TEXT, '') || '/' || COUNT(*) FROM clienti),
+        'progetti', (SELECT COALESCE(MAX(updated_at)::TEXT, '') || '/' || COUNT(*) FROM progetti),
+        'veicoli', (SELECT COALESCE(MAX(updated_at)::TEXT, '') || '/' || COUNT(*) FROM veicoli)
+    );
+$$ LANGUAGE sql STABLE;
+
+-- Ricerca full-text (configurazione italiana) e fuzzy (trigrammi) su
+-- spese e chilometriche, per /api/search. I documenti sono calcolati da
+-- funzioni IMMUTABLE e indicizzati come espressioni: nessuna colonna
+-- tsvector in più nelle risposte select=*.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE OR REPLACE FUNCTION documento_spesa(descrizione TEXT, fornitore TEXT, numero_documento TEXT, note TEXT)
+RETURNS tsvector AS $$
+    SELECT setweight(to_tsvector('italian'::regconfig,
+                                 coalesce(descrizione, '') || ' ' || coalesce(fornitore, '') || ' ' ||
+                                 coalesce(numero_documento, '')), 'A')
+        || setweight(to_tsvector('italian'::regconfig, coalesce(note, '')), 'C');
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION testo_spesa(descrizione TEXT, fornitore TEXT, numero_documento TEXT, note TEXT)
+RETURNS TEXT AS $$
+    SELECT lower(coalesce(descrizione, '') || ' ' || coalesce(fornitore, '') || ' ' ||
+                 coalesce(numero_documento, '') || ' ' || coalesce(note, ''));
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION documento_viaggio(partenza TEXT, arrivo TEXT, descrizione TEXT, note TEXT)
+RETURNS tsvector AS $$
+    SELECT setweight(to_tsvector('italian'::regconfig, coalesce(partenza, '') || ' ' || coalesce(arrivo, '')), 'A')
+        || setweight(to_tsvector('italian'::regconfig, coalesce(descrizione, '')), 'B')
+        || setweight(to_tsvector('italian'::regconfig, coalesce(note, '')), 'C');
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION testo_viaggio(partenza TEXT, arrivo TEXT, descrizione TEXT, note TEXT)
+RETURNS TEXT AS $$
+    SELECT lower(coalesce(partenza, '') || ' ' || coalesce(arrivo, '') || ' ' ||
+                 coalesce(descrizione, '') || ' ' || coalesce(note, ''));
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE INDEX idx_spese_ricerca ON spese
+    USING GIN (documento_spesa(descrizione, fornitore, numero_documento, note));
+CREATE INDEX idx_spese_trigrammi ON spese
+    USING GIN (testo_spesa(descrizione, fornitore, numero_documento, note) gin_trgm_ops);
+CREATE INDEX idx_chilometriche_ricerca ON chilometriche
+    USING GIN (documento_viaggio(partenza, arrivo, descrizione, note));
+CREATE INDEX idx_chilometriche_trigrammi ON chilometriche
+    USING GIN (testo_viaggio(partenza, arrivo, descrizione, note) gin_trgm_ops);
+
+-- Id delle righe che corrispondono alla ricerca, al massimo p_limite:
+-- full-text oppure sottostringa/parola simile (trigrammi, tollera errori
+-- di battitura). La query è costruita con le sole condizioni utili, così
+-- il piano usa sempre gli indici GIN. Con più corrispondenze del limite
+-- (termine molto comune) vengono prima quelle dell'ultimo anno.
+CREATE OR REPLACE FUNCTION candidati_ricerca(p_tabella TEXT, p_tsq tsquery, p_testo TEXT, p_limite INTEGER)
+RETURNS INTEGER[] AS $$
+DECLARE
+    v_documento TEXT;
+    v_testo TEXT;
+    v_data TEXT;
+    v_condizioni TEXT[] := '{}';
+    v_filtro TEXT;
+    v_simile TEXT := '%' || replace(replace(replace(p_testo, '\', '\\'), '%', '\%'), '_', '\_') || '%';
+    v_ids INTEGER[];
+    v_recenti INTEGER[];
+BEGIN
+    IF p_tabella = 'spese' THEN
+        v_documento := 'documento_spesa(descrizione, fornitore, numero_documento, note)';
+        v_testo := 'testo_spesa(descrizione, fornitore, numero_documento, note)';
+        v_data := 'data_spesa';
+    ELSIF p_tabella = 'chilometriche' THEN
+        v_documento := 'documento_viaggio(partenza, arrivo, descrizione, note)';
+        v_testo := 'testo_viaggio(partenza, arrivo, descrizione, note)';
+        v_data := 'data_viaggio';
+    ELSE
+        RAISE EXCEPTION 'Tabella non ricercabile: %', p_tabella;
+    END IF;
+
+    IF numnode(p_tsq) > 0 THEN
+        v_condizioni := v_condizioni || format('%s @@ $1', v_documento);
+    END IF;
+    IF length(p_testo) >= 3 THEN
+        v_condizioni := v_condizioni || format('%s LIKE $2', v_testo) || format('%s %%> $3', v_testo);
+    END IF;
+    IF cardinality(v_condizioni) = 0 THEN
+        RETURN '{}';
+    END IF;
+    v_filtro := array_to_string(v_condizioni, ' OR ');
+
+    EXECUTE format('SELECT array_agg(id) FROM (SELECT id FROM %I WHERE %s LIMIT $4) c', p_tabella, v_filtro)
+        INTO v_ids USING p_tsq, v_simile, p_testo, p_limite;
+
+    IF cardinality(v_ids) >= p_limite THEN
+        EXECUTE format('SELECT array_agg(id) FROM (SELECT id FROM %I WHERE (%s) AND %I >= current_date - 365 LIMIT $4) c',
+                       p_tabella, v_filtro, v_data)
+            INTO v_recenti USING p_tsq, v_simile, p_testo, p_limite;
+        SELECT array_agg(u.id) INTO v_ids FROM (
+            SELECT x.id FROM unnest(coalesce(v_recenti, '{}') || v_ids) WITH ORDINALITY AS x(id, n)
+            GROUP BY x.id
+            ORDER BY min(x.n)
+            LIMIT p_limite
+        ) u;
+    END IF;
+    RETURN coalesce(v_ids, '{}');
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Ricerca ordinata per rilevanza (ts_rank_cd + somiglianza per parola),
+-- a pagine con p_limite/p_offset. Il rank è calcolato solo sui candidati
+-- (al massimo p_candidati per tabella) e ts_headline solo sulla pagina.
+-- In evidenziato i termini trovati sono racchiusi tra chr(2) e chr(3):
+-- il server li converte in <mark> dopo aver fatto l'escape HTML.
+CREATE OR REPLACE FUNCTION cerca(
+    p_testo TEXT,
+    p_tipo TEXT DEFAULT NULL,
+    p_limite INTEGER DEFAULT 20,
+    p_offset INTEGER DEFAULT 0,
+    p_candidati INTEGER DEFAULT 1000
+)
+RETURNS TABLE (
+    tipo TEXT,
+    id INTEGER,
+    data DATE,
+    titolo TEXT,
+    dettaglio TEXT,
+    importo NUMERIC,
+    punteggio REAL,
+    evidenziato TEXT
+) AS $$
+#variable_conflict use_column
+DECLARE
+    v_testo TEXT := lower(trim(coalesce(p_testo, '')));
+    v_tsq tsquery := websearch_to_tsquery('italian', coalesce(p_testo, ''));
+    v_opzioni TEXT := 'StartSel=' || chr(2) || ', StopSel=' || chr(3) || ', MaxFragments=2, MinWords=5, MaxWords=20';
+    v_spese INTEGER[] := '{}';
+    v_viaggi INTEGER[] := '{}';
+BEGIN
+    IF p_tipo IS NULL OR p_tipo = 'spese' THEN
+        v_spese := candidati_ricerca('spese', v_tsq, v_testo, p_candidati);
+    END IF;
+    IF p_tipo IS NULL OR p_tipo = 'chilometriche' THEN
+        v_viaggi := candidati_ricerca('chilometriche', v_tsq, v_testo, p_candidati);
+    END IF;
+
+    RETURN QUERY
+    WITH risultati AS (
+        SELECT 'spese'::TEXT AS tipo, s.id, s.data_spesa AS data, s.descrizione::TEXT AS titolo,
+               s.fornitore::TEXT AS dettaglio, s.importo::NUMERIC AS importo,
+               (ts_rank_cd(documento_spesa(s.descrizione, s.fornitore, s.numero_documento, s.note), v_tsq)
+                + word_similarity(v_testo, testo_spesa(s.descrizione, s.fornitore, s.numero_documento, s.note)))::REAL
+                   AS punteggio,
+               concat_ws(' · ', s.descrizione, s.fornitore, s.numero_documento, s.note) AS testo
+        FROM spese s
+        WHERE s.id = ANY(v_spese)
+        UNION ALL
+        SELECT 'chilometriche'::TEXT, k.id, k.data_viaggio, (k.partenza || ' → ' || k.arrivo)::TEXT,
+               k.descrizione::TEXT, k.rimborso_calcolato::NUMERIC,
+               (ts_rank_cd(documento_viaggio(k.partenza, k.arrivo, k.descrizione, k.note), v_tsq)
+                + word_similarity(v_testo, testo_viaggio(k.partenza, k.arrivo, k.descrizione, k.note)))::REAL,
+               concat_ws(' · ', k.partenza, k.arrivo, k.descrizione, k.note)
+        FROM chilometriche k
+        WHERE k.id = ANY(v_viaggi)
+    ),
+    pagina AS (
+        SELECT * FROM risultati r
+        ORDER BY r.punteggio DESC, r.data DESC, r.id DESC
+        LIMIT p_limite OFFSET p_offset
+    )
+    SELECT p.tipo, p.id, p.data, p.titolo, p.dettaglio, p.importo, p.punteggio,
+           ts_headline('italian', p.testo, v_tsq, v_opzioni)
+    FROM pagina p
+    ORDER BY p.punteggio DESC, p.data DESC, p.id DESC;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Report addebiti (/api/report/addebiti): spese addebitabili non ancora
+-- addebitate di un cliente. L'indice parziale contiene solo quelle, nello
+-- stesso ordine della paginazione keyset del dettaglio.
+CREATE INDEX idx_spese_da_addebitare ON spese(cliente_id, data_spesa DESC, id DESC)
+    WHERE addebitabile AND NOT addebitata;
+
+-- Riepilogo per progetto e categoria, aggregato nel database
+CREATE OR REPLACE FUNCTION riepilogo_addebiti(
+    p_cliente_id INTEGER,
+    p_progetto_id INTEGER DEFAULT NULL,
+    p_da DATE DEFAULT NULL,
+    p_a DATE DEFAULT NULL
+)
+RETURNS JSON AS $$
+    SELECT json_build_object(
+        'cliente', (SELECT nome FROM clienti WHERE id = p_cliente_id),
+        'progetto', (SELECT nome FROM progetti WHERE id = p_progetto_id),
+        'num_voci', COALESCE(SUM(g.num_voci), 0),
+        'totale', COALESCE(SUM(g.totale), 0),
+        'righe', COALESCE(json_agg(json_build_object(
+            'progetto', g.progetto,
+            'categoria', g.categoria,
+            'num_voci', g.num_voci,
+            'totale', g.totale
+        ) ORDER BY g.progetto NULLS LAST, g.totale DESC), '[]'::json)
+    )
+    FROM (
+        SELECT progetto, categoria, COUNT(*) AS num_voci, SUM(importo) AS totale
+        FROM v_spese_cliente
+        WHERE cliente_id = p_cliente_id
+          AND addebitabile AND NOT addebitata
+          AND (p_progetto_id IS NULL OR progetto_id = p_progetto_id)
+          AND (p_da IS NULL OR data_spesa >= p_da)
+          AND (p_a IS NULL OR data_spesa <= p_a)
+        GROUP BY progetto, categoria
+    ) g;
+$$ LANGUAGE sql STABLE;
+
+-- Ricevute indirizzate per contenuto (image_pipeline.py): il file su
+-- Storage si chiama <sha256>.jpg dei byte caricati. La tabella è l'indice
+-- condiviso dai worker: una foto già nota non viene rielaborata né
+-- ricaricata. dhash è l'hash percettivo a 64 bit della miniatura.
+CREATE TABLE ricevute (
+    sha256 CHAR(64) PRIMARY KEY,
+    dhash BIGINT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Sha256 della ricevuta collegata a una spesa, estratto da immagine_url
+CREATE INDEX idx_spese_ricevuta ON spese ((substring(immagine_url from '([0-9a-f]{64})\.jpg$')))
+    WHERE immagine_url IS NOT NULL;
+
+-- Spese con una ricevuta uguale o simile (distanza di Hamming tra i dHash
+-- al massimo p_distanza bit): la stessa ricevuta fotografata di nuovo, da
+-- segnalare come possibile nota spese duplicata. La scansione di ricevute
+-- confronta solo due BIGINT per riga (bit_count, Postgres 14+).
+CREATE OR REPLACE FUNCTION ricevute_simili(
+    p_dhash BIGINT,
+    p_distanza INTEGER DEFAULT 6,
+    p_limite INTEGER DEFAULT 10
+)
+RETURNS TABLE(spesa_id INTEGER, data_spesa DATE, importo DECIMAL, descrizione TEXT,
+              immagine_url TEXT, distanza INTEGER) AS $$
+    SELECT s.id, s.data_spesa, s.importo, s.descrizione, s.immagine_url, r.distanza
+    FROM (
+        SELECT sha256, bit_count((dhash # p_dhash)::bit(64))::INTEGER AS distanza
+        FROM ricevute
+    ) r
+    JOIN spese s ON substring(s.immagine_url from '([0-9a-f]{64})\.jpg$') = r.sha256
+    WHERE r.distanza <= p_distanza
+    ORDER BY r.distanza, s.data_spesa DESC, s.id DESC
+    LIMIT p_limite;
+$$ LANGUAGE sql STABLE;
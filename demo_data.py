@@ -0,0 +1,288 @@
+"""
+Generatore deterministico di dati sintetici a volume di produzione.
+
+Con lo stesso seed, la stessa scala e la stessa data finale (default
+oggi: nessuna riga nel futuro) produce sempre le stesse righe, così
+può essere usato sia per popolare un database di test
+(populate_demo_data.py --scale) sia come fixture dei benchmark.
+
+Scala 1 corrisponde a circa tre anni di lavoro di una piccola squadra di
+tecnici: 100.000 spese e 40.000 viaggi. Le tabelle di riferimento
+crescono con la radice della scala (più tecnici, ma non proporzionalmente
+più clienti).
+
+Realismo:
+    - clienti, categorie e veicoli seguono una distribuzione di Zipf
+      (pochi clienti e categorie concentrano gran parte delle spese)
+    - le date sono stagionali: pochi weekend, agosto e fine dicembre
+      quasi fermi, leggera crescita anno su anno
+    - i viaggi partono dalla sede del veicolo e arrivano nella città del
+      cliente; km e rimborso sono coerenti con distanza e tariffa del veicolo
+    - il progetto di una spesa appartiene sempre al suo cliente
+
+Gli id sono locali e partono da 1 per ogni tabella: chi carica i dati li
+rimappa sugli id reali (vedi populate_demo_data.py).
+"""
+import math
+import random
+from bisect import bisect
+from datetime import date, timedelta
+from itertools import accumulate
+
+from bulk import calcola_rimborso
+
+SPESE_PER_SCALA = 100_000
+VIAGGI_PER_SCALA = 40_000
+CLIENTI_PER_SCALA = 100
+PROGETTI_PER_CLIENTE = 3
+VEICOLI_PER_SCALA = 20
+ANNI = 3
+
+# Stesso ordine delle categorie predefinite in database/schema.sql (id 1..8)
+CATEGORIE = (
+    ('Pedaggi', '#3B82F6', (3, 40)),
+    ('Chilometriche', '#10B981', (10, 80)),
+    ('Interventi', '#F59E0B', (100, 1000)),
+    ('Ristoranti', '#EF4444', (12, 70)),
+    ('Alberghi', '#8B5CF6', (70, 180)),
+    ('Carburante', '#EC4899', (30, 110)),
+    ('Materiali', '#14B8A6', (20, 600)),
+    ('Altre Spese', '#6B7280', (5, 120)),
+)
+# Frequenza delle categorie: rango di Zipf (0 = più frequente)
+RANGO_CATEGORIE = (1, 7, 5, 2, 4, 0, 3, 6)
+
+# Città con coordinate (lat, lon) per distanze coerenti
+CITTA = (
+    ('Brescia', 'BS', 45.541, 10.211),
+    ('Milano', 'MI', 45.464, 9.190),
+    ('Bergamo', 'BG', 45.698, 9.677),
+    ('Verona', 'VR', 45.438, 10.992),
+    ('Mantova', 'MN', 45.156, 10.791),
+    ('Cremona', 'CR', 45.133, 10.024),
+    ('Lodi', 'LO', 45.314, 9.503),
+    ('Como', 'CO', 45.808, 9.085),
+    ('Lecco', 'LC', 45.856, 9.397),
+    ('Varese', 'VA', 45.820, 8.825),
+    ('Pavia', 'PV', 45.185, 9.156),
+    ('Piacenza', 'PC', 45.052, 9.693),
+    ('Trento', 'TN', 46.070, 11.121),
+    ('Vicenza', 'VI', 45.545, 11.535),
+    ('Padova', 'PD', 45.406, 11.877),
+    ('Gussago', 'BS', 45.593, 10.158),
+)
+
+VEICOLI = (
+    ('Auto', 'Volkswagen', 'Golf', 0.680),
+    ('Auto', 'Fiat', 'Panda', 0.520),
+    ('Auto', 'Skoda', 'Octavia', 0.710),
+    ('Furgone', 'Fiat', 'Ducato', 0.850),
+    ('Furgone', 'Ford', 'Transit', 0.880),
+    ('Furgone', 'Renault', 'Kangoo', 0.610),
+)
+
+FORNITORI = ('Autogrill', 'Eni', 'Q8', 'IP', 'Trattoria Da Mario', 'Hotel Centrale', 'Brico Center',
+             'Würth', 'RS Components', 'Autostrade per l\'Italia', 'Ristorante Il Portico', 'Esselunga')
+
+
+def zipf_cumulativi(n, s=1.1):
+    """Pesi cumulativi di Zipf per n elementi (rango 0 il più probabile)"""
+    return list(accumulate(1 / (k ** s) for k in range(1, n + 1)))
+
+
+def scegli(rnd, cumulativi):
+    """Indice estratto con pesi cumulativi (più veloce di random.choices per un elemento)"""
+    return bisect(cumulativi, rnd.random() * cumulativi[-1])
+
+
+def peso_giorno(giorno, inizio):
+    peso = (1.0, 1.0, 1.0, 1.0, 0.9, 0.2, 0.05)[giorno.weekday()]
+    if giorno.month == 8:
+        peso *= 0.3 if 8 <= giorno.day <= 25 else 0.7
+    elif giorno.month == 12 and giorno.day >= 22:
+        peso *= 0.15
+    elif giorno.month == 1 and giorno.day <= 6:
+        peso *= 0.3
+    # Crescita del 10% l'anno
+    return peso * (1 + 0.1 * (giorno - inizio).days / 365)
+
+
+def distanza_km(a, b):
+    """Distanza stradale stimata: haversine x 1.3"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (a[2], a[3], b[2], b[3]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371 * math.asin(math.sqrt(h)) * 1.3
+
+
+class DemoDataset:
+    """Righe sintetiche per una scala e un seed; spese e viaggi sono generatori"""
+
+    def __init__(self, scale=1.0, seed=42, fine=None, anni=ANNI):
+        self.scale = scale
+        self.seed = seed
+        self.fine = fine or date.today()
+        self.inizio = self.fine - timedelta(days=365 * anni - 1)
+        self.num_spese = int(SPESE_PER_SCALA * scale)
+        self.num_viaggi = int(VIAGGI_PER_SCALA * scale)
+        self.num_clienti = max(3, int(CLIENTI_PER_SCALA * math.sqrt(scale)))
+        self.num_veicoli = max(2, int(VEICOLI_PER_SCALA * math.sqrt(scale)))
+
+        self.giorni = [self.inizio + timedelta(days=i) for i in range((self.fine - self.inizio).days + 1)]
+        self._giorni_cum = list(accumulate(peso_giorno(g, self.inizio) for g in self.giorni))
+
+        self.categorie = [{'id': i + 1, 'nome': nome, 'colore': colore}
+                          for i, (nome, colore, _) in enumerate(CATEGORIE)]
+        self.clienti = self._genera_clienti()
+        self.progetti = self._genera_progetti()
+        self.veicoli = self._genera_veicoli()
+
+    def _random(self, tabella):
+        # Un generatore per tabella: le righe non dipendono dall'ordine di consumo
+        return random.Random(f'{self.seed}:{tabella}')
+
+    def _data(self, rnd):
+        return self.giorni[scegli(rnd, self._giorni_cum)]
+
+    def _genera_clienti(self):
+        rnd = self._random('clienti')
+        forme = ('SpA', 'SRL', 'SNC', 'SAS')
+        settori = ('Acque Minerali', 'Detergenti', 'Chimica', 'Alimentari', 'Imballaggi', 'Meccanica',
+                   'Plastiche', 'Farmaceutica', 'Bevande', 'Cosmetici')
+        clienti = []
+        for i in range(1, self.num_clienti + 1):
+            citta = rnd.choice(CITTA)
+            clienti.append({
+                'id': i,
+                'nome': f'{rnd.choice(settori)} {citta[0]} {i} {rnd.choice(forme)}',
+                'codice': f'SYN{self.seed}-C{i:05d}',
+                'partita_iva': f'{rnd.randrange(10 ** 10, 10 ** 11)}',
+                'citta': citta[0],
+                'provincia': citta[1],
+            })
+        return clienti
+
+    def _genera_progetti(self):
+        rnd = self._random('progetti')
+        attivita = ('Manutenzione linea', 'Installazione impianto', 'Upgrade PLC', 'Revisione pompe',
+                    'Collaudo', 'Assistenza straordinaria')
+        progetti = []
+        for cliente in self.clienti:
+            for _ in range(rnd.randint(1, PROGETTI_PER_CLIENTE * 2 - 1)):
+                pid = len(progetti) + 1
+                inizio = self._data(rnd)
+                progetti.append({
+                    'id': pid,
+                    'cliente_id': cliente['id'],
+                    'codice': f'SYN{self.seed}-P{pid:06d}',
+                    'nome': f'{rnd.choice(attivita)} {pid}',
+                    'data_inizio': inizio.isoformat(),
+                    'stato': 'attivo' if rnd.random() < 0.6 else 'completato',
+                })
+        self._progetti_per_cliente = {}
+        for progetto in progetti:
+            self._progetti_per_cliente.setdefault(progetto['cliente_id'], []).append(progetto['id'])
+        return progetti
+
+    def _genera_veicoli(self):
+        rnd = self._random('veicoli')
+        veicoli = []
+        for i in range(1, self.num_veicoli + 1):
+            tipo, marca, modello, aci = rnd.choice(VEICOLI)
+            custom = rnd.random() < 0.25
+            veicoli.append({
+                'id': i,
+                'targa': f'S{self.seed % 100:02d}{i:04d}',
+                'tipo': tipo,
+                'marca': marca,
+                'modello': modello,
+                'anno': rnd.randint(self.inizio.year - 6, self.inizio.year),
+                'tariffa_km_aci': aci,
+                'tariffa_km_custom': round(aci * 1.05, 3) if custom else None,
+                'usa_tariffa_custom': custom,
+                # Sede del veicolo: partenza dei viaggi (non è una colonna)
+                '_sede': rnd.choice(CITTA[:3] + CITTA[-1:]),
+            })
+        return veicoli
+
+    def riferimenti(self):
+        """Tabelle di riferimento nell'ordine di inserimento (senza campi interni)"""
+        veicoli = [{k: v for k, v in veicolo.items() if not k.startswith('_')} for veicolo in self.veicoli]
+        return {'categorie': self.categorie, 'clienti': self.clienti, 'progetti': self.progetti,
+                'veicoli': veicoli}
+
+    def _cliente_progetto(self, rnd, clienti_cum):
+        cliente_id = scegli(rnd, clienti_cum) + 1
+        progetti = self._progetti_per_cliente.get(cliente_id)
+        return cliente_id, rnd.choice(progetti) if progetti else None
+
+    def spese(self):
+        rnd = self._random('spese')
+        clienti_cum = zipf_cumulativi(self.num_clienti)
+        categorie_cum = zipf_cumulativi(len(CATEGORIE))
+        # Rango di Zipf -> indice della categoria
+        per_rango = sorted(range(len(CATEGORIE)), key=lambda i: RANGO_CATEGORIE[i])
+
+        for i in range(1, self.num_spese + 1):
+            categoria = per_rango[scegli(rnd, categorie_cum)]
+            nome, _, (minimo, massimo) = CATEGORIE[categoria]
+            giorno = self._data(rnd)
+            addebitabile = rnd.random() < 0.6
+            cliente_id = progetto_id = None
+            if addebitabile or rnd.random() < 0.3:
+                cliente_id, progetto_id = self._cliente_progetto(rnd, clienti_cum)
+            yield {
+                'id': i,
+                'data_spesa': giorno.isoformat(),
+                'categoria_id': categoria + 1,
+                'cliente_id': cliente_id,
+                'progetto_id': progetto_id,
+                'importo': round(minimo + (massimo - minimo) * rnd.betavariate(2, 5), 2),
+                'descrizione': f'{nome} {giorno.strftime("%d/%m")}',
+                'fornitore': rnd.choice(FORNITORI) if rnd.random() < 0.5 else None,
+                'addebitabile': addebitabile,
+                'addebitata': addebitabile and giorno < self.fine - timedelta(days=60) and rnd.random() < 0.8,
+            }
+
+    def chilometriche(self):
+        rnd = self._random('chilometriche')
+        clienti_cum = zipf_cumulativi(self.num_clienti)
+        veicoli_cum = zipf_cumulativi(self.num_veicoli, s=0.8)
+        citta = {c[0]: c for c in CITTA}
+
+        for i in range(1, self.num_viaggi + 1):
+            veicolo = self.veicoli[scegli(rnd, veicoli_cum)]
+            sede = veicolo['_sede']
+            cliente_id, progetto_id = self._cliente_progetto(rnd, clienti_cum)
+            if rnd.random() < 0.85:
+                arrivo = citta[self.clienti[cliente_id - 1]['citta']]
+            else:
+                arrivo = rnd.choice(CITTA)
+                cliente_id = progetto_id = None
+            andata_ritorno = rnd.random() < 0.7
+            km = max(3.0, distanza_km(sede, arrivo)) * rnd.uniform(0.95, 1.15) * (2 if andata_ritorno else 1)
+            km = round(km, 1)
+            tariffa = veicolo['tariffa_km_custom'] if veicolo['usa_tariffa_custom'] else veicolo['tariffa_km_aci']
+            yield {
+                'id': i,
+                'data_viaggio': self._data(rnd).isoformat(),
+                'veicolo_id': veicolo['id'],
+                'cliente_id': cliente_id,
+                'progetto_id': progetto_id,
+                'partenza': sede[0],
+                'arrivo': arrivo[0],
+                'km_percorsi': km,
+                'tariffa_applicata': tariffa,
+                'rimborso_calcolato': calcola_rimborso(km, tariffa),
+                'addebitabile': cliente_id is not None and rnd.random() < 0.8,
+                'descrizione': 'Andata e ritorno' if andata_ritorno else None,
+            }
+
+
+def carica_fake(fake, scale=1.0, seed=42, fine=None):
+    """Carica il dataset in un benchmarks.fake_postgrest.FakeSupabase con gli id locali"""
+    dataset = DemoDataset(scale, seed, fine)
+    for table, rows in dataset.riferimenti().items():
+        fake.load(table, [dict(r) for r in rows])
+    fake.load('spese', list(dataset.spese()))
+    fake.load('chilometriche', list(dataset.chilometriche()))
+    return dataset
@@ -0,0 +1,216 @@
+"""
+Export Excel, CSV e NDJSON a memoria costante.
+
+Le righe vengono lette da Supabase a pagine (paginazione keyset) e scritte
+con openpyxl in modalità write-only, che serializza ogni riga su un file
+temporaneo invece di tenere in memoria tutte le celle. Il file .xlsx
+risultante viene poi inviato al client a blocchi.
+
+CSV e NDJSON, per script e programmi, non passano da file: ogni pagina
+letta diventa un blocco della risposta in streaming (stream_testo). Le
+colonne sono quelle della tabella più i nomi delle relazioni, con i valori
+come arrivano da Supabase (importi numerici, booleani true/false).
+"""
+import csv
+import io
+import json
+import os
+import tempfile
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font, PatternFill
+
+from pagination import iter_pages
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+PAGE_SIZE = 1000
+# Prima pagina degli export in streaming: il primo byte parte dopo una lettura breve
+FIRST_PAGE_SIZE = 100
+CHUNK_SIZE = 64 * 1024
+
+SPESE_SELECT = '*,categorie(nome),clienti(nome),progetti(nome)'
+SPESE_HEADERS = ['Data', 'Categoria', 'Cliente', 'Progetto', 'Descrizione', 'Importo', 'Fornitore', 'Addebitabile']
+
+CHILOMETRICHE_SELECT = '*,veicoli(targa),clienti(nome)'
+CHILOMETRICHE_HEADERS = ['Data', 'Veicolo', 'Partenza', 'Arrivo', 'Km', 'Tariffa', 'Rimborso', 'Cliente', 'Addebitabile']
+
+
+def riga_spesa(spesa):
+    return [
+        spesa['data_spesa'],
+        spesa['categorie']['nome'] if spesa.get('categorie') else '',
+        spesa['clienti']['nome'] if spesa.get('clienti') else '',
+        spesa['progetti']['nome'] if spesa.get('progetti') else '',
+        spesa['descrizione'],
+        float(spesa['importo']),
+        spesa.get('fornitore', ''),
+        'Sì' if spesa['addebitabile'] else 'No'
+    ]
+
+
+def riga_chilometrica(km):
+    return [
+        km['data_viaggio'],
+        km['veicoli']['targa'] if km.get('veicoli') else '',
+        km['partenza'],
+        km['arrivo'],
+        float(km['km_percorsi']),
+        float(km['tariffa_applicata']),
+        float(km['rimborso_calcolato']),
+        km['clienti']['nome'] if km.get('clienti') else '',
+        'Sì' if km['addebitabile'] else 'No'
+    ]
+
+
+# tipo -> (tabella, colonna data, select, titolo foglio, intestazioni, colore header, conversione riga)
+TIPI = {
+    'spese': ('spese', 'data_spesa', SPESE_SELECT, 'Spese', SPESE_HEADERS, '4472C4', riga_spesa),
+    'chilometriche': ('chilometriche', 'data_viaggio', CHILOMETRICHE_SELECT, 'Chilometriche',
+                      CHILOMETRICHE_HEADERS, '10B981', riga_chilometrica),
+}
+
+
+# Colonne di CSV e NDJSON
+SPESE_CAMPI = ['id', 'data_spesa', 'categoria', 'cliente', 'progetto', 'descrizione', 'importo', 'fornitore',
+               'numero_documento', 'addebitabile', 'addebitata']
+CHILOMETRICHE_CAMPI = ['id', 'data_viaggio', 'veicolo', 'partenza', 'arrivo', 'km_percorsi', 'tariffa_applicata',
+                       'rimborso_calcolato', 'cliente', 'progetto', 'descrizione', 'addebitabile', 'addebitata']
+
+
+def _nome(record, relazione, campo='nome'):
+    return record[relazione][campo] if record.get(relazione) else None
+
+
+def valori_spesa(spesa):
+    return [spesa['id'], spesa['data_spesa'], _nome(spesa, 'categorie'), _nome(spesa, 'clienti'),
+            _nome(spesa, 'progetti'), spesa.get('descrizione'), spesa['importo'], spesa.get('fornitore'),
+            spesa.get('numero_documento'), spesa.get('addebitabile'), spesa.get('addebitata')]
+
+
+def valori_chilometrica(km):
+    return [km['id'], km['data_viaggio'], _nome(km, 'veicoli', 'targa'), km['partenza'], km['arrivo'],
+            km['km_percorsi'], km['tariffa_applicata'], km['rimborso_calcolato'], _nome(km, 'clienti'),
+            _nome(km, 'progetti'), km.get('descrizione'), km.get('addebitabile'), km.get('addebitata')]
+
+
+# tipo -> (select, campi, conversione riga)
+TIPI_TESTO = {
+    'spese': ('*,categorie(nome),clienti(nome),progetti(nome)', SPESE_CAMPI, valori_spesa),
+    'chilometriche': ('*,veicoli(targa),clienti(nome),progetti(nome)', CHILOMETRICHE_CAMPI, valori_chilometrica),
+}
+# formato -> mimetype
+FORMATI_TESTO = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def scrivi_foglio(path, titolo, intestazioni, colore, righe):
+    """Scrive un .xlsx in modalità write-only; righe può essere un generatore"""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(titolo)
+
+    font = Font(bold=True, color="FFFFFF")
+    fill = PatternFill(start_color=colore, end_color=colore, fill_type="solid")
+    alignment = Alignment(horizontal="center")
+    header = []
+    for valore in intestazioni:
+        cell = WriteOnlyCell(ws, value=valore)
+        cell.font = font
+        cell.fill = fill
+        cell.alignment = alignment
+        header.append(cell)
+    ws.append(header)
+
+    for riga in righe:
+        ws.append(riga)
+
+    wb.save(path)
+
+
+def righe_da_supabase(client, tipo, params, page_size=PAGE_SIZE, progress=None):
+    table, order_column, select, _, _, _, converti = TIPI[tipo]
+    params = dict(params)
+    params['select'] = select
+    lette = 0
+    for pagina in iter_pages(client, table, params, order_column, page_size):
+        for record in pagina:
+            yield converti(record)
+        lette += len(pagina)
+        if progress:
+            progress(lette)
+
+
+def genera_excel(client, tipo, params, path=None, progress=None):
+    """
+    Genera l'export su file e ne restituisce il percorso.
+    Se path non è indicato usa un file temporaneo, da eliminare dopo l'invio.
+    """
+    if tipo not in TIPI:
+        raise ValueError(f'Tipo export non valido: {tipo}')
+    _, _, _, titolo, intestazioni, colore, _ = TIPI[tipo]
+
+    if path is None:
+        fd, path = tempfile.mkstemp(prefix=f'export_{tipo}_', suffix='.xlsx')
+        os.close(fd)
+    try:
+        scrivi_foglio(path, titolo, intestazioni, colore,
+                      righe_da_supabase(client, tipo, params, progress=progress))
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+
+def pagine_testo(client, tipo, params, page_size=PAGE_SIZE):
+    """Pagine di righe per CSV/NDJSON, la prima più piccola"""
+    if tipo not in TIPI_TESTO:
+        raise ValueError(f'Tipo export non valido: {tipo}')
+    table, order_column = TIPI[tipo][:2]
+    params = dict(params)
+    params['select'] = TIPI_TESTO[tipo][0]
+    return iter_pages(client, table, params, order_column, page_size, first_page_size=FIRST_PAGE_SIZE)
+
+
+def _csv(valore):
+    if valore is None:
+        return ''
+    if valore is True or valore is False:
+        return 'true' if valore else 'false'
+    return valore
+
+
+def stream_testo(pagine, tipo, formato):
+    """Generatore di blocchi di byte, uno per pagina: CSV con intestazione oppure NDJSON"""
+    _, campi, converti = TIPI_TESTO[tipo]
+    if formato == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerow(campi)
+        yield buffer.getvalue().encode()
+        for pagina in pagine:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows([_csv(v) for v in converti(r)] for r in pagina)
+            yield buffer.getvalue().encode()
+    elif formato == 'ndjson':
+        encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+        for pagina in pagine:
+            yield ''.join(encode(dict(zip(campi, converti(r)))) + '\n' for r in pagina).encode()
+    else:
+        raise ValueError(f'Formato export non valido: {formato}')
+
+
+def leggi_a_blocchi(path, chunk_size=CHUNK_SIZE, elimina=True):
+    """Generatore per lo streaming di un file al client, eliminato al termine"""
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        if elimina and os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,23 @@
+"""
+Configurazione gunicorn (Procfile, render.yaml: gunicorn app:app -c gunicorn.conf.py).
+
+Worker gthread: ogni processo serve GUNICORN_THREADS richieste insieme.
+Quasi tutto il tempo di una richiesta è attesa di rete verso Supabase, che
+rilascia il GIL, quindi pochi processi con molti thread reggono la stessa
+concorrenza di molti worker sync con una frazione della memoria.
+
+Variabili ambiente:
+    PORT               porta di ascolto (default 5000)
+    WEB_CONCURRENCY    processi worker (default 2)
+    GUNICORN_THREADS   thread per worker (default 16)
+    GUNICORN_TIMEOUT   secondi prima di riavviare un worker bloccato (default 60)
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+worker_class = 'gthread'
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+threads = int(os.getenv('GUNICORN_THREADS', 16))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+# Connessioni keep-alive del proxy riusate tra richieste
+keepalive = 5
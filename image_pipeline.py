@@ -0,0 +1,313 @@
+"""
+Elaborazione delle ricevute fuori dal thread della richiesta.
+
+Decodifica, ridimensionamento e ricodifica JPEG girano in un pool di
+processi limitato (il lavoro è CPU-bound e terrebbe il GIL), l'upload su
+Supabase Storage in un pool di thread. La route /api/upload restituisce
+subito un identificativo con cui interrogare lo stato.
+
+Per i JPEG viene usato Image.draft(): il decoder scala già in fase di
+decodifica DCT (1/2, 1/4, 1/8), quindi una foto da 12 MP non viene mai
+decompressa a piena risoluzione.
+
+Le ricevute sono indirizzate per contenuto: l'id dell'upload e il nome del
+file su Storage sono lo sha256 dei byte ricevuti. Una foto già nota (stesso
+upload ripetuto da una connessione mobile instabile) non viene né
+decodificata né ricaricata:
+    indice locale   upload in corso o recenti del processo e gli ultimi
+                    INDICE_LOCALE hash completati
+    indice remoto   tabella ricevute (sha256, dhash), scritta dopo ogni
+                    upload riuscito e condivisa da tutti i worker
+Per ogni ricevuta si calcola anche un hash percettivo (dHash a 64 bit) sulla
+miniatura già decodificata: la funzione SQL ricevute_simili trova le spese
+con una ricevuta a distanza di Hamming <= IMAGE_DHASH_DISTANZA, cioè la
+stessa ricevuta fotografata di nuovo, da segnalare come possibile nota
+spese duplicata (campo duplicati dello stato).
+
+Configurazione (variabili ambiente):
+    IMAGE_WORKERS         processi per la decodifica (default 2)
+    IMAGE_MAX_PENDING     upload in coda o in lavorazione per worker (default 8)
+    IMAGE_DHASH_DISTANZA  bit diversi entro cui due ricevute sono simili (default 6)
+
+Lo stato degli upload è tenuto nel processo che li ha ricevuti; se la
+richiesta di stato arriva ad un altro worker gunicorn la route verifica
+direttamente la presenza del file su Storage.
+"""
+import hashlib
+import io
+import multiprocessing
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image
+
+MAX_SIZE = (1200, 1200)
+JPEG_QUALITY = 85
+JOB_TTL = 3600
+# sha256 dei byte caricati
+JOB_ID_RE = re.compile(r'[0-9a-f]{64}')
+# Hash completati ricordati dal processo oltre JOB_TTL
+INDICE_LOCALE = 10000
+DHASH_LATO = 8
+
+IN_CODA = 'in_coda'
+CARICAMENTO = 'caricamento'
+COMPLETATO = 'completato'
+ERRORE = 'errore'
+
+
+def controlla_formato(data):
+    """Legge solo l'header: solleva un'eccezione se i dati non sono un'immagine"""
+    with Image.open(io.BytesIO(data)) as img:
+        return img.format
+
+
+def _riduci(data, max_size):
+    img = Image.open(io.BytesIO(data))
+    if img.format == 'JPEG':
+        # Decodifica ridotta: sceglie la scala DCT più piccola >= max_size
+        img.draft('RGB', max_size)
+    img.thumbnail(max_size)
+
+    if img.mode in ('RGBA', 'LA', 'P'):
+        img = img.convert('RGB')
+    return img
+
+
+def _jpeg(img, quality):
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def comprimi_immagine(data, max_size=MAX_SIZE, quality=JPEG_QUALITY):
+    """Riduce l'immagine entro max_size e la ricodifica in JPEG"""
+    return _jpeg(_riduci(data, max_size), quality)
+
+
+def dhash(img, lato=DHASH_LATO):
+    """
+    Difference hash: ogni bit dice se un pixel è più chiaro del vicino a
+    destra, su una miniatura (lato+1) x lato in scala di grigi. Resiste a
+    ricompressione, ridimensionamento e piccole variazioni di luce.
+    Restituito con segno, come il BIGINT di Postgres.
+    """
+    pixel = img.convert('L').resize((lato + 1, lato), Image.Resampling.LANCZOS).tobytes()
+    valore = 0
+    for riga in range(lato):
+        base = riga * (lato + 1)
+        for colonna in range(base, base + lato):
+            valore = valore << 1 | (pixel[colonna] > pixel[colonna + 1])
+    return valore - (1 << 64) if valore >= 1 << 63 else valore
+
+
+def elabora_ricevuta(data, max_size=MAX_SIZE, quality=JPEG_QUALITY):
+    """(JPEG ridotto, dHash) con una sola decodifica"""
+    img = _riduci(data, max_size)
+    return _jpeg(img, quality), dhash(img)
+
+
+class PipelineSatura(Exception):
+    """Troppi upload in corso su questo worker"""
+
+
+class ImagePipeline:
+    def __init__(self, client_factory, workers=2, max_pending=8, bucket='expenses', distanza=6,
+                 on_finish=None):
+        self.client_factory = client_factory
+        # on_finish(stato, secondi): durata dall'accodamento alla fine, per le metriche
+        self.on_finish = on_finish
+        self.workers = workers
+        self.bucket = bucket
+        self.distanza = distanza
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._jobs = {}
+        # sha256 -> dHash delle ricevute già su Storage (LRU)
+        self._noti = OrderedDict()
+        self._lock = threading.Lock()
+        self._process_pool = None
+        self._upload_pool = None
+        self._pid = None
+
+    def _pools(self):
+        # Pool creati pigramente e ricreati dopo un fork del worker
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    # spawn: i processi figli non ereditano thread e socket del worker
+                    context = multiprocessing.get_context('spawn')
+                    self._process_pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+                    self._upload_pool = ThreadPoolExecutor(max_workers=self.workers * 2,
+                                                           thread_name_prefix='upload')
+                    self._pid = pid
+        return self._process_pool, self._upload_pool
+
+    @staticmethod
+    def path_for(job_id):
+        return f'{job_id}.jpg'
+
+    def submit(self, data):
+        """
+        Accoda un'immagine; solleva PipelineSatura se non ci sono slot liberi.
+        Se la stessa immagine è già in lavorazione o caricata da poco
+        restituisce quell'upload (riusata=True) senza occupare uno slot.
+        """
+        self._purge()
+        # L'id è lo sha256 dei byte ed è anche il nome del file su Storage:
+        # qualunque worker può verificarne lo stato
+        job_id = hashlib.sha256(data).hexdigest()
+        path = self.path_for(job_id)
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job and job['stato'] != ERRORE:
+                return dict(job, riusata=True)
+            if not self._slots.acquire(blocking=False):
+                raise PipelineSatura('Troppi upload in corso, riprovare tra poco')
+            job = {
+                'id': job_id,
+                'stato': IN_CODA,
+                'path': path,
+                'image_url': self.client_factory().public_url(self.bucket, path),
+                'errore': None,
+                'riusata': False,
+                'duplicati': None,
+                'creato': time.time(),
+            }
+            self._jobs[job_id] = job
+
+        try:
+            process_pool, upload_pool = self._pools()
+            upload_pool.submit(self._avvia, job, data, process_pool, upload_pool)
+        except Exception:
+            self._slots.release()
+            raise
+        return dict(job)
+
+    def _avvia(self, job, data, process_pool, upload_pool):
+        """Salta decodifica e upload se la ricevuta è già su Storage, altrimenti la elabora"""
+        try:
+            noto = self._cerca(job['id'])
+            if noto is not None:
+                job['riusata'] = True
+                self._completa(job, noto)
+                return
+            future = process_pool.submit(elabora_ricevuta, data)
+        except Exception as e:
+            self._finish(job, ERRORE, str(e))
+            return
+        future.add_done_callback(lambda f: self._on_processed(job, f, upload_pool))
+
+    def _cerca(self, sha256):
+        """dHash di una ricevuta già caricata (indice locale, poi tabella ricevute), None se nuova"""
+        with self._lock:
+            if sha256 in self._noti:
+                self._noti.move_to_end(sha256)
+                return self._noti[sha256]
+        try:
+            response = self.client_factory().get('ricevute', params={'select': 'dhash', 'sha256': f'eq.{sha256}'})
+            righe = response.json() if response.ok else []
+        except Exception:
+            # Indice remoto non disponibile (es. schema non aggiornato): si elabora di nuovo
+            righe = []
+        if not righe:
+            return None
+        self._ricorda(sha256, righe[0]['dhash'])
+        return righe[0]['dhash']
+
+    def _ricorda(self, sha256, valore):
+        with self._lock:
+            self._noti[sha256] = valore
+            self._noti.move_to_end(sha256)
+            while len(self._noti) > INDICE_LOCALE:
+                self._noti.popitem(last=False)
+
+    def _on_processed(self, job, future, upload_pool):
+        error = future.exception()
+        if isinstance(error, BrokenProcessPool):
+            # Un processo è morto (es. OOM): il pool va ricreato alla prossima richiesta
+            with self._lock:
+                self._pid = None
+        if error is not None:
+            self._finish(job, ERRORE, f'Immagine non valida: {error}')
+            return
+        job['stato'] = CARICAMENTO
+        try:
+            upload_pool.submit(self._upload, job, *future.result())
+        except Exception as e:
+            self._finish(job, ERRORE, str(e))
+
+    def _upload(self, job, jpeg, valore):
+        try:
+            client = self.client_factory()
+            response = client.upload(self.bucket, job['path'], jpeg, content_type='image/jpeg')
+            # Un file con lo stesso nome ha lo stesso contenuto: "già esistente" è un successo
+            if response.status_code not in (200, 201) and not client.exists(self.bucket, job['path']):
+                self._finish(job, ERRORE, 'Errore upload immagine')
+                return
+            # Indice remoto scritto solo a file caricato: una riga in ricevute implica il file su Storage
+            client.post('ricevute', json={'sha256': job['id'], 'dhash': valore},
+                        params={'on_conflict': 'sha256'},
+                        headers={'Prefer': 'return=minimal,resolution=ignore-duplicates'})
+            self._ricorda(job['id'], valore)
+            self._completa(job, valore)
+        except Exception as e:
+            self._finish(job, ERRORE, str(e))
+
+    def _completa(self, job, valore):
+        """Cerca le spese con una ricevuta simile e chiude il lavoro"""
+        try:
+            response = self.client_factory().rpc('ricevute_simili', {'p_dhash': valore,
+                                                                     'p_distanza': self.distanza})
+            if response.ok:
+                job['duplicati'] = response.json()
+        except Exception:
+            # La segnalazione è un aiuto: senza, l'upload resta valido (duplicati None)
+            pass
+        self._finish(job, COMPLETATO)
+
+    def _finish(self, job, stato, errore=None):
+        job['stato'] = stato
+        job['errore'] = errore
+        self._slots.release()
+        if self.on_finish:
+            self.on_finish('riusata' if job['riusata'] and stato == COMPLETATO else stato,
+                           time.time() - job['creato'])
+
+    def status(self, job_id):
+        if not JOB_ID_RE.fullmatch(job_id):
+            return None
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                return dict(job)
+        # Upload ricevuto da un altro worker: lo stato si deduce da Storage
+        client = self.client_factory()
+        path = self.path_for(job_id)
+        if not client.exists(self.bucket, path):
+            return None
+        return {'id': job_id, 'stato': COMPLETATO, 'path': path,
+                'image_url': client.public_url(self.bucket, path), 'errore': None,
+                'riusata': False, 'duplicati': None}
+
+    def _purge(self):
+        limite = time.time() - JOB_TTL
+        with self._lock:
+            for job_id in [k for k, j in self._jobs.items()
+                           if j['creato'] < limite and j['stato'] in (COMPLETATO, ERRORE)]:
+                del self._jobs[job_id]
+
+
+def pipeline_from_env(client_factory, on_finish=None):
+    return ImagePipeline(
+        client_factory,
+        workers=int(os.getenv('IMAGE_WORKERS', 2)),
+        max_pending=int(os.getenv('IMAGE_MAX_PENDING', 8)),
+        distanza=int(os.getenv('IMAGE_DHASH_DISTANZA', 6)),
+        on_finish=on_finish,
+    )
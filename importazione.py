@@ -0,0 +1,409 @@
+"""
+Import di spese da file CSV: estratti conto delle carte aziendali, export
+delle carte carburante (/api/import/spese e riga di comando).
+
+Il file viene letto in streaming e mai tenuto tutto in memoria:
+    lettura          csv.reader con separatore (; , tab) riconosciuto
+                     dall'intestazione, colonne associate ai campi per nome
+                     (INTESTAZIONI) o con una mappa esplicita
+    normalizzazione  date ISO o italiane (31/12/2025, 31-12-25), importi in
+                     Decimal anche con virgola e punto delle migliaia
+                     (1.234,56), categoria per nome e cliente per codice,
+                     letti una volta sola all'inizio
+    upsert           un POST per blocco di IMPORT_CHUNK_SIZE righe con
+                     on_conflict=chiave_importazione e
+                     resolution=ignore-duplicates: le righe già importate
+                     vengono scartate dal database, quindi ripetere l'import
+                     dello stesso file (o di un estratto che si sovrappone al
+                     precedente) non inserisce nulla
+
+La chiave di idempotenza è un hash dei campi che identificano il movimento
+(data, importo, descrizione, fornitore, numero documento) più il numero di
+volte che la stessa riga è già comparsa nel file: due pedaggi identici
+nello stesso giorno restano due spese. Categoria, cliente e note non ne
+fanno parte, così un nuovo import con una mappatura diversa non duplica.
+
+I blocchi vengono inviati in background (client.submit) mentre si legge il
+successivo, al massimo IMPORT_PARALLELI alla volta. Un import interrotto
+(file con encoding sbagliato, connessione caduta) si può semplicemente
+ripetere: le righe già inserite non vengono duplicate.
+
+Uso da riga di comando (stesso backend dell'app, vedi .env):
+    python importazione.py estratto.csv
+    python importazione.py carta_carburante.csv --categoria Carburante --encoding latin-1
+    python importazione.py estratto.csv --mappa importo="Importo EUR" --inverti-segno
+
+Configurazione (variabili ambiente):
+    IMPORT_CHUNK_SIZE   righe per upsert (default 1000)
+    IMPORT_PARALLELI    upsert in volo contemporaneamente (default 4)
+    IMPORT_MAX_SIZE     dimensione massima del file caricato via HTTP
+                        (default 52428800, 50 MB)
+"""
+import argparse
+import codecs
+import csv
+import hashlib
+import io
+import json
+import os
+import re
+import time
+from collections import deque
+from datetime import date
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from functools import lru_cache
+
+from dotenv import load_dotenv
+
+from bulk import messaggio_errore
+from supabase_client import get_client
+
+# Campi del file -> nomi di intestazione riconosciuti (minuscolo, senza spazi ai lati)
+INTESTAZIONI = {
+    'data_spesa': ('data_spesa', 'data', 'data operazione', 'data contabile', 'data transazione',
+                   'data movimento', 'date', 'transaction date'),
+    'importo': ('importo', 'importo eur', 'importo (eur)', 'ammontare', 'totale', 'amount'),
+    'descrizione': ('descrizione', 'descrizione operazione', 'causale', 'dettaglio', 'description'),
+    'fornitore': ('fornitore', 'esercente', 'negozio', 'impianto', 'merchant'),
+    'numero_documento': ('numero_documento', 'numero documento', 'n. documento', 'documento',
+                         'riferimento', 'reference'),
+    'categoria': ('categoria', 'category'),
+    'cliente': ('cliente', 'codice cliente', 'cliente_codice'),
+    'addebitabile': ('addebitabile',),
+    'note': ('note', 'notes'),
+}
+OBBLIGATORI = ('data_spesa', 'importo')
+# Colonne scritte su spese, uguali per tutte le righe di un blocco
+COLONNE = ('data_spesa', 'importo', 'descrizione', 'fornitore', 'numero_documento', 'categoria_id',
+           'cliente_id', 'addebitabile', 'note', 'chiave_importazione')
+# Lunghezze massime delle colonne VARCHAR (database/schema.sql)
+LUNGHEZZE = {'fornitore': 200, 'numero_documento': 50}
+# DECIMAL(10,2)
+IMPORTO_MASSIMO = Decimal('99999999.99')
+CENTESIMO = Decimal('0.01')
+VERO = frozenset(['1', 'si', 'sì', 's', 'x', 'true', 'vero', 'yes', 'y'])
+# Errori riportati per riga nella risposta (il conteggio è sempre completo)
+MAX_ERRORI = 100
+
+DATA_ISO = re.compile(r'(\d{4})-(\d{1,2})-(\d{1,2})(?:[ T].*)?')
+DATA_IT = re.compile(r'(\d{1,2})[/.-](\d{1,2})[/.-](\d{2}|\d{4})(?:[ T].*)?')
+
+
+@lru_cache(maxsize=8192)
+def data_iso(testo):
+    """Data ISO o italiana (gg/mm/aaaa, gg-mm-aa, gg.mm.aaaa, anche con l'ora) -> 'aaaa-mm-gg'"""
+    trovata = DATA_ISO.fullmatch(testo)
+    if trovata:
+        anno, mese, giorno = trovata.groups()
+    else:
+        trovata = DATA_IT.fullmatch(testo)
+        if not trovata:
+            raise ValueError(f'Data non valida: {testo}')
+        giorno, mese, anno = trovata.groups()
+        if len(anno) == 2:
+            anno = '20' + anno
+    try:
+        return date(int(anno), int(mese), int(giorno)).isoformat()
+    except ValueError:
+        raise ValueError(f'Data non valida: {testo}') from None
+
+
+def importo_decimale(testo):
+    """
+    Importo -> Decimal a due cifre: "12.50", "12,50", "1.234,56",
+    "1,234.56", "€ -12,50", "12,50-" (segno in coda, come in alcuni estratti)
+    """
+    valore = testo.replace('€', '').replace('EUR', '').replace(' ', '').replace('\xa0', '')
+    if valore.endswith('-'):
+        valore = '-' + valore[:-1]
+    if ',' in valore:
+        # Il separatore decimale è l'ultimo dei due
+        if '.' in valore and valore.rfind('.') > valore.rfind(','):
+            valore = valore.replace(',', '')
+        else:
+            valore = valore.replace('.', '').replace(',', '.')
+    elif valore.count('.') > 1:
+        valore = valore.replace('.', '')
+    try:
+        numero = Decimal(valore)
+    except InvalidOperation:
+        raise ValueError(f'Importo non valido: {testo}') from None
+    if not numero.is_finite():
+        raise ValueError(f'Importo non valido: {testo}')
+    return numero.quantize(CENTESIMO, ROUND_HALF_UP)
+
+
+def rileva_delimitatore(intestazione):
+    """Separatore più frequente nella riga di intestazione"""
+    return max(';,\t', key=intestazione.count)
+
+
+def associa_colonne(intestazione, mappa=None):
+    """
+    Indice di colonna per ogni campo. mappa ({campo: intestazione}) ha la
+    precedenza sui nomi riconosciuti. Solleva ValueError se manca un campo
+    obbligatorio.
+    """
+    normalizzate = [nome.strip().lstrip('\ufeff').lower() for nome in intestazione]
+    posizioni = {}
+    for campo, nomi in INTESTAZIONI.items():
+        cercati = [mappa[campo].strip().lower()] if mappa and mappa.get(campo) else nomi
+        for nome in cercati:
+            if nome in normalizzate:
+                posizioni[campo] = normalizzate.index(nome)
+                break
+        else:
+            if mappa and mappa.get(campo):
+                raise ValueError(f'Colonna "{mappa[campo]}" non trovata per {campo}')
+    sconosciuti = sorted(set(mappa or ()) - set(INTESTAZIONI))
+    if sconosciuti:
+        raise ValueError(f"Campi sconosciuti nella mappa: {', '.join(sconosciuti)}")
+    mancanti = [campo for campo in OBBLIGATORI if campo not in posizioni]
+    if mancanti:
+        raise ValueError(f"Colonne obbligatorie mancanti: {', '.join(mancanti)}")
+    if 'descrizione' not in posizioni and 'fornitore' not in posizioni:
+        raise ValueError('Serve una colonna descrizione o fornitore')
+    return posizioni
+
+
+def carica_riferimenti(client):
+    """({nome categoria minuscolo: id}, {codice cliente: id}) letti in parallelo"""
+    def categorie():
+        response = client.get('categorie', params={'select': 'id,nome'})
+        response.raise_for_status()
+        return {r['nome'].strip().lower(): r['id'] for r in response.json()}
+
+    def clienti():
+        response = client.get('clienti', params={'select': 'id,codice'})
+        response.raise_for_status()
+        return {r['codice'].strip(): r['id'] for r in response.json() if r.get('codice')}
+
+    return tuple(client.gather(categorie, clienti))
+
+
+class Normalizzatore:
+    """Trasforma le righe del CSV in record di spese, contando i duplicati nel file"""
+
+    def __init__(self, posizioni, categorie, clienti, categoria=None, inverti_segno=False):
+        self.posizioni = posizioni
+        self.categorie = categorie
+        self.clienti = clienti
+        self.inverti_segno = inverti_segno
+        self.categoria_id = None
+        if categoria:
+            self.categoria_id = self._categoria(categoria)
+        # digest della riga -> volte già vista nel file
+        self.occorrenze = {}
+
+    def _categoria(self, nome):
+        try:
+            return self.categorie[nome.lower()]
+        except KeyError:
+            raise ValueError(f'Categoria sconosciuta: {nome}') from None
+
+    def __call__(self, valori):
+        """Record pronto per l'upsert; ValueError con il motivo se la riga non è valida"""
+        campi = {campo: valori[i].strip() if i < len(valori) else ''
+                 for campo, i in self.posizioni.items()}
+
+        if not campi['data_spesa']:
+            raise ValueError('Data mancante')
+        data_spesa = data_iso(campi['data_spesa'])
+        if not campi['importo']:
+            raise ValueError('Importo mancante')
+        importo = importo_decimale(campi['importo'])
+        if self.inverti_segno:
+            importo = -importo
+        if importo <= 0:
+            raise ValueError(f"Importo non positivo: {campi['importo']}")
+        if importo > IMPORTO_MASSIMO:
+            raise ValueError(f"Importo troppo grande: {campi['importo']}")
+
+        fornitore = campi.get('fornitore') or None
+        descrizione = campi.get('descrizione') or fornitore
+        if not descrizione:
+            raise ValueError('Descrizione mancante')
+        numero_documento = campi.get('numero_documento') or None
+        for campo, valore in (('fornitore', fornitore), ('numero_documento', numero_documento)):
+            if valore and len(valore) > LUNGHEZZE[campo]:
+                raise ValueError(f'{campo} oltre {LUNGHEZZE[campo]} caratteri')
+
+        nome_categoria = campi.get('categoria')
+        categoria_id = self._categoria(nome_categoria) if nome_categoria else self.categoria_id
+        codice_cliente = campi.get('cliente')
+        cliente_id = None
+        if codice_cliente:
+            cliente_id = self.clienti.get(codice_cliente)
+            if cliente_id is None:
+                raise ValueError(f'Cliente sconosciuto: {codice_cliente}')
+
+        importo = str(importo)
+        digest = hashlib.sha256('\x1f'.join(
+            (data_spesa, importo, descrizione, fornitore or '', numero_documento or '')).encode()).digest()
+        volte = self.occorrenze.get(digest, 0)
+        self.occorrenze[digest] = volte + 1
+        chiave = digest.hex()[:32]
+        if volte:
+            chiave = f'{chiave}-{volte}'
+
+        return {
+            'data_spesa': data_spesa,
+            'importo': importo,
+            'descrizione': descrizione,
+            'fornitore': fornitore,
+            'numero_documento': numero_documento,
+            'categoria_id': categoria_id,
+            'cliente_id': cliente_id,
+            'addebitabile': campi.get('addebitabile', '').lower() in VERO,
+            'note': campi.get('note') or None,
+            'chiave_importazione': chiave,
+        }
+
+
+def leggi_righe(file, delimitatore=None):
+    """(intestazione, iteratore di (numero di riga, valori)) da un file di testo"""
+    prima = file.readline()
+    if not prima.strip():
+        raise ValueError('File vuoto o senza intestazione')
+    delimitatore = delimitatore or rileva_delimitatore(prima)
+    intestazione = next(csv.reader([prima], delimiter=delimitatore))
+    lettore = csv.reader(file, delimiter=delimitatore)
+
+    def righe():
+        for valori in lettore:
+            # Il numero di riga del file (l'intestazione è la 1), anche con campi su più righe
+            if any(valori):
+                yield lettore.line_num + 1, valori
+
+    return intestazione, righe()
+
+
+def analizza(righe, normalizza, chunk_size):
+    """Blocchi di (numero di riga, record) ed errori [(numero di riga, messaggio)] per blocco"""
+    blocco, errori = [], []
+    for numero, valori in righe:
+        try:
+            blocco.append((numero, normalizza(valori)))
+        except ValueError as e:
+            errori.append((numero, str(e)))
+        if len(blocco) >= chunk_size:
+            yield blocco, errori
+            blocco, errori = [], []
+    if blocco or errori:
+        yield blocco, errori
+
+
+def _upsert_blocco(client, blocco):
+    """Upsert di un blocco; restituisce (righe inserite, errori [(riga, messaggio)])"""
+    params = {'columns': ','.join(COLONNE), 'on_conflict': 'chiave_importazione', 'select': 'id'}
+    headers = {'Prefer': 'return=representation,resolution=ignore-duplicates'}
+    try:
+        response = client.post('spese', json=[record for _, record in blocco], params=params, headers=headers)
+    except Exception as e:
+        return 0, [(numero, str(e)) for numero, _ in blocco]
+
+    # Con ignore-duplicates tornano solo le righe davvero inserite
+    if response.ok:
+        return len(response.json()), []
+    if 400 <= response.status_code < 500 and len(blocco) > 1:
+        # Blocco annullato per intero (es. cliente eliminato nel frattempo): si isolano le righe
+        inserite, errori = 0, []
+        for riga in blocco:
+            singola, errore = _upsert_blocco(client, [riga])
+            inserite += singola
+            errori.extend(errore)
+        return inserite, errori
+    messaggio = messaggio_errore(response)
+    return 0, [(numero, messaggio) for numero, _ in blocco]
+
+
+def importa(client, file, mappa=None, delimitatore=None, categoria=None, inverti_segno=False,
+            chunk_size=1000, paralleli=4):
+    """
+    Importa le spese da un file CSV di testo. Restituisce
+    {'righe', 'inserite', 'gia_presenti', 'num_errori', 'errori'}: errori
+    contiene i primi MAX_ERRORI {'riga', 'error'} con il numero di riga
+    del file. Solleva ValueError per un file o una mappa non validi.
+    """
+    intestazione, righe = leggi_righe(file, delimitatore)
+    posizioni = associa_colonne(intestazione, mappa)
+    categorie, clienti = carica_riferimenti(client)
+    normalizza = Normalizzatore(posizioni, categorie, clienti, categoria, inverti_segno)
+
+    risultato = {'righe': 0, 'inserite': 0, 'gia_presenti': 0, 'num_errori': 0, 'errori': []}
+
+    def aggiungi_errori(errori):
+        risultato['num_errori'] += len(errori)
+        spazio = MAX_ERRORI - len(risultato['errori'])
+        risultato['errori'].extend({'riga': numero, 'error': messaggio} for numero, messaggio in errori[:spazio])
+
+    def raccogli(future, blocco):
+        inserite, errori = future.result()
+        risultato['inserite'] += inserite
+        risultato['gia_presenti'] += len(blocco) - inserite - len(errori)
+        aggiungi_errori(errori)
+
+    in_volo = deque()
+    try:
+        for blocco, errori in analizza(righe, normalizza, chunk_size):
+            risultato['righe'] += len(blocco) + len(errori)
+            aggiungi_errori(errori)
+            if not blocco:
+                continue
+            if len(in_volo) >= paralleli:
+                raccogli(*in_volo.popleft())
+            in_volo.append((client.submit(_upsert_blocco, client, blocco), blocco))
+        while in_volo:
+            raccogli(*in_volo.popleft())
+    finally:
+        # Se la lettura si interrompe (es. encoding sbagliato) i blocchi già inviati vengono comunque attesi
+        for future, _ in in_volo:
+            future.exception()
+    risultato['errori'].sort(key=lambda e: e['riga'])
+    return risultato
+
+
+def testo(stream, encoding='utf-8-sig'):
+    """Stream binario (upload, file aperto in 'rb') -> file di testo per csv"""
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        raise ValueError(f'Encoding non valido: {encoding}') from None
+    return io.TextIOWrapper(stream, encoding=encoding, newline='')
+
+
+def limiti_from_env():
+    return int(os.getenv('IMPORT_CHUNK_SIZE', 1000)), int(os.getenv('IMPORT_PARALLELI', 4))
+
+
+def max_size_from_env():
+    return int(os.getenv('IMPORT_MAX_SIZE', 52428800))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('file', help='File CSV da importare')
+    parser.add_argument('--mappa', action='append', default=[], metavar='CAMPO=INTESTAZIONE',
+                        help=f"Colonna del file per un campo ({', '.join(INTESTAZIONI)}), ripetibile")
+    parser.add_argument('--delimitatore', help='Separatore dei campi (default: dall\'intestazione)')
+    parser.add_argument('--encoding', default='utf-8-sig', help='Encoding del file (es. latin-1)')
+    parser.add_argument('--categoria', help='Categoria per le righe senza categoria (per nome)')
+    parser.add_argument('--inverti-segno', action='store_true', help='Le spese sono importi negativi')
+    args = parser.parse_args()
+
+    load_dotenv()
+    mappa = dict(voce.split('=', 1) for voce in args.mappa)
+    chunk_size, paralleli = limiti_from_env()
+    inizio = time.perf_counter()
+    with open(args.file, 'rb') as f:
+        risultato = importa(get_client(), testo(f, args.encoding), mappa=mappa, delimitatore=args.delimitatore,
+                            categoria=args.categoria, inverti_segno=args.inverti_segno,
+                            chunk_size=chunk_size, paralleli=paralleli)
+    secondi = time.perf_counter() - inizio
+    print(json.dumps(risultato, indent=2, ensure_ascii=False))
+    print(f"{risultato['righe']:,} righe in {secondi:.1f} s: {risultato['inserite']:,} inserite, "
+          f"{risultato['gia_presenti']:,} già presenti, {risultato['num_errori']:,} errori")
+
+
+if __name__ == '__main__':
+    main()
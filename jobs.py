@@ -0,0 +1,281 @@
+"""
+Export e report in background (/api/jobs).
+
+Un export grande non occupa più un worker gunicorn per tutta la durata:
+la richiesta accoda il lavoro e riceve subito un id, il client interroga
+lo stato (righe elaborate sul totale) e scarica il file quando è pronto.
+
+    pool        thread limitati (JOBS_WORKERS), al massimo JOBS_MAX_PENDING
+                lavori in coda o in esecuzione per processo: oltre, la
+                richiesta riceve 503 come per gli upload
+    cache       il file prodotto prende il nome da una chiave calcolata su
+                tipo, filtri normalizzati e impronta dei dati (max
+                updated_at e numero di righe filtrate, impronta dei dati di
+                riferimento, come per gli ETag): una richiesta identica
+                su dati invariati riceve subito il file già pronto, una
+                in corso viene riusata invece di ripartire
+    scadenza    file e stati più vecchi di JOBS_TTL secondi vengono
+                eliminati (un riuso dalla cache ne rinnova la scadenza)
+
+File e stati stanno in JOBS_DIR, condivisa dai worker gunicorn della
+stessa macchina: lo stato di ogni lavoro è scritto anche su <id>.json,
+così qualunque worker risponde a stato e download.
+
+Configurazione (variabili ambiente):
+    JOBS_WORKERS       lavori eseguiti in parallelo per processo (default 2)
+    JOBS_MAX_PENDING   lavori in coda o in esecuzione per processo (default 8)
+    JOBS_TTL           durata in secondi di file e stati (default 3600)
+    JOBS_DIR           cartella dei file (default <tmp>/expense_jobs)
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import billing
+import exports
+from conditional import references_fingerprint, table_fingerprint
+
+JOB_ID_RE = re.compile(r'\d{8}_\d{6}_[0-9a-f]{12}')
+# Intervallo minimo tra due scritture dello stato durante l'esecuzione (s)
+INTERVALLO_STATO = 1.0
+# Intervallo minimo tra due pulizie della cartella (s)
+INTERVALLO_PULIZIA = 60
+
+IN_CODA = 'in_coda'
+IN_CORSO = 'in_corso'
+COMPLETATO = 'completato'
+ERRORE = 'errore'
+
+
+def _excel(tipo):
+    return lambda client, params, path, progress: exports.genera_excel(client, tipo, params, path, progress)
+
+
+def _addebiti(client, params, path, progress, **argomenti):
+    return billing.genera_pdf(client, path=path, progress=progress, **argomenti)
+
+
+# tipo -> (tabella dei dati, estensione, mimetype, esecuzione(client, params, path, progress, **argomenti))
+TIPI = {
+    'excel_spese': ('spese', '.xlsx', exports.XLSX_MIMETYPE, _excel('spese')),
+    'excel_chilometriche': ('chilometriche', '.xlsx', exports.XLSX_MIMETYPE, _excel('chilometriche')),
+    'addebiti': ('spese', '.pdf', billing.PDF_MIMETYPE, _addebiti),
+}
+
+
+class CodaPiena(Exception):
+    """Troppi lavori in corso su questo worker"""
+
+
+def normalizza(params):
+    """Filtri PostgREST in forma canonica: senza valori vuoti, chiavi e liste ordinate"""
+    normalizzati = {}
+    for chiave, valore in params.items():
+        if valore in (None, '', [], ()):
+            continue
+        if isinstance(valore, (list, tuple)):
+            valore = sorted(str(v) for v in valore)
+        else:
+            valore = str(valore)
+        normalizzati[chiave] = valore
+    return json.dumps(normalizzati, sort_keys=True, separators=(',', ':'))
+
+
+def chiave_cache(tipo, params, impronta):
+    return hashlib.sha256(f'{tipo}\0{normalizza(params)}\0{impronta}'.encode()).hexdigest()[:32]
+
+
+def totale_da_impronta(impronta):
+    """Numero di righe dall'impronta "max(updated_at)/count" di table_fingerprint"""
+    try:
+        return int(impronta.rpartition('/')[2])
+    except ValueError:
+        return None
+
+
+class JobQueue:
+    def __init__(self, client_factory, workers=2, max_pending=8, ttl=3600, directory=None, on_finish=None):
+        self.client_factory = client_factory
+        # on_finish(tipo, stato, secondi): durata dall'accodamento alla fine, per le metriche
+        self.on_finish = on_finish
+        self.workers = workers
+        self.ttl = ttl
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'expense_jobs')
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+        self._ultima_pulizia = 0
+
+    def _executor(self):
+        # Pool creato pigramente e ricreato dopo un fork del worker
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    os.makedirs(self.directory, exist_ok=True)
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='job')
+                    self._pid = pid
+        return self._pool
+
+    def _percorso(self, nome):
+        return os.path.join(self.directory, nome)
+
+    def submit(self, tipo, params, **argomenti):
+        """
+        Accoda un export/report e restituisce lo stato del lavoro. Se lo
+        stesso file è già pronto (o in preparazione) restituisce quello.
+        Solleva ValueError per un tipo sconosciuto, CodaPiena senza slot liberi.
+        """
+        if tipo not in TIPI:
+            raise ValueError(f'Tipo job non valido: {tipo}')
+        table, estensione, _, _ = TIPI[tipo]
+        self._executor()
+        self._pulisci()
+
+        client = self.client_factory()
+        righe, riferimenti = client.gather(lambda: table_fingerprint(client, table, params),
+                                           lambda: references_fingerprint(client))
+        chiave = chiave_cache(tipo, params, f'{righe}\0{riferimenti}')
+        file = f'{chiave}{estensione}'
+
+        with self._lock:
+            for job in self._jobs.values():
+                if job['chiave'] == chiave and job['stato'] in (IN_CODA, IN_CORSO):
+                    return dict(job)
+        if os.path.exists(self._percorso(file)):
+            # Già pronto (anche da un altro worker): si rinnova la scadenza
+            os.utime(self._percorso(file))
+            job = self._nuovo(tipo, chiave, file, totale_da_impronta(righe), COMPLETATO, cache=True)
+            self._salva(job)
+            return dict(job)
+
+        if not self._slots.acquire(blocking=False):
+            raise CodaPiena('Troppi export in corso, riprovare tra poco')
+        job = self._nuovo(tipo, chiave, file, totale_da_impronta(righe), IN_CODA)
+        try:
+            self._salva(job)
+            self._executor().submit(self._esegui, job, params, argomenti)
+        except Exception:
+            self._slots.release()
+            raise
+        return dict(job)
+
+    def _nuovo(self, tipo, chiave, file, totale, stato, cache=False):
+        job = {
+            'id': f"{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:12]}",
+            'tipo': tipo,
+            'stato': stato,
+            'righe': totale if stato == COMPLETATO else 0,
+            'totale': totale,
+            'cache': cache,
+            'errore': None,
+            'chiave': chiave,
+            'file': file,
+            'creato': time.time(),
+        }
+        with self._lock:
+            self._jobs[job['id']] = job
+        return job
+
+    def _salva(self, job):
+        """Stato su <id>.json, scritto in modo atomico: lo leggono gli altri worker"""
+        path = self._percorso(f"{job['id']}.json")
+        with open(path + '.tmp', 'w') as f:
+            json.dump(job, f)
+        os.replace(path + '.tmp', path)
+
+    def _esegui(self, job, params, argomenti):
+        _, _, _, esecuzione = TIPI[job['tipo']]
+        job['stato'] = IN_CORSO
+        self._salva(job)
+        ultimo = [time.monotonic()]
+
+        def progress(righe):
+            job['righe'] = righe
+            if time.monotonic() - ultimo[0] >= INTERVALLO_STATO:
+                ultimo[0] = time.monotonic()
+                self._salva(job)
+
+        # File temporaneo nella stessa cartella, rinominato solo se completo:
+        # una richiesta identica non vede mai un file a metà
+        temporaneo = self._percorso(f"{job['id']}.part")
+        try:
+            esecuzione(self.client_factory(), params, temporaneo, progress, **argomenti)
+            os.replace(temporaneo, self._percorso(job['file']))
+            job['totale'] = job['righe'] = max(job['righe'], job['totale'] or 0)
+            self._fine(job, COMPLETATO)
+        except Exception as e:
+            if os.path.exists(temporaneo):
+                os.remove(temporaneo)
+            self._fine(job, ERRORE, str(e))
+
+    def _fine(self, job, stato, errore=None):
+        job['stato'] = stato
+        job['errore'] = errore
+        try:
+            self._salva(job)
+        finally:
+            self._slots.release()
+        if self.on_finish:
+            self.on_finish(job['tipo'], stato, time.time() - job['creato'])
+
+    def status(self, job_id):
+        if not JOB_ID_RE.fullmatch(job_id):
+            return None
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                return dict(job)
+        # Lavoro accodato da un altro worker: lo stato è su file
+        try:
+            with open(self._percorso(f'{job_id}.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def artifact(self, job):
+        """(percorso, mimetype) del file di un lavoro completato, None se scaduto"""
+        path = self._percorso(job['file'])
+        if job['stato'] != COMPLETATO or not os.path.exists(path):
+            return None
+        return path, TIPI[job['tipo']][2]
+
+    def _pulisci(self):
+        """Elimina stati e file scaduti, al massimo una volta ogni INTERVALLO_PULIZIA"""
+        adesso = time.time()
+        if adesso - self._ultima_pulizia < INTERVALLO_PULIZIA:
+            return
+        self._ultima_pulizia = adesso
+        limite = adesso - self.ttl
+        with self._lock:
+            for job_id in [k for k, j in self._jobs.items()
+                           if j['creato'] < limite and j['stato'] in (COMPLETATO, ERRORE)]:
+                del self._jobs[job_id]
+        for nome in os.listdir(self.directory):
+            path = self._percorso(nome)
+            try:
+                # I .part appartengono a lavori in corso: si eliminano solo se abbandonati
+                scadenza = limite - self.ttl if nome.endswith('.part') else limite
+                if os.path.getmtime(path) < scadenza:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+def jobs_from_env(client_factory, on_finish=None):
+    return JobQueue(
+        client_factory,
+        workers=int(os.getenv('JOBS_WORKERS', 2)),
+        max_pending=int(os.getenv('JOBS_MAX_PENDING', 8)),
+        ttl=int(os.getenv('JOBS_TTL', 3600)),
+        directory=os.getenv('JOBS_DIR') or None,
+        on_finish=on_finish,
+    )
@@ -0,0 +1,193 @@
+"""
+Metriche di latenza in formato Prometheus (GET /api/metrics).
+
+Raccoglie istogrammi per:
+    - route Flask          http_request_duration_seconds{method, route, status}
+    - chiamate a Supabase  supabase_call_duration_seconds{target, method, status}
+                           supabase_response_bytes_total{target, method}
+    - sezioni interne      app_section_duration_seconds{section}
+                           (es. generazione Excel, elaborazione immagini)
+
+Le chiamate a Supabase più lente di SLOW_CALL_MS finiscono nel logger
+"expense_tracker.slow" come una riga JSON con route, destinazione,
+status, byte e durata.
+
+Il costo per osservazione è una bisect e un incremento sotto lock
+(pochi microsecondi), trascurabile rispetto a una chiamata HTTP: le
+metriche possono restare attive in produzione.
+
+Ogni worker gunicorn ha i suoi contatori: Prometheus li vede come
+istanze diverse se ogni worker è raggiungibile, altrimenti lo scrape
+mostra il worker che ha risposto.
+
+Configurazione (variabili ambiente):
+    METRICS_ENABLED  1/0 (default 1)
+    SLOW_CALL_MS     soglia del log delle chiamate lente (default 500)
+"""
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import Response, g, has_request_context, request
+
+import supabase_client
+
+# Limiti superiori dei bucket in secondi (come prometheus_client)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+slow_logger = logging.getLogger('expense_tracker.slow')
+
+
+class Histogram:
+    """Istogramma cumulativo con label: una serie per combinazione di valori"""
+
+    def __init__(self, name, help, labels, buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # conteggi per bucket (+Inf in fondo), somma, numero
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            snapshot = [(k, list(v[0]), v[1], v[2]) for k, v in sorted(self._series.items())]
+        for label_values, counts, total, count in snapshot:
+            labels = _labels(self.labels, label_values)
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {count}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        lines.extend(f'{self.name}{{{_labels(self.labels, k)}}} {v}' for k, v in snapshot)
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values):
+    return ','.join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+
+
+class Metrics:
+    def __init__(self, slow_call_ms=500):
+        self.slow_call_seconds = slow_call_ms / 1000
+        self.routes = Histogram('http_request_duration_seconds', 'Durata delle richieste per route Flask',
+                                ('method', 'route', 'status'))
+        self.calls = Histogram('supabase_call_duration_seconds', 'Durata delle chiamate a Supabase',
+                               ('target', 'method', 'status'))
+        self.bytes = Counter('supabase_response_bytes_total', 'Byte ricevuti da Supabase', ('target', 'method'))
+        self.sections = Histogram('app_section_duration_seconds', 'Durata di sezioni interne', ('section',))
+
+    def init_app(self, app):
+        app.before_request(self._inizio_richiesta)
+        app.after_request(self._fine_richiesta)
+        app.add_url_rule('/api/metrics', 'metrics', self.endpoint, methods=['GET'])
+        supabase_client.add_observer(self.osserva_chiamata)
+
+    def _inizio_richiesta(self):
+        g.metrics_start = time.perf_counter()
+
+    def _fine_richiesta(self, response):
+        start = g.pop('metrics_start', None)
+        if start is not None:
+            self.routes.observe(time.perf_counter() - start, request.method, _route(), response.status_code)
+        return response
+
+    def osserva_chiamata(self, method, target, status, nbytes, seconds):
+        self.calls.observe(seconds, target, method, status)
+        self.bytes.inc(nbytes, target, method)
+        if seconds >= self.slow_call_seconds:
+            slow_logger.warning(json.dumps({
+                'evento': 'chiamata_lenta',
+                'route': _route() if has_request_context() else None,
+                'target': target,
+                'method': method,
+                'status': status,
+                'bytes': nbytes,
+                'durata_ms': round(seconds * 1000, 1),
+            }))
+
+    @contextmanager
+    def sezione(self, nome):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.sections.observe(time.perf_counter() - start, nome)
+
+    def osserva_sezione(self, nome, seconds):
+        self.sections.observe(seconds, nome)
+
+    def render(self):
+        lines = []
+        for metric in (self.routes, self.calls, self.bytes, self.sections):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def endpoint(self):
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+class NullMetrics:
+    """METRICS_ENABLED=0: stessa interfaccia, nessun costo"""
+
+    def init_app(self, app):
+        pass
+
+    @contextmanager
+    def sezione(self, nome):
+        yield
+
+    def osserva_sezione(self, nome, seconds):
+        pass
+
+
+def _route():
+    # La regola (/api/spese/<int:id>) e non il path: cardinalità limitata
+    return request.url_rule.rule if request.url_rule else 'non_trovata'
+
+
+def metrics_from_env():
+    if os.getenv('METRICS_ENABLED', '1') == '0':
+        return NullMetrics()
+    return Metrics(slow_call_ms=float(os.getenv('SLOW_CALL_MS', 500)))
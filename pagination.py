@@ -0,0 +1,87 @@
+"""
+Paginazione keyset (a cursore) sulle tabelle PostgREST.
+
+Le liste sono ordinate per (data DESC, id DESC). Il cursore codifica la
+coppia (data, id) dell'ultima riga restituita e la pagina successiva è
+filtrata con "data < D OR (data = D AND id < I)", così il costo di ogni
+pagina non dipende da quante righe sono già state lette (niente OFFSET).
+"""
+import base64
+import json
+from datetime import date
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+def encode_cursor(date_value, id_value):
+    raw = json.dumps([date_value, id_value], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Restituisce (data, id) oppure solleva ValueError se il cursore non è valido"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        date_value, id_value = json.loads(base64.urlsafe_b64decode(padded))
+        # La data finisce nel filtro or=(...) di PostgREST: solo date ISO,
+        # un cursore manipolato non può aggiungere condizioni
+        return date.fromisoformat(date_value).isoformat(), int(id_value)
+    except Exception:
+        raise ValueError('Cursore non valido')
+
+
+def parse_limit(value, default=DEFAULT_LIMIT):
+    if value in (None, ''):
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError('Parametro limit non valido')
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def keyset_params(params, order_column, limit, cursor=None):
+    """Aggiunge ordinamento, limite e condizione del cursore ai parametri PostgREST"""
+    params = dict(params)
+    params['order'] = f'{order_column}.desc,id.desc'
+    # Una riga in più per sapere se esiste una pagina successiva
+    params['limit'] = str(limit + 1)
+    if cursor:
+        date_value, id_value = decode_cursor(cursor)
+        params['or'] = f'({order_column}.lt.{date_value},and({order_column}.eq.{date_value},id.lt.{id_value}))'
+    return params
+
+
+def fetch_page(client, table, params, order_column, limit, cursor=None):
+    """Legge una pagina e restituisce (righe, cursore_successivo)"""
+    response = client.get(table, params=keyset_params(params, order_column, limit, cursor))
+    response.raise_for_status()
+    rows = response.json()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(last[order_column], last['id'])
+
+
+def iter_pages(client, table, params, order_column, page_size=1000, first_page_size=None):
+    """
+    Scorre tutte le righe che soddisfano i filtri, una pagina alla volta.
+    La pagina successiva si legge mentre il chiamante elabora la corrente.
+    first_page_size (più piccola) anticipa la prima pagina per le risposte
+    in streaming. Con il backend Postgres diretto basta un cursore lato server.
+    """
+    if hasattr(client, 'iter_rows'):
+        yield from client.iter_rows(table, dict(params, order=f'{order_column}.desc,id.desc'), page_size)
+        return
+    rows, cursor = fetch_page(client, table, params, order_column, first_page_size or page_size)
+    while True:
+        successiva = None
+        if cursor:
+            successiva = client.submit(fetch_page, client, table, params, order_column, page_size, cursor)
+        if rows:
+            yield rows
+        if successiva is None:
+            break
+        rows, cursor = successiva.result()
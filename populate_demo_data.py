@@ -6,20 +6,37 @@ ATTENZIONE: Questo script inserisce dati di esempio.
 Usare solo su database di test!
 
 Uso: python populate_demo_data.py
+
+Volumi di produzione (dati sintetici deterministici, vedi demo_data.py):
+    python populate_demo_data.py --scale 10 --seed 42
+    python populate_demo_data.py --scale 10 --copy      # COPY diretto su DATABASE_URL
+    python populate_demo_data.py --scale 10 --dry-run   # solo generazione, misura righe/s
 """
 
-from supabase import create_client
 from dotenv import load_dotenv
+import argparse
+import csv
+import io
 import os
-from datetime import datetime, timedelta
+import sys
+import time
+from datetime import date, datetime, timedelta
 import random
 
+from demo_data import DemoDataset
+
 load_dotenv()
 
-supabase = create_client(
-    os.getenv('SUPABASE_URL'),
-    os.getenv('SUPABASE_KEY')
-)
+# Client supabase-py creato solo per la modalità interattiva
+supabase = None
+
+def connetti():
+    global supabase
+    from supabase import create_client
+    supabase = create_client(
+        os.getenv('SUPABASE_URL'),
+        os.getenv('SUPABASE_KEY')
+    )
 
 def clear_demo_data():
     """Pulisce tutti i dati (ATTENZIONE!)"""
@@ -272,7 +289,208 @@ def populate_chilometriche(veicolo_ids, cliente_ids, progetto_ids):
     
     print(f"  ✓ Inseriti {len(viaggi)} viaggi")
 
+# ============= DATI SINTETICI SU SCALA =============
+
+COLONNE_SPESE = ('data_spesa', 'categoria_id', 'cliente_id', 'progetto_id', 'importo', 'descrizione',
+                 'fornitore', 'addebitabile', 'addebitata')
+COLONNE_VIAGGI = ('data_viaggio', 'veicolo_id', 'cliente_id', 'progetto_id', 'partenza', 'arrivo',
+                  'km_percorsi', 'tariffa_applicata', 'rimborso_calcolato', 'addebitabile', 'descrizione')
+
+def blocchi(righe, dimensione):
+    blocco = []
+    for riga in righe:
+        blocco.append(riga)
+        if len(blocco) == dimensione:
+            yield blocco
+            blocco = []
+    if blocco:
+        yield blocco
+
+def rimappa(riga, colonne, mappe):
+    """Riga con solo le colonne indicate e le foreign key tradotte negli id reali"""
+    out = {}
+    for colonna in colonne:
+        valore = riga.get(colonna)
+        if valore is not None and colonna in mappe:
+            valore = mappe[colonna][valore]
+        out[colonna] = valore
+    return out
+
+def avanzamento(tabella, inserite, totale, inizio):
+    durata = time.perf_counter() - inizio
+    sys.stdout.write(f"\r  {tabella:<14} {inserite:>10,}/{totale:,}  {inserite / max(durata, 1e-9):>10,.0f} righe/s")
+    sys.stdout.flush()
+
+class CaricatoreRest:
+    """Insert a blocchi via PostgREST (supabase_client.SupabaseClient)"""
+
+    def __init__(self, chunk_size):
+        from supabase_client import client_from_env
+        self.client = client_from_env()
+        self.chunk_size = chunk_size
+
+    def categorie(self):
+        response = self.client.get('categorie', params={'select': 'id,nome'}, use_service_key=True)
+        response.raise_for_status()
+        return {c['nome']: c['id'] for c in response.json()}
+
+    def inserisci_con_id(self, table, righe):
+        ids = []
+        for blocco in blocchi(righe, self.chunk_size):
+            response = self.client.post(table, json=blocco, params={'select': 'id'})
+            response.raise_for_status()
+            ids.extend(r['id'] for r in response.json())
+        return ids
+
+    def inserisci(self, table, colonne, righe):
+        for blocco in blocchi(righe, self.chunk_size):
+            response = self.client.post(table, json=blocco, params={'columns': ','.join(colonne)},
+                                        headers={'Prefer': 'return=minimal'})
+            response.raise_for_status()
+            yield len(blocco)
+
+    def chiudi(self):
+        self.client.close()
+
+class CaricatoreCopy:
+    """COPY ... FROM STDIN su una connessione Postgres diretta (DATABASE_URL)"""
+
+    def __init__(self, chunk_size):
+        import psycopg2
+        self.conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        self.chunk_size = chunk_size
+
+    def categorie(self):
+        with self.conn.cursor() as cur:
+            cur.execute('SELECT id, nome FROM categorie')
+            return {nome: id for id, nome in cur.fetchall()}
+
+    def inserisci_con_id(self, table, righe):
+        from psycopg2.extras import execute_values
+        if not righe:
+            return []
+        colonne = list(righe[0])
+        with self.conn.cursor() as cur:
+            # Un solo statement per pagina: RETURNING rispetta l'ordine dei VALUES
+            risultato = execute_values(
+                cur, f"INSERT INTO {table} ({', '.join(colonne)}) VALUES %s RETURNING id",
+                [tuple(r[c] for c in colonne) for r in righe], page_size=len(righe), fetch=True)
+        return [r[0] for r in risultato]
+
+    def inserisci(self, table, colonne, righe):
+        sql = f"COPY {table} ({', '.join(colonne)}) FROM STDIN WITH (FORMAT csv)"
+        with self.conn.cursor() as cur:
+            for blocco in blocchi(righe, self.chunk_size):
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                for riga in blocco:
+                    writer.writerow(['' if riga[c] is None else riga[c] for c in colonne])
+                buffer.seek(0)
+                cur.copy_expert(sql, buffer)
+                yield len(blocco)
+
+    def chiudi(self):
+        self.conn.commit()
+        self.conn.close()
+
+class CaricatoreNullo:
+    """--dry-run: genera le righe senza scriverle"""
+
+    def __init__(self, chunk_size):
+        self.chunk_size = chunk_size
+
+    def categorie(self):
+        return {}
+
+    def inserisci_con_id(self, table, righe):
+        return list(range(1, len(righe) + 1))
+
+    def inserisci(self, table, colonne, righe):
+        for blocco in blocchi(righe, self.chunk_size):
+            yield len(blocco)
+
+    def chiudi(self):
+        pass
+
+def popola_su_scala(dataset, caricatore):
+    riferimenti = dataset.riferimenti()
+
+    # Categorie: si riusano quelle esistenti, create solo le mancanti
+    esistenti = caricatore.categorie()
+    mancanti = [c for c in riferimenti['categorie'] if c['nome'] not in esistenti]
+    nuove = caricatore.inserisci_con_id('categorie', [{'nome': c['nome'], 'colore': c['colore']}
+                                                      for c in mancanti])
+    esistenti.update({c['nome']: id for c, id in zip(mancanti, nuove)})
+    mappa_categorie = {c['id']: esistenti.get(c['nome'], c['id']) for c in riferimenti['categorie']}
+
+    print("\n📋 Tabelle di riferimento...")
+    clienti = [{k: v for k, v in c.items() if k != 'id'} for c in riferimenti['clienti']]
+    id_clienti = dict(zip((c['id'] for c in riferimenti['clienti']),
+                          caricatore.inserisci_con_id('clienti', clienti)))
+    progetti = [dict({k: v for k, v in p.items() if k != 'id'}, cliente_id=id_clienti[p['cliente_id']])
+                for p in riferimenti['progetti']]
+    id_progetti = dict(zip((p['id'] for p in riferimenti['progetti']),
+                           caricatore.inserisci_con_id('progetti', progetti)))
+    veicoli = [{k: v for k, v in v.items() if k != 'id'} for v in riferimenti['veicoli']]
+    id_veicoli = dict(zip((v['id'] for v in riferimenti['veicoli']),
+                          caricatore.inserisci_con_id('veicoli', veicoli)))
+    print(f"  ✓ {len(clienti)} clienti, {len(progetti)} progetti, {len(veicoli)} veicoli")
+
+    mappe = {'categoria_id': mappa_categorie, 'cliente_id': id_clienti, 'progetto_id': id_progetti,
+             'veicolo_id': id_veicoli}
+    for table, colonne, righe, totale in (
+        ('spese', COLONNE_SPESE, dataset.spese(), dataset.num_spese),
+        ('chilometriche', COLONNE_VIAGGI, dataset.chilometriche(), dataset.num_viaggi),
+    ):
+        inizio = time.perf_counter()
+        inserite = 0
+        for n in caricatore.inserisci(table, colonne, (rimappa(r, colonne, mappe) for r in righe)):
+            inserite += n
+            avanzamento(table, inserite, totale, inizio)
+        print()
+
+def main_scala(args):
+    dataset = DemoDataset(scale=args.scale, seed=args.seed, fine=args.fine)
+    if args.dry_run:
+        caricatore = CaricatoreNullo(args.chunk_size)
+        modo = 'solo generazione'
+    elif args.copy:
+        caricatore = CaricatoreCopy(args.chunk_size)
+        modo = 'COPY su DATABASE_URL'
+    else:
+        caricatore = CaricatoreRest(args.chunk_size)
+        modo = f'insert PostgREST a blocchi da {args.chunk_size}'
+
+    print("="*60)
+    print(f"Dati sintetici: scala {args.scale}, seed {args.seed} ({modo})")
+    print(f"{dataset.num_spese:,} spese, {dataset.num_viaggi:,} viaggi, "
+          f"dal {dataset.inizio} al {dataset.fine}")
+    print("="*60)
+
+    inizio = time.perf_counter()
+    try:
+        popola_su_scala(dataset, caricatore)
+    finally:
+        caricatore.chiudi()
+    print(f"\n✅ COMPLETATO in {time.perf_counter() - inizio:.1f} s")
+
 def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=float, help='Fattore di scala (1 = 100.000 spese, 40.000 viaggi)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--fine', type=date.fromisoformat, help='Data dell\'ultima riga (default oggi)')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='Righe per insert/COPY')
+    parser.add_argument('--copy', action='store_true', help='Usa COPY su DATABASE_URL invece di PostgREST')
+    parser.add_argument('--dry-run', action='store_true', help='Genera i dati senza scriverli')
+    args = parser.parse_args()
+
+    if args.scale is not None:
+        main_scala(args)
+    else:
+        main_interattivo()
+
+def main_interattivo():
+    connetti()
     print("="*60)
     print("EXPENSE TRACKER - Popolamento Dati Demo")
     print("="*60)
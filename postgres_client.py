@@ -0,0 +1,515 @@
+"""
+Backend dati diretto su PostgreSQL (DATA_BACKEND=postgres).
+
+PostgresClient espone la stessa interfaccia di SupabaseClient
+(get/post/patch/delete/rpc, gather/submit) e traduce i parametri
+PostgREST usati dall'app in SQL parametrizzato:
+    select    colonne e risorse collegate: "*,categorie(nome,colore)"
+              diventa una LEFT JOIN sulla chiave esterna (categoria_id)
+    filtri    eq, neq, gt, gte, lt, lte, like, ilike, is, in, not.<op>,
+              or=(...)/and=(...) annidati
+    order     "col.desc.nullslast,id.desc"
+    limit, offset, columns, on_conflict
+    Prefer    count=exact (header Content-Range), return=minimal,
+              missing=default, resolution=merge-duplicates/ignore-duplicates
+
+Il JSON delle risposte lo produce Postgres (json_agg), con gli stessi
+formati di PostgREST per date, timestamp e numeri: le route non vedono
+differenze. Le risposte hanno status_code, ok, headers, json() e
+raise_for_status() come requests.Response; gli errori SQL diventano
+400/404/409 con corpo {code, message, details, hint}.
+
+Le connessioni vengono da un pool per processo (psycopg2
+ThreadedConnectionPool): i thread in eccesso aspettano una connessione
+libera invece di fallire. iter_rows() legge con un cursore lato server,
+così un export di milioni di righe non passa per la paginazione.
+
+Lo Storage (ricevute) resta su Supabase: upload/exists/public_url sono
+delegati al SupabaseClient passato come storage.
+
+Configurazione (variabili ambiente):
+    DATABASE_URL                stringa di connessione PostgreSQL
+    PG_POOL_MIN                 connessioni aperte all'avvio (default 1)
+    PG_POOL_MAX                 connessioni per processo (default 10)
+    PG_STATEMENT_TIMEOUT_MS     timeout di ogni query (default 30000)
+    SUPABASE_FANOUT_WORKERS     come per il backend PostgREST
+"""
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extras import Json
+from psycopg2.pool import ThreadedConnectionPool
+from requests import HTTPError
+
+from supabase_client import FanOut, notify
+
+# Risorsa collegata -> colonna chiave esterna della tabella principale
+RELAZIONI = {
+    'categorie': 'categoria_id',
+    'clienti': 'cliente_id',
+    'progetti': 'progetto_id',
+    'veicoli': 'veicolo_id',
+}
+
+# Parametri che non sono filtri su colonne
+RISERVATI = frozenset(['select', 'order', 'limit', 'offset', 'columns', 'on_conflict'])
+
+OPERATORI = {
+    'eq': '=', 'neq': '<>', 'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<=',
+    'like': 'LIKE', 'ilike': 'ILIKE',
+}
+
+IDENTIFICATORE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+class QueryError(ValueError):
+    """Parametri non traducibili in SQL (come PGRST100 di PostgREST)"""
+
+
+class Response:
+    """Risposta con l'interfaccia di requests.Response usata dall'app"""
+
+    def __init__(self, status_code, body=None, headers=None):
+        self.status_code = status_code
+        self.text = body or ''
+        self.content = self.text.encode()
+        self.headers = headers or {}
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if not self.ok:
+            try:
+                message = self.json().get('message')
+            except ValueError:
+                message = self.text
+            raise HTTPError(f'{self.status_code} Error: {message}', response=self)
+
+
+def _ident(name):
+    if not IDENTIFICATORE.match(name):
+        raise QueryError(f'Nome non valido: {name}')
+    return sql.Identifier(name)
+
+
+def _dividi(testo):
+    """
+    Divide per virgole al livello più esterno: "a,b(c,d),e" -> [a, b(c,d), e].
+    Come in PostgREST, le virgole tra doppi apici fanno parte del valore.
+    """
+    parti, livello, inizio, apici = [], 0, 0, False
+    for i, c in enumerate(testo):
+        if c == '"':
+            apici = not apici
+        elif apici:
+            continue
+        elif c == '(':
+            livello += 1
+        elif c == ')':
+            livello -= 1
+        elif c == ',' and livello == 0:
+            parti.append(testo[inizio:i])
+            inizio = i + 1
+    parti.append(testo[inizio:])
+    return [p.strip() for p in parti if p.strip()]
+
+
+def _prefer(headers):
+    return {v.strip() for v in (headers or {}).get('Prefer', '').split(',') if v.strip()}
+
+
+# ---------- Traduzione PostgREST -> SQL ----------
+
+def colonne_select(select):
+    """
+    Espressioni della SELECT sulla tabella con alias t e le JOIN
+    necessarie per le risorse collegate.
+    """
+    colonne, joins = [], []
+    for i, voce in enumerate(_dividi(select or '*')):
+        if voce == '*':
+            colonne.append(sql.SQL('t.*'))
+        elif '(' in voce:
+            risorsa, interne = voce[:-1].split('(', 1)
+            if risorsa not in RELAZIONI or not voce.endswith(')'):
+                raise QueryError(f'Relazione non supportata: {risorsa}')
+            alias = sql.Identifier(f'j{i}')
+            joins.append(sql.SQL('LEFT JOIN {} {} ON {}.id = t.{}').format(
+                _ident(risorsa), alias, alias, _ident(RELAZIONI[risorsa])))
+            campi = _dividi(interne)
+            if campi == ['*']:
+                oggetto = sql.SQL('to_json({})').format(alias)
+            else:
+                oggetto = sql.SQL('json_build_object({})').format(sql.SQL(', ').join(
+                    sql.SQL('{}, {}.{}').format(sql.Literal(c), alias, _ident(c)) for c in campi))
+            colonne.append(sql.SQL('CASE WHEN {}.id IS NULL THEN NULL ELSE {} END AS {}').format(
+                alias, oggetto, _ident(risorsa)))
+        else:
+            colonne.append(sql.SQL('t.{}').format(_ident(voce)))
+    return sql.SQL(', ').join(colonne), sql.SQL(' ').join(joins)
+
+
+def _condizione(colonna, espressione):
+    negata = espressione.startswith('not.')
+    if negata:
+        espressione = espressione[4:]
+    operatore, _, valore = espressione.partition('.')
+    campo = sql.SQL('t.{}').format(_ident(colonna))
+
+    if operatore in OPERATORI:
+        if operatore in ('like', 'ilike'):
+            valore = valore.replace('*', '%')
+        condizione = sql.SQL('{} {} {}').format(campo, sql.SQL(OPERATORI[operatore]), sql.Literal(valore))
+    elif operatore == 'is':
+        if valore.lower() not in ('null', 'true', 'false', 'unknown'):
+            raise QueryError(f'Valore non valido per is: {valore}')
+        condizione = sql.SQL('{} IS {}').format(campo, sql.SQL(valore.upper()))
+    elif operatore == 'in':
+        valori = [v.strip('"') for v in _dividi(valore.strip('()'))]
+        if not valori:
+            condizione = sql.SQL('false')
+        else:
+            condizione = sql.SQL('{} IN ({})').format(campo, sql.SQL(', ').join(map(sql.Literal, valori)))
+    else:
+        raise QueryError(f'Operatore non supportato: {operatore}')
+    return sql.SQL('NOT ({})').format(condizione) if negata else condizione
+
+
+def _logica(operatore, testo):
+    """or=(a.lt.1,and(a.eq.1,id.lt.5)) -> (t.a < '1' OR (t.a = '1' AND t.id < '5'))"""
+    parti = []
+    for voce in _dividi(testo.strip()[1:-1]):
+        negata = voce.startswith('not.')
+        if negata:
+            voce = voce[4:]
+        if voce.startswith(('and(', 'or(')):
+            interno, _, resto = voce.partition('(')
+            condizione = _logica(interno, '(' + resto)
+        else:
+            colonna, _, espressione = voce.partition('.')
+            condizione = _condizione(colonna, espressione)
+        parti.append(sql.SQL('NOT ({})').format(condizione) if negata else condizione)
+    if not parti:
+        raise QueryError(f'Condizione {operatore} vuota')
+    separatore = sql.SQL(' OR ' if operatore == 'or' else ' AND ')
+    return sql.SQL('({})').format(separatore.join(parti))
+
+
+def where(params):
+    condizioni = []
+    for chiave, valori in (params or {}).items():
+        if chiave in RISERVATI:
+            continue
+        # Più condizioni sulla stessa colonna (lista) vanno in AND
+        for valore in valori if isinstance(valori, (list, tuple)) else [valori]:
+            if chiave in ('or', 'and'):
+                condizioni.append(_logica(chiave, valore))
+            else:
+                condizioni.append(_condizione(chiave, str(valore)))
+    if not condizioni:
+        return sql.SQL('')
+    return sql.SQL(' WHERE ') + sql.SQL(' AND ').join(condizioni)
+
+
+def order_by(order):
+    if not order:
+        return sql.SQL('')
+    termini = []
+    for voce in order.split(','):
+        colonna, *modificatori = voce.strip().split('.')
+        termine = sql.SQL('t.{}').format(_ident(colonna))
+        for m in modificatori:
+            if m not in ('asc', 'desc', 'nullsfirst', 'nullslast'):
+                raise QueryError(f'Ordinamento non valido: {voce}')
+            termine += sql.SQL({'nullsfirst': ' NULLS FIRST', 'nullslast': ' NULLS LAST'}.get(m, ' ' + m.upper()))
+        termini.append(termine)
+    return sql.SQL(' ORDER BY ') + sql.SQL(', ').join(termini)
+
+
+def limite(params):
+    parti = sql.SQL('')
+    for chiave, parola in (('limit', ' LIMIT '), ('offset', ' OFFSET ')):
+        if params.get(chiave) not in (None, ''):
+            try:
+                parti += sql.SQL(parola) + sql.Literal(int(params[chiave]))
+            except ValueError:
+                raise QueryError(f'{chiave} non valido')
+    return parti
+
+
+def query_select(table, params, sorgente=None):
+    """SELECT con JOIN, filtri, ordinamento e limite su table (o su una CTE)"""
+    params = params or {}
+    colonne, joins = colonne_select(params.get('select'))
+    return sql.SQL('SELECT {} FROM {} t {}{}{}{}').format(
+        colonne, sorgente or _ident(table), joins, where(params), order_by(params.get('order')), limite(params))
+
+
+def come_json(query):
+    """Risultato intero come testo JSON (array), prodotto da Postgres"""
+    return sql.SQL("SELECT coalesce(json_agg(q), '[]')::text FROM ({}) q").format(query)
+
+
+def _messaggio_errore(e):
+    diag = getattr(e, 'diag', None)
+    return {
+        'code': e.pgcode,
+        'message': (diag.message_primary if diag and diag.message_primary else str(e).strip()),
+        'details': diag.message_detail if diag else None,
+        'hint': diag.message_hint if diag else None,
+    }
+
+
+def _status_errore(pgcode):
+    # Stessa corrispondenza di PostgREST per i casi che l'app incontra
+    if pgcode in ('23505', '23503'):
+        return 409
+    if pgcode in ('42P01', '42883'):
+        return 404
+    if pgcode and pgcode[:2] in ('22', '23', '42'):
+        return 400
+    return 500
+
+
+class PostgresClient(FanOut):
+    """Accesso diretto a PostgreSQL con pool di connessioni per processo"""
+
+    def __init__(self, dsn, storage=None, pool_min=1, pool_max=10, statement_timeout_ms=30000,
+                 fanout_workers=8):
+        self.dsn = dsn
+        self.storage = storage
+        self.fanout_workers = fanout_workers
+        options = f'-c statement_timeout={int(statement_timeout_ms)}' if statement_timeout_ms else None
+        self._pool_pg = ThreadedConnectionPool(pool_min, pool_max, dsn, options=options)
+        # ThreadedConnectionPool fallisce a pool esaurito: qui si aspetta
+        self._slots = threading.BoundedSemaphore(pool_max)
+        self._funzioni_set = {}
+
+    @contextmanager
+    def connessione(self):
+        """Connessione del pool in una transazione: commit all'uscita, rollback su errore"""
+        self._slots.acquire()
+        conn = None
+        try:
+            conn = self._pool_pg.getconn()
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                if not conn.closed:
+                    conn.rollback()
+                raise
+        finally:
+            if conn is not None:
+                # Connessioni cadute (riavvio del server, rete) non tornano nel pool
+                self._pool_pg.putconn(conn, close=bool(conn.closed))
+            self._slots.release()
+
+    def _esegui(self, method, target, status_ok, query, args=None, headers=None):
+        """Esegue una query che restituisce testo JSON e la impacchetta in una Response"""
+        start = time.perf_counter()
+        response = None
+        try:
+            with self.connessione() as conn, conn.cursor() as cur:
+                cur.execute(query, args)
+                body = cur.fetchone()[0]
+                extra = {}
+                if headers is not None:
+                    extra = headers(cur, body)
+            response = Response(status_ok, body, extra)
+        except QueryError as e:
+            response = Response(400, json.dumps({'code': 'PGRST100', 'message': str(e),
+                                                 'details': None, 'hint': None}))
+        except psycopg2.Error as e:
+            if e.pgcode is None:
+                # Errore di connessione, non della query
+                raise
+            response = Response(_status_errore(e.pgcode), json.dumps(_messaggio_errore(e)))
+        finally:
+            notify(method, target, response.status_code if response else 'errore',
+                   len(response.content) if response else 0, time.perf_counter() - start)
+        return response
+
+    # ---------- Interfaccia PostgREST ----------
+
+    def get(self, table, params=None, use_service_key=False, headers=None, timeout=None):
+        params = params or {}
+        try:
+            query = come_json(query_select(table, params))
+        except QueryError as e:
+            return Response(400, _json_errore(e))
+
+        content_range = None
+        if 'count=exact' in _prefer(headers):
+            def intestazioni(cur, body):
+                cur.execute(sql.SQL('SELECT count(*) FROM {} t{}').format(_ident(table), where(params)))
+                totale = cur.fetchone()[0]
+                righe = len(json.loads(body))
+                inizio = int(params.get('offset') or 0)
+                intervallo = f'{inizio}-{inizio + righe - 1}' if righe else '*'
+                return {'Content-Range': f'{intervallo}/{totale}'}
+            content_range = intestazioni
+        return self._esegui('GET', table, 200, query, headers=content_range)
+
+    def _returning(self, table, params, cte, prefer, status):
+        if 'return=minimal' in prefer:
+            return sql.SQL('{} SELECT NULL').format(cte), status
+        query = come_json(query_select(table, {'select': (params or {}).get('select')}, sql.SQL('r')))
+        return sql.SQL('{} {}').format(cte, query), status
+
+    def post(self, table, json=None, params=None, use_service_key=True, headers=None, timeout=None):
+        params = params or {}
+        prefer = _prefer(headers)
+        righe = json if isinstance(json, list) else [json or {}]
+        try:
+            if params.get('columns'):
+                colonne = [c.strip() for c in params['columns'].split(',')]
+            else:
+                colonne = list(dict.fromkeys(c for riga in righe for c in riga))
+            # Come PostgREST: colonne assenti NULL, salvo missing=default
+            mancante = sql.SQL('DEFAULT' if 'missing=default' in prefer else 'NULL')
+            valori = sql.SQL(', ').join(
+                sql.SQL('({})').format(sql.SQL(', ').join(
+                    sql.Literal(_valore(riga[c])) if c in riga else mancante for c in colonne))
+                for riga in righe)
+            insert = sql.SQL('INSERT INTO {} ({}) VALUES {}').format(
+                _ident(table), sql.SQL(', ').join(map(_ident, colonne)), valori)
+            if not colonne:
+                insert = sql.SQL('INSERT INTO {} DEFAULT VALUES').format(_ident(table))
+            if params.get('on_conflict'):
+                insert += _on_conflict(params['on_conflict'], colonne, prefer)
+            cte = sql.SQL('WITH r AS ({} RETURNING *)').format(insert)
+            query, status = self._returning(table, params, cte, prefer, 201)
+        except QueryError as e:
+            return Response(400, _json_errore(e))
+        return self._esegui('POST', table, status, query)
+
+    def patch(self, table, json=None, params=None, use_service_key=True, headers=None, timeout=None):
+        params = params or {}
+        try:
+            if not json:
+                raise QueryError('Nessun campo da aggiornare')
+            assegnazioni = sql.SQL(', ').join(
+                sql.SQL('{} = {}').format(_ident(c), sql.Literal(_valore(v))) for c, v in json.items())
+            update = sql.SQL('UPDATE {} t SET {}{} RETURNING t.*').format(_ident(table), assegnazioni, where(params))
+            query, status = self._returning(table, params, sql.SQL('WITH r AS ({})').format(update),
+                                            _prefer(headers), 200)
+        except QueryError as e:
+            return Response(400, _json_errore(e))
+        return self._esegui('PATCH', table, status, query)
+
+    def delete(self, table, params=None, use_service_key=True, headers=None, timeout=None):
+        params = params or {}
+        try:
+            delete = sql.SQL('DELETE FROM {} t{} RETURNING t.*').format(_ident(table), where(params))
+            query, status = self._returning(table, params, sql.SQL('WITH r AS ({})').format(delete),
+                                            _prefer(headers), 200)
+        except QueryError as e:
+            return Response(400, _json_errore(e))
+        return self._esegui('DELETE', table, status, query)
+
+    def rpc(self, function, args=None, read_only=True, use_service_key=False, timeout=None):
+        try:
+            argomenti = sql.SQL(', ').join(
+                sql.SQL('{} => {}').format(_ident(nome), sql.Literal(_valore(valore)))
+                for nome, valore in (args or {}).items())
+            chiamata = sql.SQL('{}({})').format(_ident(function), argomenti)
+        except QueryError as e:
+            return Response(400, _json_errore(e))
+        # Funzioni SETOF: array di righe come PostgREST; le altre: il valore
+        if self._restituisce_set(function):
+            query = sql.SQL("SELECT coalesce(json_agg(r), '[]')::text FROM {} r").format(chiamata)
+        else:
+            query = sql.SQL('SELECT to_json({})::text').format(chiamata)
+        return self._esegui('GET' if read_only else 'POST', f'rpc/{function}', 200, query)
+
+    def _restituisce_set(self, function):
+        if function not in self._funzioni_set:
+            with self.connessione() as conn, conn.cursor() as cur:
+                cur.execute('SELECT bool_or(proretset) FROM pg_proc WHERE proname = %s', (function,))
+                self._funzioni_set[function] = bool(cur.fetchone()[0])
+        return self._funzioni_set[function]
+
+    def iter_rows(self, table, params, batch_size=1000):
+        """
+        Tutte le righe della query in blocchi da batch_size, lette con un
+        cursore lato server: una sola query, memoria costante.
+        """
+        query = sql.SQL('SELECT row_to_json(q)::text FROM ({}) q').format(query_select(table, params))
+        start = time.perf_counter()
+        with self.connessione() as conn:
+            with conn.cursor(name=f'iter_{table}_{threading.get_ident()}') as cur:
+                cur.itersize = batch_size
+                cur.execute(query)
+                while True:
+                    righe = cur.fetchmany(batch_size)
+                    if not righe:
+                        break
+                    yield [json.loads(r[0]) for r in righe]
+        notify('GET', table, 200, 0, time.perf_counter() - start)
+
+    # ---------- Storage (delegato a Supabase) ----------
+
+    def _storage(self):
+        if self.storage is None:
+            raise RuntimeError('Storage non configurato: servono SUPABASE_URL e SUPABASE_SERVICE_KEY')
+        return self.storage
+
+    def upload(self, bucket, path, data, content_type='application/octet-stream', timeout=None):
+        return self._storage().upload(bucket, path, data, content_type, timeout)
+
+    def exists(self, bucket, path, timeout=None):
+        return self._storage().exists(bucket, path, timeout)
+
+    def public_url(self, bucket, path):
+        return self._storage().public_url(bucket, path)
+
+    def close(self):
+        self.close_fanout()
+        self._pool_pg.closeall()
+        if self.storage is not None:
+            self.storage.close()
+
+
+def _valore(valore):
+    # Oggetti e array vanno nelle colonne json/jsonb
+    return Json(valore) if isinstance(valore, (dict, list)) else valore
+
+
+def _json_errore(e):
+    return json.dumps({'code': 'PGRST100', 'message': str(e), 'details': None, 'hint': None})
+
+
+def _on_conflict(colonne_conflitto, colonne, prefer):
+    chiavi = [c.strip() for c in colonne_conflitto.split(',')]
+    bersaglio = sql.SQL(', ').join(map(_ident, chiavi))
+    aggiornate = [c for c in colonne if c not in chiavi]
+    if 'resolution=ignore-duplicates' in prefer or ('resolution=merge-duplicates' in prefer and not aggiornate):
+        return sql.SQL(' ON CONFLICT ({}) DO NOTHING').format(bersaglio)
+    if 'resolution=merge-duplicates' not in prefer:
+        # Senza resolution un conflitto resta un errore (409)
+        return sql.SQL('')
+    return sql.SQL(' ON CONFLICT ({}) DO UPDATE SET {}').format(bersaglio, sql.SQL(', ').join(
+        sql.SQL('{} = EXCLUDED.{}').format(_ident(c), _ident(c)) for c in aggiornate))
+
+
+def postgres_client_from_env(storage=None):
+    return PostgresClient(
+        os.getenv('DATABASE_URL'),
+        storage=storage,
+        pool_min=int(os.getenv('PG_POOL_MIN', 1)),
+        pool_max=int(os.getenv('PG_POOL_MAX', 10)),
+        statement_timeout_ms=int(os.getenv('PG_STATEMENT_TIMEOUT_MS', 30000)),
+        fanout_workers=int(os.getenv('SUPABASE_FANOUT_WORKERS', 8)),
+    )
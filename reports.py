@@ -0,0 +1,113 @@
+"""
+Report mensili e annuali letti dai rollup (rollup_spese_mensili,
+rollup_km_mensili), mantenuti dai trigger in database/schema.sql.
+
+Un report legge al massimo 12 mesi x categorie/veicoli righe, quindi il
+costo non dipende da quante spese e chilometriche sono state registrate.
+Nomi di categorie e veicoli arrivano dalla cache dei dati di riferimento.
+I due rollup si leggono in parallelo (client.gather).
+"""
+from datetime import date
+
+SENZA_CATEGORIA = 'Senza categoria'
+SENZA_VEICOLO = 'Senza veicolo'
+
+CAMPI_SPESE = ('num_spese', 'totale', 'totale_addebitabile')
+CAMPI_KM = ('num_viaggi', 'km_totali', 'rimborso_totale')
+CONTATORI = ('num_spese', 'num_viaggi')
+
+
+def periodo(anno, mese=None):
+    """Intervallo [inizio, fine) in mesi: un mese o un anno intero"""
+    if mese is None:
+        return date(anno, 1, 1), date(anno + 1, 1, 1)
+    if not 1 <= mese <= 12:
+        raise ValueError('Mese non valido')
+    fine = date(anno + 1, 1, 1) if mese == 12 else date(anno, mese + 1, 1)
+    return date(anno, mese, 1), fine
+
+
+def leggi_rollup(client, table, inizio, fine):
+    params = {'mese': [f'gte.{inizio.isoformat()}', f'lt.{fine.isoformat()}'], 'order': 'mese.asc'}
+    response = client.get(table, params=params)
+    response.raise_for_status()
+    return response.json()
+
+
+def leggi_rollups(client, inizio, fine):
+    return client.gather(lambda: leggi_rollup(client, 'rollup_spese_mensili', inizio, fine),
+                         lambda: leggi_rollup(client, 'rollup_km_mensili', inizio, fine))
+
+
+def _somma(righe, campi):
+    totali = {}
+    for campo in campi:
+        if campo in CONTATORI:
+            totali[campo] = sum(int(r[campo]) for r in righe)
+        else:
+            totali[campo] = round(sum(float(r[campo]) for r in righe), 2)
+    return totali
+
+
+def _per_chiave(righe, chiave, campi):
+    gruppi = {}
+    for riga in righe:
+        gruppi.setdefault(riga[chiave], []).append(riga)
+    return {k: _somma(v, campi) for k, v in gruppi.items()}
+
+
+def _spese(righe, categorie):
+    per_categoria = []
+    for categoria_id, totali in _per_chiave(righe, 'categoria_id', CAMPI_SPESE).items():
+        categoria = categorie.get(categoria_id) or {}
+        per_categoria.append(dict(totali, categoria_id=categoria_id or None,
+                                  categoria=categoria.get('nome', SENZA_CATEGORIA),
+                                  colore=categoria.get('colore')))
+    per_categoria.sort(key=lambda c: c['totale'], reverse=True)
+    return dict(_somma(righe, CAMPI_SPESE), per_categoria=per_categoria)
+
+
+def _chilometriche(righe, veicoli):
+    per_veicolo = []
+    for veicolo_id, totali in _per_chiave(righe, 'veicolo_id', CAMPI_KM).items():
+        veicolo = veicoli.get(veicolo_id) or {}
+        per_veicolo.append(dict(totali, veicolo_id=veicolo_id or None,
+                                targa=veicolo.get('targa', SENZA_VEICOLO),
+                                modello=veicolo.get('modello')))
+    per_veicolo.sort(key=lambda v: v['km_totali'], reverse=True)
+    return dict(_somma(righe, CAMPI_KM), per_veicolo=per_veicolo)
+
+
+def report_mensile(client, anno, mese, categorie, veicoli):
+    """categorie e veicoli: dizionari id -> riga della tabella di riferimento"""
+    inizio, fine = periodo(anno, mese)
+    spese, km = leggi_rollups(client, inizio, fine)
+    return {
+        'anno': anno,
+        'mese': mese,
+        'spese': _spese(spese, categorie),
+        'chilometriche': _chilometriche(km, veicoli),
+    }
+
+
+def report_annuale(client, anno, categorie, veicoli):
+    inizio, fine = periodo(anno)
+    spese, km = leggi_rollups(client, inizio, fine)
+
+    spese_mese = _per_chiave(spese, 'mese', CAMPI_SPESE)
+    km_mese = _per_chiave(km, 'mese', CAMPI_KM)
+    mesi = []
+    for numero in range(1, 13):
+        chiave = date(anno, numero, 1).isoformat()
+        mesi.append(dict(
+            spese_mese.get(chiave, _somma([], CAMPI_SPESE)),
+            **km_mese.get(chiave, _somma([], CAMPI_KM)),
+            mese=numero,
+        ))
+
+    return {
+        'anno': anno,
+        'mesi': mesi,
+        'spese': _spese(spese, categorie),
+        'chilometriche': _chilometriche(km, veicoli),
+    }
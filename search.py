@@ -0,0 +1,61 @@
+"""
+Ricerca full-text e fuzzy su spese e chilometriche (/api/search).
+
+Il lavoro è tutto in Postgres (RPC cerca, vedi database/schema.sql):
+    full-text    configurazione italiana (radici: "carburanti" trova
+                 "carburante"), con i campi principali pesati più delle note
+    fuzzy        sottostringhe ed errori di battitura ("autogril") tramite
+                 trigrammi (pg_trgm), dai 3 caratteri in su
+Entrambe usano indici GIN su espressioni, il rank è calcolato solo sui
+candidati (al massimo CANDIDATI per tabella) e ts_headline solo sulle righe
+della pagina: il tempo dipende dalle corrispondenze, non dalla dimensione
+delle tabelle.
+
+I risultati sono ordinati per punteggio, poi per data. In evidenziato i
+termini trovati arrivano racchiusi tra \\x02 e \\x03: qui il testo viene
+prima messo al sicuro con l'escape HTML e poi i marcatori diventano <mark>.
+"""
+import html
+
+TIPI = ('spese', 'chilometriche')
+LIMITE_MASSIMO = 100
+CANDIDATI = 1000
+
+
+def evidenzia(testo):
+    """Frammento di ts_headline -> HTML sicuro con <mark> sui termini trovati"""
+    return html.escape(testo or '').replace('\x02', '<mark>').replace('\x03', '</mark>')
+
+
+def cerca(client, testo, tipo=None, limit=20, offset=0):
+    testo = (testo or '').strip()
+    if not testo:
+        raise ValueError('Parametro q obbligatorio')
+    if tipo and tipo not in TIPI:
+        raise ValueError(f'Tipo non valido: {tipo}')
+    if offset < 0:
+        raise ValueError('Parametro offset non valido')
+    limit = max(1, min(limit, LIMITE_MASSIMO))
+
+    args = {
+        'p_testo': testo,
+        # Una riga in più per sapere se esiste la pagina successiva
+        'p_limite': limit + 1,
+        'p_offset': offset,
+        'p_candidati': CANDIDATI
+    }
+    if tipo:
+        args['p_tipo'] = tipo
+    response = client.rpc('cerca', args)
+    response.raise_for_status()
+    righe = response.json()
+
+    risultati = []
+    for r in righe[:limit]:
+        r['evidenziato'] = evidenzia(r.get('evidenziato'))
+        risultati.append(r)
+    return {
+        'risultati': risultati,
+        'has_more': len(righe) > limit,
+        'next_offset': offset + limit if len(righe) > limit else None
+    }
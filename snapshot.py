@@ -0,0 +1,383 @@
+"""
+Snapshot colonnare in memoria di spese e chilometriche (opzionale).
+
+Per ogni tabella il processo tiene solo le colonne che servono a filtri,
+ordinamento e totali, in array numpy ordinati come le liste (data DESC,
+id DESC):
+    id              int64
+    data            giorni dal 1970 (int32)
+    chiavi          categoria/veicolo, cliente, progetto (int32, 0 = NULL)
+    importi         importo, km, rimborso in centesimi (int64): le somme
+                    sono esatte, senza conversioni float riga per riga
+    addebitabile    bool
+    aggiornata      updated_at in microsecondi, per l'impronta degli ETag
+
+Il filtro per data è una ricerca binaria (le righe sono già ordinate per
+data), gli altri filtri sono maschere booleane e i raggruppamenti un
+np.bincount: 100.000 righe si filtrano e si sommano in frazioni di
+millisecondo. Dal database si leggono poi solo le righe della pagina, per
+id (chiave primaria).
+
+Aggiornamento incrementale come /api/sync (sync.py): dopo il caricamento
+iniziale, al massimo ogni SNAPSHOT_INTERVALLO secondi si leggono le righe
+con updated_at successivo all'ultimo watermark (meno la sovrapposizione
+SYNC_OVERLAP_SECONDS) e i tombstone di eliminazioni. Gli array vengono
+ricostruiti solo se qualcosa è davvero cambiato. Le scritture fatte da
+questo processo invalidano lo snapshot (invalida), quelle degli altri
+worker diventano visibili entro SNAPSHOT_INTERVALLO secondi.
+
+Il caricamento iniziale avviene in un thread in background, avviato dalla
+prima richiesta del worker: finché non è completo vista() restituisce
+None e le liste continuano a usare la paginazione keyset sul database,
+senza che nessuna richiesta aspetti la lettura dell'intera tabella.
+
+Memoria: circa 50 byte per riga e per worker (un milione di spese
+~50 MB). Richiede numpy (pip install numpy): senza, lo snapshot resta
+disattivato e le liste continuano a filtrare su Supabase.
+
+Configurazione (variabili ambiente):
+    SNAPSHOT_ENABLED     1 per attivarlo (default 0)
+    SNAPSHOT_INTERVALLO  secondi tra due aggiornamenti incrementali (default 5)
+    SNAPSHOT_PAGE_SIZE   righe per pagina nel caricamento (default 1000, il
+                         massimo di righe per risposta di PostgREST su Supabase)
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import sync
+from pagination import decode_cursor, encode_cursor, iter_pages
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# Colonne per tabella: data, chiavi esterne, importi (centesimi), flag
+SPEC = {
+    'spese': {
+        'data': 'data_spesa',
+        'chiavi': ('categoria_id', 'cliente_id', 'progetto_id'),
+        'importi': ('importo',),
+        'flag': ('addebitabile',),
+    },
+    'chilometriche': {
+        'data': 'data_viaggio',
+        'chiavi': ('veicolo_id', 'cliente_id', 'progetto_id'),
+        'importi': ('km_percorsi', 'rimborso_calcolato'),
+        'flag': ('addebitabile',),
+    },
+}
+# Filtri delle liste (filtri_spese / filtri_chilometriche in app.py) oltre alle date
+FILTRI = {
+    'spese': ('categoria_id', 'cliente_id', 'addebitabile'),
+    'chilometriche': ('veicolo_id', 'cliente_id'),
+}
+
+
+def _select(table):
+    spec = SPEC[table]
+    return ','.join(('id', spec['data'], *spec['chiavi'], *spec['importi'], *spec['flag'], 'updated_at'))
+
+
+def _giorno(testo):
+    try:
+        return int(np.datetime64(testo, 'D').astype(np.int64))
+    except ValueError:
+        raise ValueError(f'Data non valida: {testo}') from None
+
+
+def _intero(nome, valore):
+    try:
+        return int(valore)
+    except ValueError:
+        raise ValueError(f'Parametro {nome} non valido') from None
+
+
+class Vista:
+    """Colonne di una tabella in un certo istante: immutabile, sostituita a ogni aggiornamento"""
+
+    def __init__(self, table, colonne):
+        self.table = table
+        self.spec = SPEC[table]
+        # Ordine delle liste: data DESC, id DESC (lexsort: l'ultima chiave è la principale)
+        ordine = np.lexsort((-colonne['id'], -colonne['data']))
+        self.colonne = {nome: valori[ordine] for nome, valori in colonne.items()}
+        self.id = self.colonne['id']
+        self.data = self.colonne['data']
+        self._data_crescente = -self.data
+        # Posizioni per id crescente, per confrontare le righe lette con quelle note
+        self._per_id = np.argsort(self.id, kind='stable')
+
+    def __len__(self):
+        return len(self.id)
+
+    def filtra(self, args):
+        """Posizioni (in ordine di lista) delle righe che soddisfano i filtri della richiesta"""
+        inizio, fine = 0, len(self)
+        if args.get('data_fine'):
+            inizio = int(np.searchsorted(self._data_crescente, -_giorno(args['data_fine']), 'left'))
+        if args.get('data_inizio'):
+            fine = int(np.searchsorted(self._data_crescente, -_giorno(args['data_inizio']), 'right'))
+        maschera = None
+        for nome in FILTRI[self.table]:
+            valore = args.get(nome)
+            if not valore:
+                continue
+            if nome == 'addebitabile':
+                if valore not in ('true', 'false'):
+                    raise ValueError('Parametro addebitabile non valido')
+                condizione = self.colonne[nome][inizio:fine] == (valore == 'true')
+            else:
+                condizione = self.colonne[nome][inizio:fine] == _intero(nome, valore)
+            maschera = condizione if maschera is None else maschera & condizione
+        if maschera is None:
+            return np.arange(inizio, max(inizio, fine))
+        return np.flatnonzero(maschera) + inizio
+
+    def pagina(self, posizioni, limit, cursor=None):
+        """(id della pagina, cursore successivo) con la stessa paginazione keyset di pagination.py"""
+        if cursor:
+            data, id_ = decode_cursor(cursor)
+            giorno = _giorno(data)
+            dopo = (self.data[posizioni] < giorno) | ((self.data[posizioni] == giorno) & (self.id[posizioni] < id_))
+            posizioni = posizioni[int(np.argmax(dopo)):] if dopo.any() else posizioni[:0]
+        pagina = posizioni[:limit + 1]
+        if len(pagina) <= limit:
+            return self.id[pagina].tolist(), None
+        ultima = pagina[limit - 1]
+        cursore = encode_cursor(str(np.datetime64(int(self.data[ultima]), 'D')), int(self.id[ultima]))
+        return self.id[pagina[:limit]].tolist(), cursore
+
+    def impronta(self, posizioni):
+        """Come conditional.table_fingerprint: max(updated_at) e numero di righe filtrate"""
+        if not len(posizioni):
+            return '/0'
+        return f"{int(self.colonne['aggiornata'][posizioni].max())}/{len(posizioni)}"
+
+    def totali(self, posizioni, per=None):
+        """
+        Numero di righe e somme degli importi (in unità, non centesimi);
+        con per=<chiave> anche i gruppi {chiave, num, importi...}, ordinati
+        per il primo importo decrescente
+        """
+        risultato = {'num': len(posizioni)}
+        for nome in self.spec['importi']:
+            risultato[nome] = int(self.colonne[nome][posizioni].sum()) / 100
+        if per is None:
+            return risultato
+
+        chiavi, gruppo = np.unique(self.colonne[per][posizioni], return_inverse=True)
+        conteggi = np.bincount(gruppo, minlength=len(chiavi))
+        somme = {nome: np.bincount(gruppo, weights=self.colonne[nome][posizioni], minlength=len(chiavi))
+                 for nome in self.spec['importi']}
+        gruppi = [{per: int(chiave) or None, 'num': int(conteggi[i]),
+                   **{nome: int(somme[nome][i]) / 100 for nome in somme}}
+                  for i, chiave in enumerate(chiavi)]
+        primo = self.spec['importi'][0]
+        # Come ORDER BY totale DESC, chiave (NULL in fondo)
+        gruppi.sort(key=lambda g: (-g[primo], g[per] is None, g[per] or 0))
+        risultato['gruppi'] = gruppi
+        return risultato
+
+    def invariate(self, colonne):
+        """True se le righe lette esistono già con lo stesso updated_at"""
+        if not len(self):
+            return False
+        posizioni = np.searchsorted(self.id, colonne['id'], sorter=self._per_id)
+        posizioni = self._per_id[np.minimum(posizioni, len(self) - 1)]
+        return bool(np.all(self.id[posizioni] == colonne['id'])
+                    and np.all(self.colonne['aggiornata'][posizioni] == colonne['aggiornata']))
+
+    def applica(self, colonne, eliminati):
+        """Nuova vista con le righe lette (inserite o modificate) e senza quelle eliminate"""
+        rimosse = np.concatenate((colonne['id'], eliminati))
+        tenute = ~np.isin(self.id, rimosse)
+        return Vista(self.table, {nome: np.concatenate((valori[tenute], colonne[nome]))
+                                  for nome, valori in self.colonne.items()})
+
+
+def totali_spese(vista, posizioni):
+    """Stessa forma della funzione SQL totali_spese"""
+    totali = vista.totali(posizioni, per='categoria_id')
+    return {
+        'num_spese': totali['num'],
+        'importo_totale': totali['importo'],
+        'per_categoria': [{'categoria_id': g['categoria_id'], 'num_spese': g['num'], 'totale': g['importo']}
+                          for g in totali['gruppi']],
+    }
+
+
+def totali_chilometriche(vista, posizioni):
+    """Stessa forma della funzione SQL totali_chilometriche"""
+    totali = vista.totali(posizioni)
+    return {
+        'num_viaggi': totali['num'],
+        'km_totali': totali['km_percorsi'],
+        'rimborso_totale': totali['rimborso_calcolato'],
+    }
+
+
+def _colonne_vuote(table):
+    spec = SPEC[table]
+    colonne = {'id': np.empty(0, np.int64), 'data': np.empty(0, np.int32),
+               'aggiornata': np.empty(0, np.int64)}
+    colonne.update({nome: np.empty(0, np.int32) for nome in spec['chiavi']})
+    colonne.update({nome: np.empty(0, np.int64) for nome in spec['importi']})
+    colonne.update({nome: np.empty(0, bool) for nome in spec['flag']})
+    return colonne
+
+
+def colonne_da_righe(table, righe):
+    """Righe JSON di PostgREST -> array per colonna (conversione vettoriale per pagina)"""
+    spec = SPEC[table]
+    colonne = {
+        'id': np.fromiter((r['id'] for r in righe), np.int64, len(righe)),
+        'data': np.array([r[spec['data']] for r in righe], dtype='datetime64[D]').astype(np.int32),
+        'aggiornata': np.array([r['updated_at'] or 'NaT' for r in righe],
+                               dtype='datetime64[us]').astype(np.int64),
+    }
+    for nome in spec['chiavi']:
+        colonne[nome] = np.fromiter((r[nome] or 0 for r in righe), np.int32, len(righe))
+    for nome in spec['importi']:
+        # DECIMAL(10,2): valore * 100 arrotondato è esatto ben oltre gli importi ammessi
+        valori = np.array([r[nome] or 0 for r in righe], dtype=np.float64)
+        colonne[nome] = np.rint(valori * 100).astype(np.int64)
+    for nome in spec['flag']:
+        colonne[nome] = np.fromiter((bool(r[nome]) for r in righe), bool, len(righe))
+    return colonne
+
+
+def leggi_colonne(client, table, dal=None, page_size=1000):
+    """Colonne delle righe con updated_at > dal (tutte se dal è None), lette a pagine"""
+    params = {'select': _select(table)}
+    if dal is not None:
+        params['updated_at'] = f'gt.{dal.isoformat()}'
+    blocchi = [colonne_da_righe(table, righe)
+               for righe in iter_pages(client, table, params, SPEC[table]['data'], page_size)]
+    if not blocchi:
+        return _colonne_vuote(table)
+    return {nome: np.concatenate([b[nome] for b in blocchi]) for nome in blocchi[0]}
+
+
+def leggi_per_id(client, table, ids, select):
+    """Righe complete (con le relazioni di select) nell'ordine di ids"""
+    if not ids:
+        return []
+    response = client.get(table, params={'select': select, 'id': f"in.({','.join(map(str, ids))})"})
+    response.raise_for_status()
+    per_id = {r['id']: r for r in response.json()}
+    # Una riga eliminata dopo l'ultimo aggiornamento dello snapshot manca e basta
+    return [per_id[i] for i in ids if i in per_id]
+
+
+class Snapshot:
+    def __init__(self, client_factory, intervallo=5.0, overlap=60, retention_days=30, page_size=1000):
+        self.client_factory = client_factory
+        self.intervallo = intervallo
+        self.overlap = overlap
+        self.retention_days = retention_days
+        self.page_size = page_size
+        self._viste = {}
+        # tabella -> (watermark del database, scadenza monotonic)
+        self._stato = {}
+        # tabella -> istante monotonic prima del quale non si ritenta il caricamento iniziale
+        self._riprova = {}
+        self._locks = {table: threading.Lock() for table in SPEC}
+
+    def vista(self, table):
+        """
+        Vista aggiornata al più a SNAPSHOT_INTERVALLO secondi fa, None se il
+        caricamento iniziale non è ancora completo (le liste usano il database)
+        """
+        stato = self._stato.get(table)
+        if stato and time.monotonic() < stato[1]:
+            return self._viste[table]
+        if table not in self._viste:
+            self._carica_in_background(table)
+            return None
+        # Aggiornamento incrementale, già in corso in un altro thread: va bene la vista corrente
+        lock = self._locks[table]
+        if not lock.acquire(blocking=False):
+            return self._viste[table]
+        try:
+            stato = self._stato.get(table)
+            if not stato or time.monotonic() >= stato[1]:
+                self._aggiorna(table)
+        finally:
+            lock.release()
+        return self._viste[table]
+
+    def _carica_in_background(self, table):
+        lock = self._locks[table]
+        if time.monotonic() < self._riprova.get(table, 0) or not lock.acquire(blocking=False):
+            return
+
+        def carica():
+            try:
+                self._aggiorna(table)
+            except Exception as e:
+                logger.warning('Caricamento snapshot %s fallito: %s', table, e)
+                self._riprova[table] = time.monotonic() + self.intervallo
+            finally:
+                lock.release()
+        threading.Thread(target=carica, name=f'snapshot_{table}', daemon=True).start()
+
+    def invalida(self, *tables):
+        """Dopo una scrittura: la prossima lettura aggiorna lo snapshot"""
+        for table in tables:
+            if table in self._stato:
+                self._stato[table] = (self._stato[table][0], 0)
+
+    def _aggiorna(self, table):
+        client = self.client_factory()
+        watermark = self._stato[table][0] if table in self._stato else None
+        completa = (table not in self._viste or watermark is None
+                    or watermark < datetime.utcnow() - timedelta(days=self.retention_days))
+        try:
+            if completa:
+                istante, colonne = client.gather(lambda: sync.leggi_istante(client),
+                                                 lambda: leggi_colonne(client, table, None, self.page_size))
+                vista = Vista(table, colonne)
+            else:
+                dal = watermark - timedelta(seconds=self.overlap)
+                istante, colonne, eliminazioni = client.gather(
+                    lambda: sync.leggi_istante(client),
+                    lambda: leggi_colonne(client, table, dal, self.page_size),
+                    lambda: sync.leggi_eliminazioni(client, dal))
+                vista = self._viste[table]
+                eliminati = np.array([e['riga_id'] for e in eliminazioni if e['tabella'] == table], np.int64)
+                eliminati = eliminati[np.isin(eliminati, vista.id)]
+                # La sovrapposizione rilegge sempre le ultime modifiche: si ricostruisce solo se servono
+                if len(eliminati) or (len(colonne['id']) and not vista.invariate(colonne)):
+                    vista = vista.applica(colonne, eliminati)
+        except Exception as e:
+            if table not in self._viste:
+                raise
+            # Database irraggiungibile: si continua con la vista precedente e si riprova più tardi
+            logger.warning('Aggiornamento snapshot %s fallito: %s', table, e)
+            self._stato[table] = (watermark, time.monotonic() + self.intervallo)
+            return
+        self._viste[table] = vista
+        self._stato[table] = (sync.istante(istante), time.monotonic() + self.intervallo)
+
+
+def snapshot_from_env(client_factory):
+    """Snapshot condiviso dalle route, None se disattivato"""
+    if os.getenv('SNAPSHOT_ENABLED', '0') != '1':
+        return None
+    if np is None:
+        logger.warning('SNAPSHOT_ENABLED=1 ma numpy non è installato: snapshot disattivato')
+        return None
+    overlap, retention_days = sync.parametri_from_env()
+    return Snapshot(
+        client_factory,
+        intervallo=float(os.getenv('SNAPSHOT_INTERVALLO', 5)),
+        overlap=overlap,
+        retention_days=retention_days,
+        page_size=int(os.getenv('SNAPSHOT_PAGE_SIZE', 1000)),
+    )
@@ -9,7 +9,16 @@ let currentData = {
     progetti: [],
     veicoli: [],
     spese: [],
-    chilometriche: []
+    chilometriche: [],
+    kmTotali: null
+};
+
+// Paginazione a cursore per le liste lunghe (scroll infinito)
+const PAGE_SIZE = 100;
+
+const pagine = {
+    spese: { query: '', cursor: null, hasMore: false, loading: false, generation: 0 },
+    chilometriche: { query: '', cursor: null, hasMore: false, loading: false, generation: 0 }
 };
 
 // ========== INIT ==========
@@ -18,7 +27,10 @@ document.addEventListener('DOMContentLoaded', () => {
     initApp();
     initNavigation();
     initForms();
+    initInfiniteScroll();
+    initTabelle();
     registerServiceWorker();
+    initSincronizzazione();
 });
 
 async function initApp() {
@@ -72,6 +84,11 @@ function registerServiceWorker() {
         navigator.serviceWorker.register('/service-worker.js')
             .then(() => console.log('Service Worker registrato'))
             .catch(err => console.error('Errore Service Worker:', err));
+        
+        // Esito degli invii della coda fatti dal service worker (Background Sync)
+        navigator.serviceWorker.addEventListener('message', event => {
+            if (event.data && event.data.tipo === 'outbox') esitoSincronizzazione(event.data.esito);
+        });
     }
 }
 
@@ -108,6 +125,21 @@ function navigateToPage(page) {
 
 // ========== API CALLS ==========
 
+// Ultima risposta di ogni GET con il suo ETag: se il server risponde
+// 304 Not Modified si riusa il corpo già scaricato. La copia in memoria
+// è affiancata da quella in IndexedDB (idb-store.js), che sopravvive
+// alla chiusura dell'app
+const etagCache = new Map();
+
+async function rispostaLocale(endpoint) {
+    let cached = etagCache.get(endpoint);
+    if (!cached) {
+        cached = await IdbStore.get('risposte', endpoint).catch(() => null);
+        if (cached) etagCache.set(endpoint, cached);
+    }
+    return cached;
+}
+
 async function apiCall(endpoint, method = 'GET', data = null) {
     const options = {
         method,
@@ -120,91 +152,365 @@ async function apiCall(endpoint, method = 'GET', data = null) {
         options.body = JSON.stringify(data);
     }
     
+    const cached = method === 'GET' ? await rispostaLocale(endpoint) : null;
+    if (cached) {
+        options.headers['If-None-Match'] = cached.etag;
+    }
+    
     const response = await fetch(`${API_URL}${endpoint}`, options);
+    
+    if (response.status === 304 && cached) {
+        return cached.data;
+    }
+    
     const result = await response.json();
     
     if (!response.ok) {
         throw new Error(result.error || 'Errore API');
     }
     
+    const etag = response.headers.get('ETag');
+    if (method === 'GET' && etag) {
+        const voce = { etag, data: result, salvata: Date.now() };
+        etagCache.set(endpoint, voce);
+        IdbStore.put('risposte', voce, endpoint).catch(() => {});
+    }
+    
     return result;
 }
 
+// Stale-while-revalidate: render riceve subito la copia locale (se c'è),
+// poi la risposta del server se è cambiata. Senza rete e senza copia
+// locale usa fallback (es. ricerca nella replica); render(data, locale)
+async function apiCallLocale(endpoint, render, fallback = null) {
+    const cached = await rispostaLocale(endpoint);
+    if (cached) render(cached.data, true);
+    
+    try {
+        const data = await apiCall(endpoint);
+        aggiornaStatoRete(true);
+        if (!cached || data !== cached.data) render(data, false);
+        return data;
+    } catch (error) {
+        if (!(error instanceof TypeError)) throw error;
+        // TypeError da fetch: rete assente
+        aggiornaStatoRete(false);
+        if (cached) return cached.data;
+        if (!fallback) throw error;
+        const data = await fallback();
+        render(data, true);
+        return data;
+    }
+}
+
+// ========== OFFLINE ==========
+
+// Spese e chilometriche vengono sempre scritte nella coda locale
+// (idb-store.js): la UI si aggiorna subito e l'invio al server avviene
+// adesso oppure al ritorno della connessione, a blocchi via /bulk
+
+function initSincronizzazione() {
+    window.addEventListener('online', () => {
+        aggiornaStatoRete(true);
+        sincronizza();
+    });
+    window.addEventListener('offline', () => aggiornaStatoRete(false));
+    aggiornaStatoRete(navigator.onLine);
+    sincronizza();
+}
+
+async function scriviInCoda(tipo, metodo, id, dati = null) {
+    await IdbStore.accoda(tipo, metodo, id, dati);
+    await aggiornaStatoSync();
+    sincronizza();
+}
+
+async function sincronizza() {
+    if (!navigator.onLine) return;
+    
+    const registration = 'serviceWorker' in navigator
+        ? await navigator.serviceWorker.getRegistration()
+        : null;
+    if (registration && registration.active && 'sync' in registration) {
+        // Background Sync: il service worker invia la coda anche a pagina chiusa
+        try {
+            await registration.sync.register('outbox');
+            return;
+        } catch (error) {
+            // Permesso negato: invio dalla pagina
+        }
+    }
+    esitoSincronizzazione(await IdbStore.inviaOutbox(API_URL));
+}
+
+async function esitoSincronizzazione(esito) {
+    if (esito.interrotta) aggiornaStatoRete(false);
+    await aggiornaStatoSync();
+    
+    if (esito.inviate || esito.errori.length) {
+        // Liste e dashboard con gli id e i totali calcolati dal server
+        const attiva = document.querySelector('.page.active');
+        if (attiva && attiva.id === 'page-spese') loadSpese();
+        if (attiva && attiva.id === 'page-km') loadChilometriche();
+        loadDashboard();
+    }
+    if (esito.errori.length) {
+        showError(`${esito.errori.length} registrazioni rifiutate dal server: ` +
+                  esito.errori.map(e => e.errore).join('; '));
+    }
+}
+
+function aggiornaStatoRete(online) {
+    document.body.classList.toggle('offline', !online);
+    aggiornaStatoSync();
+}
+
+async function aggiornaStatoSync() {
+    const stato = document.getElementById('stato-sync');
+    const inCoda = (await IdbStore.inAttesa().catch(() => [])).length;
+    const offline = document.body.classList.contains('offline');
+    
+    stato.classList.toggle('hidden', !offline && !inCoda);
+    stato.textContent = [offline ? 'Offline' : '', inCoda ? `${inCoda} in attesa di invio` : '']
+        .filter(Boolean).join(' · ');
+}
+
+// Nomi di categoria, cliente e veicolo per le righe create o modificate
+// localmente, che non hanno le risorse collegate restituite dal server
+function conRiferimenti(tipo, riga, forza = false) {
+    const trova = (lista, id) => (id ? lista.find(x => x.id === id) : null) || null;
+    const cliente = trova(currentData.clienti, riga.cliente_id);
+    
+    if (tipo === 'spese' && (forza || riga.categorie === undefined)) {
+        const categoria = trova(currentData.categorie, riga.categoria_id);
+        return {
+            ...riga,
+            categorie: categoria && { nome: categoria.nome, colore: categoria.colore },
+            clienti: cliente && { nome: cliente.nome }
+        };
+    }
+    if (tipo === 'chilometriche' && (forza || riga.veicoli === undefined)) {
+        const veicolo = trova(currentData.veicoli, riga.veicolo_id);
+        return {
+            ...riga,
+            veicoli: veicolo && { targa: veicolo.targa, modello: veicolo.modello },
+            clienti: cliente && { nome: cliente.nome },
+            rimborso_calcolato: riga.km_percorsi * riga.tariffa_applicata
+        };
+    }
+    return riga;
+}
+
+// Prima pagina con le scritture ancora in coda: nuovi inserimenti che
+// rispettano i filtri, modifiche applicate, eliminazioni nascoste
+function conScrittureInAttesa(tipo, righe, pendenti) {
+    const ops = pendenti.filter(op => op.tipo === tipo);
+    let risultato = righe.map(riga => conRiferimenti(tipo, riga));
+    if (!ops.length) return risultato;
+    
+    const corrisponde = IdbStore.filtro(tipo, new URLSearchParams(pagine[tipo].query));
+    ops.forEach(op => {
+        if (op.metodo === 'DELETE') {
+            risultato = risultato.filter(riga => riga.id !== op.id);
+        } else if (op.metodo === 'PUT') {
+            risultato = risultato.map(riga => riga.id === op.id
+                ? conRiferimenti(tipo, { ...riga, ...op.dati, in_attesa: true }, true)
+                : riga);
+        } else if (corrisponde(op.dati)) {
+            risultato.push(conRiferimenti(tipo, { ...op.dati, id: op.id, in_attesa: true }));
+        }
+    });
+    return IdbStore.ordina(tipo, risultato);
+}
+
 // ========== LOAD DATA ==========
 
 async function loadCategorie() {
-    currentData.categorie = await apiCall('/categorie');
-    populateCategorieSelects();
+    await apiCallLocale('/categorie', data => {
+        currentData.categorie = data;
+        populateCategorieSelects();
+    });
 }
 
 async function loadClienti() {
-    currentData.clienti = await apiCall('/clienti');
-    populateClientiSelects();
+    await apiCallLocale('/clienti', data => {
+        currentData.clienti = data;
+        populateClientiSelects();
+    });
 }
 
 async function loadVeicoli() {
-    currentData.veicoli = await apiCall('/veicoli');
-    populateVeicoliSelects();
+    await apiCallLocale('/veicoli', data => {
+        currentData.veicoli = data;
+        populateVeicoliSelects();
+    });
 }
 
-async function loadSpese() {
+function speseFilterParams() {
+    const params = new URLSearchParams();
+    const da = document.getElementById('filter-spese-da').value;
+    const a = document.getElementById('filter-spese-a').value;
+    const cliente = document.getElementById('filter-spese-cliente').value;
+    const categoria = document.getElementById('filter-spese-categoria').value;
+    const addebitabili = document.getElementById('filter-spese-addebitabili').checked;
+    
+    if (da) params.append('data_inizio', da);
+    if (a) params.append('data_fine', a);
+    if (cliente) params.append('cliente_id', cliente);
+    if (categoria) params.append('categoria_id', categoria);
+    if (addebitabili) params.append('addebitabile', 'true');
+    return params;
+}
+
+function kmFilterParams() {
+    const params = new URLSearchParams();
+    const da = document.getElementById('filter-km-da').value;
+    const a = document.getElementById('filter-km-a').value;
+    const veicolo = document.getElementById('filter-km-veicolo').value;
+    
+    if (da) params.append('data_inizio', da);
+    if (a) params.append('data_fine', a);
+    if (veicolo) params.append('veicolo_id', veicolo);
+    return params;
+}
+
+function pageEndpoint(tipo) {
+    const stato = pagine[tipo];
+    const params = new URLSearchParams(stato.query);
+    params.append('limit', PAGE_SIZE);
+    if (stato.cursor) params.append('cursor', stato.cursor);
+    return `/${tipo}?${params}`;
+}
+
+async function fetchPage(tipo) {
+    const page = await apiCall(pageEndpoint(tipo));
+    IdbStore.putAll(tipo, page.data).catch(() => {});
+    return page;
+}
+
+// Prima pagina dalla copia locale, poi dal server (apiCallLocale).
+// Offline e senza copia: ricerca con gli stessi filtri nella replica
+async function loadFirstPage(tipo, render) {
+    const stato = pagine[tipo];
+    const generation = stato.generation;
+    const pendenti = await IdbStore.inAttesa().catch(() => []);
+    let mostrata = false;
+    
+    const renderPage = (page, locale) => {
+        if (generation !== stato.generation) return;
+        applyPage(tipo, page);
+        // Copia: l'array viene esteso dallo scroll e la risposta resta in cache
+        render(page, conScrittureInAttesa(tipo, page.data, pendenti));
+        if (!locale) IdbStore.putAll(tipo, page.data).catch(() => {});
+        if (!mostrata) hideLoader();
+        mostrata = true;
+    };
+    const fallback = async () => {
+        const righe = await IdbStore.cerca(tipo, new URLSearchParams(stato.query));
+        return { data: righe, next_cursor: null, has_more: false };
+    };
+    
     showLoader();
     try {
-        const params = new URLSearchParams();
-        const da = document.getElementById('filter-spese-da').value;
-        const a = document.getElementById('filter-spese-a').value;
-        const cliente = document.getElementById('filter-spese-cliente').value;
-        const categoria = document.getElementById('filter-spese-categoria').value;
-        const addebitabili = document.getElementById('filter-spese-addebitabili').checked;
-        
-        if (da) params.append('data_inizio', da);
-        if (a) params.append('data_fine', a);
-        if (cliente) params.append('cliente_id', cliente);
-        if (categoria) params.append('categoria_id', categoria);
-        if (addebitabili) params.append('addebitabile', 'true');
-        
-        currentData.spese = await apiCall(`/spese?${params}`);
-        renderSpeseTable();
+        await apiCallLocale(pageEndpoint(tipo), renderPage, fallback);
     } finally {
         hideLoader();
     }
 }
 
+function applyPage(tipo, page) {
+    pagine[tipo].cursor = page.next_cursor;
+    pagine[tipo].hasMore = page.has_more;
+}
+
+function resetPagination(tipo, params) {
+    const stato = pagine[tipo];
+    stato.query = params.toString();
+    stato.cursor = null;
+    stato.hasMore = false;
+    stato.generation++;
+}
+
+async function loadSpese() {
+    resetPagination('spese', speseFilterParams());
+    await loadFirstPage('spese', (page, righe) => {
+        currentData.spese = righe;
+        renderSpeseTable();
+    });
+}
+
 async function loadChilometriche() {
-    showLoader();
-    try {
-        const params = new URLSearchParams();
-        const da = document.getElementById('filter-km-da').value;
-        const a = document.getElementById('filter-km-a').value;
-        const veicolo = document.getElementById('filter-km-veicolo').value;
-        
-        if (da) params.append('data_inizio', da);
-        if (a) params.append('data_fine', a);
-        if (veicolo) params.append('veicolo_id', veicolo);
-        
-        currentData.chilometriche = await apiCall(`/chilometriche?${params}`);
+    resetPagination('chilometriche', kmFilterParams());
+    await loadFirstPage('chilometriche', (page, righe) => {
+        currentData.chilometriche = righe;
+        currentData.kmTotali = page.totali || null;
         renderKmTable();
         updateKmTotals();
+    });
+}
+
+async function loadMore(tipo) {
+    const stato = pagine[tipo];
+    if (!stato.hasMore || stato.loading) return;
+    
+    const generation = stato.generation;
+    stato.loading = true;
+    try {
+        const page = await fetchPage(tipo);
+        // I filtri sono cambiati mentre la pagina era in caricamento
+        if (generation !== stato.generation) return;
+        
+        applyPage(tipo, page);
+        currentData[tipo].push(...page.data);
+        if (tipo === 'spese') appendSpeseRows(page.data);
+        else appendKmRows(page.data);
+    } catch (error) {
+        console.error('Errore caricamento pagina:', error);
     } finally {
-        hideLoader();
+        stato.loading = false;
     }
 }
 
+function initInfiniteScroll() {
+    if (!('IntersectionObserver' in window)) return;
+    
+    const sentinels = {
+        spese: document.getElementById('spese-sentinel'),
+        chilometriche: document.getElementById('km-sentinel')
+    };
+    
+    const observer = new IntersectionObserver(entries => {
+        entries.forEach(entry => {
+            if (entry.isIntersecting) loadMore(entry.target.dataset.tipo);
+        });
+    }, { rootMargin: '400px' });
+    
+    Object.entries(sentinels).forEach(([tipo, sentinel]) => {
+        sentinel.dataset.tipo = tipo;
+        observer.observe(sentinel);
+    });
+}
+
 async function loadDashboard() {
     try {
-        const stats = await apiCall('/stats/dashboard');
-        updateDashboardStats(stats);
-        
-        // Carica ultime spese
-        const recentSpese = await apiCall('/spese?data_inizio=' + 
-            new Date(Date.now() - 30 * 24 * 60 * 60 * 1000).toISOString().split('T')[0]);
-        renderRecentSpese(recentSpese.slice(0, 10));
+        await apiCallLocale('/stats/dashboard', stats => {
+            updateDashboardStats(stats);
+
+            // Ultime spese incluse nella stessa risposta
+            renderRecentSpese(stats.ultime_spese || []);
+        });
     } catch (error) {
         console.error('Errore dashboard:', error);
     }
 }
 
-async function loadClientiTable() {
+async function loadClientiTable(force = false) {
+    // Le liste di riferimento sono già in memoria dall'avvio: niente nuova richiesta
+    if (!force && currentData.clienti.length) {
+        renderClientiTable();
+        return;
+    }
+    
     showLoader();
     try {
         currentData.clienti = await apiCall('/clienti');
@@ -214,7 +520,12 @@ async function loadClientiTable() {
     }
 }
 
-async function loadVeicoliTable() {
+async function loadVeicoliTable(force = false) {
+    if (!force && currentData.veicoli.length) {
+        renderVeicoliTable();
+        return;
+    }
+    
     showLoader();
     try {
         currentData.veicoli = await apiCall('/veicoli');
@@ -281,63 +592,113 @@ function populateVeicoliSelects() {
 
 // ========== RENDER TABLES ==========
 
-function renderSpeseTable() {
-    const tbody = document.getElementById('spese-tbody');
-    tbody.innerHTML = '';
-    
-    if (currentData.spese.length === 0) {
-        tbody.innerHTML = '<tr><td colspan="7" style="text-align:center">Nessuna spesa trovata</td></tr>';
-        return;
-    }
+// Spese e chilometriche possono essere migliaia (scroll infinito, replica
+// offline): tabelle virtualizzate con ordinamento e ricerca in memoria
+// (virtual-table.js). Le altre tabelle restano semplici.
+let tabellaSpese = null;
+let tabellaKm = null;
+
+function initTabelle() {
+    tabellaSpese = new VirtualTable.Tabella(document.getElementById('spese-tbody'), {
+        numeroColonne: 7,
+        vuoto: 'Nessuna spesa trovata',
+        riga: rigaSpesa,
+        colonne: {
+            data: { valore: s => s.data_spesa },
+            categoria: { valore: s => s.categorie && s.categorie.nome },
+            cliente: { valore: s => s.clienti && s.clienti.nome },
+            descrizione: { valore: s => s.descrizione },
+            importo: { valore: s => s.importo, numero: true },
+            addebitabile: { valore: s => s.addebitabile ? 1 : 0, numero: true }
+        },
+        testo: s => [s.descrizione, s.fornitore, s.note, s.categorie && s.categorie.nome,
+                     s.clienti && s.clienti.nome, s.importo].filter(Boolean).join(' ')
+    });
+    tabellaKm = new VirtualTable.Tabella(document.getElementById('km-tbody'), {
+        numeroColonne: 8,
+        vuoto: 'Nessun viaggio trovato',
+        riga: rigaKm,
+        colonne: {
+            data: { valore: k => k.data_viaggio },
+            veicolo: { valore: k => k.veicoli && k.veicoli.targa },
+            percorso: { valore: k => `${k.partenza} ${k.arrivo}` },
+            cliente: { valore: k => k.clienti && k.clienti.nome },
+            km: { valore: k => k.km_percorsi, numero: true },
+            tariffa: { valore: k => k.tariffa_applicata, numero: true },
+            rimborso: { valore: k => k.rimborso_calcolato, numero: true }
+        },
+        testo: k => [k.partenza, k.arrivo, k.descrizione, k.note, k.veicoli && k.veicoli.targa,
+                     k.clienti && k.clienti.nome].filter(Boolean).join(' ')
+    });
     
-    currentData.spese.forEach(spesa => {
-        const tr = document.createElement('tr');
-        tr.innerHTML = `
-            <td>${formatDate(spesa.data_spesa)}</td>
-            <td>
-                ${spesa.categorie ? `<span class="category-color" style="background:${spesa.categorie.colore}"></span>${spesa.categorie.nome}` : '-'}
-            </td>
-            <td>${spesa.clienti ? spesa.clienti.nome : '-'}</td>
-            <td>${spesa.descrizione}</td>
-            <td><strong>€ ${parseFloat(spesa.importo).toFixed(2)}</strong></td>
-            <td>
-                ${spesa.addebitabile ? '<span class="badge badge-success">Sì</span>' : '<span class="badge badge-secondary">No</span>'}
-            </td>
-            <td>
-                <button class="btn btn-sm btn-primary" onclick="editSpesa(${spesa.id})">✏️</button>
-                <button class="btn btn-sm btn-danger" onclick="deleteSpesa(${spesa.id})">🗑️</button>
-            </td>
-        `;
-        tbody.appendChild(tr);
+    [['spese', tabellaSpese], ['km', tabellaKm]].forEach(([nome, tabella]) => {
+        const intestazioni = document.querySelectorAll(`#page-${nome} th[data-ordina]`);
+        intestazioni.forEach(th => {
+            th.addEventListener('click', () => {
+                const ordine = tabella.ordina(th.dataset.ordina);
+                intestazioni.forEach(altra => altra.classList.remove('ordinata-asc', 'ordinata-desc'));
+                if (ordine.colonna) th.classList.add(ordine.discendente ? 'ordinata-desc' : 'ordinata-asc');
+            });
+        });
+        document.getElementById(`cerca-${nome}`).addEventListener('input', e => tabella.cerca(e.target.value));
     });
 }
 
+function renderSpeseTable() {
+    tabellaSpese.imposta(currentData.spese);
+}
+
+function appendSpeseRows(spese) {
+    tabellaSpese.aggiungi(spese);
+}
+
+function rigaSpesa(spesa) {
+    const tr = document.createElement('tr');
+    if (spesa.in_attesa) tr.classList.add('riga-in-attesa');
+    tr.innerHTML = `
+        <td>${formatDate(spesa.data_spesa)}</td>
+        <td>
+            ${spesa.categorie ? `<span class="category-color" style="background:${spesa.categorie.colore}"></span>${spesa.categorie.nome}` : '-'}
+        </td>
+        <td>${spesa.clienti ? spesa.clienti.nome : '-'}</td>
+        <td class="testo-lungo">${spesa.descrizione}</td>
+        <td><strong>€ ${parseFloat(spesa.importo).toFixed(2)}</strong></td>
+        <td>
+            ${spesa.addebitabile ? '<span class="badge badge-success">Sì</span>' : '<span class="badge badge-secondary">No</span>'}
+        </td>
+        <td>
+            <button class="btn btn-sm btn-primary" onclick="editSpesa(${spesa.id})">✏️</button>
+            <button class="btn btn-sm btn-danger" onclick="deleteSpesa(${spesa.id})">🗑️</button>
+        </td>
+    `;
+    return tr;
+}
+
 function renderKmTable() {
-    const tbody = document.getElementById('km-tbody');
-    tbody.innerHTML = '';
-    
-    if (currentData.chilometriche.length === 0) {
-        tbody.innerHTML = '<tr><td colspan="8" style="text-align:center">Nessun viaggio trovato</td></tr>';
-        return;
-    }
-    
-    currentData.chilometriche.forEach(km => {
-        const tr = document.createElement('tr');
-        tr.innerHTML = `
-            <td>${formatDate(km.data_viaggio)}</td>
-            <td>${km.veicoli ? km.veicoli.targa : '-'}</td>
-            <td>${km.partenza} → ${km.arrivo}</td>
-            <td>${km.clienti ? km.clienti.nome : '-'}</td>
-            <td><strong>${parseFloat(km.km_percorsi).toFixed(1)} km</strong></td>
-            <td>€ ${parseFloat(km.tariffa_applicata).toFixed(3)}</td>
-            <td><strong>€ ${parseFloat(km.rimborso_calcolato).toFixed(2)}</strong></td>
-            <td>
-                <button class="btn btn-sm btn-primary" onclick="editKm(${km.id})">✏️</button>
-                <button class="btn btn-sm btn-danger" onclick="deleteKm(${km.id})">🗑️</button>
-            </td>
-        `;
-        tbody.appendChild(tr);
-    });
+    tabellaKm.imposta(currentData.chilometriche);
+}
+
+function appendKmRows(chilometriche) {
+    tabellaKm.aggiungi(chilometriche);
+}
+
+function rigaKm(km) {
+    const tr = document.createElement('tr');
+    if (km.in_attesa) tr.classList.add('riga-in-attesa');
+    tr.innerHTML = `
+        <td>${formatDate(km.data_viaggio)}</td>
+        <td>${km.veicoli ? km.veicoli.targa : '-'}</td>
+        <td class="testo-lungo">${km.partenza} → ${km.arrivo}</td>
+        <td>${km.clienti ? km.clienti.nome : '-'}</td>
+        <td><strong>${parseFloat(km.km_percorsi).toFixed(1)} km</strong></td>
+        <td>€ ${parseFloat(km.tariffa_applicata).toFixed(3)}</td>
+        <td><strong>€ ${parseFloat(km.rimborso_calcolato).toFixed(2)}</strong></td>
+        <td>
+            <button class="btn btn-sm btn-primary" onclick="editKm(${km.id})">✏️</button>
+            <button class="btn btn-sm btn-danger" onclick="deleteKm(${km.id})">🗑️</button>
+        </td>
+    `;
+    return tr;
 }
 
 function renderClientiTable() {
@@ -461,8 +822,14 @@ function renderCategorieChart(categorie) {
 }
 
 function updateKmTotals() {
-    const totaleKm = currentData.chilometriche.reduce((sum, km) => sum + parseFloat(km.km_percorsi), 0);
-    const totaleRimborsi = currentData.chilometriche.reduce((sum, km) => sum + parseFloat(km.rimborso_calcolato), 0);
+    // Totali calcolati dal server sull'intero filtro (la lista è paginata)
+    const totali = currentData.kmTotali;
+    const totaleKm = totali
+        ? parseFloat(totali.km_totali)
+        : currentData.chilometriche.reduce((sum, km) => sum + parseFloat(km.km_percorsi), 0);
+    const totaleRimborsi = totali
+        ? parseFloat(totali.rimborso_totale)
+        : currentData.chilometriche.reduce((sum, km) => sum + parseFloat(km.rimborso_calcolato), 0);
     
     document.getElementById('totale-km-filtrato').textContent = `${totaleKm.toFixed(1)} km`;
     document.getElementById('totale-rimborsi-filtrato').textContent = `€ ${totaleRimborsi.toFixed(2)}`;
@@ -526,15 +893,16 @@ async function saveSpesa(e) {
         };
         
         if (id) {
-            await apiCall(`/spese/${id}`, 'PUT', data);
+            await scriviInCoda('spese', 'PUT', parseInt(id), data);
         } else {
-            await apiCall('/spese', 'POST', data);
+            await scriviInCoda('spese', 'POST', IdbStore.nuovoIdLocale(), data);
         }
         
         closeSpesaModal();
         await loadSpese();
-        await loadDashboard();
-        showSuccess('Spesa salvata con successo');
+        showSuccess(navigator.onLine
+            ? 'Spesa salvata con successo'
+            : 'Spesa salvata: verrà inviata al ritorno della connessione');
     } catch (error) {
         showError('Errore nel salvare la spesa: ' + error.message);
     } finally {
@@ -551,9 +919,8 @@ async function deleteSpesa(id) {
     
     showLoader();
     try {
-        await apiCall(`/spese/${id}`, 'DELETE');
+        await scriviInCoda('spese', 'DELETE', id);
         await loadSpese();
-        await loadDashboard();
         showSuccess('Spesa eliminata');
     } catch (error) {
         showError('Errore: ' + error.message);
@@ -630,15 +997,16 @@ async function saveKm(e) {
         };
         
         if (id) {
-            await apiCall(`/chilometriche/${id}`, 'PUT', data);
+            await scriviInCoda('chilometriche', 'PUT', parseInt(id), data);
         } else {
-            await apiCall('/chilometriche', 'POST', data);
+            await scriviInCoda('chilometriche', 'POST', IdbStore.nuovoIdLocale(), data);
         }
         
         closeKmModal();
         await loadChilometriche();
-        await loadDashboard();
-        showSuccess('Viaggio salvato con successo');
+        showSuccess(navigator.onLine
+            ? 'Viaggio salvato con successo'
+            : 'Viaggio salvato: verrà inviato al ritorno della connessione');
     } catch (error) {
         showError('Errore: ' + error.message);
     } finally {
@@ -655,9 +1023,8 @@ async function deleteKm(id) {
     
     showLoader();
     try {
-        await apiCall(`/chilometriche/${id}`, 'DELETE');
+        await scriviInCoda('chilometriche', 'DELETE', id);
         await loadChilometriche();
-        await loadDashboard();
         showSuccess('Viaggio eliminato');
     } catch (error) {
         showError('Errore: ' + error.message);
@@ -714,7 +1081,7 @@ async function saveCliente(e) {
         
         closeClienteModal();
         await loadClienti();
-        await loadClientiTable();
+        renderClientiTable();
         showSuccess('Cliente salvato con successo');
     } catch (error) {
         showError('Errore: ' + error.message);
@@ -734,7 +1101,7 @@ async function deleteCliente(id) {
     try {
         await apiCall(`/clienti/${id}`, 'DELETE');
         await loadClienti();
-        await loadClientiTable();
+        renderClientiTable();
         showSuccess('Cliente disattivato');
     } catch (error) {
         showError('Errore: ' + error.message);
@@ -800,7 +1167,7 @@ async function saveVeicolo(e) {
         
         closeVeicoloModal();
         await loadVeicoli();
-        await loadVeicoliTable();
+        renderVeicoliTable();
         showSuccess('Veicolo salvato con successo');
     } catch (error) {
         showError('Errore: ' + error.message);
@@ -820,7 +1187,7 @@ async function deleteVeicolo(id) {
     try {
         await apiCall(`/veicoli/${id}`, 'DELETE');
         await loadVeicoli();
-        await loadVeicoliTable();
+        renderVeicoliTable();
         showSuccess('Veicolo disattivato');
     } catch (error) {
         showError('Errore: ' + error.message);
@@ -890,6 +1257,28 @@ function applyKmFiltri() {
 
 // ========== EXPORT ==========
 
+// Export e report girano in background sul server (jobs.py): il job viene
+// accodato, se ne segue l'avanzamento e il file si scarica quando è pronto
+async function eseguiJob(tipo, filtri) {
+    let job = await apiCall('/jobs', 'POST', { tipo, filtri });
+    while (job.stato === 'in_coda' || job.stato === 'in_corso') {
+        mostraAvanzamento(job.progresso);
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        job = await apiCall(`/jobs/${job.job_id}`);
+    }
+    if (job.stato === 'errore') {
+        throw new Error(job.errore);
+    }
+    const link = document.createElement('a');
+    link.href = `${API_URL}/jobs/${job.job_id}/download`;
+    link.click();
+}
+
+function mostraAvanzamento(progresso) {
+    document.getElementById('loader-testo').textContent =
+        progresso != null ? `${Math.round(progresso * 100)}%` : '';
+}
+
 async function exportSpese() {
     showLoader();
     
@@ -898,23 +1287,7 @@ async function exportSpese() {
         const dataFine = document.getElementById('export-spese-a').value;
         const cliente = document.getElementById('export-spese-cliente').value;
         
-        const response = await fetch(`${API_URL}/export/excel`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({
-                tipo: 'spese',
-                filtri: { data_inizio: da, data_fine: dataFine, cliente_id: cliente }
-            })
-        });
-        
-        const blob = await response.blob();
-        const url = window.URL.createObjectURL(blob);
-        const link = document.createElement('a');
-        link.href = url;
-        link.download = `spese_${new Date().toISOString().split('T')[0]}.xlsx`;
-        link.click();
+        await eseguiJob('excel_spese', { data_inizio: da, data_fine: dataFine, cliente_id: cliente });
         
         showSuccess('Export completato!');
     } catch (error) {
@@ -924,6 +1297,28 @@ async function exportSpese() {
     }
 }
 
+async function exportAddebiti() {
+    const cliente = document.getElementById('export-spese-cliente').value;
+    if (!cliente) {
+        showError('Seleziona un cliente per il report addebiti');
+        return;
+    }
+    showLoader();
+    
+    try {
+        const da = document.getElementById('export-spese-da').value;
+        const dataFine = document.getElementById('export-spese-a').value;
+        
+        await eseguiJob('addebiti', { cliente_id: cliente, da, a: dataFine });
+        
+        showSuccess('Report addebiti completato!');
+    } catch (error) {
+        showError('Errore report: ' + error.message);
+    } finally {
+        hideLoader();
+    }
+}
+
 async function exportKm() {
     showLoader();
     
@@ -931,23 +1326,7 @@ async function exportKm() {
         const da = document.getElementById('export-km-da').value;
         const dataFine = document.getElementById('export-km-a').value;
         
-        const response = await fetch(`${API_URL}/export/excel`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({
-                tipo: 'chilometriche',
-                filtri: { data_inizio: da, data_fine: dataFine }
-            })
-        });
-        
-        const blob = await response.blob();
-        const url = window.URL.createObjectURL(blob);
-        const link = document.createElement('a');
-        link.href = url;
-        link.download = `chilometriche_${new Date().toISOString().split('T')[0]}.xlsx`;
-        link.click();
+        await eseguiJob('excel_chilometriche', { data_inizio: da, data_fine: dataFine });
         
         showSuccess('Export completato!');
     } catch (error) {
@@ -965,6 +1344,7 @@ function showLoader() {
 
 function hideLoader() {
     document.getElementById('loader').classList.add('hidden');
+    mostraAvanzamento(null);
 }
 
 function showSuccess(message) {
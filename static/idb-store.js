@@ -0,0 +1,226 @@
+// Replica locale in IndexedDB e coda delle scritture (outbox).
+// Caricato dalla pagina (app.js) e dal service worker (importScripts):
+// niente DOM qui dentro.
+
+const IdbStore = (() => {
+    const DB_NAME = 'expense-tracker';
+    const DB_VERSION = 1;
+    const TIPI = ['spese', 'chilometriche'];
+    const COLONNA_DATA = { spese: 'data_spesa', chilometriche: 'data_viaggio' };
+    // Righe per chiamata /bulk (BULK_MAX_RECORDS lato server è 5000)
+    const BULK_MAX = 500;
+
+    // Object store:
+    //   risposte       endpoint GET -> { etag, data, salvata } (stale-while-revalidate)
+    //   spese, chilometriche   righe note per id, per la consultazione offline
+    //   outbox         scritture in attesa, in ordine di inserimento (seq)
+    //   id_server      "tipo:id_locale" -> id assegnato dal server
+    let dbPromise = null;
+
+    function open() {
+        if (!dbPromise) {
+            dbPromise = new Promise((resolve, reject) => {
+                const req = indexedDB.open(DB_NAME, DB_VERSION);
+                req.onupgradeneeded = () => {
+                    const db = req.result;
+                    db.createObjectStore('risposte');
+                    TIPI.forEach(tipo => db.createObjectStore(tipo, { keyPath: 'id' }));
+                    db.createObjectStore('outbox', { keyPath: 'seq', autoIncrement: true });
+                    db.createObjectStore('id_server');
+                };
+                req.onsuccess = () => resolve(req.result);
+                req.onerror = () => reject(req.error);
+            });
+        }
+        return dbPromise;
+    }
+
+    // Una transazione: fn riceve lo store e può restituire una richiesta,
+    // il cui risultato è disponibile a transazione completata
+    async function tx(store, mode, fn) {
+        const db = await open();
+        return new Promise((resolve, reject) => {
+            const t = db.transaction(store, mode);
+            const req = fn(t.objectStore(store));
+            t.oncomplete = () => resolve(req ? req.result : undefined);
+            t.onerror = t.onabort = () => reject(t.error);
+        });
+    }
+
+    const get = (store, key) => tx(store, 'readonly', s => s.get(key));
+    const put = (store, value, key) => tx(store, 'readwrite', s => s.put(value, key));
+    const del = (store, key) => tx(store, 'readwrite', s => s.delete(key));
+    const getAll = store => tx(store, 'readonly', s => s.getAll());
+
+    function putAll(store, values) {
+        return tx(store, 'readwrite', s => { values.forEach(v => s.put(v)); });
+    }
+
+    // ---------- Consultazione offline ----------
+
+    // Stessi filtri di filtri_spese/filtri_chilometriche in app.py
+    function filtro(tipo, params) {
+        const colonna = COLONNA_DATA[tipo];
+        const da = params.get('data_inizio');
+        const a = params.get('data_fine');
+        const uguali = ['cliente_id', 'categoria_id', 'veicolo_id']
+            .filter(c => params.get(c))
+            .map(c => [c, Number(params.get(c))]);
+        const addebitabile = params.get('addebitabile');
+
+        return r =>
+            (!da || r[colonna] >= da) &&
+            (!a || r[colonna] <= a) &&
+            uguali.every(([c, v]) => r[c] === v) &&
+            (!addebitabile || String(r.addebitabile) === addebitabile);
+    }
+
+    function ordina(tipo, righe) {
+        const colonna = COLONNA_DATA[tipo];
+        return righe.sort((x, y) => (y[colonna] || '').localeCompare(x[colonna] || '') || y.id - x.id);
+    }
+
+    async function cerca(tipo, params) {
+        return ordina(tipo, (await getAll(tipo)).filter(filtro(tipo, params)));
+    }
+
+    // ---------- Outbox ----------
+
+    let ultimoIdLocale = 0;
+
+    // Id negativi per le righe create offline: non collidono con quelli del server
+    function nuovoIdLocale() {
+        ultimoIdLocale = Math.min(ultimoIdLocale - 1, -Date.now());
+        return ultimoIdLocale;
+    }
+
+    async function risolviId(tipo, id) {
+        if (id >= 0) return id;
+        return (await get('id_server', `${tipo}:${id}`)) || id;
+    }
+
+    async function accoda(tipo, metodo, id, dati = null) {
+        id = await risolviId(tipo, id);
+
+        // Una riga ancora in coda si modifica (o si scarta) direttamente nell'insert
+        if (id < 0) {
+            const insert = (await getAll('outbox')).find(op => op.tipo === tipo && op.metodo === 'POST' && op.id === id);
+            if (insert) {
+                if (metodo === 'DELETE') await del('outbox', insert.seq);
+                else await put('outbox', { ...insert, dati: { ...insert.dati, ...dati } });
+                await aggiornaReplica(tipo, metodo, id, dati);
+                return;
+            }
+        }
+        await put('outbox', { tipo, metodo, id, dati, creata: Date.now() });
+        await aggiornaReplica(tipo, metodo, id, dati);
+    }
+
+    async function aggiornaReplica(tipo, metodo, id, dati) {
+        if (metodo === 'DELETE') return del(tipo, id);
+        const riga = (await get(tipo, id)) || { id };
+        return put(tipo, { ...riga, ...dati, id, in_attesa: true });
+    }
+
+    function inAttesa() {
+        return getAll('outbox');
+    }
+
+    // Chiave di idempotenza di un insert in coda (chiave_client lato server)
+    function nuovaChiave() {
+        if (crypto.randomUUID) return crypto.randomUUID();
+        return Array.from(crypto.getRandomValues(new Uint8Array(16)),
+                          b => b.toString(16).padStart(2, '0')).join('');
+    }
+
+    // Invia la coda: insert consecutivi sulla stessa tabella in un'unica
+    // chiamata /bulk, modifiche ed eliminazioni una alla volta e in ordine.
+    // Ogni insert ha una chiave_client salvata nella coda prima del primo
+    // invio: se la risposta si perde (rete, timeout) il reinvio non
+    // duplica le righe già salvate dal server.
+    // Si ferma al primo errore di rete o 5xx (si riprova più tardi);
+    // le scritture rifiutate dal server (4xx) escono dalla coda e
+    // vengono riportate in esito.errori.
+    async function inviaOutbox(apiUrl) {
+        const esegui = async () => {
+            const ops = await getAll('outbox');
+            const esito = { inviate: 0, errori: [], interrotta: false, rimaste: 0 };
+            const headers = { 'Content-Type': 'application/json' };
+            let i = 0;
+            try {
+                while (i < ops.length) {
+                    const op = ops[i];
+                    if (op.metodo === 'POST') {
+                        const gruppo = [];
+                        while (i < ops.length && ops[i].metodo === 'POST' && ops[i].tipo === op.tipo &&
+                               gruppo.length < BULK_MAX) {
+                            const insert = ops[i++];
+                            if (!insert.dati.chiave_client) {
+                                insert.dati = { ...insert.dati, chiave_client: nuovaChiave() };
+                                await put('outbox', insert);
+                            }
+                            gruppo.push(insert);
+                        }
+                        const response = await fetch(`${apiUrl}/${op.tipo}/bulk`, {
+                            method: 'POST', headers, body: JSON.stringify(gruppo.map(o => o.dati))
+                        });
+                        if (response.status >= 500) throw new Error(`HTTP ${response.status}`);
+                        const corpo = await response.json();
+                        await registraInsert(gruppo, response.ok ? corpo : null, corpo.error, esito);
+                    } else {
+                        i++;
+                        const id = await risolviId(op.tipo, op.id);
+                        const response = await fetch(`${apiUrl}/${op.tipo}/${id}`, {
+                            method: op.metodo, headers,
+                            body: op.metodo === 'PUT' ? JSON.stringify(op.dati) : undefined
+                        });
+                        if (response.status >= 500) throw new Error(`HTTP ${response.status}`);
+                        if (response.ok) {
+                            esito.inviate++;
+                            if (op.metodo === 'PUT') await put(op.tipo, await response.json());
+                        } else {
+                            const corpo = await response.json().catch(() => ({}));
+                            esito.errori.push({ tipo: op.tipo, metodo: op.metodo, dati: op.dati,
+                                                errore: corpo.error || `HTTP ${response.status}` });
+                        }
+                        await del('outbox', op.seq);
+                    }
+                }
+            } catch (error) {
+                // Rete assente o server non disponibile: la coda resta per il prossimo tentativo
+                esito.interrotta = true;
+            }
+            esito.rimaste = (await getAll('outbox')).length;
+            return esito;
+        };
+        // Pagina e service worker non devono inviare la stessa coda insieme
+        if (self.navigator && navigator.locks) {
+            return navigator.locks.request('expense-tracker-outbox', esegui);
+        }
+        return esegui();
+    }
+
+    // Risposta /bulk: ids allineati agli insert, errori con l'indice della riga
+    async function registraInsert(gruppo, risultato, erroreGenerale, esito) {
+        const errori = new Map(((risultato && risultato.errori) || []).map(e => [e.indice, e.error]));
+        for (let k = 0; k < gruppo.length; k++) {
+            const op = gruppo[k];
+            const idServer = risultato ? risultato.ids[k] : null;
+            await del(op.tipo, op.id);
+            if (idServer != null) {
+                esito.inviate++;
+                await put('id_server', idServer, `${op.tipo}:${op.id}`);
+                await put(op.tipo, { ...op.dati, id: idServer });
+            } else {
+                esito.errori.push({ tipo: op.tipo, metodo: 'POST', dati: op.dati,
+                                    errore: errori.get(k) || erroreGenerale || 'Inserimento rifiutato' });
+            }
+            await del('outbox', op.seq);
+        }
+    }
+
+    return {
+        open, get, put, del, getAll, putAll,
+        filtro, ordina, cerca, nuovoIdLocale, accoda, inAttesa, inviaOutbox
+    };
+})();
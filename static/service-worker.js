@@ -1,8 +1,12 @@
+importScripts('/idb-store.js');
+
 const CACHE_NAME = 'expense-tracker-v1';
 const urlsToCache = [
   '/',
   '/index.html',
   '/styles.css',
+  '/idb-store.js',
+  '/virtual-table.js',
   '/app.js',
   '/manifest.json',
   '/icon-192.png',
@@ -21,7 +25,12 @@ self.addEventListener('install', event => {
 });
 
 // Fetch event - serve from cache, fallback to network
+// Le API non passano dalla cache: i dati offline sono in IndexedDB (idb-store.js)
 self.addEventListener('fetch', event => {
+  if (event.request.method !== 'GET' || new URL(event.request.url).pathname.startsWith('/api/')) {
+    return;
+  }
+
   event.respondWith(
     caches.match(event.request)
       .then(response => {
@@ -68,3 +77,22 @@ self.addEventListener('activate', event => {
     })
   );
 });
+
+// Background Sync - invia le scritture in coda quando torna la rete
+self.addEventListener('sync', event => {
+  if (event.tag === 'outbox') {
+    event.waitUntil(inviaOutbox());
+  }
+});
+
+async function inviaOutbox() {
+  const esito = await IdbStore.inviaOutbox('/api');
+
+  const clients = await self.clients.matchAll({ type: 'window' });
+  clients.forEach(client => client.postMessage({ tipo: 'outbox', esito }));
+
+  // Un errore fa ripetere il sync al browser più tardi
+  if (esito.interrotta) {
+    throw new Error('Invio della coda interrotto');
+  }
+}
@@ -0,0 +1,227 @@
+// Tabelle virtualizzate per le liste lunghe (spese, chilometriche).
+// Nel DOM ci sono solo le righe visibili più un margine: due righe
+// spaziatrici in cima e in fondo danno alla tabella l'altezza completa,
+// così la pagina scorre come prima e la sentinella dello scroll infinito
+// resta in fondo. Ordinamento e ricerca lavorano su un indice per colonna
+// in memoria, senza ricreare le righe.
+
+const VirtualTable = (() => {
+    // Righe renderizzate oltre quelle visibili, sopra e sotto
+    const MARGINE = 15;
+    // Altezza usata finché non c'è una riga da misurare (px)
+    const ALTEZZA_STIMATA = 53;
+
+    const confronta = (a, b) => (a < b ? -1 : a > b ? 1 : 0);
+
+    // ---------- Indice per colonna ----------
+
+    // colonne: { nome: { valore: riga => ..., numero: bool } }
+    // testo:   riga => stringa su cui gira la ricerca
+    class IndiceColonne {
+        constructor(colonne, testo) {
+            this.colonne = colonne;
+            this.testo = testo;
+            this.imposta([]);
+        }
+
+        imposta(righe) {
+            this.righe = righe.slice();
+            this.svuota();
+        }
+
+        aggiungi(righe) {
+            this.righe.push(...righe);
+            this.svuota();
+        }
+
+        svuota() {
+            this.valori = {};
+            this.permutazioni = {};
+            this.testi = null;
+            this.ricerca = null;
+        }
+
+        // Valori della colonna in un array compatto, calcolati una volta
+        valoriColonna(nome) {
+            if (!this.valori[nome]) {
+                const { valore, numero } = this.colonne[nome];
+                this.valori[nome] = numero
+                    ? Float64Array.from(this.righe, r => Number(valore(r)) || 0)
+                    : this.righe.map(r => String(valore(r) ?? '').toLowerCase());
+            }
+            return this.valori[nome];
+        }
+
+        // Indici delle righe in ordine crescente per la colonna, in cache
+        // finché le righe non cambiano (il decrescente la legge al contrario)
+        permutazione(nome) {
+            if (!this.permutazioni[nome]) {
+                const valori = this.valoriColonna(nome);
+                const ordine = new Uint32Array(this.righe.length);
+                for (let i = 0; i < ordine.length; i++) ordine[i] = i;
+                ordine.sort((a, b) => confronta(valori[a], valori[b]) || a - b);
+                this.permutazioni[nome] = ordine;
+            }
+            return this.permutazioni[nome];
+        }
+
+        // Righe che contengono la ricerca (Uint8Array), o null senza ricerca.
+        // Se la ricerca estende la precedente si scorrono solo i risultati di quella
+        corrispondenze(query) {
+            query = query.trim().toLowerCase();
+            if (!query) return null;
+            if (!this.testi) {
+                this.testi = this.righe.map(r => this.testo(r).toLowerCase());
+            }
+            const precedente = this.ricerca && query.startsWith(this.ricerca.query) ? this.ricerca.esito : null;
+            const esito = new Uint8Array(this.righe.length);
+            for (let i = 0; i < esito.length; i++) {
+                if ((!precedente || precedente[i]) && this.testi[i].includes(query)) esito[i] = 1;
+            }
+            this.ricerca = { query, esito };
+            return esito;
+        }
+
+        // Indici delle righe da mostrare, nell'ordine richiesto
+        // (colonna null: l'ordine di caricamento, cioè quello del server)
+        vista(colonna, discendente, query) {
+            const filtro = this.corrispondenze(query);
+            const n = this.righe.length;
+            const ordine = colonna ? this.permutazione(colonna) : null;
+            const vista = new Uint32Array(n);
+            let k = 0;
+            for (let j = 0; j < n; j++) {
+                const i = ordine ? ordine[discendente ? n - 1 - j : j] : j;
+                if (!filtro || filtro[i]) vista[k++] = i;
+            }
+            return vista.subarray(0, k);
+        }
+    }
+
+    // ---------- Tabella ----------
+
+    const tabelle = new Set();
+    let richiesta = null;
+
+    // Un solo listener per tutte le tabelle, al massimo un render per frame
+    function pianifica() {
+        if (richiesta) return;
+        richiesta = requestAnimationFrame(() => {
+            richiesta = null;
+            tabelle.forEach(t => t.render());
+        });
+    }
+
+    window.addEventListener('scroll', pianifica, { passive: true, capture: true });
+    window.addEventListener('resize', () => {
+        tabelle.forEach(t => { t.altezza = null; });
+        pianifica();
+    });
+
+    // opzioni: colonne e testo (vedi IndiceColonne), riga(dati) -> <tr>,
+    //          vuoto (messaggio senza righe), numeroColonne
+    class Tabella {
+        constructor(tbody, opzioni) {
+            this.tbody = tbody;
+            this.opzioni = opzioni;
+            this.indice = new IndiceColonne(opzioni.colonne, opzioni.testo);
+            this.ordine = { colonna: null, discendente: false };
+            this.query = '';
+            this.vista = new Uint32Array(0);
+            this.altezza = null;
+            this.finestra = null;
+            // Durata dell'ultimo render in ms (per il benchmark)
+            this.ultimoRender = 0;
+            tabelle.add(this);
+        }
+
+        imposta(righe) {
+            this.indice.imposta(righe);
+            this.aggiornaVista();
+        }
+
+        aggiungi(righe) {
+            this.indice.aggiungi(righe);
+            this.aggiornaVista();
+        }
+
+        // Stessa colonna: crescente -> decrescente -> ordine del server
+        ordina(colonna) {
+            const { colonna: attuale, discendente } = this.ordine;
+            if (attuale !== colonna) this.ordine = { colonna, discendente: false };
+            else if (!discendente) this.ordine = { colonna, discendente: true };
+            else this.ordine = { colonna: null, discendente: false };
+            this.aggiornaVista();
+            return this.ordine;
+        }
+
+        cerca(query) {
+            this.query = query;
+            this.aggiornaVista();
+        }
+
+        aggiornaVista() {
+            this.vista = this.indice.vista(this.ordine.colonna, this.ordine.discendente, this.query);
+            this.finestra = null;
+            this.render();
+        }
+
+        spaziatore(altezza) {
+            const tr = document.createElement('tr');
+            tr.className = 'spaziatore';
+            tr.innerHTML = `<td colspan="${this.opzioni.numeroColonne}" style="height:${altezza}px"></td>`;
+            return tr;
+        }
+
+        render() {
+            // Pagina nascosta: si renderizza quando torna visibile
+            if (this.tbody.offsetParent === null && this.finestra) return;
+            const inizio = performance.now();
+            const n = this.vista.length;
+
+            if (n === 0) {
+                if (this.finestra && this.finestra.vuota) return;
+                this.tbody.innerHTML = `<tr><td colspan="${this.opzioni.numeroColonne}" style="text-align:center">${this.opzioni.vuoto}</td></tr>`;
+                this.finestra = { vuota: true };
+                return;
+            }
+
+            const altezza = this.altezza || ALTEZZA_STIMATA;
+            const rect = this.tbody.getBoundingClientRect();
+            const sopra = Math.max(0, -rect.top);
+            const primoVisibile = Math.min(n, Math.floor(sopra / altezza));
+            const ultimoVisibile = Math.min(n, Math.ceil((sopra + window.innerHeight) / altezza));
+            // Le righe visibili sono già nel DOM: nessun lavoro in questo frame
+            const f = this.finestra;
+            if (f && !f.vuota && f.primo <= primoVisibile && ultimoVisibile <= f.ultimo) return;
+
+            const primo = Math.max(0, primoVisibile - MARGINE);
+            const ultimo = Math.min(n, ultimoVisibile + MARGINE);
+
+            const fragment = document.createDocumentFragment();
+            fragment.appendChild(this.spaziatore(primo * altezza));
+            for (let k = primo; k < ultimo; k++) {
+                fragment.appendChild(this.opzioni.riga(this.indice.righe[this.vista[k]]));
+            }
+            fragment.appendChild(this.spaziatore((n - ultimo) * altezza));
+            this.tbody.replaceChildren(fragment);
+            this.finestra = { primo, ultimo };
+
+            // Le righe hanno altezza fissa (nessun a capo): basta misurarne una
+            if (!this.altezza) {
+                const riga = this.tbody.children[1];
+                const misurata = riga ? riga.getBoundingClientRect().height : 0;
+                if (misurata) {
+                    this.altezza = misurata;
+                    if (Math.abs(misurata - altezza) > 1) {
+                        this.finestra = null;
+                        pianifica();
+                    }
+                }
+            }
+            this.ultimoRender = performance.now() - inizio;
+        }
+    }
+
+    return { IndiceColonne, Tabella };
+})();
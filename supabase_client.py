@@ -0,0 +1,332 @@
+"""
+Client condiviso per le API Supabase (PostgREST + Storage).
+
+Ogni worker gunicorn mantiene una sola requests.Session con un pool di
+connessioni keep-alive, così le chiamate successive riusano la stessa
+connessione TCP/TLS invece di rifare l'handshake ad ogni richiesta.
+
+Configurazione (variabili ambiente):
+    SUPABASE_POOL_CONNECTIONS  numero di pool per host (default 4)
+    SUPABASE_POOL_MAXSIZE      connessioni per pool (default 16)
+    SUPABASE_CONNECT_TIMEOUT   timeout di connessione in secondi (default 3.05)
+    SUPABASE_READ_TIMEOUT      timeout di lettura in secondi (default 30)
+    SUPABASE_MAX_RETRIES       tentativi sui verbi idempotenti (default 3)
+    SUPABASE_RETRY_BACKOFF     fattore di backoff esponenziale (default 0.3)
+    SUPABASE_FANOUT_WORKERS    chiamate parallele per gather()/submit() (default 8)
+
+Le chiamate indipendenti di una stessa richiesta (impronte ETag, pagina e
+totali, blocchi di un insert bulk) partono in parallelo con gather(): le
+richieste HTTP rilasciano il GIL, quindi la latenza è quella della più
+lenta invece della somma.
+
+Con DATA_BACKEND=postgres get_client() restituisce invece un
+PostgresClient con la stessa interfaccia (postgres_client.py).
+
+Gli osservatori registrati con add_observer() ricevono ogni chiamata
+(verbo, destinazione, status, byte, durata): li usa metrics.py.
+"""
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Verbi ripetibili senza effetti collaterali: POST (insert/upload) escluso
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE', 'PATCH'])
+RETRY_STATUS = (502, 503, 504)
+
+# Callback (method, target, status, nbytes, seconds) chiamate dopo ogni richiesta
+_observers = []
+
+
+def add_observer(callback):
+    _observers.append(callback)
+
+
+def notify(method, target, status, nbytes, seconds):
+    """Inoltra una chiamata agli osservatori (usata anche da postgres_client.py)"""
+    for observer in _observers:
+        observer(method, target, status, nbytes, seconds)
+
+
+# Segna i thread del pool di fan-out: un gather annidato gira in sequenza
+_fanout = threading.local()
+
+
+def _run_in_pool(fn, args, kwargs):
+    _fanout.active = True
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _fanout.active = False
+
+
+class FanOut:
+    """
+    gather()/submit() su un pool di thread del client, comune ai due
+    backend dati (SupabaseClient, postgres_client.PostgresClient).
+    """
+    fanout_workers = 8
+    _executor = None
+    _executor_lock = threading.Lock()
+
+    def _pool(self):
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.fanout_workers,
+                                                        thread_name_prefix='fanout')
+        return self._executor
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Avvia fn in background e restituisce un Future. Da un thread del pool
+        (gather/submit annidati) esegue subito: il pool non può esaurirsi
+        aspettando se stesso.
+        """
+        if getattr(_fanout, 'active', False) or self.fanout_workers < 1:
+            future = Future()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        return self._pool().submit(_run_in_pool, fn, args, kwargs)
+
+    def gather(self, *calls):
+        """
+        Esegue in parallelo callable indipendenti e restituisce i risultati
+        nello stesso ordine; la prima eccezione viene rilanciata.
+        Le callable girano fuori dal contesto Flask: non devono usare request.
+        """
+        if len(calls) < 2:
+            return [call() for call in calls]
+        futures = [self.submit(call) for call in calls[1:]]
+        # La prima nel thread corrente: un thread in meno occupato
+        results = [calls[0]()]
+        results.extend(future.result() for future in futures)
+        return results
+
+    def close_fanout(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+class SupabaseClient(FanOut):
+    """Client HTTP con pool di connessioni verso un progetto Supabase"""
+
+    def __init__(self, url, key, service_key=None, pool_connections=4, pool_maxsize=16,
+                 connect_timeout=3.05, read_timeout=30, max_retries=3, retry_backoff=0.3,
+                 fanout_workers=8):
+        self.url = (url or '').rstrip('/')
+        self.rest_url = f"{self.url}/rest/v1"
+        self.storage_url = f"{self.url}/storage/v1"
+        self.timeout = (connect_timeout, read_timeout)
+
+        # Header precalcolati: anon per le letture, service per le scritture
+        self.anon_headers = self._build_headers(key)
+        self.service_headers = self._build_headers(service_key or key)
+        self.storage_headers = {'Authorization': f'Bearer {service_key or key}'}
+
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            backoff_factor=retry_backoff,
+            status_forcelist=RETRY_STATUS,
+            allowed_methods=IDEMPOTENT_METHODS,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                              max_retries=retry, pool_block=False)
+
+        # POST non viene ripetuto: un retry potrebbe duplicare un insert
+        no_retry_adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                                       max_retries=Retry(total=0, raise_on_status=False),
+                                       pool_block=False)
+
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._post_session = requests.Session()
+        self._post_session.mount('http://', no_retry_adapter)
+        self._post_session.mount('https://', no_retry_adapter)
+
+        self.fanout_workers = fanout_workers
+
+    @staticmethod
+    def _build_headers(key):
+        return {
+            'apikey': key or '',
+            'Authorization': f'Bearer {key or ""}',
+            'Content-Type': 'application/json',
+            'Prefer': 'return=representation'
+        }
+
+    def headers(self, use_service_key=False, extra=None):
+        base = self.service_headers if use_service_key else self.anon_headers
+        if not extra:
+            return base
+        merged = dict(base)
+        merged.update(extra)
+        return merged
+
+    def request(self, method, url, use_service_key=False, headers=None, timeout=None, **kwargs):
+        method = method.upper()
+        session = self._post_session if method == 'POST' else self.session
+        if not _observers:
+            return session.request(
+                method,
+                url,
+                headers=headers if headers is not None else self.headers(use_service_key),
+                timeout=timeout or self.timeout,
+                **kwargs
+            )
+
+        start = time.perf_counter()
+        status, nbytes = 'errore', 0
+        try:
+            response = session.request(
+                method,
+                url,
+                headers=headers if headers is not None else self.headers(use_service_key),
+                timeout=timeout or self.timeout,
+                **kwargs
+            )
+            status = response.status_code
+            if kwargs.get('stream'):
+                nbytes = int(response.headers.get('Content-Length') or 0)
+            else:
+                nbytes = len(response.content)
+            return response
+        finally:
+            notify(method, self.target(url), status, nbytes, time.perf_counter() - start)
+
+    def target(self, url):
+        """Destinazione di una chiamata per le metriche: tabella, rpc/<nome> o storage/<bucket>"""
+        if url.startswith(self.rest_url):
+            return url[len(self.rest_url) + 1:].split('?', 1)[0]
+        if url.startswith(self.storage_url):
+            parts = url[len(self.storage_url) + 1:].split('/')
+            # object/<bucket>/... oppure object/public/<bucket>/...
+            bucket = parts[2] if len(parts) > 2 and parts[1] == 'public' else parts[1] if len(parts) > 1 else ''
+            return f'storage/{bucket}'
+        return url
+
+    # ---------- PostgREST ----------
+
+    def get(self, table, params=None, use_service_key=False, headers=None, timeout=None):
+        return self.request('GET', f"{self.rest_url}/{table}", use_service_key,
+                            headers=self.headers(use_service_key, headers), params=params, timeout=timeout)
+
+    def post(self, table, json=None, params=None, use_service_key=True, headers=None, timeout=None):
+        return self.request('POST', f"{self.rest_url}/{table}", use_service_key,
+                            headers=self.headers(use_service_key, headers), params=params, json=json,
+                            timeout=timeout)
+
+    def patch(self, table, json=None, params=None, use_service_key=True, headers=None, timeout=None):
+        return self.request('PATCH', f"{self.rest_url}/{table}", use_service_key,
+                            headers=self.headers(use_service_key, headers), params=params, json=json,
+                            timeout=timeout)
+
+    def delete(self, table, params=None, use_service_key=True, headers=None, timeout=None):
+        return self.request('DELETE', f"{self.rest_url}/{table}", use_service_key,
+                            headers=self.headers(use_service_key, headers), params=params, timeout=timeout)
+
+    def rpc(self, function, args=None, read_only=True, use_service_key=False, timeout=None):
+        """
+        Chiama una funzione SQL esposta da PostgREST (/rest/v1/rpc/<nome>).
+        Le funzioni in sola lettura usano GET, così beneficiano dei retry.
+        """
+        url = f"{self.rest_url}/rpc/{function}"
+        if read_only:
+            return self.request('GET', url, use_service_key, params=args, timeout=timeout)
+        return self.request('POST', url, use_service_key, json=args or {}, timeout=timeout)
+
+    # ---------- Storage ----------
+
+    def upload(self, bucket, path, data, content_type='application/octet-stream', timeout=None):
+        headers = dict(self.storage_headers)
+        headers['Content-Type'] = content_type
+        return self.request('POST', f"{self.storage_url}/object/{bucket}/{path}",
+                            headers=headers, data=data, timeout=timeout)
+
+    def exists(self, bucket, path, timeout=None):
+        response = self.request('HEAD', self.public_url(bucket, path), headers=self.storage_headers,
+                                timeout=timeout)
+        return response.status_code == 200
+
+    def public_url(self, bucket, path):
+        return f"{self.storage_url}/object/public/{bucket}/{path}"
+
+    def close(self):
+        self.close_fanout()
+        self.session.close()
+        self._post_session.close()
+
+
+def _env_float(name, default):
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def client_from_env():
+    return SupabaseClient(
+        os.getenv('SUPABASE_URL'),
+        os.getenv('SUPABASE_KEY'),
+        os.getenv('SUPABASE_SERVICE_KEY'),
+        pool_connections=_env_int('SUPABASE_POOL_CONNECTIONS', 4),
+        pool_maxsize=_env_int('SUPABASE_POOL_MAXSIZE', 16),
+        connect_timeout=_env_float('SUPABASE_CONNECT_TIMEOUT', 3.05),
+        read_timeout=_env_float('SUPABASE_READ_TIMEOUT', 30),
+        max_retries=_env_int('SUPABASE_MAX_RETRIES', 3),
+        retry_backoff=_env_float('SUPABASE_RETRY_BACKOFF', 0.3),
+        fanout_workers=_env_int('SUPABASE_FANOUT_WORKERS', 8),
+    )
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def data_client_from_env():
+    """
+    Client del backend scelto con DATA_BACKEND: postgrest (default) oppure
+    postgres, connessione diretta a DATABASE_URL (postgres_client.py)
+    con lo Storage che resta su Supabase.
+    """
+    backend = os.getenv('DATA_BACKEND', 'postgrest')
+    if backend == 'postgres':
+        from postgres_client import postgres_client_from_env
+        storage = client_from_env() if os.getenv('SUPABASE_URL') else None
+        return postgres_client_from_env(storage=storage)
+    if backend != 'postgrest':
+        raise ValueError(f'DATA_BACKEND non valido: {backend}')
+    return client_from_env()
+
+
+def get_client():
+    """
+    Restituisce il client del processo corrente (DATA_BACKEND).
+    Il pool viene ricreato dopo un fork (gunicorn --preload) per non
+    condividere socket tra worker diversi.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = data_client_from_env()
+                _client_pid = pid
+    return _client
@@ -0,0 +1,121 @@
+"""
+Sincronizzazione incrementale (/api/sync?since=<watermark>).
+
+Invece di riscaricare intere tabelle, il client chiede solo le righe
+create, modificate o eliminate dopo l'ultimo watermark ricevuto:
+    modificate   righe con updated_at > since, per tabella
+    eliminate    id cancellati dopo since, dalla tabella eliminazioni
+                 (tombstone scritti dai trigger, vedi database/schema.sql)
+    watermark    da passare come since alla chiamata successiva
+    completa     true se since manca o è più vecchio della finestra dei
+                 tombstone: le righe sono tutte quelle esistenti e il
+                 client deve scartare quelle locali non presenti
+
+Il client applica prima le modificate e poi le eliminate. Le letture
+delle tabelle partono in parallelo (client.gather) e usano gli indici
+su updated_at ed eliminata_il: il costo dipende dal numero di modifiche,
+non dalla dimensione delle tabelle. Ogni tabella è letta a pagine di
+PAGE_SIZE righe per id crescente (id.gt.<ultimo>) fino a una pagina
+incompleta: PostgREST su Supabase restituisce al massimo 1000 righe per
+risposta e le righe oltre il limite andrebbero perse (in una
+sincronizzazione completa il client scarterebbe quelle locali).
+
+Il watermark è l'orologio del database (RPC istante_sync), letto insieme
+alle tabelle. updated_at vale l'inizio della transazione che ha scritto
+la riga: una transazione ancora aperta durante la lettura può rendere
+visibili più tardi righe con timestamp precedente al watermark. Per
+questo ogni lettura riparte da since - SYNC_OVERLAP_SECONDS: qualche riga
+arriva due volte, nessuna va persa. Le righe hanno solo le colonne della
+tabella (nessuna relazione incorporata): i nomi di categorie, clienti,
+ecc. si ricavano dalle tabelle di riferimento sincronizzate insieme.
+
+Configurazione (variabili ambiente):
+    SYNC_OVERLAP_SECONDS  sovrapposizione tra letture successive (default 60)
+    SYNC_RETENTION_DAYS   giorni di tombstone conservati (default 30,
+                          lo stesso valore di pulisci_eliminazioni)
+"""
+import os
+from datetime import datetime, timedelta, timezone
+
+# Tabelle sincronizzate, nell'ordine in cui conviene applicarle
+TABELLE = ('categorie', 'clienti', 'progetti', 'veicoli', 'spese', 'chilometriche')
+# Righe per richiesta: non oltre il max-rows di PostgREST (1000 su Supabase),
+# altrimenti una pagina troncata sembrerebbe l'ultima
+PAGE_SIZE = 1000
+
+
+def istante(valore):
+    """Timestamp ISO (since o colonna) -> datetime senza fuso, in UTC se il fuso è indicato"""
+    try:
+        momento = datetime.fromisoformat(valore)
+    except (TypeError, ValueError):
+        raise ValueError(f'Timestamp non valido: {valore}')
+    if momento.tzinfo is not None:
+        momento = momento.astimezone(timezone.utc).replace(tzinfo=None)
+    return momento
+
+
+def leggi_a_pagine(client, table, params, page_size=PAGE_SIZE):
+    """Tutte le righe che soddisfano params, per id crescente, a pagine di page_size"""
+    params = dict(params, order='id.asc', limit=str(page_size))
+    righe = []
+    while True:
+        if righe:
+            params['id'] = f"gt.{righe[-1]['id']}"
+        response = client.get(table, params=params)
+        response.raise_for_status()
+        pagina = response.json()
+        righe.extend(pagina)
+        if len(pagina) < page_size:
+            return righe
+
+
+def leggi_modificate(client, table, dal, page_size=PAGE_SIZE):
+    params = {}
+    if dal is not None:
+        params['updated_at'] = f'gt.{dal.isoformat()}'
+    return leggi_a_pagine(client, table, params, page_size)
+
+
+def leggi_eliminazioni(client, dal, page_size=PAGE_SIZE):
+    params = {
+        'select': 'id,tabella,riga_id,eliminata_il',
+        'eliminata_il': f'gt.{dal.isoformat()}'
+    }
+    return leggi_a_pagine(client, 'eliminazioni', params, page_size)
+
+
+def leggi_istante(client):
+    response = client.rpc('istante_sync')
+    response.raise_for_status()
+    return response.json()
+
+
+def delta(client, since=None, overlap=60, retention_days=30, page_size=PAGE_SIZE):
+    """Modifiche ed eliminazioni dopo since (datetime o None per la sincronizzazione completa)"""
+    completa = since is None or since < datetime.utcnow() - timedelta(days=retention_days)
+    dal = None if completa else since - timedelta(seconds=overlap)
+
+    letture = [lambda: leggi_istante(client)]
+    letture += [lambda table=table: leggi_modificate(client, table, dal, page_size) for table in TABELLE]
+    if not completa:
+        letture.append(lambda: leggi_eliminazioni(client, dal, page_size))
+    risultati = client.gather(*letture)
+
+    modificate = dict(zip(TABELLE, risultati[1:]))
+    eliminate = {table: [] for table in TABELLE}
+    if not completa:
+        for e in risultati[-1]:
+            if e['tabella'] in eliminate:
+                eliminate[e['tabella']].append(e['riga_id'])
+
+    return {
+        'watermark': istante(risultati[0]).isoformat(),
+        'completa': completa,
+        'modificate': modificate,
+        'eliminate': eliminate
+    }
+
+
+def parametri_from_env():
+    return int(os.getenv('SYNC_OVERLAP_SECONDS', 60)), int(os.getenv('SYNC_RETENTION_DAYS', 30))
@@ -0,0 +1,39 @@
+"""
+Validazione dei record di /api/*/bulk (bulk.py).
+"""
+import pytest
+
+from bulk import DEFAULT_TARIFFA, valida
+
+
+def chilometrica(**campi):
+    return {'data_viaggio': '2026-01-10', 'partenza': 'Milano', 'arrivo': 'Bergamo', 'km_percorsi': 50, **campi}
+
+
+@pytest.mark.parametrize('campi, tariffa, rimborso', [
+    ({}, DEFAULT_TARIFFA, 9.5),
+    ({'tariffa_applicata': None}, DEFAULT_TARIFFA, 9.5),
+    ({'tariffa_applicata': ''}, DEFAULT_TARIFFA, 9.5),
+    ({'tariffa_applicata': 0}, 0.0, 0.0),
+    ({'tariffa_applicata': '0.35'}, 0.35, 17.5),
+])
+def test_tariffa_chilometriche(campi, tariffa, rimborso):
+    righe, errori = valida('chilometriche', [chilometrica(**campi)])
+    assert errori == []
+    [(indice, riga)] = righe
+    assert indice == 0
+    assert riga['tariffa_applicata'] == tariffa
+    assert riga['rimborso_calcolato'] == rimborso
+
+
+def test_record_non_validi():
+    righe, errori = valida('chilometriche', [
+        chilometrica(),
+        chilometrica(km_percorsi='tanti'),
+        chilometrica(targa='AB123CD'),
+        {'data_viaggio': '2026-01-10'},
+        chilometrica(chiave_client='non-una-chiave'),
+    ])
+    assert [indice for indice, _ in righe] == [0]
+    assert [e['indice'] for e in errori] == [1, 2, 3, 4]
+    assert errori[0]['error'] == 'Valore numerico non valido in km_percorsi'
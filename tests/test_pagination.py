@@ -0,0 +1,38 @@
+import base64
+import json
+
+import pytest
+
+from pagination import decode_cursor, encode_cursor, keyset_params
+
+
+def cursore(date_value, id_value):
+    raw = json.dumps([date_value, id_value]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def test_cursore_andata_e_ritorno():
+    assert decode_cursor(encode_cursor('2026-03-15', 42)) == ('2026-03-15', 42)
+
+
+def test_filtro_del_cursore():
+    params = keyset_params({'cliente_id': 'eq.1'}, 'data_spesa', 50, encode_cursor('2026-03-15', 42))
+    assert params['or'] == '(data_spesa.lt.2026-03-15,and(data_spesa.eq.2026-03-15,id.lt.42))'
+    assert params['limit'] == '51'
+
+
+@pytest.mark.parametrize('date_value, id_value', [
+    ('2026-03-15),cliente_id.eq.3,and(id.gt.0', 1),
+    ('2026-03-15,id.gt.0', 1),
+    ('2026-02-30', 1),
+    (20260315, 1),
+    ('2026-03-15', '1),cliente_id.eq.3'),
+])
+def test_cursore_manipolato(date_value, id_value):
+    with pytest.raises(ValueError, match='Cursore non valido'):
+        keyset_params({}, 'data_spesa', 50, cursore(date_value, id_value))
+
+
+def test_cursore_non_base64():
+    with pytest.raises(ValueError, match='Cursore non valido'):
+        decode_cursor('%%%')
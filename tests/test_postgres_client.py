@@ -0,0 +1,176 @@
+"""
+Traduzione dei parametri PostgREST in SQL (postgres_client.py).
+
+I test di traduzione non aprono connessioni: il SQL composto viene reso
+come testo da render(). Quelli in fondo girano su un database vero solo
+se TEST_DATABASE_URL è impostata, altrimenti vengono saltati (usano
+tabelle temporanee, il database non viene modificato).
+"""
+import json
+import os
+
+import pytest
+from psycopg2 import sql
+
+import postgres_client
+from postgres_client import QueryError, order_by, query_select, where
+
+
+def render(composto):
+    """SQL composto -> testo, senza connessione"""
+    if isinstance(composto, sql.Composed):
+        return ''.join(render(parte) for parte in composto.seq)
+    if isinstance(composto, sql.SQL):
+        return composto.string
+    if isinstance(composto, sql.Identifier):
+        return '.'.join(f'"{nome}"' for nome in composto.strings)
+    if isinstance(composto, sql.Literal):
+        valore = composto.wrapped
+        if isinstance(valore, str):
+            return "'" + valore.replace("'", "''") + "'"
+        return str(valore)
+    raise TypeError(composto)
+
+
+def test_filtri_semplici():
+    assert render(where({'cliente_id': 'eq.3', 'importo': 'gte.10.5'})) == \
+        """ WHERE t."cliente_id" = '3' AND t."importo" >= '10.5'"""
+
+
+def test_piu_condizioni_sulla_stessa_colonna():
+    assert render(where({'data_spesa': ['gte.2026-01-01', 'lte.2026-01-31']})) == \
+        """ WHERE t."data_spesa" >= '2026-01-01' AND t."data_spesa" <= '2026-01-31'"""
+
+
+@pytest.mark.parametrize('espressione, atteso', [
+    ('neq.1', """t."x" <> '1'"""),
+    ('like.*taxi*', """t."x" LIKE '%taxi%'"""),
+    ('ilike.Auto*', """t."x" ILIKE 'Auto%'"""),
+    ('is.null', 't."x" IS NULL'),
+    ('not.is.null', 'NOT (t."x" IS NULL)'),
+    ('in.(1,2,"a,b")', """t."x" IN ('1', '2', 'a,b')"""),
+    ('in.()', 'false'),
+    ('not.eq.3', """NOT (t."x" = '3')"""),
+])
+def test_operatori(espressione, atteso):
+    assert render(where({'x': espressione})) == ' WHERE ' + atteso
+
+
+def test_or_annidato_del_cursore():
+    params = {'or': '(data_spesa.lt.2026-01-01,and(data_spesa.eq.2026-01-01,id.lt.5))'}
+    assert render(where(params)) == (
+        """ WHERE (t."data_spesa" < '2026-01-01' OR """
+        """(t."data_spesa" = '2026-01-01' AND t."id" < '5'))""")
+
+
+def test_valori_con_apici_restano_letterali():
+    assert render(where({'descrizione': "eq.l'hotel"})) == """ WHERE t."descrizione" = 'l''hotel'"""
+
+
+def test_parametri_riservati_non_sono_filtri():
+    assert render(where({'select': '*', 'order': 'id.desc', 'limit': '5', 'offset': '10'})) == ''
+
+
+def test_ordinamento():
+    assert render(order_by('data_spesa.desc.nullslast,id.desc')) == \
+        ' ORDER BY t."data_spesa" DESC NULLS LAST, t."id" DESC'
+    assert render(order_by('nome')) == ' ORDER BY t."nome"'
+
+
+def test_select_con_risorse_collegate():
+    testo = render(query_select('spese', {'select': '*,categorie(nome,colore),clienti(*)',
+                                          'order': 'id.desc', 'limit': '11', 'offset': '20'}))
+    assert testo == (
+        'SELECT t.*, '
+        """CASE WHEN "j1".id IS NULL THEN NULL ELSE json_build_object('nome', "j1"."nome", 'colore', "j1"."colore") """
+        'END AS "categorie", '
+        'CASE WHEN "j2".id IS NULL THEN NULL ELSE to_json("j2") END AS "clienti" '
+        'FROM "spese" t '
+        'LEFT JOIN "categorie" "j1" ON "j1".id = t."categoria_id" '
+        'LEFT JOIN "clienti" "j2" ON "j2".id = t."cliente_id"'
+        ' ORDER BY t."id" DESC LIMIT 11 OFFSET 20')
+
+
+@pytest.mark.parametrize('params', [
+    {'x': 'regex.a'},
+    {'x': 'is.maybe'},
+    {'x; drop table spese': 'eq.1'},
+    {'order': 'id.sideways'},
+    {'select': 'fornitori(nome)'},
+    {'limit': 'molti'},
+])
+def test_parametri_non_traducibili(params):
+    with pytest.raises(QueryError):
+        query_select('spese', params)
+
+
+# ---------- Database vero (TEST_DATABASE_URL) ----------
+
+DSN = os.getenv('TEST_DATABASE_URL')
+
+
+@pytest.fixture(scope='module')
+def client():
+    if not DSN:
+        pytest.skip('TEST_DATABASE_URL non impostata')
+    # Una sola connessione: le tabelle temporanee sono visibili a tutte le query
+    client = postgres_client.PostgresClient(DSN, pool_min=1, pool_max=1, fanout_workers=1)
+    with client.connessione() as conn, conn.cursor() as cur:
+        cur.execute("""
+            CREATE TEMP TABLE categorie (id INTEGER PRIMARY KEY, nome TEXT, colore TEXT);
+            CREATE TEMP TABLE spese (id INTEGER PRIMARY KEY, data_spesa DATE, categoria_id INTEGER,
+                                     cliente_id INTEGER, importo DECIMAL(10,2), descrizione TEXT);
+            INSERT INTO categorie VALUES (1, 'Carburante', '#f00'), (2, 'Pedaggi', '#0f0');
+            INSERT INTO spese VALUES
+                (1, '2026-01-01', 1, 3, 50.00, 'Pieno'),
+                (2, '2026-01-01', 2, NULL, 7.30, 'Autostrada A4'),
+                (3, '2026-01-02', 1, 3, 61.20, 'Pieno autostrada'),
+                (4, '2026-01-03', NULL, 4, 12.00, 'Parcheggio'),
+                (5, '2026-01-03', 2, 3, 3.10, 'Tangenziale');
+        """)
+    yield client
+    client.close()
+
+
+def ids(response):
+    response.raise_for_status()
+    return [r['id'] for r in response.json()]
+
+
+@pytest.mark.parametrize('params, attesi', [
+    ({'order': 'data_spesa.desc,id.desc'}, [5, 4, 3, 2, 1]),
+    ({'cliente_id': 'eq.3', 'order': 'id'}, [1, 3, 5]),
+    ({'cliente_id': 'is.null'}, [2]),
+    ({'categoria_id': 'in.(2)', 'order': 'id'}, [2, 5]),
+    ({'descrizione': 'ilike.*autostrada*', 'order': 'id'}, [2, 3]),
+    ({'data_spesa': ['gte.2026-01-02', 'lte.2026-01-03'], 'order': 'id'}, [3, 4, 5]),
+    ({'categoria_id': 'not.eq.1', 'order': 'id'}, [2, 5]),
+    # Pagina successiva del cursore (2026-01-03, 4), come in pagination.keyset_params
+    ({'or': '(data_spesa.lt.2026-01-03,and(data_spesa.eq.2026-01-03,id.lt.4))',
+      'order': 'data_spesa.desc,id.desc', 'limit': '2'}, [3, 2]),
+    ({'order': 'categoria_id.desc.nullsfirst,id', 'limit': '3'}, [4, 2, 5]),
+])
+def test_query_sul_database(client, params, attesi):
+    assert ids(client.get('spese', params=params)) == attesi
+
+
+def test_risorse_collegate_sul_database(client):
+    righe = client.get('spese', params={'select': 'id,importo,categorie(nome)', 'order': 'id'}).json()
+    assert righe[0] == {'id': 1, 'importo': 50.00, 'categorie': {'nome': 'Carburante'}}
+    # Chiave esterna NULL: la risorsa collegata è null, come in PostgREST
+    assert righe[3]['categorie'] is None
+
+
+def test_count_exact_sul_database(client):
+    response = client.get('spese', params={'cliente_id': 'eq.3', 'order': 'id', 'limit': '2', 'offset': '1'},
+                          headers={'Prefer': 'count=exact'})
+    assert ids(response) == [3, 5]
+    assert response.headers['Content-Range'] == '1-2/3'
+    vuota = client.get('spese', params={'cliente_id': 'eq.99'}, headers={'Prefer': 'count=exact'})
+    assert vuota.headers['Content-Range'] == '*/0'
+
+
+def test_parametri_non_validi_sul_database(client):
+    response = client.get('spese', params={'importo': 'regex.1'})
+    assert response.status_code == 400
+    assert json.loads(response.text)['code'] == 'PGRST100'
@@ -0,0 +1,91 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('numpy')
+
+import snapshot  # noqa: E402
+from benchmarks.fake_postgrest import FakeSupabase, FakeSupabaseServer, rpc_totali_spese  # noqa: E402
+from demo_data import carica_fake  # noqa: E402
+from pagination import fetch_page  # noqa: E402
+from supabase_client import SupabaseClient  # noqa: E402
+
+
+@pytest.fixture
+def fake():
+    fake = FakeSupabase()
+    carica_fake(fake, scale=0.005)
+    return fake
+
+
+@pytest.fixture
+def client(fake):
+    server = FakeSupabaseServer(fake).start()
+    client = SupabaseClient(server.url, 'test')
+    yield client
+    client.close()
+    server.shutdown()
+
+
+def attendi(cache, table, timeout=30):
+    fine = time.monotonic() + timeout
+    while (vista := cache.vista(table)) is None:
+        assert time.monotonic() < fine, 'caricamento dello snapshot non completato'
+        time.sleep(0.01)
+    return vista
+
+
+def test_caricamento_iniziale_non_blocca_le_richieste(client, fake):
+    sblocca = threading.Event()
+    originale = snapshot.leggi_colonne
+
+    def lenta(*args, **kwargs):
+        sblocca.wait(10)
+        return originale(*args, **kwargs)
+
+    cache = snapshot.Snapshot(lambda: client, intervallo=3600)
+    snapshot.leggi_colonne = lenta
+    try:
+        inizio = time.monotonic()
+        # Durante il caricamento le richieste non aspettano: la lista usa il database
+        assert cache.vista('spese') is None
+        assert cache.vista('spese') is None
+        assert time.monotonic() - inizio < 1
+        sblocca.set()
+        assert len(attendi(cache, 'spese')) == len(fake.tables['spese'])
+    finally:
+        snapshot.leggi_colonne = originale
+
+
+@pytest.mark.parametrize('filtri', [
+    {},
+    {'categoria_id': '1'},
+    {'data_inizio': '2025-01-01', 'data_fine': '2025-06-30', 'addebitabile': 'true'},
+])
+def test_stessi_risultati_del_database(client, fake, filtri):
+    vista = attendi(snapshot.Snapshot(lambda: client, intervallo=3600), 'spese')
+    posizioni = vista.filtra(filtri)
+
+    params = {}
+    if filtri.get('categoria_id'):
+        params['categoria_id'] = f"eq.{filtri['categoria_id']}"
+    if filtri.get('addebitabile'):
+        params['addebitabile'] = f"eq.{filtri['addebitabile']}"
+    date = [f'{op}.{filtri[k]}' for op, k in (('gte', 'data_inizio'), ('lte', 'data_fine')) if k in filtri]
+    if date:
+        params['data_spesa'] = date
+
+    cursore = None
+    for _ in range(3):
+        righe, atteso = fetch_page(client, 'spese', params, 'data_spesa', 20, cursore)
+        ids, successivo = vista.pagina(posizioni, 20, cursore)
+        assert ids == [r['id'] for r in righe]
+        assert successivo == atteso
+        if not atteso:
+            break
+        cursore = atteso
+
+    argomenti = {'p_da': filtri.get('data_inizio'), 'p_a': filtri.get('data_fine'),
+                 'p_categoria_id': filtri.get('categoria_id'), 'p_addebitabile': filtri.get('addebitabile')}
+    assert snapshot.totali_spese(vista, posizioni) == rpc_totali_spese(fake, argomenti)
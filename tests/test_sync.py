@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import sync
+from benchmarks.fake_postgrest import FakeSupabase, FakeSupabaseServer
+from supabase_client import SupabaseClient
+
+# Più righe di una pagina, come una tabella oltre il max-rows di Supabase
+MAX_ROWS = 4
+RIGHE = 11
+
+
+@pytest.fixture
+def fake():
+    fake = FakeSupabase()
+    fake.max_rows = MAX_ROWS
+    fake.load('spese', [{'id': i, 'data_spesa': '2026-01-01', 'importo': i, 'descrizione': f'spesa {i}'}
+                        for i in range(1, RIGHE + 1)])
+    return fake
+
+
+@pytest.fixture
+def client(fake):
+    server = FakeSupabaseServer(fake).start()
+    client = SupabaseClient(server.url, 'test')
+    yield client
+    client.close()
+    server.shutdown()
+
+
+def test_completa_oltre_il_limite_di_righe(client, fake):
+    risultato = sync.delta(client, page_size=MAX_ROWS)
+    assert risultato['completa']
+    assert [r['id'] for r in risultato['modificate']['spese']] == list(range(1, RIGHE + 1))
+
+
+def test_pagina_piena_non_e_l_ultima(client, fake):
+    # RIGHE multiplo di page_size: dopo l'ultima pagina piena ne arriva una vuota
+    fake.max_rows = None
+    assert len(sync.leggi_modificate(client, 'spese', None, page_size=RIGHE)) == RIGHE
+    assert len(sync.leggi_a_pagine(client, 'spese', {}, page_size=1)) == RIGHE
+
+
+def test_delta_ed_eliminazioni_oltre_il_limite_di_righe(client, fake):
+    since = datetime.utcnow().replace(microsecond=0)
+    dopo = (since + timedelta(hours=1)).isoformat()
+    for riga in fake.tables['spese']:
+        if riga['id'] % 2:
+            riga['updated_at'] = dopo
+    fake.load('eliminazioni', [{'id': i, 'tabella': 'spese', 'riga_id': 100 + i, 'eliminata_il': dopo}
+                               for i in range(1, RIGHE + 1)])
+
+    risultato = sync.delta(client, since, overlap=0, page_size=MAX_ROWS)
+    assert not risultato['completa']
+    assert [r['id'] for r in risultato['modificate']['spese']] == list(range(1, RIGHE + 1, 2))
+    assert risultato['eliminate']['spese'] == [100 + i for i in range(1, RIGHE + 1)]